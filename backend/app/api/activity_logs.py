@@ -1,12 +1,14 @@
 """
 活动日志API路由
 """
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
 from sqlmodel import Session, select
 from typing import Optional
+from app.core.config import settings
 from app.core.database import get_session
 from app.models.activity_log import ActivityLog
 from app.schemas.common import Response
+from app.utils.pagination import keyset, keyset_page, capped_count, approximate_total
 
 router = APIRouter(prefix="/activity-logs", tags=["活动日志"])
 
@@ -16,17 +18,36 @@ async def get_activity_logs(
     activity_type: Optional[str] = None,
     status: Optional[str] = None,
     limit: int = 20,
+    cursor: Optional[str] = None,
+    include_total: bool = False,
     db: Session = Depends(get_session)
 ):
-    """获取活动日志列表"""
-    query = select(ActivityLog).order_by(ActivityLog.created_at.desc())
+    """
+    获取活动日志列表
+    
+    传 cursor 时（首页传空字符串）按 (created_at, id) 游标分页，返回 {items, next_cursor}；
+    不传时返回最近 limit 条日志的列表
+    """
+    query = select(ActivityLog)
     
     if activity_type:
         query = query.where(ActivityLog.activity_type == activity_type)
     if status:
         query = query.where(ActivityLog.status == status)
     
-    query = query.limit(limit)
+    if cursor is not None:
+        keys = (ActivityLog.created_at, ActivityLog.id)
+        try:
+            statement = keyset(query, keys, cursor, limit)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        data = keyset_page(db.exec(statement).all(), keys, limit)
+        if include_total:
+            count = db.exec(capped_count(query, settings.PAGINATION_COUNT_CAP)).one()
+            data.update(approximate_total(count, settings.PAGINATION_COUNT_CAP))
+        return Response(data=data)
+    
+    query = query.order_by(ActivityLog.created_at.desc()).limit(limit)
     logs = db.exec(query).all()
     
     return Response(data=logs)
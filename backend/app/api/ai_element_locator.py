@@ -352,12 +352,14 @@ async def smart_click(
         if device_id:
             try:
                 import subprocess
-                result = subprocess.run(
-                    command.split(),
-                    capture_output=True,
-                    text=True,
-                    timeout=10
-                )
+                from app.core.metrics import adb_command_duration
+                with adb_command_duration.time(command="shell"):
+                    result = subprocess.run(
+                        command.split(),
+                        capture_output=True,
+                        text=True,
+                        timeout=10
+                    )
                 execution_result = {
                     "success": result.returncode == 0,
                     "stdout": result.stdout,
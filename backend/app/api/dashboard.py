@@ -2,8 +2,8 @@
 仪表盘API路由
 """
 from fastapi import APIRouter, Depends
-from sqlmodel import Session
-from app.core.database import get_session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.core.database import get_async_session
 from app.services.dashboard_service import DashboardService
 from app.schemas.common import Response
 from app.schemas.dashboard import DashboardOverview
@@ -12,14 +12,14 @@ router = APIRouter(prefix="/dashboard", tags=["仪表盘"])
 
 
 @router.get("/overview", response_model=Response[DashboardOverview])
-async def get_dashboard_overview(db: Session = Depends(get_session)):
+async def get_dashboard_overview(db: AsyncSession = Depends(get_async_session)):
     """获取仪表盘概览数据"""
-    data = DashboardService.get_dashboard_overview(db)
+    data = await db.run_sync(DashboardService.get_dashboard_overview)
     return Response(data=data)
 
 
 @router.get("/stats", response_model=Response[DashboardOverview])
-async def get_dashboard_stats(db: Session = Depends(get_session)):
+async def get_dashboard_stats(db: AsyncSession = Depends(get_async_session)):
     """获取仪表盘统计数据（别名接口）"""
-    data = DashboardService.get_dashboard_overview(db)
+    data = await db.run_sync(DashboardService.get_dashboard_overview)
     return Response(data=data)
@@ -2,18 +2,25 @@
 设备健康度 API
 """
 from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel, Field
 from sqlmodel import Session, select, func
-from app.core.database import get_session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.core.config import settings
+from app.core.database import get_session, get_async_session
 from app.models.device_health import (
     DeviceHealthRecord, 
     DeviceUsageStats, 
     DeviceAlert,
-    AlertRule
+    AlertRule,
+    DeviceHealthLatest
 )
 from app.models.device import Device
 from app.schemas.common import Response
 from app.services.device_health import DeviceHealthService
-from app.services.alert_engine import AlertEngine
+from app.services.alert_engine import AlertEngine, alert_rule_cache
+from app.services.health_rollup import health_rollup_service
+from app.utils.downsample import lttb
+from app.utils.pagination import keyset, keyset_page, capped_count, approximate_total
 from typing import Optional
 from datetime import datetime, timedelta
 
@@ -23,10 +30,10 @@ router = APIRouter(prefix="/device-health", tags=["设备健康度"])
 @router.get("/devices/{device_id}/health", response_model=Response)
 async def get_device_health(
     device_id: int,
-    db: Session = Depends(get_session)
+    db: AsyncSession = Depends(get_async_session)
 ):
     """获取设备当前健康度"""
-    device = db.get(Device, device_id)
+    device = await db.get(Device, device_id)
     if not device:
         raise HTTPException(status_code=404, detail="设备不存在")
     
@@ -35,7 +42,7 @@ async def get_device_health(
         DeviceHealthRecord.device_id == device_id
     ).order_by(DeviceHealthRecord.created_at.desc()).limit(1)
     
-    health_record = db.exec(statement).first()
+    health_record = (await db.exec(statement)).first()
     
     if not health_record:
         return Response(
@@ -68,113 +75,75 @@ async def get_device_health(
     )
 
 
-@router.get("/devices/{device_id}/health/history", response_model=Response)
-async def get_device_health_history(
+def _build_health_history(
+    db: Session,
     device_id: int,
-    hours: int = Query(default=24, description="查询最近N小时的数据"),
-    sample_interval: int = Query(default=30, description="采样间隔（分钟），用于数据降采样"),
-    db: Session = Depends(get_session)
-):
-    """获取设备健康度历史"""
+    hours: int,
+    sample_interval: int,
+    max_points: Optional[int]
+) -> dict:
+    """
+    查询设备健康度历史
+
+    根据时间窗口和采样间隔自动选择原始记录或 1m/1h/1d 聚合数据，在 SQL 中按采样间隔分桶；
+    指定 max_points 时再用 LTTB 降采样到图表需要的点数
+    """
     device = db.get(Device, device_id)
     if not device:
         raise HTTPException(status_code=404, detail="设备不存在")
 
-    # 查询指定时间范围内的记录
     start_time = datetime.now() - timedelta(hours=hours)
-    statement = select(DeviceHealthRecord).where(
-        DeviceHealthRecord.device_id == device_id,
-        DeviceHealthRecord.created_at >= start_time
-    ).order_by(DeviceHealthRecord.created_at.asc())
-
-    records = db.exec(statement).all()
-
-    # 数据降采样：按时间间隔抽样
-    sampled_records = []
-    if records and sample_interval > 0:
-        last_sample_time = None
-        for record in records:
-            if last_sample_time is None or (record.created_at - last_sample_time).total_seconds() >= sample_interval * 60:
-                sampled_records.append(record)
-                last_sample_time = record.created_at
-    else:
-        sampled_records = records
+    resolution, points = health_rollup_service.query_history(db, device_id, start_time, sample_interval * 60)
 
-    return Response(
-        data={
-            "device_id": device_id,
-            "records": [
-                {
-                    "health_score": r.health_score,
-                    "battery_level": r.battery_level,
-                    "temperature": r.temperature,
-                    "cpu_usage": r.cpu_usage,
-                    "memory_usage": r.memory_usage,
-                    "created_at": r.created_at.isoformat()
-                }
-                for r in sampled_records
-            ]
-        }
-    )
+    if max_points:
+        points = lttb(
+            points,
+            max_points,
+            x=lambda point: point["created_at"].timestamp(),
+            y=lambda point: point["health_score"] or 0
+        )
+
+    return {
+        "device_id": device_id,
+        "resolution": resolution,
+        "records": [
+            {**point, "created_at": point["created_at"].isoformat()}
+            for point in points
+        ]
+    }
+
+
+@router.get("/devices/{device_id}/health/history", response_model=Response)
+async def get_device_health_history(
+    device_id: int,
+    hours: int = Query(default=24, description="查询最近N小时的数据"),
+    sample_interval: int = Query(default=30, description="采样间隔（分钟），按该间隔分桶聚合"),
+    max_points: Optional[int] = Query(default=None, ge=3, description="图表最大点数，使用 LTTB 降采样"),
+    db: AsyncSession = Depends(get_async_session)
+):
+    """获取设备健康度历史"""
+    return Response(data=await db.run_sync(_build_health_history, device_id, hours, sample_interval, max_points))
 
 
 @router.get("/devices/{device_id}/history", response_model=Response)
 async def get_device_history(
     device_id: int,
     hours: int = Query(default=24, description="查询最近N小时的数据"),
-    sample_interval: int = Query(default=30, description="采样间隔（分钟），用于数据降采样"),
-    db: Session = Depends(get_session)
+    sample_interval: int = Query(default=30, description="采样间隔（分钟），按该间隔分桶聚合"),
+    max_points: Optional[int] = Query(default=None, ge=3, description="图表最大点数，使用 LTTB 降采样"),
+    db: AsyncSession = Depends(get_async_session)
 ):
     """获取设备健康度历史（别名接口）"""
-    device = db.get(Device, device_id)
-    if not device:
-        raise HTTPException(status_code=404, detail="设备不存在")
-
-    # 查询指定时间范围内的记录
-    start_time = datetime.now() - timedelta(hours=hours)
-    statement = select(DeviceHealthRecord).where(
-        DeviceHealthRecord.device_id == device_id,
-        DeviceHealthRecord.created_at >= start_time
-    ).order_by(DeviceHealthRecord.created_at.asc())
-
-    records = db.exec(statement).all()
-
-    # 数据降采样：按时间间隔抽样
-    sampled_records = []
-    if records and sample_interval > 0:
-        last_sample_time = None
-        for record in records:
-            if last_sample_time is None or (record.created_at - last_sample_time).total_seconds() >= sample_interval * 60:
-                sampled_records.append(record)
-                last_sample_time = record.created_at
-    else:
-        sampled_records = records
-
-    return Response(
-        data={
-            "device_id": device_id,
-            "records": [
-                {
-                    "health_score": r.health_score,
-                    "battery_level": r.battery_level,
-                    "temperature": r.temperature,
-                    "cpu_usage": r.cpu_usage,
-                    "memory_usage": r.memory_usage,
-                    "created_at": r.created_at.isoformat()
-                }
-                for r in sampled_records
-            ]
-        }
-    )
+    return Response(data=await db.run_sync(_build_health_history, device_id, hours, sample_interval, max_points))
 
 
 @router.get("/devices/{device_id}/stats", response_model=Response)
 async def get_device_stats(
     device_id: int,
-    db: Session = Depends(get_session)
+    db: AsyncSession = Depends(get_async_session)
 ):
     """获取设备使用统计"""
-    device = db.get(Device, device_id)
+    device = await db.get(Device, device_id)
     if not device:
         raise HTTPException(status_code=404, detail="设备不存在")
     
@@ -182,7 +151,7 @@ async def get_device_stats(
     statement = select(DeviceUsageStats).where(
         DeviceUsageStats.device_id == device_id
     )
-    stats = db.exec(statement).first()
+    stats = (await db.exec(statement)).first()
     
     if not stats:
         return Response(
@@ -214,9 +183,17 @@ async def get_alerts(
     device_id: Optional[int] = None,
     is_resolved: Optional[bool] = None,
     severity: Optional[str] = None,
-    db: Session = Depends(get_session)
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="每页告警数（游标分页默认 200）"),
+    cursor: Optional[str] = None,
+    include_total: bool = False,
+    db: AsyncSession = Depends(get_async_session)
 ):
-    """获取告警列表"""
+    """
+    获取告警列表
+    
+    传 cursor 时（首页传空字符串）按 (created_at, id) 游标分页，返回 {items, next_cursor}；
+    不传时与原接口一致返回全部告警的列表，传 limit 时只返回最近 limit 条
+    """
     statement = select(DeviceAlert)
     
     # 添加筛选条件
@@ -227,35 +204,49 @@ async def get_alerts(
     if severity:
         statement = statement.where(DeviceAlert.severity == severity)
     
-    statement = statement.order_by(DeviceAlert.created_at.desc())
+    if cursor is not None:
+        limit = limit or 200
+        keys = (DeviceAlert.created_at, DeviceAlert.id)
+        try:
+            page_statement = keyset(statement, keys, cursor, limit)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        data = keyset_page((await db.exec(page_statement)).all(), keys, limit)
+        data["items"] = [_alert_item(alert) for alert in data["items"]]
+        if include_total:
+            count = (await db.exec(capped_count(statement, settings.PAGINATION_COUNT_CAP))).one()
+            data.update(approximate_total(count, settings.PAGINATION_COUNT_CAP))
+        return Response(data=data)
     
-    alerts = db.exec(statement).all()
+    statement = statement.order_by(DeviceAlert.created_at.desc(), DeviceAlert.id.desc())
+    if limit is not None:
+        statement = statement.limit(limit)
     
-    return Response(
-        data=[
-            {
-                "id": alert.id,
-                "device_id": alert.device_id,
-                "alert_type": alert.alert_type,
-                "severity": alert.severity,
-                "message": alert.message,
-                "is_resolved": alert.is_resolved,
-                "created_at": alert.created_at.isoformat(),
-                "resolved_at": alert.resolved_at.isoformat() if alert.resolved_at else None
-            }
-            for alert in alerts
-        ]
-    )
+    alerts = (await db.exec(statement)).all()
+    
+    return Response(data=[_alert_item(alert) for alert in alerts])
+
+
+def _alert_item(alert: DeviceAlert) -> dict:
+    return {
+        "id": alert.id,
+        "device_id": alert.device_id,
+        "alert_type": alert.alert_type,
+        "severity": alert.severity,
+        "message": alert.message,
+        "is_resolved": alert.is_resolved,
+        "created_at": alert.created_at.isoformat(),
+        "resolved_at": alert.resolved_at.isoformat() if alert.resolved_at else None
+    }
 
 
 @router.post("/alerts/{alert_id}/resolve", response_model=Response)
 async def resolve_alert(
     alert_id: int,
-    db: Session = Depends(get_session)
+    db: AsyncSession = Depends(get_async_session)
 ):
     """解决告警"""
-    alert_engine = AlertEngine(db)
-    success = alert_engine.resolve_alert(alert_id)
+    success = await db.run_sync(lambda session: AlertEngine(session).resolve_alert(alert_id))
     
     if not success:
         raise HTTPException(status_code=404, detail="告警不存在或已解决")
@@ -263,54 +254,179 @@ async def resolve_alert(
     return Response(message="告警已解决")
 
 
+class AlertRuleCreate(BaseModel):
+    """创建告警规则"""
+    rule_name: str
+    rule_type: str
+    condition_field: str
+    operator: str
+    threshold_value: float
+    severity: str
+    is_enabled: bool = True
+    notification_channels: Optional[str] = None
+    condition_type: str = "threshold"
+    duration_seconds: Optional[int] = Field(None, ge=0)
+    window_seconds: Optional[int] = Field(None, gt=0)
+    clear_threshold: Optional[float] = None
+
+
+class AlertRuleUpdate(BaseModel):
+    """更新告警规则"""
+    rule_name: Optional[str] = None
+    rule_type: Optional[str] = None
+    condition_field: Optional[str] = None
+    operator: Optional[str] = None
+    threshold_value: Optional[float] = None
+    severity: Optional[str] = None
+    is_enabled: Optional[bool] = None
+    notification_channels: Optional[str] = None
+    condition_type: Optional[str] = None
+    duration_seconds: Optional[int] = Field(None, ge=0)
+    window_seconds: Optional[int] = Field(None, gt=0)
+    clear_threshold: Optional[float] = None
+
+
+class ToggleAlertRuleRequest(BaseModel):
+    """切换告警规则状态"""
+    is_enabled: bool
+
+
+ALERT_RULE_OPERATORS = ('<', '>', '<=', '>=', '==')
+ALERT_CONDITION_TYPES = ('threshold', 'rate')
+
+
+def _alert_rule_data(rule: AlertRule) -> dict:
+    return {
+        "id": rule.id,
+        "rule_name": rule.rule_name,
+        "rule_type": rule.rule_type,
+        "condition_field": rule.condition_field,
+        "operator": rule.operator,
+        "threshold_value": rule.threshold_value,
+        "severity": rule.severity,
+        "is_enabled": rule.is_enabled,
+        "condition_type": rule.condition_type,
+        "duration_seconds": rule.duration_seconds,
+        "window_seconds": rule.window_seconds,
+        "clear_threshold": rule.clear_threshold
+    }
+
+
 @router.get("/alert-rules", response_model=Response)
 async def get_alert_rules(
-    db: Session = Depends(get_session)
+    db: AsyncSession = Depends(get_async_session)
 ):
     """获取告警规则列表"""
     statement = select(AlertRule)
-    rules = db.exec(statement).all()
+    rules = (await db.exec(statement)).all()
     
     return Response(
-        data=[
-            {
-                "id": rule.id,
-                "rule_name": rule.rule_name,
-                "rule_type": rule.rule_type,
-                "condition_field": rule.condition_field,
-                "operator": rule.operator,
-                "threshold_value": rule.threshold_value,
-                "severity": rule.severity,
-                "is_enabled": rule.is_enabled
-            }
-            for rule in rules
-        ]
+        data=[_alert_rule_data(rule) for rule in rules]
+    )
+
+
+@router.post("/alert-rules", response_model=Response)
+async def create_alert_rule(
+    rule_data: AlertRuleCreate,
+    db: AsyncSession = Depends(get_async_session)
+):
+    """创建告警规则"""
+    if rule_data.operator not in ALERT_RULE_OPERATORS:
+        raise HTTPException(status_code=400, detail=f"不支持的操作符: {rule_data.operator}")
+    if rule_data.condition_type not in ALERT_CONDITION_TYPES:
+        raise HTTPException(status_code=400, detail=f"不支持的条件类型: {rule_data.condition_type}")
+    
+    rule = AlertRule(**rule_data.model_dump())
+    db.add(rule)
+    await db.commit()
+    await db.refresh(rule)
+    
+    # 规则变更后重新编译（其他规则的流式状态保留）
+    alert_rule_cache.invalidate([rule.id])
+    
+    return Response(message="告警规则创建成功", data=_alert_rule_data(rule))
+
+
+@router.put("/alert-rules/{rule_id}", response_model=Response)
+async def update_alert_rule(
+    rule_id: int,
+    rule_data: AlertRuleUpdate,
+    db: AsyncSession = Depends(get_async_session)
+):
+    """更新告警规则"""
+    rule = await db.get(AlertRule, rule_id)
+    if not rule:
+        raise HTTPException(status_code=404, detail="告警规则不存在")
+    
+    updates = rule_data.model_dump(exclude_unset=True)
+    if "operator" in updates and updates["operator"] not in ALERT_RULE_OPERATORS:
+        raise HTTPException(status_code=400, detail=f"不支持的操作符: {updates['operator']}")
+    if "condition_type" in updates and updates["condition_type"] not in ALERT_CONDITION_TYPES:
+        raise HTTPException(status_code=400, detail=f"不支持的条件类型: {updates['condition_type']}")
+    
+    for key, value in updates.items():
+        setattr(rule, key, value)
+    db.add(rule)
+    await db.commit()
+    await db.refresh(rule)
+    
+    alert_rule_cache.invalidate([rule_id])
+    
+    return Response(message="告警规则更新成功", data=_alert_rule_data(rule))
+
+
+@router.delete("/alert-rules/{rule_id}", response_model=Response)
+async def delete_alert_rule(
+    rule_id: int,
+    db: AsyncSession = Depends(get_async_session)
+):
+    """删除告警规则"""
+    rule = await db.get(AlertRule, rule_id)
+    if not rule:
+        raise HTTPException(status_code=404, detail="告警规则不存在")
+    
+    await db.delete(rule)
+    await db.commit()
+    
+    alert_rule_cache.invalidate([rule_id])
+    
+    return Response(message="告警规则删除成功")
+
+
+@router.put("/alert-rules/{rule_id}/toggle", response_model=Response)
+async def toggle_alert_rule(
+    rule_id: int,
+    toggle_data: ToggleAlertRuleRequest,
+    db: AsyncSession = Depends(get_async_session)
+):
+    """切换告警规则状态"""
+    rule = await db.get(AlertRule, rule_id)
+    if not rule:
+        raise HTTPException(status_code=404, detail="告警规则不存在")
+    
+    rule.is_enabled = toggle_data.is_enabled
+    db.add(rule)
+    await db.commit()
+    
+    alert_rule_cache.invalidate([rule_id])
+    
+    return Response(
+        message="告警规则状态已更新",
+        data={"id": rule_id, "is_enabled": toggle_data.is_enabled}
     )
 
 
 @router.get("/overview", response_model=Response)
 async def get_health_overview(
-    db: Session = Depends(get_session)
+    db: AsyncSession = Depends(get_async_session)
 ):
-    """获取健康度总览（优化版）"""
-    # 使用子查询获取每个设备的最新健康度记录ID
-    subquery = (
-        select(
-            DeviceHealthRecord.device_id,
-            func.max(DeviceHealthRecord.id).label('max_id')
-        )
-        .group_by(DeviceHealthRecord.device_id)
-        .subquery()
-    )
-    
-    # 一次性查询所有设备的最新健康度记录
+    """获取健康度总览（读取最新健康度快照，耗时只与设备数有关）"""
     statement = (
-        select(DeviceHealthRecord, Device)
-        .join(subquery, DeviceHealthRecord.id == subquery.c.max_id)
-        .join(Device, DeviceHealthRecord.device_id == Device.id)
+        select(DeviceHealthLatest, Device)
+        .join(Device, DeviceHealthLatest.device_id == Device.id)
     )
     
-    results = db.exec(statement).all()
+    results = (await db.exec(statement)).all()
     
     health_service = DeviceHealthService()
     health_data = []
@@ -333,13 +449,13 @@ async def get_health_overview(
             "memory_usage": health_record.memory_usage,
             "storage_usage": health_record.storage_usage,
             "network_status": health_record.network_status,
-            "last_check_time": health_record.created_at.isoformat()
+            "last_check_time": health_record.recorded_at.isoformat()
         })
     
     # 获取未解决的告警数量
-    unresolved_alerts = db.exec(
+    unresolved_alerts = (await db.exec(
         select(func.count(DeviceAlert.id)).where(DeviceAlert.is_resolved == False)
-    ).one()
+    )).one()
     
     return Response(
         data={
@@ -369,3 +485,11 @@ async def trigger_health_collection(
             status_code=500,
             detail=f"启动采集任务失败: {str(e)}"
         )
+
+
+@router.get("/collector/stats", response_model=Response)
+async def get_collector_stats():
+    """获取健康度采集器状态（最近一轮耗时、覆盖率、超时设备数、自适应采样速率、最久未采集的设备）"""
+    from app.services.health_scheduler import health_scheduler
+    
+    return Response(data=health_scheduler.get_stats())
@@ -6,6 +6,7 @@ from sqlmodel import Session, select, func
 from typing import List, Optional
 from datetime import datetime
 
+from app.core.config import settings
 from app.core.database import get_session
 from app.models.example import Example, BestPractice, Snippet
 from app.schemas.example import (
@@ -13,6 +14,7 @@ from app.schemas.example import (
     BestPracticeCreate, BestPracticeUpdate, BestPracticeResponse,
     SnippetCreate, SnippetUpdate, SnippetResponse
 )
+from app.utils.pagination import keyset, keyset_page, capped_count, approximate_total
 
 router = APIRouter(prefix="/examples", tags=["示例库"])
 
@@ -28,9 +30,15 @@ async def get_examples(
     script_type: Optional[str] = Query(None, description="脚本类型筛选"),
     keyword: Optional[str] = Query(None, description="关键词搜索"),
     is_featured: Optional[bool] = Query(None, description="是否精选"),
+    cursor: Optional[str] = Query(None, description="游标分页：上一页返回的 next_cursor，首页传空字符串"),
+    include_total: bool = Query(False, description="游标分页时返回近似总数"),
     session: Session = Depends(get_session)
 ):
-    """获取示例列表"""
+    """
+    获取示例列表
+    
+    传 cursor 时按 (created_at, id) 倒序游标分页；不传时为旧的 page/page_size 分页（精选、下载量优先）
+    """
     query = select(Example)
     
     # 筛选条件
@@ -49,6 +57,18 @@ async def get_examples(
             (Example.tags.contains(keyword))
         )
     
+    if cursor is not None:
+        keys = (Example.created_at, Example.id)
+        try:
+            statement = keyset(query, keys, cursor, page_size)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        data = keyset_page(session.exec(statement).all(), keys, page_size)
+        if include_total:
+            count = session.exec(capped_count(query, settings.PAGINATION_COUNT_CAP)).one()
+            data.update(approximate_total(count, settings.PAGINATION_COUNT_CAP))
+        return {"code": 200, "message": "获取成功", "data": data}
+    
     # 总数
     total_query = select(func.count()).select_from(query.subquery())
     total = session.exec(total_query).one()
@@ -135,6 +135,29 @@ async def get_script_failure_stats(
     )
 
 
+@router.get("/scripts/{script_id}/step-latency", response_model=Response)
+async def get_script_step_latency(
+    script_id: int,
+    days: int = Query(default=30, ge=1, le=90, description="统计最近N天"),
+    db: Session = Depends(get_session)
+):
+    """获取脚本各步骤耗时百分位数（用于定位慢步骤）"""
+    service = FailureService(db)
+    steps = service.get_step_latency_stats(script_id, days)
+    
+    # 按p95降序列出最慢的步骤
+    slowest = sorted(steps, key=lambda s: s['p95'], reverse=True)[:5]
+    
+    return Response(
+        data={
+            "script_id": script_id,
+            "days": days,
+            "steps": steps,
+            "slowest_steps": [s['step_index'] for s in slowest]
+        }
+    )
+
+
 @router.get("/trend", response_model=Response)
 async def get_failure_trend(
     script_id: Optional[int] = None,
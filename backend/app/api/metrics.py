@@ -0,0 +1,18 @@
+"""
+OpenMetrics 指标抓取接口
+"""
+from fastapi import APIRouter
+from fastapi.responses import Response as RawResponse
+from app.core.metrics import registry, CONTENT_TYPE
+
+router = APIRouter(tags=["监控指标"])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """
+    Prometheus/OpenMetrics 抓取端点
+    
+    只读取内存中的计数器和连接状态，不查询数据库
+    """
+    return RawResponse(content=registry.render(), media_type=CONTENT_TYPE)
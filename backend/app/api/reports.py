@@ -2,19 +2,39 @@
 报告中心API路由
 """
 from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session, select
-from typing import Optional
+from sqlmodel import select, func
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import List, Optional, Union
 from datetime import datetime
-from app.core.database import get_session
+from app.core.config import settings
+from app.core.database import get_async_session
+from app.models.archive import ArchiveSegment
 from app.models.task_log import TaskLog
 from app.models.script import Script
 from app.models.device import Device
-from app.schemas.common import Response, PaginatedResponse
+from app.schemas.common import Response, PaginatedResponse, CursorPageResponse
+from app.services.data_archiver import data_archiver
+from app.utils.pagination import keyset, keyset_page, capped_count, approximate_total
+import asyncio
 
 router = APIRouter(prefix="/reports", tags=["报告中心"])
 
+# 游标分页的排序键
+REPORT_KEYS = (TaskLog.start_time, TaskLog.id)
 
-@router.get("", response_model=Response[PaginatedResponse])
+# 列表错误信息只取开头，完整内容在详情中返回
+REPORT_ERROR_PREVIEW = 500
+
+# 列表返回的列：不含日志内容和截图路径这类大文本列
+REPORT_COLUMNS = (
+    TaskLog.id, TaskLog.task_name, TaskLog.script_id, TaskLog.device_id, TaskLog.scheduled_task_id,
+    TaskLog.status, TaskLog.start_time, TaskLog.end_time, TaskLog.duration,
+    func.substr(TaskLog.error_message, 1, REPORT_ERROR_PREVIEW).label("error_message"),
+    TaskLog.created_at,
+)
+
+
+@router.get("", response_model=Response[Union[PaginatedResponse, CursorPageResponse]])
 async def get_reports(
     status: Optional[str] = None,
     device_id: Optional[int] = None,
@@ -23,51 +43,99 @@ async def get_reports(
     end_date: Optional[str] = None,
     page: int = 1,
     page_size: int = 10,
-    db: Session = Depends(get_session)
+    include_archived: bool = False,
+    cursor: Optional[str] = None,
+    include_total: bool = False,
+    db: AsyncSession = Depends(get_async_session)
 ):
-    """获取报告列表"""
-    query = select(TaskLog).order_by(TaskLog.start_time.desc())
+    """
+    获取报告列表
+    
+    传 cursor 时（首页传空字符串）按 (start_time, id) 游标分页，include_total=true 时附带近似总数；
+    不传 cursor 时为旧的 page/page_size 分页。
+    开始日期早于热库数据（落在归档分段内）或 include_archived=true 时合并查询归档库，
+    归档记录都早于热库记录，按时间倒序排在热库记录之后
+    """
+    conditions = []
+    start_dt = end_dt = None
     
     if status and status != 'undefined':
-        query = query.where(TaskLog.status == status)
+        conditions.append(TaskLog.status == status)
     if device_id:
-        query = query.where(TaskLog.device_id == device_id)
+        conditions.append(TaskLog.device_id == device_id)
     if script_id:
-        query = query.where(TaskLog.script_id == script_id)
+        conditions.append(TaskLog.script_id == script_id)
     if start_date and start_date != 'undefined':
         try:
             start_dt = datetime.strptime(start_date, "%Y-%m-%d")
-            query = query.where(TaskLog.start_time >= start_dt)
+            conditions.append(TaskLog.start_time >= start_dt)
         except ValueError:
             pass  # 忽略无效的日期格式
     if end_date and end_date != 'undefined':
         try:
             end_dt = datetime.strptime(end_date, "%Y-%m-%d")
-            query = query.where(TaskLog.start_time <= end_dt)
+            conditions.append(TaskLog.start_time <= end_dt)
         except ValueError:
             pass  # 忽略无效的日期格式
     
+    # 热库一次查询带出脚本和设备名称；归档库只有 task_log 表，名称在热库中补查
+    query = (
+        select(*REPORT_COLUMNS, Script.name.label("script_name"), Device.model.label("device_name"))
+        .outerjoin(Script, Script.id == TaskLog.script_id)
+        .outerjoin(Device, Device.id == TaskLog.device_id)
+        .where(*conditions)
+    )
+    archive_query = select(*REPORT_COLUMNS).where(*conditions)
+    # 计数不连表、不取大文本列，只需过滤条件涉及的列，可以只走索引
+    count_query = select(TaskLog.id).where(*conditions)
+    
+    segments = []
+    if include_archived or start_dt is not None:
+        segments = await db.run_sync(
+            lambda session: data_archiver.segments(session, "task_log", start_dt, end_dt, newest_first=True)
+        )
+    
+    if cursor is not None:
+        try:
+            statement = keyset(query, REPORT_KEYS, cursor, page_size)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        reports = list((await db.exec(statement)).all())
+        # 热库不足一页时从归档库继续（游标条件对归档库同样适用）
+        if segments and len(reports) <= page_size:
+            reports.extend(await asyncio.to_thread(
+                data_archiver.fetch, segments, keyset(archive_query, REPORT_KEYS, cursor, page_size),
+                page_size + 1 - len(reports)
+            ))
+        data = keyset_page(reports, REPORT_KEYS, page_size)
+        data["items"] = await _report_items(db, data["items"])
+        if include_total:
+            cap = settings.PAGINATION_COUNT_CAP
+            count = (await db.exec(capped_count(count_query, cap))).one()
+            if segments and count <= cap:
+                count += await asyncio.to_thread(data_archiver.count, segments, count_query, cap - count)
+            data.update(approximate_total(count, cap))
+        return Response(data=data)
+    
     # 计算总数
-    total = len(db.exec(query).all())
+    total = (await db.exec(select(func.count(TaskLog.id)).where(*conditions))).one()
     
     # 分页
+    order = (TaskLog.start_time.desc(), TaskLog.id.desc())
     offset = (page - 1) * page_size
-    reports = db.exec(query.offset(offset).limit(page_size)).all()
-    
-    # 构建响应数据（包含关联的脚本和设备名称）
-    items = []
-    for report in reports:
-        item = report.model_dump()
-        if report.script_id:
-            script = db.get(Script, report.script_id)
-            item["script_name"] = script.name if script else None
-        if report.device_id:
-            device = db.get(Device, report.device_id)
-            item["device_name"] = device.model if device else None
-        items.append(item)
+    reports = list((await db.exec(query.order_by(*order).offset(offset).limit(page_size))).all())
+    
+    # 合并归档库
+    if segments:
+        archived_total, archived = await asyncio.to_thread(
+            data_archiver.page, segments, archive_query.order_by(*order),
+            max(0, offset - total), page_size - len(reports)
+        )
+        total += archived_total
+        reports.extend(archived)
     
     return Response(data={
-        "items": items,
+        "items": await _report_items(db, reports),
         "total": total,
         "page": page,
         "page_size": page_size,
@@ -75,12 +143,35 @@ async def get_reports(
     })
 
 
+async def _report_items(db: AsyncSession, rows: List) -> List[dict]:
+    """查询结果转换为响应数据，归档库中的记录从热库补充脚本和设备名称（各一次 IN 查询）"""
+    items = [dict(row._mapping) for row in rows]
+    archived = [item for item in items if "script_name" not in item]
+    if archived:
+        script_ids = {item["script_id"] for item in archived if item["script_id"]}
+        device_ids = {item["device_id"] for item in archived if item["device_id"]}
+        scripts = dict((await db.exec(select(Script.id, Script.name).where(Script.id.in_(script_ids)))).all())
+        devices = dict((await db.exec(select(Device.id, Device.model).where(Device.id.in_(device_ids)))).all())
+        for item in archived:
+            item["script_name"] = scripts.get(item["script_id"])
+            item["device_name"] = devices.get(item["device_id"])
+    return items
+
+
+async def _archive_segments(db: AsyncSession) -> list:
+    return await db.run_sync(lambda session: data_archiver.segments(session, "task_log", newest_first=True))
+
+
 @router.get("/{report_id}", response_model=Response[TaskLog])
-async def get_report_detail(report_id: int, db: Session = Depends(get_session)):
-    """获取报告详情"""
-    report = db.get(TaskLog, report_id)
+async def get_report_detail(report_id: int, db: AsyncSession = Depends(get_async_session)):
+    """获取报告详情（热库中没有时到归档库中查找）"""
+    report = await db.get(TaskLog, report_id)
     if not report:
-        raise HTTPException(status_code=404, detail="报告不存在")
+        segments = await _archive_segments(db)
+        archived = await asyncio.to_thread(data_archiver.lookup, segments, TaskLog, [report_id])
+        if not archived:
+            raise HTTPException(status_code=404, detail="报告不存在")
+        report = archived[0]
     return Response(data=report)
 
 
@@ -89,7 +180,7 @@ async def batch_delete_reports(
     status: Optional[str] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    db: Session = Depends(get_session)
+    db: AsyncSession = Depends(get_async_session)
 ):
     """批量删除报告"""
     # 至少需要一个删除条件
@@ -117,7 +208,7 @@ async def batch_delete_reports(
             raise HTTPException(status_code=400, detail="结束日期格式无效")
     
     # 获取要删除的报告
-    reports_to_delete = db.exec(query).all()
+    reports_to_delete = (await db.exec(query)).all()
     
     if not reports_to_delete:
         return Response(message="没有符合条件的报告需要删除", data={"deleted_count": 0})
@@ -125,10 +216,10 @@ async def batch_delete_reports(
     # 批量删除
     deleted_count = 0
     for report in reports_to_delete:
-        db.delete(report)
+        await db.delete(report)
         deleted_count += 1
     
-    db.commit()
+    await db.commit()
     
     return Response(
         message=f"成功删除 {deleted_count} 条报告",
@@ -137,14 +228,22 @@ async def batch_delete_reports(
 
 
 @router.delete("/{report_id}", response_model=Response)
-async def delete_report(report_id: int, db: Session = Depends(get_session)):
-    """删除报告"""
-    report = db.get(TaskLog, report_id)
+async def delete_report(report_id: int, db: AsyncSession = Depends(get_async_session)):
+    """删除报告（已归档的报告从归档库中删除，同时删除其失败分析和步骤日志）"""
+    report = await db.get(TaskLog, report_id)
     if not report:
-        raise HTTPException(status_code=404, detail="报告不存在")
+        segments = await _archive_segments(db)
+        segment = await asyncio.to_thread(data_archiver.remove, segments, "task_log", report_id)
+        if segment is None:
+            raise HTTPException(status_code=404, detail="报告不存在")
+        segment = await db.get(ArchiveSegment, segment.id)
+        segment.row_count -= 1
+        db.add(segment)
+        await db.commit()
+        return Response(message="报告删除成功")
     
-    db.delete(report)
-    db.commit()
+    await db.delete(report)
+    await db.commit()
     
     return Response(message="报告删除成功")
 
@@ -7,6 +7,7 @@ from app.core.database import get_session
 from app.models import ScheduledTask, Script, Device, ActivityLog
 from app.schemas.common import Response, PageResponse
 from app.services.scheduler_service import scheduler_service
+from app.core.metrics import task_queue_depth, tasks_running, tasks_finished
 from pydantic import BaseModel
 from typing import Optional
 from datetime import datetime
@@ -272,6 +273,9 @@ async def execute_scheduled_task(
     
     async def execute_task_background():
         executor = TaskExecutor()
+        task_queue_depth.dec()
+        tasks_running.inc()
+        status = "failed"
         
         try:
             # 根据脚本类型执行不同逻辑
@@ -292,6 +296,7 @@ async def execute_scheduled_task(
                 )
             else:
                 raise Exception(f"不支持的脚本类型: {script.type}")
+            status = result["status"]
             
             # 更新任务日志
             with Session(engine) as db_session:
@@ -356,7 +361,12 @@ async def execute_scheduled_task(
                         db_session.add(device_update)
                         db_session.commit()
     
+        finally:
+            tasks_running.dec()
+            tasks_finished.inc(status=status)
+    
     # 启动后台任务
+    task_queue_depth.inc()
     asyncio.create_task(execute_task_background())
     
     logger.info(f"✅ 定时任务已创建: {task.name} (ID: {task_log.id})")
@@ -3,10 +3,12 @@
 """
 from fastapi import APIRouter, Depends, HTTPException
 from sqlmodel import Session, select, func
-from typing import Optional
+from typing import Optional, Union
+from app.core.config import settings
 from app.core.database import get_session
 from app.models.script import Script
-from app.schemas.common import Response, PaginatedResponse
+from app.schemas.common import Response, PaginatedResponse, CursorPageResponse
+from app.utils.pagination import keyset, keyset_page, capped_count, approximate_total
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/scripts", tags=["脚本管理"])
@@ -35,16 +37,23 @@ class ScriptUpdate(BaseModel):
     is_active: Optional[bool] = None
 
 
-@router.get("", response_model=Response[PaginatedResponse])
+@router.get("", response_model=Response[Union[PaginatedResponse, CursorPageResponse]])
 async def get_scripts(
     type: Optional[str] = None,
     category: Optional[str] = None,
     keyword: Optional[str] = None,
     page: int = 1,
     page_size: int = 10,
+    cursor: Optional[str] = None,
+    include_total: bool = False,
     db: Session = Depends(get_session)
 ):
-    """获取脚本列表"""
+    """
+    获取脚本列表
+    
+    传 cursor 时（首页传空字符串）按 (created_at, id) 游标分页，include_total=true 时附带近似总数；
+    不传 cursor 时为旧的 page/page_size 分页（按更新时间倒序）
+    """
     query = select(Script).where(Script.is_active == True)
     
     if type:
@@ -54,6 +63,18 @@ async def get_scripts(
     if keyword:
         query = query.where(Script.name.contains(keyword))
     
+    if cursor is not None:
+        keys = (Script.created_at, Script.id)
+        try:
+            statement = keyset(query, keys, cursor, page_size)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        data = keyset_page(db.exec(statement).all(), keys, page_size)
+        if include_total:
+            count = db.exec(capped_count(query, settings.PAGINATION_COUNT_CAP)).one()
+            data.update(approximate_total(count, settings.PAGINATION_COUNT_CAP))
+        return Response(data=data)
+    
     # 优化：使用count查询计算总数
     count_query = select(func.count(Script.id)).where(Script.is_active == True)
     if type:
@@ -3,14 +3,18 @@
 """
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
 from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 from datetime import datetime
-from typing import Optional
-from app.core.database import get_session
+from typing import Optional, List
+from app.core.config import settings
+from app.core.database import get_async_session
 from app.models.task_log import TaskLog
 from app.models.script import Script
 from app.models.device import Device
 from app.schemas.common import Response
 from app.services.task_executor import TaskExecutor
+from app.utils.pagination import keyset, keyset_page, capped_count, approximate_total
+from app.core.metrics import task_queue_depth, tasks_running, tasks_finished
 from pydantic import BaseModel
 import asyncio
 
@@ -24,30 +28,70 @@ class TaskExecute(BaseModel):
     device_id: int
 
 
+class TaskRerun(BaseModel):
+    """重跑任务请求模型"""
+    mode: str = "resume"  # resume: 从失败步骤续跑; full: 从头重跑
+
+
+class BatchTaskRerun(BaseModel):
+    """批量重跑请求模型（只重跑其中失败的任务）"""
+    task_log_ids: List[int]
+    mode: str = "resume"
+
+
 @router.post("/execute", response_model=Response)
 async def execute_task(
     task_data: TaskExecute, 
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_session)
+    db: AsyncSession = Depends(get_async_session)
 ):
     """执行脚本(支持实时推送)"""
     # 验证脚本和设备是否存在
-    script = db.get(Script, task_data.script_id)
+    script = await db.get(Script, task_data.script_id)
     if not script or not script.is_active:
         raise HTTPException(status_code=404, detail="脚本不存在")
     
-    device = db.get(Device, task_data.device_id)
+    device = await db.get(Device, task_data.device_id)
     if not device:
         raise HTTPException(status_code=404, detail="设备不存在")
     
     if device.status != "online":
         raise HTTPException(status_code=400, detail="设备离线或忙碌")
     
+    task_log = await db.run_sync(_start_task, background_tasks, task_data.task_name, script, device)
+    
+    return Response(
+        message="任务已开始执行",
+        data={"task_log_id": task_log.id, "status": "running"}
+    )
+
+
+def _load_steps(script: Script) -> list:
+    """解析脚本的可视化步骤"""
+    steps = []
+    if script.steps_json:
+        import json
+        try:
+            steps = json.loads(script.steps_json)
+        except:
+            steps = []
+    return steps
+
+
+def _start_task(
+    db: Session,
+    background_tasks: BackgroundTasks,
+    task_name: str,
+    script: Script,
+    device: Device,
+    start_step: int = 1
+) -> TaskLog:
+    """创建任务日志、占用设备并在后台开始执行"""
     # 创建任务日志
     task_log = TaskLog(
-        task_name=task_data.task_name,
-        script_id=task_data.script_id,
-        device_id=task_data.device_id,
+        task_name=task_name,
+        script_id=script.id,
+        device_id=device.id,
         status="running",
         start_time=datetime.now()
     )
@@ -60,48 +104,43 @@ async def execute_task(
     db.commit()
     db.refresh(task_log)
     
-    # 获取脚本步骤
-    steps = []
-    if script.steps_json:
-        import json
-        try:
-            steps = json.loads(script.steps_json)
-        except:
-            steps = []
-    
     # 在后台执行任务
+    task_queue_depth.inc()
     background_tasks.add_task(
         execute_task_background,
         task_log.id,
-        task_data.script_id,
-        task_data.device_id,
-        steps
+        script.id,
+        device.id,
+        _load_steps(script),
+        start_step
     )
     
-    print(f"✅ 任务已创建: {task_data.task_name} (ID: {task_log.id})")
+    print(f"✅ 任务已创建: {task_name} (ID: {task_log.id})")
     
-    return Response(
-        message="任务已开始执行",
-        data={"task_log_id": task_log.id, "status": "running"}
-    )
+    return task_log
 
 
 async def execute_task_background(
     task_log_id: int,
     script_id: int,
     device_id: int,
-    steps: list
+    steps: list,
+    start_step: int = 1
 ):
     """后台执行任务"""
-    from app.core.database import engine
+    from app.core.database import engine, async_engine
+    from app.core.write_queue import write_queue
     from app.services.failure_service import FailureService
     
     executor = TaskExecutor()
+    task_queue_depth.dec()
+    tasks_running.inc()
+    status = "failed"
     
     try:
         # 获取脚本详情
-        with Session(engine) as db:
-            script = db.get(Script, script_id)
+        async with AsyncSession(async_engine) as db:
+            script = await db.get(Script, script_id)
             if not script:
                 raise Exception("脚本不存在")
         
@@ -112,7 +151,8 @@ async def execute_task_background(
                 task_id=task_log_id,
                 script_id=script_id,
                 device_id=device_id,
-                steps=steps
+                steps=steps,
+                start_step=start_step
             )
         elif script.type in ["python", "batch"]:
             # Python/批处理脚本：执行文件内容
@@ -123,63 +163,68 @@ async def execute_task_background(
             )
         else:
             raise Exception(f"不支持的脚本类型: {script.type}")
+        status = result["status"]
         
-        # 更新任务日志
-        with Session(engine) as db:
-            task_log = db.get(TaskLog, task_log_id)
-            if task_log:
-                task_log.status = result["status"]
-                task_log.end_time = datetime.now()
-                if result["status"] == "failed":
-                    task_log.error_message = result.get("message", "执行失败")
-                
-                # 计算执行时长
-                if task_log.start_time and task_log.end_time:
-                    duration = (task_log.end_time - task_log.start_time).total_seconds()
-                    task_log.duration = int(duration)
-                
-                db.add(task_log)
-                db.commit()
-                
-                # 如果失败，自动分析
-                if result["status"] == "failed":
-                    print(f"🔍 开始分析失败原因...")
+        # 更新任务日志并恢复设备状态（经写入队列，与其他任务的完成写入合并提交）
+        found = await write_queue.run(
+            lambda db: _finish_task_log(db, task_log_id, device_id, result["status"], result.get("message", "执行失败"))
+        )
+        if found:
+            # 如果失败，自动分析
+            if result["status"] == "failed":
+                print(f"🔍 开始分析失败原因...")
+                with Session(engine) as db:
                     failure_service = FailureService(db)
                     await failure_service.analyze_task_failure(task_log_id)
                 
-                # 恢复设备状态
-                device = db.get(Device, device_id)
-                if device:
-                    device.status = "online"
-                    db.add(device)
-                    db.commit()
-                
-                print(f"✅ 任务完成: {task_log_id}, 状态: {result['status']}")
+            print(f"✅ 任务完成: {task_log_id}, 状态: {result['status']}")
     
     except Exception as e:
         print(f"❌ 任务执行异常: {task_log_id}, 错误: {e}")
         
         # 更新失败状态
-        with Session(engine) as db:
-            task_log = db.get(TaskLog, task_log_id)
-            if task_log:
-                task_log.status = "failed"
-                task_log.end_time = datetime.now()
-                task_log.error_message = str(e)
-                db.add(task_log)
-                db.commit()
-                
-                # 自动分析失败
+        error_message = str(e)
+        found = await write_queue.run(
+            lambda db: _finish_task_log(db, task_log_id, device_id, "failed", error_message)
+        )
+        if found:
+            # 自动分析失败
+            with Session(engine) as db:
                 failure_service = FailureService(db)
                 await failure_service.analyze_task_failure(task_log_id)
-                
-                # 恢复设备状态
-                device = db.get(Device, device_id)
-                if device:
-                    device.status = "online"
-                    db.add(device)
-                    db.commit()
 
+    finally:
+        tasks_running.dec()
+        tasks_finished.inc(status=status)
+
+
+def _finish_task_log(db: Session, task_log_id: int, device_id: int, status: str, error_message: str) -> bool:
+    """
+    写入任务结束状态并恢复设备为在线（在写入队列中执行，不提交）
+    
+    Returns:
+        任务日志是否存在
+    """
+    task_log = db.get(TaskLog, task_log_id)
+    if not task_log:
+        return False
+    
+    task_log.status = status
+    task_log.end_time = datetime.now()
+    if status == "failed":
+        task_log.error_message = error_message
+    
+    # 计算执行时长
+    if task_log.start_time and task_log.end_time:
+        duration = (task_log.end_time - task_log.start_time).total_seconds()
+        task_log.duration = int(duration)
+    db.add(task_log)
+    
+    device = db.get(Device, device_id)
+    if device:
+        device.status = "online"
+        db.add(device)
+    return True
 
 
 @router.get("", response_model=Response)
@@ -187,9 +232,16 @@ async def get_task_logs_list(
     status: Optional[str] = None,
     page: int = 1,
     page_size: int = 20,
-    db: Session = Depends(get_session)
+    cursor: Optional[str] = None,
+    include_total: bool = False,
+    db: AsyncSession = Depends(get_async_session)
 ):
-    """获取任务日志列表"""
+    """
+    获取任务日志列表
+    
+    传 cursor 时（首页传空字符串）按 (start_time, id) 游标分页，include_total=true 时附带近似总数；
+    不传 cursor 时为旧的 page/page_size 分页
+    """
     from sqlmodel import select, func
     
     query = select(TaskLog)
@@ -197,16 +249,28 @@ async def get_task_logs_list(
     if status:
         query = query.where(TaskLog.status == status)
     
+    if cursor is not None:
+        keys = (TaskLog.start_time, TaskLog.id)
+        try:
+            statement = keyset(query, keys, cursor, page_size)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        data = keyset_page((await db.exec(statement)).all(), keys, page_size)
+        if include_total:
+            count = (await db.exec(capped_count(query, settings.PAGINATION_COUNT_CAP))).one()
+            data.update(approximate_total(count, settings.PAGINATION_COUNT_CAP))
+        return Response(data=data)
+    
     # 计算总数
     count_query = select(func.count(TaskLog.id))
     if status:
         count_query = count_query.where(TaskLog.status == status)
-    total = db.exec(count_query).one()
+    total = (await db.exec(count_query)).one()
     
     # 分页查询，按开始时间倒序
     offset = (page - 1) * page_size
     query = query.order_by(TaskLog.start_time.desc()).offset(offset).limit(page_size)
-    task_logs = db.exec(query).all()
+    task_logs = (await db.exec(query)).all()
     
     return Response(data={
         "items": task_logs,
@@ -217,19 +281,114 @@ async def get_task_logs_list(
     })
 
 
+def _resolve_start_step(db: Session, task_log: TaskLog, script: Script, mode: str) -> int:
+    """计算重跑的起始步骤：续跑模式下使用步骤检查点，仅可视化脚本支持"""
+    if mode != "resume" or script.type != "visual":
+        return 1
+    
+    from app.services.step_telemetry import get_resume_step
+    return get_resume_step(db, task_log.id) or 1
+
+
+@router.post("/rerun-failed", response_model=Response)
+async def rerun_failed_tasks(
+    rerun_data: BatchTaskRerun,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_session)
+):
+    """批量重跑：只重跑列表中失败的任务，可视化脚本从失败步骤续跑"""
+    if rerun_data.mode not in ("resume", "full"):
+        raise HTTPException(status_code=400, detail="重跑模式无效")
+    
+    rerun_tasks = []
+    skipped = []
+    for task_log_id in rerun_data.task_log_ids:
+        task_log = await db.get(TaskLog, task_log_id)
+        if not task_log or task_log.status != "failed":
+            skipped.append({"task_log_id": task_log_id, "reason": "任务不存在或未失败"})
+            continue
+        
+        script = await db.get(Script, task_log.script_id) if task_log.script_id else None
+        device = await db.get(Device, task_log.device_id) if task_log.device_id else None
+        if not script or not script.is_active or not device:
+            skipped.append({"task_log_id": task_log_id, "reason": "脚本或设备不存在"})
+            continue
+        if device.status != "online":
+            skipped.append({"task_log_id": task_log_id, "reason": "设备离线或忙碌"})
+            continue
+        
+        start_step = await db.run_sync(_resolve_start_step, task_log, script, rerun_data.mode)
+        new_task_log = await db.run_sync(
+            _start_task, background_tasks, f"{task_log.task_name} (重跑)", script, device, start_step
+        )
+        rerun_tasks.append({
+            "task_log_id": new_task_log.id,
+            "rerun_of": task_log_id,
+            "start_step": start_step
+        })
+    
+    return Response(
+        message=f"已重跑 {len(rerun_tasks)} 个失败任务，跳过 {len(skipped)} 个",
+        data={"tasks": rerun_tasks, "skipped": skipped}
+    )
+
+
+@router.post("/{task_log_id}/rerun", response_model=Response)
+async def rerun_task(
+    task_log_id: int,
+    rerun_data: TaskRerun,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_session)
+):
+    """重跑任务：resume 模式先执行 setup 步骤恢复应用状态，再从失败步骤继续"""
+    if rerun_data.mode not in ("resume", "full"):
+        raise HTTPException(status_code=400, detail="重跑模式无效")
+    
+    task_log = await db.get(TaskLog, task_log_id)
+    if not task_log:
+        raise HTTPException(status_code=404, detail="任务日志不存在")
+    if task_log.status == "running":
+        raise HTTPException(status_code=400, detail="任务仍在运行中")
+    
+    script = await db.get(Script, task_log.script_id) if task_log.script_id else None
+    if not script or not script.is_active:
+        raise HTTPException(status_code=404, detail="脚本不存在")
+    
+    device = await db.get(Device, task_log.device_id) if task_log.device_id else None
+    if not device:
+        raise HTTPException(status_code=404, detail="设备不存在")
+    if device.status != "online":
+        raise HTTPException(status_code=400, detail="设备离线或忙碌")
+    
+    start_step = await db.run_sync(_resolve_start_step, task_log, script, rerun_data.mode)
+    new_task_log = await db.run_sync(
+        _start_task, background_tasks, f"{task_log.task_name} (重跑)", script, device, start_step
+    )
+    
+    return Response(
+        message="任务已开始重跑" if start_step <= 1 else f"任务已从第 {start_step} 步开始续跑",
+        data={
+            "task_log_id": new_task_log.id,
+            "rerun_of": task_log_id,
+            "start_step": start_step,
+            "status": "running"
+        }
+    )
+
+
 @router.get("/{task_log_id}/logs", response_model=Response[TaskLog])
-async def get_task_logs(task_log_id: int, db: Session = Depends(get_session)):
+async def get_task_logs(task_log_id: int, db: AsyncSession = Depends(get_async_session)):
     """获取任务执行日志"""
-    task_log = db.get(TaskLog, task_log_id)
+    task_log = await db.get(TaskLog, task_log_id)
     if not task_log:
         raise HTTPException(status_code=404, detail="任务日志不存在")
     return Response(data=task_log)
 
 
 @router.post("/{task_log_id}/stop", response_model=Response)
-async def stop_task(task_log_id: int, db: Session = Depends(get_session)):
+async def stop_task(task_log_id: int, db: AsyncSession = Depends(get_async_session)):
     """停止任务执行"""
-    task_log = db.get(TaskLog, task_log_id)
+    task_log = await db.get(TaskLog, task_log_id)
     if not task_log:
         raise HTTPException(status_code=404, detail="任务日志不存在")
     
@@ -244,12 +403,12 @@ async def stop_task(task_log_id: int, db: Session = Depends(get_session)):
     
     # 更新设备状态
     if task_log.device_id:
-        device = db.get(Device, task_log.device_id)
+        device = await db.get(Device, task_log.device_id)
         if device:
             device.status = "online"
             db.add(device)
     
-    db.commit()
+    await db.commit()
     
     # TODO: 预留接口：停止正在执行的脚本进程
     print(f"[INFO] 停止任务: {task_log_id}")
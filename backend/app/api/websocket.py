@@ -1,55 +1,115 @@
 """
 WebSocket API 路由
 """
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from typing import Optional
+from fastapi import APIRouter, Query, WebSocket, WebSocketDisconnect
 from app.core.websocket_manager import manager
-import json
+from app.core.ws_codec import get_codec
+from app.schemas.common import Response
 
 router = APIRouter()
 
 
 @router.websocket("/ws/{client_id}")
-async def websocket_endpoint(websocket: WebSocket, client_id: str):
+async def websocket_endpoint(
+    websocket: WebSocket,
+    client_id: str,
+    encoding: Optional[str] = Query(None, description="消息编码: json(默认) / msgpack")
+):
     """WebSocket 连接端点"""
-    await manager.connect(websocket, client_id)
+    codec = get_codec(encoding)
+    connection = await manager.connect(websocket, client_id, codec)
+    # 连接确认带上实际使用的编码：请求的编码不支持时客户端据此按 JSON 解析
+    await manager.send_personal_message(client_id, {
+        "type": "connected",
+        "client_id": client_id,
+        "encoding": codec.name,
+        "message": "WebSocket 连接成功"
+    })
     
     try:
         while True:
-            # 接收客户端消息
-            data = await websocket.receive_text()
-            message = json.loads(data)
+            # 接收客户端消息（JSON 文本帧，msgpack 连接也可以发送二进制帧）
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            data = frame.get("text")
+            if data is None:
+                data = frame.get("bytes")
+            message = codec.decode(data)
             
             # 处理订阅请求
             if message.get("type") == "subscribe":
                 task_id = message.get("task_id")
+                topic = message.get("topic")
                 if task_id:
-                    manager.subscribe_task(task_id, client_id)
-                    await websocket.send_text(json.dumps({
+                    batch = bool(message.get("batch"))
+                    since_seq = message.get("since_seq")
+                    ack = {
                         "type": "subscribed",
                         "task_id": task_id,
+                        "last_seq": manager.task_events.last_seq(task_id),
                         "message": f"已订阅任务 {task_id}"
-                    }))
+                    }
+                    if since_seq is not None:
+                        # 先确认订阅，再重放 seq > since_seq 的事件
+                        await manager.send_personal_message(client_id, ack)
+                        await manager.subscribe_task_since(
+                            task_id, client_id, int(since_seq), batch=batch
+                        )
+                    else:
+                        # batch=true 的客户端接收合并后的 task_update_batch 帧
+                        manager.subscribe_task(task_id, client_id, batch=batch)
+                        await manager.send_personal_message(client_id, ack)
+                elif topic or message.get("topics"):
+                    # 主题订阅，支持通配符，如 task:* 订阅所有任务、device:* 接收所有设备告警
+                    # 设备事件主题: device:{id}、group:{分组名}、severity:{级别}
+                    topics = message.get("topics") or [topic]
+                    for item in topics:
+                        manager.subscribe(item, client_id, batch=bool(message.get("batch")))
+                    await manager.send_personal_message(client_id, {
+                        "type": "subscribed",
+                        "topic": topic,
+                        "topics": topics,
+                        "message": f"已订阅 {', '.join(topics)}"
+                    })
             
             # 处理取消订阅
             elif message.get("type") == "unsubscribe":
                 task_id = message.get("task_id")
-                if task_id and task_id in manager.task_subscribers:
-                    if client_id in manager.task_subscribers[task_id]:
-                        manager.task_subscribers[task_id].remove(client_id)
-                        await websocket.send_text(json.dumps({
+                topic = message.get("topic")
+                if task_id and manager.unsubscribe_task(task_id, client_id):
+                    await manager.send_personal_message(client_id, {
+                        "type": "unsubscribed",
+                        "task_id": task_id
+                    })
+                elif topic or message.get("topics"):
+                    topics = [
+                        item for item in (message.get("topics") or [topic])
+                        if manager.unsubscribe(item, client_id)
+                    ]
+                    if topics:
+                        await manager.send_personal_message(client_id, {
                             "type": "unsubscribed",
-                            "task_id": task_id
-                        }))
+                            "topic": topic,
+                            "topics": topics
+                        })
             
             # 处理心跳
             elif message.get("type") == "ping":
-                await websocket.send_text(json.dumps({
+                await manager.send_personal_message(client_id, {
                     "type": "pong",
                     "timestamp": message.get("timestamp")
-                }))
+                })
     
     except WebSocketDisconnect:
-        manager.disconnect(client_id)
+        manager.disconnect(client_id, connection)
     except Exception as e:
         print(f"❌ WebSocket 错误: {e}")
-        manager.disconnect(client_id)
+        manager.disconnect(client_id, connection)
+
+
+@router.get("/ws/stats", response_model=Response)
+async def get_websocket_stats():
+    """获取 WebSocket 连接和发送队列指标（队列深度、滞后、丢弃数）"""
+    return Response(data=manager.get_stats())
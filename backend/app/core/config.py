@@ -10,6 +10,8 @@ class Settings(BaseSettings):
     
     # 数据库配置
     DATABASE_URL: str = "sqlite:///./test_platform.db"
+    ASYNC_DATABASE_URL: str = ""  # 异步路由使用的连接串，为空时由 SQLite 的 DATABASE_URL 推导(sqlite+aiosqlite)
+    PAGINATION_COUNT_CAP: int = 10000  # 游标分页 include_total 时最多计数的记录数，超过时返回近似总数
     
     # 服务器配置
     HOST: str = "0.0.0.0"
@@ -22,6 +24,64 @@ class Settings(BaseSettings):
     # 日志配置
     LOG_LEVEL: str = "INFO"
     
+    # WebSocket 推送配置
+    WS_FLUSH_INTERVAL_MS: int = 100  # 任务更新合并发送的时间窗口(毫秒)
+    WS_FLUSH_MAX_MESSAGES: int = 50  # 缓冲消息数达到该值时立即发送
+    WS_TASK_BUFFER_SIZE: int = 1000  # 每个任务缓冲的最大日志条数(环形缓冲)
+    WS_SEND_QUEUE_SIZE: int = 500  # 每个连接的发送队列上限，满后先丢debug日志，再断开慢客户端
+    WS_PER_MESSAGE_DEFLATE: bool = True  # 启用 permessage-deflate 压缩(客户端支持时协商)
+    WS_REPLAY_BUFFER_SIZE: int = 500  # 每个任务在内存中保留的可重放事件数，更早的写入事件日志文件
+    TASK_EVENT_LOG_DIR: str = "./logs/task_events"  # 任务事件日志目录(用于 since_seq 重放)
+    TASK_EVENT_IDLE_TTL: int = 3600  # 未结束任务超过该秒数没有新事件时移出内存(只能从事件日志文件重放)
+    
+    # 多进程部署配置
+    EVENT_BUS_URL: str = ""  # 跨 worker 事件总线，为空时单进程；多 worker 时设为 redis://localhost:6379/0
+    SCHEDULER_LOCK_FILE: str = "./logs/scheduler.lock"  # 调度器选主锁文件，只有持锁的 worker 运行调度器
+    
+    # SQLite 性能配置
+    SQLITE_TUNED: bool = True  # 启用 WAL 和下列 PRAGMA，读写互不阻塞
+    SQLITE_SYNCHRONOUS: str = "NORMAL"  # WAL 下 NORMAL 只在检查点 fsync，断电最多丢失最近的提交，不会损坏数据库
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000  # 遇到写锁时等待的毫秒数，超时才报 database is locked
+    SQLITE_CACHE_SIZE_MB: int = 64  # 每个连接的页缓存
+    SQLITE_MMAP_SIZE_MB: int = 256  # 内存映射读取的上限，0 表示关闭
+    DB_WRITE_QUEUE_MAX_BATCH: int = 200  # 写入队列每个事务最多合并的写操作数
+    DB_WRITE_QUEUE_MAX_DELAY_MS: int = 0  # 收到第一个写操作后额外等待的毫秒数；0 表示只合并上一批提交期间排队的写操作
+    
+    # 设备健康度采集配置
+    HEALTH_COLLECT_CONCURRENCY: int = 16  # 同时探测的设备数(adb 调用线程数)
+    HEALTH_CYCLE_DEADLINE_SECONDS: int = 240  # 单轮采集的截止时间，未完成的设备下一轮优先采集
+    HEALTH_ADB_TIMEOUT_SECONDS: float = 5  # 采集时单条 adb 命令的超时时间
+    HEALTH_PROBE_TIMEOUT_SECONDS: float = 20  # 单个设备一次探测(全部 adb 命令)的总时间上限，超时放弃该设备
+    HEALTH_MAX_DEVICES_PER_CYCLE: int = 0  # 单轮最多采集的设备数，0 表示不限制；超出的设备轮转到后续轮次
+    HEALTH_SAMPLE_INTERVAL_SECONDS: int = 300  # 基准采集间隔；探测预算 = 在线设备数 / 基准间隔
+    HEALTH_ADAPTIVE_SAMPLING: bool = True  # 按设备状态自适应调整采集间隔，关闭时所有设备按基准间隔采集
+    HEALTH_SAMPLE_MIN_INTERVAL_SECONDS: int = 60  # 高温、高负载、健康度下降设备的最短采集间隔
+    HEALTH_SAMPLE_MAX_INTERVAL_SECONDS: int = 900  # 稳定空闲设备的最长采集间隔
+    
+    # 设备健康度聚合与保留配置（天数为 0 表示永久保留）
+    HEALTH_ROLLUP_INTERVAL_MINUTES: int = 10  # 聚合任务执行间隔
+    HEALTH_ROLLUP_GRACE_MINUTES: int = 15  # 时间桶结束后的宽限期，期间每次聚合都重新计算以收录延迟提交的记录(应大于聚合间隔)
+    HEALTH_RAW_RETENTION_DAYS: int = 7  # 原始健康记录保留天数，已聚合且过期的原始记录会被删除
+    HEALTH_ROLLUP_1M_RETENTION_DAYS: int = 14  # 1分钟聚合保留天数
+    HEALTH_ROLLUP_1H_RETENTION_DAYS: int = 180  # 1小时聚合保留天数
+    HEALTH_ROLLUP_1D_RETENTION_DAYS: int = 0  # 1天聚合保留天数
+    
+    # 冷数据归档配置（早于截止时间的记录按月移入 ARCHIVE_DIR 下的归档库，天数为 0 表示不归档）
+    ARCHIVE_DIR: str = "./archive"  # 归档库目录，每月一个 archive_YYYY_MM.db
+    ARCHIVE_TASK_LOG_DAYS: int = 365  # 开始时间早于该天数的任务日志移入归档库
+    ARCHIVE_HEALTH_RECORD_DAYS: int = 90  # 早于该天数且已聚合的原始健康记录移入归档库（原始记录保留期短于该值时不会产生归档）
+    ARCHIVE_INTERVAL_HOURS: int = 24  # 归档任务执行间隔
+    ARCHIVE_BATCH_SIZE: int = 5000  # 每批移动的记录数
+    
+    # 设备指标异常检测配置（每个设备每个指标的 EWMA 基线）
+    ANOMALY_DETECTION_ENABLED: bool = True  # 是否启用异常检测
+    ANOMALY_EWMA_HALFLIFE_HOURS: float = 72  # 基线半衰期，越长基线越接近过去一周的水平
+    ANOMALY_Z_THRESHOLD: float = 4.0  # 偏离基线的标准差倍数
+    ANOMALY_MIN_SAMPLES: int = 30  # 基线至少学习的样本数，之前不报警
+    ANOMALY_CONSECUTIVE_SAMPLES: int = 3  # 连续异常的样本数，达到后产生告警
+    ANOMALY_STATE_FILE: str = "./logs/anomaly_state.json"  # 基线快照文件，重启后恢复
+    ANOMALY_SNAPSHOT_INTERVAL_MINUTES: int = 10  # 基线快照间隔
+    
     # API 配置
     API_V1_PREFIX: str = "/api/v1"
     PROJECT_NAME: str = "手机自动化测试平台"
@@ -1,24 +1,91 @@
 """
 数据库连接和会话管理
 """
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlmodel import SQLModel, create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 from app.core.config import settings
+from app.core.metrics import instrument_engine
+from app.core.migrations import run_migrations
 import logging
 
 logger = logging.getLogger(__name__)
 
-# 创建数据库引擎
+# SQLite 需要 check_same_thread=False；timeout 即 busy_timeout，遇到写锁时等待而不是立即失败
+SQLITE_CONNECT_ARGS = {
+    "check_same_thread": False,
+    "timeout": settings.SQLITE_BUSY_TIMEOUT_MS / 1000
+}
+
+
+def is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def configure_sqlite(dbapi_connection, connection_record):
+    """
+    新连接的 SQLite 调优参数（engine connect 事件）
+
+    WAL 让读不阻塞写、写不阻塞读；journal_mode 写入数据库文件，其余参数按连接生效
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+        cursor.execute(f"PRAGMA cache_size={-int(settings.SQLITE_CACHE_SIZE_MB) * 1024}")
+        cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE_MB) * 1024 * 1024}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+
+
+# 创建数据库引擎（SQLite 连接参数和 PRAGMA 只用于 SQLite 连接串，其他驱动不接受）
 engine = create_engine(
     settings.DATABASE_URL,
     echo=False,  # 生产环境设置为 False
-    connect_args={"check_same_thread": False}  # SQLite 需要
+    connect_args=SQLITE_CONNECT_ARGS if is_sqlite(settings.DATABASE_URL) else {}
 )
+if settings.SQLITE_TUNED and is_sqlite(settings.DATABASE_URL):
+    event.listen(engine, "connect", configure_sqlite)
+# 语句耗时计入 /metrics
+instrument_engine(engine)
+
+
+def async_database_url(url: str) -> str:
+    """
+    同步连接串对应的异步驱动连接串（sqlite -> aiosqlite）
+    
+    写入队列、迁移和健康度历史分桶都使用 SQLite 专有的 SQL，其他数据库不自动推导，
+    需要时用 ASYNC_DATABASE_URL 显式指定
+    """
+    if settings.ASYNC_DATABASE_URL:
+        return settings.ASYNC_DATABASE_URL
+    scheme, sep, rest = url.partition("://")
+    if scheme.split("+", 1)[0] == "sqlite":
+        return f"sqlite+aiosqlite{sep}{rest}"
+    return url
+
+
+# 异步数据库引擎：async 路由通过 get_async_session 查询，等待数据库时不阻塞事件循环
+ASYNC_URL = async_database_url(settings.DATABASE_URL)
+async_engine = create_async_engine(
+    ASYNC_URL,
+    echo=False,
+    connect_args=SQLITE_CONNECT_ARGS if is_sqlite(ASYNC_URL) else {}
+)
+if settings.SQLITE_TUNED and is_sqlite(ASYNC_URL):
+    event.listen(async_engine.sync_engine, "connect", configure_sqlite)
+instrument_engine(async_engine.sync_engine)
 
 
 def create_db_and_tables():
     """创建数据库表"""
     try:
         SQLModel.metadata.create_all(engine)
+        run_migrations(engine)
         logger.info("数据库表创建成功")
     except Exception as e:
         logger.error(f"数据库表创建失败: {e}")
@@ -29,3 +96,14 @@ def get_session():
     """获取数据库会话"""
     with Session(engine) as session:
         yield session
+
+
+async def get_async_session():
+    """
+    获取异步数据库会话
+
+    提交后不过期对象，避免在响应序列化时触发同步的延迟加载；
+    复用同步服务代码时使用 await session.run_sync(fn)
+    """
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
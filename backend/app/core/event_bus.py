@@ -0,0 +1,186 @@
+"""
+跨进程事件总线
+多 worker 部署时，把任务更新和广播消息转发给其他 worker 进程，
+使连接在任意 worker 上的客户端都能收到推送
+
+- 默认（EVENT_BUS_URL 为空）：单进程，本地直接投递，不做转发
+- redis://host:port/db：通过 Redis Pub/Sub 在 worker 之间转发（需要安装 redis）
+"""
+from typing import Awaitable, Callable, Optional
+import asyncio
+import json
+import os
+import socket
+import uuid
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+
+# 总线消息处理函数: handler(channel, payload)
+EventHandler = Callable[[str, dict], Awaitable[None]]
+
+# Redis 中使用的频道名
+REDIS_CHANNEL = "adbweb:events"
+
+
+def new_worker_id() -> str:
+    """当前 worker 的唯一标识"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+class InProcessEventBus:
+    """进程内总线（单 worker），本地投递由 ConnectionManager 完成，这里无需转发"""
+    
+    name = "memory"
+    
+    def __init__(self):
+        self.worker_id = new_worker_id()
+    
+    @property
+    def distributed(self) -> bool:
+        return False
+    
+    async def start(self, handler: EventHandler):
+        pass
+    
+    async def publish(self, channel: str, payload: dict):
+        pass
+    
+    def publish_nowait(self, channel: str, payload: dict):
+        pass
+    
+    async def stop(self):
+        pass
+    
+    def get_stats(self) -> dict:
+        return {"backend": self.name, "worker_id": self.worker_id}
+
+
+class RedisEventBus:
+    """
+    Redis Pub/Sub 总线
+    
+    发布只入队，由后台协程按顺序写入 Redis，任务执行器不会被网络往返阻塞；
+    订阅协程收到其他 worker 的消息后交给 handler，自己发布的消息直接忽略。
+    """
+    
+    name = "redis"
+    
+    def __init__(self, url: str = "", client=None, max_pending: int = 10000):
+        """
+        Args:
+            url: Redis 地址
+            client: 已创建的 redis.asyncio 客户端（可选，便于测试替换）
+            max_pending: 待发布消息上限，超出后丢弃并计数
+        """
+        if client is None:
+            if aioredis is None:
+                raise RuntimeError("使用 Redis 事件总线需要安装 redis: pip install redis")
+            client = aioredis.from_url(url)
+        self.client = client
+        self.worker_id = new_worker_id()
+        self.outbox: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self.handler: Optional[EventHandler] = None
+        self.tasks = []
+        # 指标
+        self.published = 0
+        self.received = 0
+        self.dropped = 0
+        self.errors = 0
+    
+    @property
+    def distributed(self) -> bool:
+        return True
+    
+    async def start(self, handler: EventHandler):
+        """启动发布和订阅协程"""
+        self.handler = handler
+        pubsub = self.client.pubsub()
+        await pubsub.subscribe(REDIS_CHANNEL)
+        self.tasks = [
+            asyncio.create_task(self._publish_loop()),
+            asyncio.create_task(self._listen_loop(pubsub)),
+        ]
+        print(f"🔗 事件总线已连接 Redis, worker: {self.worker_id}")
+    
+    async def publish(self, channel: str, payload: dict):
+        """发布消息到其他 worker（入队，不等待网络）"""
+        self.publish_nowait(channel, payload)
+    
+    def publish_nowait(self, channel: str, payload: dict):
+        """同步代码中发布消息"""
+        message = json.dumps({"origin": self.worker_id, "channel": channel, "payload": payload})
+        try:
+            self.outbox.put_nowait(message)
+        except asyncio.QueueFull:
+            self.dropped += 1
+    
+    async def _publish_loop(self):
+        while True:
+            message = await self.outbox.get()
+            try:
+                await self.client.publish(REDIS_CHANNEL, message)
+                self.published += 1
+            except Exception as e:
+                self.errors += 1
+                print(f"⚠️ 事件总线发布失败: {e}")
+                await asyncio.sleep(1)
+    
+    async def _listen_loop(self, pubsub):
+        while True:
+            try:
+                async for item in pubsub.listen():
+                    if item.get("type") != "message":
+                        continue
+                    await self._dispatch(item["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                print(f"⚠️ 事件总线订阅中断, 1 秒后重试: {e}")
+                await asyncio.sleep(1)
+    
+    async def _dispatch(self, data):
+        if isinstance(data, bytes):
+            data = data.decode("utf-8")
+        message = json.loads(data)
+        if message.get("origin") == self.worker_id:
+            return
+        self.received += 1
+        try:
+            await self.handler(message["channel"], message["payload"])
+        except Exception as e:
+            self.errors += 1
+            print(f"⚠️ 处理事件总线消息失败: {e}")
+    
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+        try:
+            await self.client.close()
+        except Exception:
+            pass
+    
+    def get_stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "worker_id": self.worker_id,
+            "pending": self.outbox.qsize(),
+            "published": self.published,
+            "received": self.received,
+            "dropped": self.dropped,
+            "errors": self.errors
+        }
+
+
+def create_event_bus(url: str = ""):
+    """根据 EVENT_BUS_URL 创建事件总线"""
+    if not url or url.startswith("memory://"):
+        return InProcessEventBus()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisEventBus(url)
+    raise ValueError(f"不支持的事件总线地址: {url}")
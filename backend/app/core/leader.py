@@ -0,0 +1,61 @@
+"""
+调度器选主
+多 worker 部署时只允许一个进程运行定时任务和健康度调度器，
+通过对锁文件加非阻塞排他锁实现，持锁进程退出后锁自动释放
+"""
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class LeaderLock:
+    """基于文件锁的选主"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+    
+    @property
+    def is_leader(self) -> bool:
+        return self._file is not None
+    
+    def acquire(self) -> bool:
+        """
+        尝试成为主进程
+        
+        Returns:
+            是否获得锁（不支持文件锁的平台视为单进程，直接返回 True）
+        """
+        if self._file is not None:
+            return True
+        if fcntl is None:
+            self._file = True
+            return True
+        
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        f = open(self.path, "a+")
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        
+        f.seek(0)
+        f.truncate()
+        f.write(str(os.getpid()))
+        f.flush()
+        self._file = f
+        return True
+    
+    def release(self):
+        """释放锁"""
+        f, self._file = self._file, None
+        if f is None or f is True:
+            return
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        finally:
+            f.close()
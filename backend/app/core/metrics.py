@@ -0,0 +1,342 @@
+"""
+OpenMetrics 指标
+热路径只更新内存中的计数，不加锁、不访问数据库：计数器和直方图按线程分片，
+每个线程只写自己的分片，抓取时再汇总；抓取时由 registry.render() 输出 OpenMetrics 文本格式
+"""
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import math
+import threading
+import time
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# 默认直方图分桶(秒)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _ThreadShards:
+    """按线程分片的存储：写入只访问当前线程的 dict，读取时遍历所有分片"""
+    
+    def __init__(self):
+        self._local = threading.local()
+        self._shards: List[dict] = []
+    
+    def local(self) -> dict:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            self._shards.append(shard)  # list.append 在 GIL 下是原子的
+        return shard
+    
+    def snapshot(self) -> List[list]:
+        # list(dict.items()) 在 GIL 下一次完成，不会和写入线程交错
+        return [list(shard.items()) for shard in list(self._shards)]
+
+
+class Metric:
+    """指标基类"""
+    type_name = "unknown"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+    
+    def _key(self, labels: Dict[str, object]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+    
+    def samples(self) -> Iterable[Tuple[str, LabelValues, str, float]]:
+        """(样本名后缀, 标签值, 额外标签, 值)"""
+        return []
+    
+    def render(self) -> List[str]:
+        lines = [
+            f"# TYPE {self.name} {self.type_name}",
+            f"# HELP {self.name} {_escape(self.documentation)}",
+        ]
+        for suffix, values, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_labels(self.labelnames, values, extra)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """单调递增计数器"""
+    type_name = "counter"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._shards = _ThreadShards()
+    
+    def inc(self, amount: float = 1, **labels):
+        shard = self._shards.local()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0) + amount
+    
+    def value(self, **labels) -> float:
+        key = self._key(labels)
+        return sum(dict(items).get(key, 0) for items in self._shards.snapshot())
+    
+    def samples(self):
+        totals: Dict[LabelValues, float] = {}
+        for items in self._shards.snapshot():
+            for key, value in items:
+                totals[key] = totals.get(key, 0) + value
+        for key in sorted(totals):
+            yield "_total", key, "", totals[key]
+
+
+class Gauge(Metric):
+    """
+    可增可减的当前值
+    
+    set() 是单次 dict 赋值；inc()/dec() 只应在事件循环线程中调用。
+    也可以用 set_function() 注册抓取时计算的回调（只读内存状态）
+    """
+    type_name = "gauge"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._function: Optional[Callable[[], Iterable[Tuple[Dict[str, object], float]]]] = None
+    
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+    
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+    
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+    
+    def remove(self, **labels):
+        self._values.pop(self._key(labels), None)
+    
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+    
+    def set_function(self, function: Callable[[], Iterable[Tuple[Dict[str, object], float]]]):
+        """抓取时调用 function()，返回 [(标签, 值)]"""
+        self._function = function
+    
+    def samples(self):
+        if self._function is not None:
+            values = {self._key(labels): value for labels, value in self._function()}
+        else:
+            values = dict(self._values)
+        for key in sorted(values):
+            if values[key] is not None:
+                yield "", key, "", values[key]
+
+
+class Histogram(Metric):
+    """分桶直方图"""
+    type_name = "histogram"
+    
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._shards = _ThreadShards()
+    
+    def observe(self, value: float, **labels):
+        shard = self._shards.local()
+        key = self._key(labels)
+        cell = shard.get(key)
+        if cell is None:
+            # [各分桶计数(非累计)..., 总和, 样本数]
+            cell = shard[key] = [0] * len(self.buckets) + [0.0, 0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                cell[index] += 1
+                break
+        cell[-2] += value
+        cell[-1] += 1
+    
+    @contextmanager
+    def time(self, **labels):
+        """记录代码块耗时（异常时同样记录）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+    
+    def count(self, **labels) -> int:
+        key = self._key(labels)
+        return sum(cell[-1] for items in self._shards.snapshot() for cell_key, cell in items if cell_key == key)
+    
+    def samples(self):
+        totals: Dict[LabelValues, list] = {}
+        for items in self._shards.snapshot():
+            for key, cell in items:
+                total = totals.setdefault(key, [0] * len(cell))
+                for index, value in enumerate(list(cell)):
+                    total[index] += value
+        for key in sorted(totals):
+            total = totals[key]
+            cumulative = 0
+            for index, bound in enumerate(self.buckets):
+                cumulative += total[index]
+                yield "_bucket", key, f'le="{_format_value(bound)}"', cumulative
+            yield "_count", key, "", total[-1]
+            yield "_sum", key, "", total[-2]
+
+
+class MetricsRegistry:
+    """指标注册表"""
+    
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+    
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"指标已注册: {metric.name}")
+        self.metrics[metric.name] = metric
+        return metric
+    
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+    
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+    
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+    
+    def render(self) -> str:
+        """OpenMetrics 文本"""
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# 设备最新一次采样（采集器写入健康记录时更新）
+DEVICE_LABELS = ("device_id", "serial")
+device_health_score = registry.gauge("adbweb_device_health_score", "设备健康度分数 0-100", DEVICE_LABELS)
+device_battery_level = registry.gauge("adbweb_device_battery_level_percent", "设备电量百分比", DEVICE_LABELS)
+device_temperature = registry.gauge("adbweb_device_temperature_celsius", "设备电池温度(摄氏度)", DEVICE_LABELS)
+device_cpu_usage = registry.gauge("adbweb_device_cpu_usage_percent", "设备CPU使用率", DEVICE_LABELS)
+device_memory_usage = registry.gauge("adbweb_device_memory_usage_percent", "设备内存使用率", DEVICE_LABELS)
+
+# 任务执行
+task_queue_depth = registry.gauge("adbweb_task_queue_depth", "已创建、等待后台开始执行的任务数")
+tasks_running = registry.gauge("adbweb_tasks_running", "正在执行的任务数")
+tasks_finished = registry.counter("adbweb_tasks_finished", "已结束的任务数", ("status",))
+
+# WebSocket（抓取时从连接管理器的内存状态读取）
+websocket_connections = registry.gauge("adbweb_websocket_connections", "当前 WebSocket 连接数")
+websocket_client_lag = registry.gauge("adbweb_websocket_client_lag_seconds", "客户端发送队列滞后时间", ("client_id",))
+websocket_client_queue_depth = registry.gauge("adbweb_websocket_client_queue_depth", "客户端发送队列长度", ("client_id",))
+
+# 健康度采集
+health_cycle_duration = registry.histogram(
+    "adbweb_health_cycle_duration_seconds", "健康度采集单轮耗时",
+    buckets=(1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 240.0, 300.0)
+)
+health_cycle_coverage = registry.gauge("adbweb_health_cycle_coverage_ratio", "最近一轮采集覆盖率(成功数/到期设备数)")
+
+# adb 命令耗时（command 为 adb 子命令，如 shell/install/push，不含具体参数）
+adb_command_duration = registry.histogram("adbweb_adb_command_duration_seconds", "adb 命令耗时", ("command",))
+
+# 数据库语句耗时（operation 为语句类型）
+db_query_duration = registry.histogram(
+    "adbweb_db_query_duration_seconds", "数据库语句执行耗时", ("operation",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+)
+
+# 数据库写入队列
+db_write_queue_depth = registry.gauge("adbweb_db_write_queue_depth", "等待写线程执行的写操作数")
+db_write_batch_size = registry.histogram(
+    "adbweb_db_write_batch_size", "写入队列每个事务合并的写操作数",
+    buckets=(1.0, 2.0, 5.0, 10.0, 25.0, 50.0, 100.0, 200.0)
+)
+
+_DB_OPERATIONS = {"select", "insert", "update", "delete", "pragma", "create", "alter", "drop", "with"}
+
+
+def observe_device_health(device_id: int, serial: str, sample: dict) -> None:
+    """
+    更新设备最新采样指标
+    
+    Args:
+        device_id: 设备ID
+        serial: 设备序列号
+        sample: 指标字典（health_score/battery_level/temperature/cpu_usage/memory_usage）
+    """
+    labels = {"device_id": device_id, "serial": serial}
+    for gauge, field in (
+        (device_health_score, "health_score"),
+        (device_battery_level, "battery_level"),
+        (device_temperature, "temperature"),
+        (device_cpu_usage, "cpu_usage"),
+        (device_memory_usage, "memory_usage"),
+    ):
+        value = sample.get(field)
+        if value is None:
+            gauge.remove(**labels)
+        else:
+            gauge.set(value, **labels)
+
+
+def instrument_engine(engine) -> None:
+    """通过 SQLAlchemy 游标事件记录每条语句的耗时"""
+    from sqlalchemy import event
+    
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+    
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_start"].pop()
+        head = statement.lstrip()[:8].split(None, 1)
+        operation = head[0].lower() if head else "other"
+        db_query_duration.observe(
+            time.perf_counter() - started,
+            operation=operation if operation in _DB_OPERATIONS else "other"
+        )
+    
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        # 执行失败时不会触发 after_cursor_execute，丢弃对应的开始时间
+        starts = context.connection.info.get("query_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
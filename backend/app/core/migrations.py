@@ -0,0 +1,134 @@
+"""
+数据库结构迁移
+create_all 只创建缺失的表（新表带有模型中声明的全部列和索引）；已有表的新增列、
+新增或替换的索引、回填数据等变更写成按版本号递增的迁移。
+启动时按顺序执行尚未执行过的迁移，每个迁移一个事务，执行后记录到 schema_migrations 表。
+表和列的检查通过 SQLAlchemy inspect 完成，迁移语句只使用 SQLite 与 PostgreSQL 都支持的语法
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, List
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Migration:
+    """单个迁移"""
+    version: int
+    description: str
+    upgrade: Callable[[Connection], None]
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, description: str):
+    """注册迁移（版本号必须递增，已发布的迁移不要修改）"""
+    def decorator(upgrade: Callable[[Connection], None]):
+        if MIGRATIONS and version <= MIGRATIONS[-1].version:
+            raise ValueError(f"迁移版本号必须递增: {version}")
+        MIGRATIONS.append(Migration(version, description, upgrade))
+        return upgrade
+    return decorator
+
+
+def _table_exists(conn: Connection, table: str) -> bool:
+    return inspect(conn).has_table(table)
+
+
+def _add_column(conn: Connection, table: str, column: str, ddl: str):
+    """表已存在且缺少该列时补加（新建的表由 create_all 带上该列）"""
+    if not _table_exists(conn, table):
+        return
+    columns = {column["name"] for column in inspect(conn).get_columns(table)}
+    if column not in columns:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+@migration(1, "热点查询的复合索引")
+def _hot_query_indexes(conn: Connection):
+    """
+    任务/报告列表按状态或脚本过滤并按开始时间倒序，告警按设备 + 类型查找未解决告警，
+    失败分析按任务日志和时间查询，活动日志按时间倒序。
+    复合索引以原单列索引为前缀，删除被覆盖的单列索引以减少写入开销
+    """
+    indexes = [
+        ("task_log", "ix_task_log_status_start_time", "status, start_time"),
+        ("task_log", "ix_task_log_script_id_start_time", "script_id, start_time"),
+        ("device_health_records", "ix_device_health_records_device_created", "device_id, created_at"),
+        ("device_alerts", "ix_device_alerts_device_type_resolved", "device_id, alert_type, is_resolved"),
+        ("failure_analysis", "ix_failure_analysis_task_log_id", "task_log_id"),
+        ("failure_analysis", "ix_failure_analysis_created_at", "created_at"),
+        ("activity_log", "ix_activity_log_created_at", "created_at"),
+    ]
+    for table, name, columns in indexes:
+        if _table_exists(conn, table):
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+
+    conn.execute(text("DROP INDEX IF EXISTS ix_task_log_status"))
+    conn.execute(text("DROP INDEX IF EXISTS ix_task_log_script_id"))
+    # 更新统计信息，让查询规划器在多个可用索引间正确选择
+    conn.execute(text("ANALYZE"))
+
+
+@migration(2, "告警规则的持续时间、变化率和滞回条件列")
+def _alert_rule_conditions(conn: Connection):
+    """已有规则的 condition_type 取默认值 threshold，其余条件为空（与原有行为一致）"""
+    _add_column(conn, "alert_rules", "condition_type", "VARCHAR(20) NOT NULL DEFAULT 'threshold'")
+    _add_column(conn, "alert_rules", "duration_seconds", "INTEGER")
+    _add_column(conn, "alert_rules", "window_seconds", "INTEGER")
+    _add_column(conn, "alert_rules", "clear_threshold", "FLOAT")
+
+
+@migration(3, "告警列表按创建时间游标分页的索引")
+def _alert_created_at_index(conn: Connection):
+    if _table_exists(conn, "device_alerts"):
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_device_alerts_created_at ON device_alerts (created_at)"))
+
+
+def ensure_migrations_table(conn: Connection):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, description TEXT NOT NULL, applied_at TEXT NOT NULL)"
+    ))
+
+
+def applied_versions(engine: Engine) -> List[int]:
+    """已执行的迁移版本号"""
+    with engine.begin() as conn:
+        ensure_migrations_table(conn)
+        return [row[0] for row in conn.execute(text("SELECT version FROM schema_migrations ORDER BY version"))]
+
+
+def run_migrations(engine: Engine) -> List[int]:
+    """
+    执行尚未执行过的迁移
+
+    多个 worker 同时启动时，版本号主键冲突的一方回滚，视为已由其他 worker 执行
+
+    Returns:
+        本次执行的迁移版本号
+    """
+    applied = set(applied_versions(engine))
+    executed = []
+    for item in MIGRATIONS:
+        if item.version in applied:
+            continue
+        try:
+            with engine.begin() as conn:
+                conn.execute(
+                    text("INSERT INTO schema_migrations (version, description, applied_at) VALUES (:v, :d, :t)"),
+                    {"v": item.version, "d": item.description, "t": datetime.now().isoformat(timespec="seconds")}
+                )
+                item.upgrade(conn)
+        except IntegrityError:
+            logger.info(f"迁移 {item.version} 已由其他进程执行")
+            continue
+        executed.append(item.version)
+        logger.info(f"已执行数据库迁移 {item.version}: {item.description}")
+    return executed
@@ -0,0 +1,134 @@
+"""
+WebSocket 订阅索引
+维护 主题→客户端 和 客户端→主题 双向索引，订阅/取消/断开都是 O(该客户端订阅数)
+"""
+from typing import Callable, Dict, List, Optional, Set
+from fnmatch import translate
+import re
+
+
+def task_topic(task_id) -> str:
+    """任务主题名"""
+    return f"task:{task_id}"
+
+
+def device_event_topics(device_id, group_name: Optional[str] = None, severity: Optional[str] = None) -> List[str]:
+    """
+    设备事件（告警等）投递的主题
+    
+    客户端可以按设备(device:{id})、分组(group:{name})、严重程度(severity:{level})订阅，
+    也可以用 device:* 接收所有设备事件
+    """
+    topics = [f"device:{device_id}"]
+    if group_name:
+        topics.append(f"group:{group_name}")
+    if severity:
+        topics.append(f"severity:{severity}")
+    return topics
+
+
+def is_pattern(topic: str) -> bool:
+    """包含通配符的主题（如 task:*、device:*）"""
+    return "*" in topic or "?" in topic
+
+
+def compile_pattern(pattern: str) -> Callable[[str], bool]:
+    """编译通配符主题，前缀通配（如 task:*）直接用 startswith"""
+    prefix = pattern[:-1]
+    if pattern.endswith("*") and not is_pattern(prefix):
+        return lambda topic: topic.startswith(prefix)
+    return re.compile(translate(pattern)).match
+
+
+class SubscriptionRegistry:
+    """订阅注册表（支持通配符主题）"""
+    
+    def __init__(self):
+        # 精确主题: {topic: {client_id}}
+        self.topic_clients: Dict[str, Set[str]] = {}
+        # 通配符主题: {pattern: {client_id}}
+        self.pattern_clients: Dict[str, Set[str]] = {}
+        # 通配符匹配函数缓存: {pattern: matcher}
+        self.pattern_matchers: Dict[str, Callable[[str], bool]] = {}
+        # 反向索引: {client_id: {topic_or_pattern}}
+        self.client_topics: Dict[str, Set[str]] = {}
+    
+    def subscribe(self, client_id: str, topic: str) -> bool:
+        """
+        订阅主题
+        
+        Returns:
+            是否为新订阅
+        """
+        if is_pattern(topic):
+            index = self.pattern_clients
+            if topic not in self.pattern_matchers:
+                self.pattern_matchers[topic] = compile_pattern(topic)
+        else:
+            index = self.topic_clients
+        clients = index.setdefault(topic, set())
+        if client_id in clients:
+            return False
+        clients.add(client_id)
+        self.client_topics.setdefault(client_id, set()).add(topic)
+        return True
+    
+    def unsubscribe(self, client_id: str, topic: str) -> bool:
+        """
+        取消订阅
+        
+        Returns:
+            是否存在该订阅
+        """
+        index = self.pattern_clients if is_pattern(topic) else self.topic_clients
+        clients = index.get(topic)
+        if not clients or client_id not in clients:
+            return False
+        clients.discard(client_id)
+        if not clients:
+            self._drop_topic(index, topic)
+        
+        topics = self.client_topics.get(client_id)
+        if topics is not None:
+            topics.discard(topic)
+            if not topics:
+                del self.client_topics[client_id]
+        return True
+    
+    def remove_client(self, client_id: str):
+        """移除客户端的所有订阅（只遍历该客户端自己的订阅）"""
+        for topic in self.client_topics.pop(client_id, set()):
+            index = self.pattern_clients if is_pattern(topic) else self.topic_clients
+            clients = index.get(topic)
+            if clients is not None:
+                clients.discard(client_id)
+                if not clients:
+                    self._drop_topic(index, topic)
+    
+    def _drop_topic(self, index: Dict[str, Set[str]], topic: str):
+        """删除已没有订阅者的主题"""
+        del index[topic]
+        self.pattern_matchers.pop(topic, None)
+    
+    def subscribers(self, topic: str) -> Set[str]:
+        """获取订阅了该主题的客户端（包括通配符匹配）"""
+        clients = self.topic_clients.get(topic)
+        result = set(clients) if clients else set()
+        for pattern, pattern_clients in self.pattern_clients.items():
+            if self.pattern_matchers[pattern](topic):
+                result |= pattern_clients
+        return result
+    
+    def has_subscribers(self, topic: str) -> bool:
+        """该主题是否有订阅者"""
+        if topic in self.topic_clients:
+            return True
+        return any(self.pattern_matchers[pattern](topic) for pattern in self.pattern_clients)
+    
+    def topics_of(self, client_id: str) -> Set[str]:
+        """客户端订阅的主题"""
+        return set(self.client_topics.get(client_id, ()))
+    
+    def __len__(self) -> int:
+        """订阅总数"""
+        return sum(len(topics) for topics in self.client_topics.values())
@@ -0,0 +1,247 @@
+"""
+任务事件流
+为每个任务的推送事件分配单调递增的序号，保留有界的内存重放缓冲，
+更早的事件溢出写入任务事件日志文件，订阅时可通过 since_seq 补齐错过的事件。
+文件由单独的写线程追加，事件循环中只做序列化；读文件也在同一线程中执行，排在已提交的写入之后
+"""
+from typing import Dict, List, Optional, Tuple
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import json
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TaskEventLog:
+    """单个任务的事件序列"""
+    
+    def __init__(self, task_id: int, persist: bool = True):
+        self.task_id = task_id
+        # 是否由本进程写事件日志文件（多 worker 时只有执行任务的 worker 写）
+        self.persist = persist
+        self.last_seq = 0
+        # 内存重放缓冲
+        self.buffer: deque = deque()
+        # 等待写入文件的溢出事件（不写文件时只保留最近一批，覆盖写入方尚未落盘的部分）
+        self.pending_spill: List[dict] = []
+        # 已经推送给订阅者（或无人订阅直接跳过）的最大序号
+        self.flushed_seq = 0
+        # 已交给写线程写入文件的最大序号，之前的事件不再重复写
+        self.spilled_seq = 0
+        self.finished = False
+        # 最近一次记录事件的时间（time.monotonic），用于淘汰长时间没有事件的未结束任务
+        self.last_active = time.monotonic()
+
+
+class TaskEventStore:
+    """任务事件存储"""
+    
+    def __init__(
+        self,
+        log_dir: str,
+        buffer_size: int = 500,
+        spill_batch: int = 100,
+        max_finished_tasks: int = 100,
+        idle_ttl: float = 3600
+    ):
+        """
+        Args:
+            log_dir: 任务事件日志目录
+            buffer_size: 每个任务在内存中保留的事件数
+            spill_batch: 溢出事件累计到该数量时写一次文件
+            max_finished_tasks: 内存中保留的已结束任务数，更早的只能从文件重放
+            idle_ttl: 未结束任务超过该秒数没有新事件时移出内存（执行进程异常退出、
+                没有收到结束事件的任务），剩余事件写入文件后只能从文件重放
+        """
+        self.log_dir = log_dir
+        self.buffer_size = buffer_size
+        self.spill_batch = spill_batch
+        self.max_finished_tasks = max_finished_tasks
+        self.idle_ttl = idle_ttl
+        self.tasks: Dict[int, TaskEventLog] = {}
+        self.finished_tasks: "OrderedDict[int, None]" = OrderedDict()
+        # 下一次检查空闲任务的时间
+        self._next_idle_check = time.monotonic() + min(idle_ttl, 60)
+        # 单线程写文件，保证同一任务的写入按提交顺序执行
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="task-events")
+    
+    def _log_path(self, task_id: int) -> str:
+        return os.path.join(self.log_dir, f"task_{task_id}.jsonl")
+    
+    def record(self, task_id: int, envelope: dict, finished: bool = False, persist: bool = True) -> int:
+        """
+        记录事件并分配序号（序号写入 envelope["seq"]）
+        
+        Args:
+            task_id: 任务ID
+            envelope: task_update 消息，已带 seq 时（其他 worker 转发来的）沿用原序号
+            finished: 是否为任务结束事件
+            persist: 是否由本进程写事件日志文件
+        
+        Returns:
+            事件序号
+        """
+        now = time.monotonic()
+        if now >= self._next_idle_check:
+            self._evict_idle(now)
+        
+        log = self.tasks.get(task_id)
+        if log is None:
+            log = self.tasks[task_id] = TaskEventLog(task_id, persist)
+        log.last_active = now
+        
+        if "seq" in envelope:
+            log.last_seq = max(log.last_seq, envelope["seq"])
+        else:
+            log.last_seq += 1
+            envelope["seq"] = log.last_seq
+        log.buffer.append(envelope)
+        
+        if len(log.buffer) > self.buffer_size:
+            log.pending_spill.append(log.buffer.popleft())
+            if len(log.pending_spill) >= self.spill_batch:
+                if log.persist:
+                    self._write_spill(log)
+                else:
+                    del log.pending_spill[0]
+        
+        if finished:
+            self._finish(log)
+        
+        return log.last_seq
+    
+    def mark_flushed(self, task_id: int, seq: int):
+        """标记序号之前的事件已推送"""
+        log = self.tasks.get(task_id)
+        if log and seq > log.flushed_seq:
+            log.flushed_seq = seq
+    
+    def last_seq(self, task_id: int) -> int:
+        """任务当前的最大序号"""
+        log = self.tasks.get(task_id)
+        return log.last_seq if log else 0
+    
+    def replay(self, task_id: int, since_seq: int) -> List[dict]:
+        """
+        获取序号大于 since_seq 且已推送过的事件
+        
+        尚在发送缓冲区中的事件不会返回，它们会随下一次推送送达，避免重复。
+        """
+        events, needs_file, before_seq = self.memory_events(task_id, since_seq)
+        if not needs_file:
+            return events
+        self.flush()
+        return self.read_file(task_id, since_seq, before_seq) + events
+    
+    def memory_events(self, task_id: int, since_seq: int) -> Tuple[List[dict], bool, Optional[int]]:
+        """
+        取内存重放缓冲中的事件，并判断是否还需要读文件
+        
+        需要在事件循环线程中调用；文件部分可以放到线程池中用 read_file 读取。
+        
+        Returns:
+            (内存中的事件, 是否需要读文件, 文件读取的截止序号（不含）)
+        """
+        log = self.tasks.get(task_id)
+        if log is None:
+            # 内存中已没有该任务（服务重启或已淘汰），全部从文件重放
+            return [], True, None
+        
+        if log.pending_spill:
+            oldest_in_memory = log.pending_spill[0]["seq"]
+        elif log.buffer:
+            oldest_in_memory = log.buffer[0]["seq"]
+        else:
+            oldest_in_memory = log.last_seq + 1
+        needs_file = since_seq + 1 < oldest_in_memory
+        
+        events = [
+            event for source in (log.pending_spill, log.buffer) for event in source
+            if since_seq < event["seq"] <= log.flushed_seq
+        ]
+        return events, needs_file, oldest_in_memory
+    
+    def _finish(self, log: TaskEventLog):
+        """任务结束：把完整事件流写入文件，按 LRU 淘汰内存中的旧任务"""
+        log.finished = True
+        if log.persist:
+            events, log.pending_spill = log.pending_spill + list(log.buffer), []
+            self._write_spill(log, events)
+        
+        self.finished_tasks[log.task_id] = None
+        while len(self.finished_tasks) > self.max_finished_tasks:
+            task_id, _ = self.finished_tasks.popitem(last=False)
+            self.tasks.pop(task_id, None)
+    
+    def _evict_idle(self, now: float):
+        """把超过 idle_ttl 没有新事件的未结束任务写入文件并移出内存"""
+        self._next_idle_check = now + min(self.idle_ttl, 60)
+        idle = [
+            log for log in self.tasks.values()
+            if not log.finished and now - log.last_active > self.idle_ttl
+        ]
+        for log in idle:
+            if log.persist:
+                events, log.pending_spill = log.pending_spill + list(log.buffer), []
+                self._write_spill(log, events)
+            del self.tasks[log.task_id]
+        if idle:
+            logger.warning(f"任务事件流长时间没有更新，已移出内存: {[log.task_id for log in idle]}")
+    
+    def _write_spill(self, log: TaskEventLog, events: Optional[List[dict]] = None):
+        """
+        把溢出事件交给写线程追加到任务事件日志文件
+        
+        events 默认取 pending_spill；序号不大于 spilled_seq 的事件已经写过，跳过
+        """
+        if events is None:
+            events, log.pending_spill = log.pending_spill, []
+        events = [event for event in events if event["seq"] > log.spilled_seq]
+        if not events:
+            return
+        log.spilled_seq = events[-1]["seq"]
+        lines = [json.dumps(event, ensure_ascii=False) + "\n" for event in events]
+        self.writer.submit(self._append, log.task_id, lines)
+    
+    def _append(self, task_id: int, lines: List[str]):
+        """追加写入事件日志文件（在写线程中执行）"""
+        try:
+            os.makedirs(self.log_dir, exist_ok=True)
+            with open(self._log_path(task_id), "a", encoding="utf-8") as f:
+                f.writelines(lines)
+        except OSError as e:
+            logger.error(f"写入任务事件日志失败 (任务 {task_id}): {e}")
+    
+    def flush(self):
+        """等待已提交的文件写入完成"""
+        self.writer.submit(lambda: None).result()
+    
+    async def read_file_async(self, task_id: int, since_seq: int, before_seq: Optional[int]) -> List[dict]:
+        """在写线程中读取事件日志文件（排在已提交的写入之后，不会读到缺口），不阻塞事件循环"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.writer, self.read_file, task_id, since_seq, before_seq)
+    
+    def read_file(self, task_id: int, since_seq: int, before_seq: Optional[int]) -> List[dict]:
+        """从任务事件日志文件读取 (since_seq, before_seq) 范围内的事件"""
+        path = self._log_path(task_id)
+        if not os.path.exists(path):
+            return []
+        
+        events = []
+        seen = set()
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                seq = event.get("seq", 0)
+                if seq <= since_seq or (before_seq is not None and seq >= before_seq) or seq in seen:
+                    continue
+                seen.add(seq)
+                events.append(event)
+        return events
@@ -1,86 +1,558 @@
 """
 WebSocket 连接管理器
 """
-from typing import Dict, List
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Union
+from collections import deque
 from fastapi import WebSocket
+from app.core.config import settings
+from app.core.subscriptions import SubscriptionRegistry, task_topic
+from app.core.task_events import TaskEventStore
+from app.core.event_bus import InProcessEventBus
+from app.core.ws_codec import JSON_CODEC, EncodedMessage
+from app.core.metrics import websocket_connections, websocket_client_lag, websocket_client_queue_depth
 import json
 import asyncio
+import time
 from datetime import datetime
 
 
+# 任务结束状态，收到后立即发送缓冲区内容
+TERMINAL_STATUSES = ("success", "failed")
+
+# 重放时每个批量帧最多包含的事件数
+REPLAY_CHUNK_SIZE = 200
+
+
+class TaskUpdateBuffer:
+    """
+    单个任务的发送缓冲区
+    
+    更新按产生顺序保存，日志行最多保留 max_logs 条（超出时丢弃最旧的行）；
+    进度类更新只保留一条：新进度与旧进度的字段合并（新值覆盖旧值，旧进度中独有的字段保留），
+    放在新进度产生的位置，旧进度从原位置移除。
+    """
+    
+    def __init__(self, max_logs: int):
+        self.max_logs = max_logs
+        self.updates: List[dict] = []
+        self.log_count = 0
+        self.progress: Optional[dict] = None
+        self.dropped = 0
+        self.flush_scheduled = False
+    
+    def add(self, envelope: dict):
+        """加入一条更新"""
+        if envelope["data"].get("type") == "log":
+            if self.log_count == self.max_logs:
+                oldest = next(i for i, u in enumerate(self.updates) if u["data"].get("type") == "log")
+                del self.updates[oldest]
+                self.log_count -= 1
+                self.dropped += 1
+            self.updates.append(envelope)
+            self.log_count += 1
+            return
+        
+        if self.progress is not None:
+            # 不修改原消息（事件重放缓冲中保存的是同一个对象）
+            self.updates.remove(self.progress)
+            envelope = {**envelope, "data": {**self.progress["data"], **envelope["data"]}}
+        self.progress = envelope
+        self.updates.append(envelope)
+    
+    @property
+    def size(self) -> int:
+        return len(self.updates)
+    
+    def drain(self) -> List[dict]:
+        """按产生顺序取出所有缓冲的更新"""
+        updates, self.updates = self.updates, []
+        self.log_count = 0
+        self.progress = None
+        return updates
+
+
+class ClientConnection:
+    """
+    单个客户端连接
+    
+    每个连接有一个有界发送队列，由独立的写协程发送，慢客户端不会阻塞其他订阅者和任务执行器。
+    队列满时先丢弃最旧的可丢弃消息（debug 日志），仍然放不下则判定为慢消费者。
+    """
+    
+    def __init__(self, websocket: WebSocket, client_id: str, max_queue: int, codec=JSON_CODEC):
+        self.websocket = websocket
+        self.client_id = client_id
+        self.max_queue = max_queue
+        # 消息编码（JSON 文本帧或 MessagePack 二进制帧）
+        self.codec = codec
+        # 队列元素: (已编码的消息, 是否可丢弃, 入队时间)
+        self.queue: deque = deque()
+        self.wakeup = asyncio.Event()
+        self.writer_task: Optional[asyncio.Task] = None
+        self.connected_at = datetime.now()
+        # 指标
+        self.sent = 0
+        self.sent_bytes = 0
+        self.dropped = 0
+        self.max_queue_depth = 0
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+    
+    @property
+    def congested(self) -> bool:
+        """队列超过一半容量时认为客户端处理不过来"""
+        return len(self.queue) >= self.max_queue // 2
+    
+    def enqueue(self, data: Union[str, bytes], droppable: bool = False) -> bool:
+        """
+        消息入队（不等待发送）
+        
+        Returns:
+            False 表示队列已满且没有可丢弃的消息，应断开该客户端
+        """
+        if len(self.queue) >= self.max_queue:
+            if droppable:
+                self.dropped += 1
+                return True
+            # 丢弃最旧的一条可丢弃消息腾出空间
+            for index, item in enumerate(self.queue):
+                if item[1]:
+                    del self.queue[index]
+                    self.dropped += 1
+                    break
+            else:
+                return False
+        
+        self.queue.append((data, droppable, time.monotonic()))
+        self.max_queue_depth = max(self.max_queue_depth, len(self.queue))
+        self.wakeup.set()
+        return True
+    
+    async def run_writer(self, on_error):
+        """写协程：按顺序发送队列中的消息"""
+        try:
+            while True:
+                while not self.queue:
+                    self.wakeup.clear()
+                    await self.wakeup.wait()
+                
+                data, _, enqueued_at = self.queue.popleft()
+                if isinstance(data, bytes):
+                    await self.websocket.send_bytes(data)
+                else:
+                    await self.websocket.send_text(data)
+                
+                self.sent += 1
+                self.sent_bytes += len(data)
+                self.last_lag_ms = (time.monotonic() - enqueued_at) * 1000
+                self.max_lag_ms = max(self.max_lag_ms, self.last_lag_ms)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ 发送失败: {self.client_id}, 错误: {e}")
+            on_error(self)
+    
+    def get_stats(self) -> dict:
+        """连接指标"""
+        lag_ms = self.last_lag_ms
+        if self.queue:
+            # 队首消息的等待时间即当前滞后
+            lag_ms = max(lag_ms, (time.monotonic() - self.queue[0][2]) * 1000)
+        return {
+            "client_id": self.client_id,
+            "encoding": self.codec.name,
+            "queue_depth": len(self.queue),
+            "max_queue_depth": self.max_queue_depth,
+            "queue_capacity": self.max_queue,
+            "sent": self.sent,
+            "sent_bytes": self.sent_bytes,
+            "dropped": self.dropped,
+            "lag_ms": round(lag_ms, 2),
+            "max_lag_ms": round(self.max_lag_ms, 2),
+            "connected_at": self.connected_at.isoformat()
+        }
+
+
 class ConnectionManager:
     def __init__(self):
-        # 存储所有活跃连接: {client_id: WebSocket}
-        self.active_connections: Dict[str, WebSocket] = {}
-        # 存储任务订阅: {task_id: [client_id1, client_id2]}
-        self.task_subscribers: Dict[int, List[str]] = {}
+        # 存储所有活跃连接: {client_id: ClientConnection}
+        self.active_connections: Dict[str, ClientConnection] = {}
+        # 订阅索引: 主题→客户端、客户端→主题（任务主题为 task:{task_id}，支持通配符）
+        self.subscriptions = SubscriptionRegistry()
+        # 支持批量帧的客户端（订阅时声明 batch=true）
+        self.batch_clients: Set[str] = set()
+        # 每个任务的发送缓冲区: {task_id: TaskUpdateBuffer}
+        self.task_buffers: Dict[int, TaskUpdateBuffer] = {}
+        # 延迟发送等后台协程（保留引用直到完成）
+        self.background_tasks: Set[asyncio.Task] = set()
+        self.flush_interval = settings.WS_FLUSH_INTERVAL_MS / 1000
+        self.flush_max_messages = settings.WS_FLUSH_MAX_MESSAGES
+        self.task_buffer_size = settings.WS_TASK_BUFFER_SIZE
+        self.send_queue_size = settings.WS_SEND_QUEUE_SIZE
+        # 因处理过慢被断开的客户端数
+        self.slow_consumer_disconnects = 0
+        # 任务事件序号与重放缓冲
+        self.task_events = TaskEventStore(
+            settings.TASK_EVENT_LOG_DIR,
+            buffer_size=settings.WS_REPLAY_BUFFER_SIZE,
+            idle_ttl=settings.TASK_EVENT_IDLE_TTL
+        )
+        # 跨进程事件总线（默认单进程，不转发）
+        self.bus = InProcessEventBus()
+        # 其他频道的处理函数: {channel: async handler(payload)}
+        self.bus_handlers: Dict[str, Callable[[dict], Awaitable[None]]] = {}
+    
+    async def start_event_bus(self, bus):
+        """启用事件总线，接收其他 worker 转发来的任务更新和广播"""
+        self.bus = bus
+        await bus.start(self._on_bus_event)
+    
+    async def stop_event_bus(self):
+        """关闭事件总线"""
+        await self.bus.stop()
+        self.bus = InProcessEventBus()
+    
+    async def _on_bus_event(self, channel: str, payload: dict):
+        """处理其他 worker 发布的消息，投递给本进程的客户端"""
+        if channel == "task_update":
+            envelope = payload["envelope"]
+            finished = envelope["data"].get("status") in TERMINAL_STATUSES
+            self.task_events.record(payload["task_id"], envelope, finished=finished, persist=False)
+            await self._dispatch_task_update(payload["task_id"], envelope, finished)
+        elif channel == "broadcast":
+            self._broadcast_local(payload["message"])
+        elif channel == "event":
+            self._publish_local(payload["topics"], payload["message"])
+        elif channel in self.bus_handlers:
+            await self.bus_handlers[channel](payload)
     
-    async def connect(self, websocket: WebSocket, client_id: str):
-        """接受新连接"""
+    def on_bus_event(self, channel: str, handler: Callable[[dict], Awaitable[None]]):
+        """注册事件总线频道的处理函数（如定时任务变更转发给主进程）"""
+        self.bus_handlers[channel] = handler
+    
+    async def connect(self, websocket: WebSocket, client_id: str, codec=JSON_CODEC) -> ClientConnection:
+        """
+        接受新连接（codec 为协商后的消息编码）
+        
+        Returns:
+            本次连接，断开时传给 disconnect，避免同名重连后旧连接清理掉新连接
+        """
         await websocket.accept()
-        self.active_connections[client_id] = websocket
+        if client_id in self.active_connections:
+            self.disconnect(client_id)
+        
+        connection = ClientConnection(websocket, client_id, self.send_queue_size, codec)
+        connection.writer_task = asyncio.create_task(connection.run_writer(self._on_writer_error))
+        self.active_connections[client_id] = connection
         print(f"✅ 客户端 {client_id} 已连接, 当前连接数: {len(self.active_connections)}")
+        return connection
     
-    def disconnect(self, client_id: str):
-        """断开连接"""
-        if client_id in self.active_connections:
-            del self.active_connections[client_id]
+    def disconnect(self, client_id: str, connection: Optional[ClientConnection] = None):
+        """
+        断开连接
+        
+        传入 connection 时只在它仍是该客户端的当前连接时清理（已被同名新连接替换时不处理）
+        """
+        if connection is not None and self.active_connections.get(client_id) is not connection:
+            return
+        connection = self.active_connections.pop(client_id, None)
+        if connection and connection.writer_task:
+            connection.writer_task.cancel()
+        self.batch_clients.discard(client_id)
         
         # 清理订阅
-        for task_id in list(self.task_subscribers.keys()):
-            if client_id in self.task_subscribers[task_id]:
-                self.task_subscribers[task_id].remove(client_id)
-                if not self.task_subscribers[task_id]:
-                    del self.task_subscribers[task_id]
+        self.subscriptions.remove_client(client_id)
         
         print(f"❌ 客户端 {client_id} 已断开, 当前连接数: {len(self.active_connections)}")
     
-    def subscribe_task(self, task_id: int, client_id: str):
-        """订阅任务更新"""
-        if task_id not in self.task_subscribers:
-            self.task_subscribers[task_id] = []
-        if client_id not in self.task_subscribers[task_id]:
-            self.task_subscribers[task_id].append(client_id)
-            print(f"📡 客户端 {client_id} 订阅任务 {task_id}")
+    def _on_writer_error(self, connection: ClientConnection):
+        """写协程发送失败，清理该连接"""
+        self.disconnect(connection.client_id, connection)
+    
+    def subscribe_task(self, task_id: int, client_id: str, batch: bool = False):
+        """订阅任务更新（batch=True 表示客户端可以接收合并后的批量帧）"""
+        self.subscribe(task_topic(task_id), client_id, batch)
+    
+    def unsubscribe_task(self, task_id: int, client_id: str) -> bool:
+        """取消订阅任务更新"""
+        return self.unsubscribe(task_topic(task_id), client_id)
+    
+    def subscribe(self, topic: str, client_id: str, batch: bool = False):
+        """订阅主题，支持通配符（如 task:* 订阅所有任务）"""
+        if batch:
+            self.batch_clients.add(client_id)
+        if self.subscriptions.subscribe(client_id, topic):
+            print(f"📡 客户端 {client_id} 订阅 {topic}")
+    
+    def unsubscribe(self, topic: str, client_id: str) -> bool:
+        """取消订阅主题"""
+        return self.subscriptions.unsubscribe(client_id, topic)
     
     async def send_task_update(self, task_id: int, data: dict):
-        """向订阅该任务的所有客户端发送更新"""
-        if task_id not in self.task_subscribers:
-            return
+        """
+        向订阅该任务的所有客户端发送更新
         
-        message = json.dumps({
+        更新先进入任务缓冲区，每隔 WS_FLUSH_INTERVAL_MS 或累计 WS_FLUSH_MAX_MESSAGES 条
+        合并发送一次；任务结束状态会立即发送。
+        每条更新都带有任务内单调递增的 seq，没有订阅者时也会记录，供稍后订阅的客户端重放。
+        多 worker 部署时同时经事件总线转发，连接在其他 worker 上的客户端也能收到。
+        """
+        envelope = {
             "type": "task_update",
             "task_id": task_id,
             "data": data,
             "timestamp": datetime.now().isoformat()
-        })
-        
-        # 发送给所有订阅者
-        disconnected_clients = []
-        for client_id in self.task_subscribers[task_id]:
-            if client_id in self.active_connections:
-                try:
-                    await self.active_connections[client_id].send_text(message)
-                except Exception as e:
-                    print(f"⚠️ 发送失败: {client_id}, 错误: {e}")
-                    disconnected_clients.append(client_id)
-        
-        # 清理断开的连接
-        for client_id in disconnected_clients:
-            self.disconnect(client_id)
+        }
+        finished = data.get("status") in TERMINAL_STATUSES
+        self.task_events.record(task_id, envelope, finished=finished)
+        await self.bus.publish("task_update", {"task_id": task_id, "envelope": envelope})
+        await self._dispatch_task_update(task_id, envelope, finished)
+    
+    async def _dispatch_task_update(self, task_id: int, envelope: dict, finished: bool):
+        """把已记录的更新放入本进程的发送缓冲区"""
+        if not self.subscriptions.has_subscribers(task_topic(task_id)):
+            self.task_events.mark_flushed(task_id, envelope["seq"])
+            return
+        
+        buffer = self.task_buffers.get(task_id)
+        if buffer is None:
+            buffer = self.task_buffers[task_id] = TaskUpdateBuffer(self.task_buffer_size)
+        buffer.add(envelope)
+        
+        if finished or buffer.size >= self.flush_max_messages:
+            await self.flush_task(task_id)
+        elif not buffer.flush_scheduled:
+            buffer.flush_scheduled = True
+            self._spawn(self._delayed_flush(task_id))
+    
+    def _spawn(self, coro):
+        """启动后台协程并保留引用，避免任务在完成前被垃圾回收"""
+        task = asyncio.create_task(coro)
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+        return task
+    
+    async def _delayed_flush(self, task_id: int):
+        """时间窗口结束后发送缓冲区"""
+        await asyncio.sleep(self.flush_interval)
+        await self.flush_task(task_id)
+    
+    async def flush_task(self, task_id: int):
+        """立即发送任务缓冲区中的所有更新"""
+        buffer = self.task_buffers.pop(task_id, None)
+        if buffer is None:
+            return
+        
+        updates = buffer.drain()
+        if not updates:
+            return
+        self.task_events.mark_flushed(task_id, max(u["seq"] for u in updates))
+        
+        # 各类消息按需构建，每种编码只序列化一次
+        # 批量帧：支持批量的客户端一次收到所有更新
+        batch_message = None
+        # 拥塞客户端使用的精简批量帧（去掉 debug 日志）
+        essential_batch_message = None
+        # 兼容旧客户端：逐条发送原有格式的 task_update 消息
+        legacy_messages = None
+        
+        for client_id in self.subscriptions.subscribers(task_topic(task_id)):
+            connection = self.active_connections.get(client_id)
+            if not connection:
+                continue
+            
+            if client_id in self.batch_clients:
+                if connection.congested:
+                    if essential_batch_message is None:
+                        essential = [u for u in updates if not _is_debug(u)]
+                        essential_batch_message = EncodedMessage(self._batch_message(
+                            task_id, essential, buffer.dropped + len(updates) - len(essential)
+                        ))
+                    connection.dropped += sum(1 for u in updates if _is_debug(u))
+                    ok = connection.enqueue(essential_batch_message.encode(connection.codec))
+                else:
+                    if batch_message is None:
+                        batch_message = EncodedMessage(self._batch_message(task_id, updates, buffer.dropped))
+                    ok = connection.enqueue(batch_message.encode(connection.codec))
+            else:
+                if legacy_messages is None:
+                    legacy_messages = [(EncodedMessage(u), _is_debug(u)) for u in updates]
+                ok = all(
+                    connection.enqueue(message.encode(connection.codec), droppable)
+                    for message, droppable in legacy_messages
+                )
+            
+            if not ok:
+                self._drop_slow_consumer(client_id)
+    
+    async def subscribe_task_since(
+        self,
+        task_id: int,
+        client_id: str,
+        since_seq: int,
+        batch: bool = False
+    ) -> int:
+        """
+        订阅任务并重放 seq 大于 since_seq 的事件（迟到订阅或断线重连后补齐）
+        
+        重放使用 task_update_batch 帧（replay=true），每帧最多 REPLAY_CHUNK_SIZE 条。
+        较早的事件从事件日志文件读取，读完后再同步取内存事件并订阅，
+        保证重放帧排在后续实时推送之前，且不重复、不遗漏。
+        
+        Returns:
+            重放的事件数
+        """
+        events: List[dict] = []
+        cursor = since_seq
+        while True:
+            memory, needs_file, before_seq = self.task_events.memory_events(task_id, cursor)
+            if not needs_file:
+                break
+            # 在写线程中读取文件，不阻塞事件循环
+            file_events = await self.task_events.read_file_async(task_id, cursor, before_seq)
+            events.extend(file_events)
+            if before_seq is None:
+                # 内存中没有该任务，文件即完整事件流
+                memory = []
+                break
+            # 读文件期间可能有更多事件被挤出内存，继续从文件补齐
+            cursor = before_seq - 1
+        events.extend(memory)
+        
+        self.subscribe_task(task_id, client_id, batch)
+        connection = self.active_connections.get(client_id)
+        if not connection:
+            return 0
+        
+        for start in range(0, len(events), REPLAY_CHUNK_SIZE):
+            chunk = events[start:start + REPLAY_CHUNK_SIZE]
+            frame = connection.codec.encode(self._batch_message(task_id, chunk, 0, replay=True))
+            if not connection.enqueue(frame):
+                self._drop_slow_consumer(client_id)
+                break
+        return len(events)
+    
+    def _batch_message(self, task_id: int, updates: List[dict], dropped: int, replay: bool = False) -> dict:
+        """构建批量帧"""
+        message = {
+            "type": "task_update_batch",
+            "task_id": task_id,
+            "updates": updates,
+            "dropped": dropped,
+            "timestamp": datetime.now().isoformat()
+        }
+        if replay:
+            message["replay"] = True
+        return message
+    
+    def _drop_slow_consumer(self, client_id: str):
+        """断开队列已满的慢客户端"""
+        connection = self.active_connections.get(client_id)
+        if not connection:
+            return
+        self.slow_consumer_disconnects += 1
+        print(f"🐢 客户端 {client_id} 处理过慢 (队列 {len(connection.queue)}), 断开连接")
+        self.disconnect(client_id)
+        self._spawn(_close_quietly(connection.websocket))
+    
+    async def send_personal_message(self, client_id: str, message: dict):
+        """向单个客户端发送消息（入队，不等待发送）"""
+        connection = self.active_connections.get(client_id)
+        if connection and not connection.enqueue(connection.codec.encode(message)):
+            self._drop_slow_consumer(client_id)
+    
+    async def publish(self, topics: List[str], message: dict) -> int:
+        """
+        按主题推送事件（如设备告警）
+        
+        只发给订阅了其中任一主题的客户端，同时匹配多个主题的客户端只收到一次；
+        消息每种编码只序列化一次，所有接收者共享。
+        
+        Returns:
+            本进程中的接收客户端数
+        """
+        await self.bus.publish("event", {"topics": topics, "message": message})
+        return self._publish_local(topics, message)
+    
+    def _publish_local(self, topics: List[str], message: dict) -> int:
+        """按主题推送给本进程的客户端"""
+        recipients: Set[str] = set()
+        for topic in topics:
+            recipients |= self.subscriptions.subscribers(topic)
+        if not recipients:
+            return 0
+        
+        encoded = EncodedMessage(message)
+        delivered = 0
+        for client_id in recipients:
+            connection = self.active_connections.get(client_id)
+            if not connection:
+                continue
+            if connection.enqueue(encoded.encode(connection.codec)):
+                delivered += 1
+            else:
+                self._drop_slow_consumer(client_id)
+        return delivered
     
     async def broadcast(self, message: str):
-        """广播消息给所有连接"""
-        disconnected_clients = []
-        for client_id, connection in self.active_connections.items():
-            try:
-                await connection.send_text(message)
-            except Exception:
-                disconnected_clients.append(client_id)
-        
-        for client_id in disconnected_clients:
-            self.disconnect(client_id)
+        """广播消息给所有连接（入队后立即返回，不等待慢客户端），多 worker 时经事件总线转发"""
+        await self.bus.publish("broadcast", {"message": message})
+        self._broadcast_local(message)
+    
+    def _broadcast_local(self, message: str):
+        """广播给本进程的连接（JSON 客户端直接发送原文，其他编码的客户端解析一次后重新编码）"""
+        encoded = None
+        for client_id, connection in list(self.active_connections.items()):
+            if connection.codec is JSON_CODEC:
+                data = message
+            else:
+                if encoded is None:
+                    encoded = EncodedMessage(json.loads(message))
+                data = encoded.encode(connection.codec)
+            if not connection.enqueue(data):
+                self._drop_slow_consumer(client_id)
+    
+    def get_stats(self) -> dict:
+        """连接与发送队列指标"""
+        return {
+            "connections": len(self.active_connections),
+            "subscriptions": len(self.subscriptions),
+            "subscribed_topics": len(self.subscriptions.topic_clients) + len(self.subscriptions.pattern_clients),
+            "buffered_tasks": len(self.task_buffers),
+            "slow_consumer_disconnects": self.slow_consumer_disconnects,
+            "event_bus": self.bus.get_stats(),
+            "clients": [connection.get_stats() for connection in self.active_connections.values()]
+        }
+
+
+def _is_debug(update: dict) -> bool:
+    """debug 级别的日志在拥塞时可以丢弃"""
+    data = update.get("data", {})
+    return data.get("type") == "log" and data.get("level") == "debug"
+
+
+async def _close_quietly(websocket: WebSocket):
+    """关闭连接，忽略已断开等异常"""
+    try:
+        await websocket.close(code=1008)
+    except Exception:
+        pass
 
 
 # 全局连接管理器实例
 manager = ConnectionManager()
+
+
+def _client_samples(attr: str):
+    """抓取时读取每个连接的指标"""
+    def samples():
+        for connection in list(manager.active_connections.values()):
+            stats = connection.get_stats()
+            value = stats["lag_ms"] / 1000 if attr == "lag" else stats["queue_depth"]
+            yield {"client_id": connection.client_id}, value
+    return samples
+
+
+websocket_connections.set_function(lambda: [({}, len(manager.active_connections))])
+websocket_client_lag.set_function(_client_samples("lag"))
+websocket_client_queue_depth.set_function(_client_samples("queue_depth"))
@@ -0,0 +1,213 @@
+"""
+数据库写入队列
+SQLite 同一时间只允许一个写事务。执行器、调度器各自提交小事务时会互相争抢写锁，
+读事务升级为写事务时还可能直接报 database is locked。写入队列用一个专用线程和连接
+串行执行所有排队的写操作，把短时间内到达的多个写操作合并到一个 BEGIN IMMEDIATE 事务中，
+每个写操作包在 SAVEPOINT 里，单个失败不影响同批的其他写操作。
+非 SQLite 数据库同样按批合并提交，使用驱动默认的事务和连接参数
+"""
+from concurrent.futures import Future
+from typing import Callable, List, Optional, Tuple, TypeVar
+from sqlalchemy import event
+from sqlmodel import Session, create_engine
+from app.core.config import settings
+from app.core.database import SQLITE_CONNECT_ARGS, configure_sqlite, is_sqlite
+from app.core.metrics import db_write_batch_size, db_write_queue_depth, instrument_engine
+import asyncio
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_STOP = object()
+
+
+def create_writer_engine():
+    """
+    写线程专用的引擎
+
+    SQLite 下关闭 pysqlite 自带的事务处理，由 begin 事件发出 BEGIN IMMEDIATE：
+    事务开始即拿到写锁（等待 busy_timeout），SAVEPOINT 也能正确嵌套在批次事务中。
+    其他数据库的驱动不接受这些连接参数和语句，使用普通引擎
+    """
+    if not is_sqlite(settings.DATABASE_URL):
+        writer = create_engine(settings.DATABASE_URL, echo=False)
+        instrument_engine(writer)
+        return writer
+
+    writer = create_engine(settings.DATABASE_URL, echo=False, connect_args=SQLITE_CONNECT_ARGS)
+    if settings.SQLITE_TUNED:
+        event.listen(writer, "connect", configure_sqlite)
+
+    @event.listens_for(writer, "connect")
+    def _disable_pysqlite_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(writer, "begin")
+    def _begin_immediate(conn):
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+    instrument_engine(writer)
+    return writer
+
+
+class WriteQueue:
+    """单写线程的批量写入队列"""
+
+    def __init__(self, engine=None, max_batch: int = None, max_delay_ms: float = None):
+        """
+        Args:
+            engine: 写入使用的引擎，默认首次写入时创建 create_writer_engine()
+            max_batch: 每个事务最多合并的写操作数
+            max_delay_ms: 收到第一个写操作后等待更多写操作的最长时间
+        """
+        self.engine = engine
+        self.max_batch = max_batch or settings.DB_WRITE_QUEUE_MAX_BATCH
+        self.max_delay = (settings.DB_WRITE_QUEUE_MAX_DELAY_MS if max_delay_ms is None else max_delay_ms) / 1000
+        self._queue: "queue.SimpleQueue[Tuple[Callable, Future]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        # 统计
+        self.submitted = 0
+        self.batches = 0
+        self.committed = 0
+        self.failed = 0
+        self.max_batch_seen = 0
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            if self.engine is None:
+                self.engine = create_writer_engine()
+            self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, write: Callable[[Session], T]) -> "Future[T]":
+        """
+        提交写操作（任意线程可调用，不等待执行）
+
+        Args:
+            write: 接收 Session 的函数，只 add/修改对象，不要 commit
+
+        Returns:
+            写入提交后得到 write 返回值的 Future
+        """
+        self._ensure_started()
+        future: Future = Future()
+        self.submitted += 1
+        self._queue.put((write, future))
+        return future
+
+    def execute(self, write: Callable[[Session], T], timeout: float = 30) -> T:
+        """提交写操作并等待提交完成（在线程中调用）"""
+        return self.submit(write).result(timeout=timeout)
+
+    async def run(self, write: Callable[[Session], T]) -> T:
+        """提交写操作并等待提交完成（在事件循环中调用，不阻塞事件循环）"""
+        return await asyncio.wrap_future(self.submit(write))
+
+    def stop(self, timeout: float = 5):
+        """处理完已排队的写操作后停止写线程"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put((_STOP, None))
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item[0] is _STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item[0] is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                self._execute_batch(batch)
+            except Exception as e:
+                logger.error(f"写入队列批次执行失败: {e}")
+
+    def _execute_batch(self, batch: List[Tuple[Callable, Future]]):
+        """
+        一个事务执行整批写操作
+
+        先不加 SAVEPOINT 整批执行、一次 flush（同表 INSERT 合并为 executemany）；
+        失败时回滚，再逐个包在 SAVEPOINT 里重做，只让出错的写操作失败
+        """
+        batch = [(write, future) for write, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            outcomes = self._commit(batch, isolate=False)
+        except Exception:
+            try:
+                outcomes = self._commit(batch, isolate=True)
+            except Exception as e:
+                self.failed += len(batch)
+                for _, future in batch:
+                    future.set_exception(e)
+                return
+
+        self.batches += 1
+        self.max_batch_seen = max(self.max_batch_seen, len(outcomes))
+        db_write_batch_size.observe(len(outcomes))
+        for future, result, error in outcomes:
+            if error is None:
+                self.committed += 1
+                future.set_result(result)
+            else:
+                self.failed += 1
+                future.set_exception(error)
+
+    def _commit(self, batch: List[Tuple[Callable, Future]], isolate: bool) -> List[Tuple[Future, object, Optional[Exception]]]:
+        outcomes = []
+        with Session(self.engine, expire_on_commit=False) as session:
+            try:
+                for write, future in batch:
+                    if not isolate:
+                        outcomes.append((future, write(session), None))
+                        continue
+                    try:
+                        with session.begin_nested():
+                            result = write(session)
+                        outcomes.append((future, result, None))
+                    except Exception as e:
+                        outcomes.append((future, None, e))
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+        return outcomes
+
+    def get_stats(self) -> dict:
+        """写入队列指标"""
+        return {
+            "queue_depth": self._queue.qsize(),
+            "submitted": self.submitted,
+            "batches": self.batches,
+            "committed": self.committed,
+            "failed": self.failed,
+            "avg_batch_size": round(self.committed / self.batches, 2) if self.batches else 0,
+            "max_batch_size": self.max_batch_seen,
+        }
+
+
+# 全局写入队列
+write_queue = WriteQueue()
+db_write_queue_depth.set_function(lambda: [({}, write_queue._queue.qsize())])
@@ -0,0 +1,68 @@
+"""
+WebSocket 消息编码
+默认 JSON 文本帧；客户端连接时通过 ?encoding=msgpack 协商 MessagePack 二进制帧
+（消息结构与 JSON 完全相同，只是编码不同）。实际使用的编码在连接确认消息中告知客户端
+"""
+from typing import Any, Dict, Optional, Union
+import json
+import msgpack
+
+
+class JsonCodec:
+    """JSON 文本帧（默认）"""
+    
+    name = "json"
+    binary = False
+    
+    def encode(self, message: Any) -> str:
+        # 直接输出 UTF-8，中文日志不转义成 \uXXXX（每字符 6 字节）
+        return json.dumps(message, ensure_ascii=False)
+    
+    def decode(self, data: Union[str, bytes]) -> Any:
+        return json.loads(data)
+
+
+class MsgpackCodec:
+    """MessagePack 二进制帧"""
+    
+    name = "msgpack"
+    binary = True
+    
+    def encode(self, message: Any) -> bytes:
+        return msgpack.packb(message, use_bin_type=True)
+    
+    def decode(self, data: Union[str, bytes]) -> Any:
+        if isinstance(data, str):
+            # 客户端仍可以发送 JSON 文本消息
+            return json.loads(data)
+        return msgpack.unpackb(data, raw=False)
+
+
+JSON_CODEC = JsonCodec()
+
+CODECS: Dict[str, Any] = {"json": JSON_CODEC, "msgpack": MsgpackCodec()}
+
+
+def get_codec(name: Optional[str]):
+    """
+    按名称获取编码器
+    
+    未指定或不支持时使用 JSON，连接确认消息的 encoding 字段告知客户端实际编码
+    """
+    return CODECS.get((name or "json").lower(), JSON_CODEC)
+
+
+class EncodedMessage:
+    """同一条消息按编码缓存编码结果，推送给多个客户端时每种编码只序列化一次"""
+    
+    __slots__ = ("message", "_encoded")
+    
+    def __init__(self, message: Any):
+        self.message = message
+        self._encoded: Dict[str, Union[str, bytes]] = {}
+    
+    def encode(self, codec) -> Union[str, bytes]:
+        data = self._encoded.get(codec.name)
+        if data is None:
+            data = self._encoded[codec.name] = codec.encode(self.message)
+        return data
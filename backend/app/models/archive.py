@@ -0,0 +1,24 @@
+"""
+冷数据归档模型
+"""
+from sqlmodel import SQLModel, Field
+from sqlalchemy import UniqueConstraint
+from datetime import datetime
+from typing import Optional
+
+
+class ArchiveSegment(SQLModel, table=True):
+    """归档分段表（每个表每个月一行，记录归档库位置和时间范围，查询据此决定需要合并哪些归档库）"""
+    __tablename__ = "archive_segments"
+    __table_args__ = (
+        UniqueConstraint("table_name", "month", name="uq_archive_segment_month"),
+    )
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    table_name: str = Field(max_length=50, description="归档的表名")
+    month: str = Field(max_length=7, description="月份 YYYY-MM")
+    path: str = Field(max_length=500, description="归档库文件路径")
+    row_count: int = Field(default=0, description="已归档记录数")
+    min_time: datetime = Field(description="归档记录的最早时间")
+    max_time: datetime = Field(description="归档记录的最晚时间")
+    archived_at: datetime = Field(default_factory=datetime.now, description="最近一次归档时间")
@@ -2,6 +2,7 @@
 设备健康度相关模型
 """
 from sqlmodel import SQLModel, Field
+from sqlalchemy import Index, UniqueConstraint
 from datetime import datetime
 from typing import Optional
 
@@ -9,6 +10,10 @@ from typing import Optional
 class DeviceHealthRecord(SQLModel, table=True):
     """设备健康度记录表"""
     __tablename__ = "device_health_records"
+    __table_args__ = (
+        # 历史查询按设备 + 时间范围过滤
+        Index("ix_device_health_records_device_created", "device_id", "created_at"),
+    )
     
     id: Optional[int] = Field(default=None, primary_key=True)
     device_id: int = Field(foreign_key="device.id", description="设备ID")
@@ -42,6 +47,10 @@ class DeviceUsageStats(SQLModel, table=True):
 class DeviceAlert(SQLModel, table=True):
     """设备告警记录表"""
     __tablename__ = "device_alerts"
+    __table_args__ = (
+        # 告警引擎按设备 + 类型查找未解决告警，告警列表按设备和解决状态过滤
+        Index("ix_device_alerts_device_type_resolved", "device_id", "alert_type", "is_resolved"),
+    )
     
     id: Optional[int] = Field(default=None, primary_key=True)
     device_id: int = Field(foreign_key="device.id", description="设备ID")
@@ -50,7 +59,7 @@ class DeviceAlert(SQLModel, table=True):
     message: str = Field(description="告警消息")
     is_resolved: bool = Field(default=False, description="是否已解决")
     resolved_at: Optional[datetime] = Field(default=None, description="解决时间")
-    created_at: datetime = Field(default_factory=datetime.now, description="创建时间")
+    created_at: datetime = Field(default_factory=datetime.now, index=True, description="创建时间")
 
 
 class AlertRule(SQLModel, table=True):
@@ -66,4 +75,64 @@ class AlertRule(SQLModel, table=True):
     severity: str = Field(max_length=20, description="严重程度")
     is_enabled: bool = Field(default=True, description="是否启用")
     notification_channels: Optional[str] = Field(default=None, description="通知渠道(JSON)")
+    condition_type: str = Field(default="threshold", max_length=20, description="条件类型: threshold(阈值)/rate(每分钟变化量)")
+    duration_seconds: Optional[int] = Field(default=None, description="条件需持续满足的秒数，为空表示单个样本即触发")
+    window_seconds: Optional[int] = Field(default=None, description="变化率规则的时间窗口(秒)")
+    clear_threshold: Optional[float] = Field(default=None, description="恢复阈值(滞回)，触发后需越过该值才恢复并自动解决告警")
     created_at: datetime = Field(default_factory=datetime.now, description="创建时间")
+
+
+class DeviceHealthRollup(SQLModel, table=True):
+    """设备健康度聚合表（按 1m/1h/1d 时间桶聚合原始记录）"""
+    __tablename__ = "device_health_rollups"
+    __table_args__ = (
+        UniqueConstraint("device_id", "resolution", "bucket_start", name="uq_health_rollup_bucket"),
+        # 聚合进度（各粒度最大 bucket_start）和按粒度清理过期数据
+        Index("ix_device_health_rollups_resolution_bucket", "resolution", "bucket_start"),
+    )
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    device_id: int = Field(foreign_key="device.id", description="设备ID")
+    resolution: str = Field(max_length=4, description="聚合粒度: 1m/1h/1d")
+    bucket_start: datetime = Field(description="时间桶起点")
+    sample_count: int = Field(default=0, description="桶内原始记录数")
+    health_score_min: Optional[float] = Field(default=None)
+    health_score_max: Optional[float] = Field(default=None)
+    health_score_avg: Optional[float] = Field(default=None)
+    health_score_p95: Optional[float] = Field(default=None)
+    battery_level_min: Optional[float] = Field(default=None)
+    battery_level_max: Optional[float] = Field(default=None)
+    battery_level_avg: Optional[float] = Field(default=None)
+    battery_level_p95: Optional[float] = Field(default=None)
+    temperature_min: Optional[float] = Field(default=None)
+    temperature_max: Optional[float] = Field(default=None)
+    temperature_avg: Optional[float] = Field(default=None)
+    temperature_p95: Optional[float] = Field(default=None)
+    cpu_usage_min: Optional[float] = Field(default=None)
+    cpu_usage_max: Optional[float] = Field(default=None)
+    cpu_usage_avg: Optional[float] = Field(default=None)
+    cpu_usage_p95: Optional[float] = Field(default=None)
+    memory_usage_min: Optional[float] = Field(default=None)
+    memory_usage_max: Optional[float] = Field(default=None)
+    memory_usage_avg: Optional[float] = Field(default=None)
+    memory_usage_p95: Optional[float] = Field(default=None)
+    storage_usage_min: Optional[float] = Field(default=None)
+    storage_usage_max: Optional[float] = Field(default=None)
+    storage_usage_avg: Optional[float] = Field(default=None)
+    storage_usage_p95: Optional[float] = Field(default=None)
+
+
+class DeviceHealthLatest(SQLModel, table=True):
+    """设备最新健康度快照表（每个设备一行，采集器写入健康记录时同步更新）"""
+    __tablename__ = "device_health_latest"
+    
+    device_id: int = Field(foreign_key="device.id", primary_key=True, description="设备ID")
+    health_score: int = Field(description="健康度分数 0-100")
+    battery_level: Optional[int] = Field(default=None, description="电量百分比")
+    temperature: Optional[float] = Field(default=None, description="温度(摄氏度)")
+    cpu_usage: Optional[float] = Field(default=None, description="CPU使用率")
+    memory_usage: Optional[float] = Field(default=None, description="内存使用率")
+    storage_usage: Optional[float] = Field(default=None, description="存储使用率")
+    network_status: Optional[str] = Field(default=None, description="网络状态")
+    last_active_time: Optional[datetime] = Field(default=None, description="最后活跃时间")
+    recorded_at: datetime = Field(description="最新健康记录的采集时间")
@@ -11,7 +11,7 @@ class FailureAnalysis(SQLModel, table=True):
     __tablename__ = "failure_analysis"
     
     id: Optional[int] = Field(default=None, primary_key=True)
-    task_log_id: int = Field(foreign_key="task_log.id", description="任务日志ID")
+    task_log_id: int = Field(foreign_key="task_log.id", index=True, description="任务日志ID")
     failure_type: str = Field(max_length=50, description="失败类型")
     failed_step_index: Optional[int] = Field(default=None, description="失败步骤索引")
     failed_step_name: Optional[str] = Field(default=None, max_length=200, description="失败步骤名称")
@@ -21,7 +21,7 @@ class FailureAnalysis(SQLModel, table=True):
     suggestions: Optional[str] = Field(default=None, description="解决建议(逗号分隔)")
     confidence: Optional[float] = Field(default=None, description="分类置信度")
     is_auto_analyzed: bool = Field(default=True, description="是否自动分析")
-    created_at: datetime = Field(default_factory=datetime.now, description="创建时间")
+    created_at: datetime = Field(default_factory=datetime.now, index=True, description="创建时间")
 
 
 class ScriptFailureStats(SQLModel, table=True):
@@ -47,7 +47,7 @@ class StepExecutionLog(SQLModel, table=True):
     step_index: int = Field(description="步骤索引")
     step_name: Optional[str] = Field(default=None, max_length=200, description="步骤名称")
     step_type: Optional[str] = Field(default=None, max_length=50, description="步骤类型")
-    status: str = Field(max_length=20, description="状态: success/failed/skipped")
+    status: str = Field(max_length=20, description="状态: success/failed/skipped/cancelled")
     start_time: Optional[datetime] = Field(default=None, description="开始时间")
     end_time: Optional[datetime] = Field(default=None, description="结束时间")
     duration: Optional[float] = Field(default=None, description="执行时长(秒)")
@@ -2,6 +2,7 @@
 任务执行日志表模型
 """
 from sqlmodel import SQLModel, Field
+from sqlalchemy import Index
 from datetime import datetime
 from typing import Optional
 
@@ -9,13 +10,18 @@ from typing import Optional
 class TaskLog(SQLModel, table=True):
     """任务执行日志表"""
     __tablename__ = "task_log"
+    __table_args__ = (
+        # 任务/报告列表按状态或脚本过滤并按开始时间倒序（同时覆盖按状态、按脚本的单列查询）
+        Index("ix_task_log_status_start_time", "status", "start_time"),
+        Index("ix_task_log_script_id_start_time", "script_id", "start_time"),
+    )
     
     id: Optional[int] = Field(default=None, primary_key=True, description="日志ID")
     task_name: str = Field(max_length=200, description="任务名称")
-    script_id: Optional[int] = Field(default=None, foreign_key="script.id", index=True, description="关联脚本ID")  # 添加索引
+    script_id: Optional[int] = Field(default=None, foreign_key="script.id", description="关联脚本ID")
     device_id: Optional[int] = Field(default=None, foreign_key="device.id", index=True, description="关联设备ID")  # 添加索引
     scheduled_task_id: Optional[int] = Field(default=None, foreign_key="scheduled_task.id", index=True, description="关联定时任务ID")  # 添加索引
-    status: str = Field(default="running", max_length=20, index=True, description="执行状态")  # 添加索引
+    status: str = Field(default="running", max_length=20, description="执行状态")
     start_time: datetime = Field(default_factory=datetime.now, index=True, description="开始时间")  # 添加索引
     end_time: Optional[datetime] = Field(default=None, description="结束时间")
     duration: Optional[float] = Field(default=None, description="执行耗时")
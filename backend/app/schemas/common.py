@@ -23,5 +23,14 @@ class PageResponse(BaseModel, Generic[T]):
     total_pages: int
 
 
+class CursorPageResponse(BaseModel, Generic[T]):
+    """游标分页响应（next_cursor 为空表示没有下一页，total 仅在请求 include_total 时返回）"""
+    items: List[T]
+    page_size: int
+    next_cursor: Optional[str] = None
+    total: Optional[int] = None
+    total_exact: Optional[bool] = None
+
+
 # 别名，保持兼容性
 PaginatedResponse = PageResponse
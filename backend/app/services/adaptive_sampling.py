@@ -0,0 +1,193 @@
+"""
+设备健康度自适应采样
+根据设备最近一次的指标调整采集间隔：高温、高负载、正在执行任务、健康度下降的设备
+采集更频繁，稳定空闲的设备采集更稀疏。整体探测速率不超过按固定间隔采集全部在线设备时的预算，
+即不增加 adb 总负载，只是把探测次数分配给更需要关注的设备
+"""
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+def _ramp(value: Optional[float], low: float, high: float) -> float:
+    """value 在 [low, high] 间线性映射到 [0, 1]，缺失值为 0"""
+    if value is None:
+        return 0.0
+    try:
+        value = float(value)
+    except (ValueError, TypeError):
+        return 0.0
+    if value <= low:
+        return 0.0
+    if value >= high:
+        return 1.0
+    return (value - low) / (high - low)
+
+
+@dataclass
+class SamplingState:
+    """单个设备的采样状态"""
+    urgency: float = 0.0  # 0 表示稳定空闲，1 表示最需要关注
+    reason: str = "stable"  # urgency 的主要来源: hot/busy/task/degrading/unhealthy/stable
+    last_score: Optional[int] = None
+    running_task: bool = False  # 设备正在执行任务（status 为 busy）
+    interval: float = 0.0  # 当前生效的采集间隔(秒)
+
+
+class AdaptiveSampler:
+    """
+    自适应采样器
+    
+    urgency 取各项信号的最大值，采集间隔在 [min_interval, max_interval] 间按几何插值：
+    urgency 为 0 时为 max_interval，为 1 时为 min_interval。所有设备的探测速率之和
+    超过预算（在线设备数 / base_interval）时整体等比例拉长间隔
+    
+    正在执行任务的设备 urgency 至少为 TASK_URGENCY：任务期间的温度、负载变化最快，
+    也最需要及时发现异常
+    """
+    
+    TASK_URGENCY = 0.75
+    
+    def __init__(self, base_interval: float, min_interval: float, max_interval: float):
+        self.base_interval = base_interval
+        self.min_interval = min(min_interval, base_interval)
+        self.max_interval = max(max_interval, base_interval)
+        self.states: Dict[int, SamplingState] = {}
+        self.scale = 1.0
+        self.budget_per_minute = 0.0
+        self.rate_per_minute = 0.0
+    
+    def urgency(self, metrics: dict, score: int, previous_score: Optional[int]) -> Tuple[float, str]:
+        """
+        计算设备的关注程度
+        
+        Args:
+            metrics: 设备指标
+            score: 本次健康度分数
+            previous_score: 上次健康度分数
+        
+        Returns:
+            (urgency, 主要原因)
+        """
+        signals = {
+            "hot": _ramp(metrics.get("temperature"), 38, 45),
+            "busy": _ramp(metrics.get("cpu_usage"), 50, 90),
+            "degrading": _ramp(previous_score - score, 0, 15) if previous_score is not None else 0.0,
+            "unhealthy": _ramp(80 - score, 0, 30),
+        }
+        reason = max(signals, key=signals.get)
+        value = signals[reason]
+        return value, reason if value > 0 else "stable"
+    
+    def record(self, device_id: int, metrics: dict, score: int):
+        """记录设备本次采集结果，更新 urgency"""
+        state = self.states.get(device_id)
+        if state is None:
+            state = self.states[device_id] = SamplingState()
+        state.urgency, state.reason = self.urgency(metrics, score, state.last_score)
+        state.last_score = score
+    
+    def effective_urgency(self, state: SamplingState) -> Tuple[float, str]:
+        """叠加任务状态后的 urgency 与主要原因"""
+        if state.running_task and self.TASK_URGENCY > state.urgency:
+            return self.TASK_URGENCY, "task"
+        return state.urgency, state.reason
+    
+    def target_interval(self, urgency: float) -> float:
+        """未受预算约束时的采集间隔"""
+        return self.max_interval * (self.min_interval / self.max_interval) ** urgency
+    
+    def rebalance(self, device_ids: List[int], running: Iterable[int] = ()):
+        """
+        重新计算在线设备的采集间隔，并丢弃已离线设备的状态
+        
+        尚未采集过的设备按 base_interval 计入预算
+        
+        Args:
+            device_ids: 在线设备ID（含正在执行任务的设备）
+            running: 正在执行任务的设备ID
+        """
+        online = set(device_ids)
+        running = set(running)
+        self.states = {device_id: state for device_id, state in self.states.items() if device_id in online}
+        for device_id, state in self.states.items():
+            state.running_task = device_id in running
+        self.budget_per_minute = len(device_ids) * 60 / self.base_interval
+        targets = {
+            device_id: self.target_interval(self.effective_urgency(self.states[device_id])[0])
+            if device_id in self.states else self.base_interval
+            for device_id in device_ids
+        }
+        
+        # 被 max_interval 截断的设备不再随 scale 降低速率，迭代几次收敛
+        scale = 1.0
+        rate = self._rate(targets, scale)
+        for _ in range(8):
+            if rate <= self.budget_per_minute * 1.0001:
+                break
+            scale *= rate / self.budget_per_minute
+            rate = self._rate(targets, scale)
+        
+        self.scale = scale
+        self.rate_per_minute = rate
+        for device_id, state in self.states.items():
+            state.interval = min(self.max_interval, targets[device_id] * scale)
+    
+    def _rate(self, targets: Dict[int, float], scale: float) -> float:
+        """每分钟探测次数"""
+        return sum(60 / min(self.max_interval, interval * scale) for interval in targets.values())
+    
+    def interval(self, device_id: int) -> float:
+        """设备当前的采集间隔，未采集过的设备为 0（立即采集）"""
+        state = self.states.get(device_id)
+        return state.interval if state else 0.0
+    
+    def due(self, device_ids: List[int], last_collected: Dict[int, float], now: float) -> List[int]:
+        """
+        到期需要采集的设备
+        
+        Args:
+            device_ids: 在线设备ID
+            last_collected: {设备ID: 最后一次采集时间戳}
+            now: 当前时间戳
+        
+        Returns:
+            到期设备ID，按逾期比例从高到低排序（从未采集的设备最先）
+        """
+        overdue = []
+        for device_id in device_ids:
+            last = last_collected.get(device_id)
+            interval = self.interval(device_id)
+            if last is None or interval <= 0:
+                overdue.append((float("inf"), device_id))
+            elif now - last >= interval:
+                overdue.append(((now - last) / interval, device_id))
+        overdue.sort(key=lambda item: -item[0])
+        return [device_id for _, device_id in overdue]
+    
+    def get_stats(self, last_collected: Dict[int, float], now: float, limit: int = 10) -> dict:
+        """采样速率与采集最频繁的设备"""
+        reasons: Dict[str, int] = {}
+        for state in self.states.values():
+            reason = self.effective_urgency(state)[1]
+            reasons[reason] = reasons.get(reason, 0) + 1
+        fastest = sorted(self.states.items(), key=lambda item: item[1].interval)[:limit]
+        return {
+            "enabled": True,
+            "base_interval_seconds": self.base_interval,
+            "min_interval_seconds": self.min_interval,
+            "max_interval_seconds": self.max_interval,
+            "budget_per_minute": round(self.budget_per_minute, 2),
+            "probes_per_minute": round(self.rate_per_minute, 2),
+            "scale": round(self.scale, 3),
+            "reasons": reasons,
+            "fastest_devices": [
+                {
+                    "device_id": device_id,
+                    "interval_seconds": round(state.interval, 1),
+                    "urgency": round(self.effective_urgency(state)[0], 3),
+                    "reason": self.effective_urgency(state)[1],
+                    "next_due_in": round(max(0.0, last_collected.get(device_id, now) + state.interval - now), 1),
+                }
+                for device_id, state in fastest
+            ],
+        }
@@ -9,6 +9,7 @@ from typing import List, Dict, Optional
 from datetime import datetime
 from sqlmodel import Session, select
 from app.models import Device, SystemConfig
+from app.core.metrics import adb_command_duration
 
 logger = logging.getLogger(__name__)
 
@@ -34,12 +35,13 @@ class ADBDeviceScanner:
         """
         try:
             # 执行 adb devices 命令
-            result = subprocess.run(
-                [self.adb_path, "devices", "-l"],
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
+            with adb_command_duration.time(command="devices"):
+                result = subprocess.run(
+                    [self.adb_path, "devices", "-l"],
+                    capture_output=True,
+                    text=True,
+                    timeout=10
+                )
             
             if result.returncode != 0:
                 logger.error(f"ADB命令执行失败: {result.stderr}")
@@ -140,24 +142,26 @@ class ADBDeviceScanner:
             logger.error(f"获取设备 {serial} 详情失败: {e}")
             return None
     
-    def _execute_shell_command(self, serial: str, command: str) -> Optional[str]:
+    def _execute_shell_command(self, serial: str, command: str, timeout: float = 5) -> Optional[str]:
         """
         在设备上执行shell命令
         
         Args:
             serial: 设备序列号
             command: shell命令
+            timeout: 超时时间(秒)，超时后结束 adb 进程并返回 None
             
         Returns:
             命令输出结果
         """
         try:
-            result = subprocess.run(
-                [self.adb_path, "-s", serial, "shell", command],
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
+            with adb_command_duration.time(command="shell"):
+                result = subprocess.run(
+                    [self.adb_path, "-s", serial, "shell", command],
+                    capture_output=True,
+                    text=True,
+                    timeout=timeout
+                )
             
             if result.returncode == 0:
                 return result.stdout.strip()
@@ -1,127 +1,412 @@
 """
 告警规则引擎
 """
-from typing import List, Dict
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import update
 from sqlmodel import Session, select
+from app.models import Device
 from app.models.device_health import DeviceAlert, AlertRule
+from app.core.subscriptions import device_event_topics
 from app.core.websocket_manager import manager
+from app.services.anomaly_detector import AnomalyEvent
+from collections import deque
+from dataclasses import dataclass
 from datetime import datetime
 import json
+import operator
 
 
-class AlertEngine:
-    """告警引擎"""
+# 数值比较操作符
+_COMPARATORS: Dict[str, Callable[[float, float], bool]] = {
+    '<': operator.lt,
+    '>': operator.gt,
+    '<=': operator.le,
+    '>=': operator.ge,
+}
+
+
+@dataclass
+class CompiledRule:
+    """编译后的告警规则（规则字段快照 + 判断闭包）"""
+    id: int
+    rule_name: str
+    rule_type: str
+    condition_field: str
+    operator: str
+    threshold_value: float
+    severity: str
+    channels: List[str]
+    condition_type: str
+    duration_seconds: float
+    window_seconds: float
+    clear_threshold: Optional[float]
+    compare: Callable[[object], bool]
+    clears: Callable[[object], bool]
     
-    def __init__(self, session: Session):
-        self.session = session
+    def predicate(self, metrics: Dict) -> bool:
+        """单个样本是否满足条件"""
+        return self.compare(metrics.get(self.condition_field))
+
+
+def compile_rule(rule: AlertRule) -> CompiledRule:
+    """
+    把告警规则编译为判断闭包，操作符和阈值在编译时确定
     
-    async def check_alerts(self, device_id: int, metrics: Dict) -> List[DeviceAlert]:
+    Args:
+        rule: 告警规则
+    
+    Returns:
+        编译后的规则
+    """
+    threshold = rule.threshold_value
+    
+    if rule.operator == '==':
+        expected = str(threshold)
+        
+        def compare(value) -> bool:
+            return value is not None and str(value) == expected
+    elif rule.operator in _COMPARATORS:
+        comparator = _COMPARATORS[rule.operator]
+        
+        def compare(value) -> bool:
+            if value is None:
+                return False
+            try:
+                return comparator(float(value), threshold)
+            except (ValueError, TypeError):
+                return False
+    else:
+        def compare(value) -> bool:
+            return False
+    
+    # 滞回：告警触发后，值需越过恢复阈值才算恢复；未配置时条件不再满足即恢复
+    clear_threshold = rule.clear_threshold
+    if clear_threshold is not None and rule.operator in ('<', '<=', '>', '>='):
+        clear_compare = operator.ge if rule.operator in ('<', '<=') else operator.le
+        
+        def clears(value) -> bool:
+            try:
+                return clear_compare(float(value), clear_threshold)
+            except (ValueError, TypeError):
+                return False
+    else:
+        def clears(value) -> bool:
+            return value is not None and not compare(value)
+    
+    channels = []
+    if rule.notification_channels:
+        try:
+            channels = json.loads(rule.notification_channels)
+        except:
+            channels = []
+    
+    return CompiledRule(
+        id=rule.id,
+        rule_name=rule.rule_name,
+        rule_type=rule.rule_type,
+        condition_field=rule.condition_field,
+        operator=rule.operator,
+        threshold_value=threshold,
+        severity=rule.severity,
+        channels=channels,
+        condition_type=rule.condition_type or 'threshold',
+        duration_seconds=rule.duration_seconds or 0,
+        window_seconds=rule.window_seconds or 0,
+        clear_threshold=clear_threshold,
+        compare=compare,
+        clears=clears
+    )
+
+
+class RuleState:
+    """单个 (设备, 规则) 的流式判断状态"""
+    __slots__ = ('breach_since', 'active', 'window')
+    
+    def __init__(self):
+        self.breach_since: Optional[float] = None  # 条件开始持续满足的时间
+        self.active = False  # 已触发、尚未恢复
+        self.window: Deque[Tuple[float, float]] = deque()  # 变化率规则的 (时间, 值) 环形缓冲
+
+
+class AlertStateTracker:
+    """
+    告警流式判断
+    
+    每个 (设备, 规则) 维护 O(1) 状态：持续时间条件只记录开始满足的时间；
+    变化率规则用按时间窗口淘汰的环形缓冲，每个样本均摊 O(1)，不回读数据库历史
+    """
+    
+    def __init__(self):
+        self.states: Dict[Tuple[int, int], RuleState] = {}
+    
+    def reset(self):
+        """清空全部状态"""
+        self.states.clear()
+    
+    def forget_rules(self, rule_ids: Iterable[int]):
+        """丢弃指定规则的状态（规则修改或删除后），其他规则的持续时间和变化率窗口不受影响"""
+        rule_ids = set(rule_ids)
+        self.states = {key: state for key, state in self.states.items() if key[1] not in rule_ids}
+    
+    def update(self, device_id: int, rule: CompiledRule, metrics: Dict, now: float) -> Optional[str]:
         """
-        检查设备指标是否触发告警
+        输入一个样本
         
         Args:
             device_id: 设备ID
+            rule: 已编译规则
             metrics: 设备指标
-            
+            now: 样本时间戳（秒）
+        
         Returns:
-            触发的告警列表
+            "fire"（应触发告警）、"clear"（已恢复）或 None
         """
-        # 获取所有启用的告警规则
-        statement = select(AlertRule).where(AlertRule.is_enabled == True)
-        rules = self.session.exec(statement).all()
+        value = metrics.get(rule.condition_field)
+        if value is None:
+            return None
+        
+        key = (device_id, rule.id)
+        state = self.states.get(key)
+        if state is None:
+            state = self.states[key] = RuleState()
         
-        triggered_alerts = []
+        if rule.condition_type == 'rate':
+            value = self._rate(state, rule, value, now)
+            if value is None:
+                return None
         
-        for rule in rules:
-            if self._evaluate_rule(rule, metrics):
-                alert = await self._create_alert(device_id, rule, metrics)
-                if alert:
-                    triggered_alerts.append(alert)
+        if state.active:
+            if rule.clears(value):
+                state.active = False
+                state.breach_since = None
+                return 'clear'
+            return None
         
-        return triggered_alerts
+        if not rule.compare(value):
+            state.breach_since = None
+            return None
+        if state.breach_since is None:
+            state.breach_since = now
+        if now - state.breach_since >= rule.duration_seconds:
+            state.active = True
+            return 'fire'
+        return None
+    
+    def _rate(self, state: RuleState, rule: CompiledRule, value, now: float) -> Optional[float]:
+        """窗口内每分钟变化量，样本不足时返回 None"""
+        try:
+            value = float(value)
+        except (ValueError, TypeError):
+            return None
+        
+        window = state.window
+        window.append((now, value))
+        while now - window[0][0] > rule.window_seconds:
+            window.popleft()
+        
+        first_time, first_value = window[0]
+        if now <= first_time:
+            return None
+        return (value - first_value) / (now - first_time) * 60
+
+
+class AlertRuleCache:
+    """
+    已编译告警规则缓存，规则变更时失效，下次检查时重新加载
+    
+    同时维护未解决告警的 (设备ID, 告警类型) -> 告警ID 索引：告警引擎创建和自动解决告警时
+    增量更新，每批检查不再查询数据库；缓存失效或告警被手动解决时下次检查重新加载
+    """
+    
+    def __init__(self):
+        self.rules: Optional[List[CompiledRule]] = None
+        self.tracker = AlertStateTracker()
+        self.open_alerts: Optional[Dict[Tuple[int, str], int]] = None
     
-    def _evaluate_rule(self, rule: AlertRule, metrics: Dict) -> bool:
+    def get(self, session: Session) -> List[CompiledRule]:
+        """获取启用的已编译规则，缓存失效时从数据库加载一次"""
+        if self.rules is None:
+            statement = select(AlertRule).where(AlertRule.is_enabled == True)
+            self.rules = [compile_rule(rule) for rule in session.exec(statement).all()]
+        return self.rules
+    
+    def open_alert_index(self, session: Session) -> Dict[Tuple[int, str], int]:
+        """未解决告警索引，失效时从数据库加载一次"""
+        if self.open_alerts is None:
+            statement = select(DeviceAlert.device_id, DeviceAlert.alert_type, DeviceAlert.id).where(
+                DeviceAlert.is_resolved == False
+            )
+            self.open_alerts = {
+                (device_id, alert_type): alert_id for device_id, alert_type, alert_id in session.exec(statement)
+            }
+        return self.open_alerts
+    
+    def invalidate(self, rule_ids: Optional[Iterable[int]] = None, broadcast: bool = True):
         """
-        评估规则是否触发
+        使缓存失效
         
         Args:
-            rule: 告警规则
+            rule_ids: 修改、删除或新建的规则ID，只丢弃这些规则的流式状态；None 时丢弃全部状态
+            broadcast: 是否经事件总线通知其他 worker（告警检查在主进程执行，规则可能在任意 worker 修改）
+        """
+        self.rules = None
+        self.open_alerts = None
+        if rule_ids is None:
+            self.tracker.reset()
+        else:
+            rule_ids = list(rule_ids)
+            self.tracker.forget_rules(rule_ids)
+        if broadcast:
+            manager.bus.publish_nowait("alert_rules", {"action": "invalidate", "rule_ids": rule_ids})
+    
+    def invalidate_open_alerts(self, broadcast: bool = True):
+        """告警在告警引擎之外被解决（手动解决）后重新加载未解决告警索引"""
+        self.open_alerts = None
+        if broadcast:
+            manager.bus.publish_nowait("alert_rules", {"action": "invalidate_open_alerts"})
+    
+    async def handle_bus_event(self, payload: dict):
+        """其他 worker 修改了规则或解决了告警"""
+        if payload.get("action") == "invalidate_open_alerts":
+            self.invalidate_open_alerts(broadcast=False)
+        else:
+            self.invalidate(payload.get("rule_ids"), broadcast=False)
+
+
+# 全局规则缓存
+alert_rule_cache = AlertRuleCache()
+
+
+class AlertEngine:
+    """告警引擎"""
+    
+    def __init__(self, session: Session):
+        self.session = session
+    
+    async def check_alerts(self, device_id: int, metrics: Dict) -> List[DeviceAlert]:
+        """
+        检查设备指标是否触发告警
+        
+        Args:
+            device_id: 设备ID
             metrics: 设备指标
             
         Returns:
-            是否触发
+            触发的告警列表
         """
-        field_value = metrics.get(rule.condition_field)
-        if field_value is None:
-            return False
+        return await self.check_alerts_batch({device_id: metrics})
         
-        threshold = rule.threshold_value
-        operator = rule.operator
-        
-        try:
-            if operator == '<':
-                return float(field_value) < threshold
-            elif operator == '>':
-                return float(field_value) > threshold
-            elif operator == '<=':
-                return float(field_value) <= threshold
-            elif operator == '>=':
-                return float(field_value) >= threshold
-            elif operator == '==':
-                return str(field_value) == str(threshold)
-        except (ValueError, TypeError):
-            return False
-        
-        return False
-    
-    async def _create_alert(
-        self, 
-        device_id: int, 
-        rule: AlertRule, 
-        metrics: Dict
-    ) -> DeviceAlert:
+    async def check_alerts_batch(
+        self,
+        devices_metrics: Dict[int, Dict],
+        now: Optional[datetime] = None,
+        anomalies: Optional[List[AnomalyEvent]] = None
+    ) -> List[DeviceAlert]:
         """
-        创建告警记录
+        批量检查多个设备的告警
+        
+        每个样本都送入流式状态（持续时间、变化率、滞回）；规则和未解决告警索引使用缓存，
+        已有未解决的同类告警时不重复创建；
+        配置了恢复阈值的规则在恢复时自动解决告警。异常检测事件按 anomaly_<指标> 类型
+        走同样的去重和通知，恢复事件自动解决告警。新告警和解决状态在同一个事务中写入
         
         Args:
-            device_id: 设备ID
-            rule: 告警规则
-            metrics: 设备指标
+            devices_metrics: {设备ID: 设备指标}
+            now: 样本时间，默认当前时间
+            anomalies: 异常检测产生的事件
             
         Returns:
-            告警记录
+            新触发的告警列表
         """
-        # 检查是否已存在未解决的相同告警
-        statement = select(DeviceAlert).where(
-            DeviceAlert.device_id == device_id,
-            DeviceAlert.alert_type == rule.rule_type,
-            DeviceAlert.is_resolved == False
-        )
-        existing_alert = self.session.exec(statement).first()
+        anomalies = anomalies or []
+        rules = alert_rule_cache.get(self.session) if devices_metrics else []
+        if not rules and not anomalies:
+            return []
         
-        if existing_alert:
-            # 已存在未解决的告警，不重复创建
-            return None
+        now = now or datetime.now()
+        timestamp = now.timestamp()
+        tracker = alert_rule_cache.tracker
+        open_alerts = alert_rule_cache.open_alert_index(self.session)
+        # 本批的变更提交成功后才写回索引
+        opened: Dict[Tuple[int, str], DeviceAlert] = {}
+        resolved: Dict[Tuple[int, str], int] = {}
         
-        # 创建新告警
-        alert = DeviceAlert(
-            device_id=device_id,
-            alert_type=rule.rule_type,
-            severity=rule.severity,
-            message=self._generate_alert_message(rule, metrics),
-            is_resolved=False
-        )
+        def is_open(key: Tuple[int, str]) -> bool:
+            return key in opened or (key in open_alerts and key not in resolved)
+        
+        def resolve(key: Tuple[int, str]):
+            if key in open_alerts and key not in resolved:
+                resolved[key] = open_alerts[key]
+        
+        triggered = []
+        for device_id, metrics in devices_metrics.items():
+            for rule in rules:
+                transition = tracker.update(device_id, rule, metrics, timestamp)
+                if transition is None:
+                    continue
+                key = (device_id, rule.rule_type)
+                if transition == 'clear':
+                    if rule.clear_threshold is not None:
+                        resolve(key)
+                    continue
+                if is_open(key):
+                    continue
+                alert = DeviceAlert(
+                    device_id=device_id,
+                    alert_type=rule.rule_type,
+                    severity=rule.severity,
+                    message=self._generate_alert_message(rule, metrics),
+                    is_resolved=False
+                )
+                opened[key] = alert
+                triggered.append((alert, rule.channels))
+        
+        for event in anomalies:
+            key = (event.device_id, event.alert_type)
+            if event.cleared:
+                resolve(key)
+                continue
+            if is_open(key):
+                continue
+            alert = DeviceAlert(
+                device_id=event.device_id,
+                alert_type=event.alert_type,
+                severity='warning',
+                message=event.message,
+                is_resolved=False
+            )
+            opened[key] = alert
+            triggered.append((alert, []))
         
-        self.session.add(alert)
-        self.session.commit()
-        self.session.refresh(alert)
+        if not triggered and not resolved:
+            return []
+    
+        try:
+            if resolved:
+                self.session.exec(
+                    update(DeviceAlert)
+                    .where(DeviceAlert.id.in_(list(resolved.values())))
+                    .values(is_resolved=True, resolved_at=now)
+                )
+            self.session.add_all([alert for alert, _ in triggered])
+            self.session.flush()
+            opened_ids = {key: alert.id for key, alert in opened.items()}
+            self.session.commit()
+        except Exception:
+            # 提交失败时索引可能与数据库不一致，下次检查重新加载
+            alert_rule_cache.open_alerts = None
+            raise
+        for key in resolved:
+            del open_alerts[key]
+        open_alerts.update(opened_ids)
         
         # 发送通知
-        await self._send_notifications(alert, rule, device_id)
+        for alert, channels in triggered:
+            await self._send_notifications(alert, channels, alert.device_id)
         
-        return alert
+        return [alert for alert, _ in triggered]
     
-    def _generate_alert_message(self, rule: AlertRule, metrics: Dict) -> str:
+    def _generate_alert_message(self, rule: CompiledRule, metrics: Dict) -> str:
         """
         生成告警消息
         
@@ -134,6 +419,14 @@ class AlertEngine:
         """
         field_value = metrics.get(rule.condition_field)
         
+        if rule.condition_type == 'rate':
+            message = (
+                f'{rule.rule_name}: {rule.condition_field} 每分钟变化 {rule.operator} {rule.threshold_value}'
+                f' (当前值 {field_value})'
+            )
+        else:
+            message = None
+        
         messages = {
             'low_battery': f'设备电量过低: {field_value}%',
             'high_temp': f'设备温度过高: {field_value}°C',
@@ -144,15 +437,18 @@ class AlertEngine:
             'network_error': '网络连接异常',
         }
         
-        return messages.get(
+        message = message or messages.get(
             rule.rule_type, 
             f'{rule.rule_name}: {field_value} {rule.operator} {rule.threshold_value}'
         )
+        if rule.duration_seconds:
+            message += f'，已持续 {rule.duration_seconds / 60:g} 分钟'
+        return message
     
     async def _send_notifications(
         self, 
         alert: DeviceAlert, 
-        rule: AlertRule,
+        channels: List[str],
         device_id: int
     ):
         """
@@ -160,30 +456,30 @@ class AlertEngine:
         
         Args:
             alert: 告警记录
-            rule: 告警规则
+            channels: 通知渠道，为空时默认 WebSocket
             device_id: 设备ID
         """
-        channels = []
-        if rule.notification_channels:
-            try:
-                channels = json.loads(rule.notification_channels)
-            except:
-                channels = []
         
-        # WebSocket 推送
+        # WebSocket 推送（只发给订阅了该设备、分组或严重程度主题的客户端）
         if 'websocket' in channels or not channels:  # 默认使用websocket
-            await manager.broadcast(json.dumps({
-                'type': 'device_alert',
-                'data': {
-                    'alert_id': alert.id,
-                    'device_id': device_id,
-                    'alert_type': alert.alert_type,
-                    'severity': alert.severity,
-                    'message': alert.message,
-                    'created_at': alert.created_at.isoformat()
+            device = self.session.get(Device, device_id)
+            group_name = device.group_name if device else None
+            recipients = await manager.publish(
+                device_event_topics(device_id, group_name, alert.severity),
+                {
+                    'type': 'device_alert',
+                    'data': {
+                        'alert_id': alert.id,
+                        'device_id': device_id,
+                        'group_name': group_name,
+                        'alert_type': alert.alert_type,
+                        'severity': alert.severity,
+                        'message': alert.message,
+                        'created_at': alert.created_at.isoformat()
+                    }
                 }
-            }))
-            print(f"📢 告警通知已发送: {alert.message}")
+            )
+            print(f"📢 告警通知已发送 ({recipients} 个订阅者): {alert.message}")
         
         # 邮件通知
         if 'email' in channels:
@@ -211,5 +507,6 @@ class AlertEngine:
             alert.resolved_at = datetime.now()
             self.session.add(alert)
             self.session.commit()
+            alert_rule_cache.invalidate_open_alerts()
             return True
         return False
@@ -0,0 +1,206 @@
+"""
+设备指标流式异常检测
+每个 (设备, 指标) 维护按时间衰减的 EWMA 均值/方差，采集器每写入一个样本增量更新一次；
+样本偏离自身基线超过 ANOMALY_Z_THRESHOLD 个标准差并连续出现时产生异常事件，
+交给告警引擎写入告警。能发现固定阈值规则漏掉的缓慢劣化，比如耗电速度比上周快一倍
+"""
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from app.core.config import settings
+import json
+import math
+import os
+
+
+# 检测的指标: {指标: (方向, 标准差下限, 名称)}，方向 1 表示只检测偏高，-1 表示只检测偏低
+ANOMALY_METRICS: Dict[str, Tuple[int, float, str]] = {
+    'battery_drain': (1, 0.5, '耗电速度(%/小时)'),
+    'temperature': (1, 0.5, '温度(°C)'),
+    'cpu_usage': (1, 2.0, 'CPU使用率(%)'),
+    'memory_usage': (1, 1.0, '内存使用率(%)'),
+    'health_score': (-1, 1.0, '健康度'),
+}
+
+# 耗电速度至少跨越这么长时间才计算一次，避免整数电量在短间隔内的量化噪声
+DRAIN_MIN_SPAN_SECONDS = 1800
+
+
+class EwmaState:
+    """单个 (设备, 指标) 的基线，__slots__ 保持每个状态只有几个数字"""
+    __slots__ = ('mean', 'var', 'count', 'last_ts', 'streak', 'active')
+    
+    def __init__(self, mean: float = 0.0, var: float = 0.0, count: int = 0, last_ts: float = 0.0):
+        self.mean = mean
+        self.var = var
+        self.count = count
+        self.last_ts = last_ts
+        self.streak = 0  # 连续异常样本数
+        self.active = False  # 已产生异常事件、尚未恢复
+    
+    def update(self, value: float, now: float, halflife: float):
+        """按样本间隔计算衰减系数，增量更新均值和方差"""
+        if self.count == 0:
+            self.mean, self.var = value, 0.0
+        else:
+            alpha = 1 - 0.5 ** (max(now - self.last_ts, 0.0) / halflife)
+            diff = value - self.mean
+            increment = alpha * diff
+            self.mean += increment
+            self.var = (1 - alpha) * (self.var + diff * increment)
+        self.count += 1
+        self.last_ts = now
+
+
+@dataclass
+class AnomalyEvent:
+    """异常事件（cleared 为 True 表示已恢复到基线附近）"""
+    device_id: int
+    metric: str
+    value: float
+    mean: float
+    std: float
+    z: float
+    cleared: bool = False
+    
+    @property
+    def alert_type(self) -> str:
+        return f'anomaly_{self.metric}'
+    
+    @property
+    def message(self) -> str:
+        label = ANOMALY_METRICS[self.metric][2]
+        return f'{label}异常: 当前 {self.value:.1f}，基线 {self.mean:.1f}±{self.std:.1f} (z={self.z:+.1f})'
+
+
+class AnomalyDetector:
+    """EWMA 异常检测器"""
+    
+    def __init__(
+        self,
+        halflife_hours: float = None,
+        z_threshold: float = None,
+        min_samples: int = None,
+        consecutive: int = None
+    ):
+        self.halflife = (halflife_hours or settings.ANOMALY_EWMA_HALFLIFE_HOURS) * 3600
+        self.z_threshold = z_threshold or settings.ANOMALY_Z_THRESHOLD
+        self.min_samples = min_samples or settings.ANOMALY_MIN_SAMPLES
+        self.consecutive = consecutive or settings.ANOMALY_CONSECUTIVE_SAMPLES
+        self.states: Dict[Tuple[int, str], EwmaState] = {}
+        # 计算耗电速度的起点: {设备ID: (电量, 时间戳)}
+        self.drain_anchors: Dict[int, Tuple[float, float]] = {}
+    
+    def observe(self, device_id: int, sample: dict, now: float) -> List[AnomalyEvent]:
+        """
+        输入一个样本
+        
+        Args:
+            device_id: 设备ID
+            sample: 指标（健康度分数、电量、温度、CPU、内存）
+            now: 样本时间戳（秒）
+        
+        Returns:
+            本样本产生的异常/恢复事件
+        """
+        values = {metric: sample.get(metric) for metric in ANOMALY_METRICS if metric != 'battery_drain'}
+        values['battery_drain'] = self._battery_drain(device_id, sample.get('battery_level'), now)
+        
+        events = []
+        for metric, value in values.items():
+            if value is None:
+                continue
+            event = self._observe_metric(device_id, metric, float(value), now)
+            if event is not None:
+                events.append(event)
+        return events
+    
+    def _battery_drain(self, device_id: int, battery_level, now: float) -> Optional[float]:
+        """距离起点足够久时返回每小时耗电百分比；充电（电量上升）时重置起点"""
+        if battery_level is None:
+            return None
+        anchor = self.drain_anchors.get(device_id)
+        if anchor is None or battery_level > anchor[0]:
+            self.drain_anchors[device_id] = (battery_level, now)
+            return None
+        level, started = anchor
+        if now - started < DRAIN_MIN_SPAN_SECONDS:
+            return None
+        self.drain_anchors[device_id] = (battery_level, now)
+        return (level - battery_level) / (now - started) * 3600
+    
+    def _observe_metric(self, device_id: int, metric: str, value: float, now: float) -> Optional[AnomalyEvent]:
+        direction, min_std, _ = ANOMALY_METRICS[metric]
+        key = (device_id, metric)
+        state = self.states.get(key)
+        if state is None:
+            state = self.states[key] = EwmaState()
+        
+        event = None
+        if state.count >= self.min_samples:
+            std = max(math.sqrt(state.var), min_std)
+            z = (value - state.mean) / std
+            if z * direction >= self.z_threshold:
+                state.streak += 1
+                if state.streak >= self.consecutive and not state.active:
+                    state.active = True
+                    event = AnomalyEvent(device_id, metric, value, state.mean, std, z)
+                # 异常值截断后再更新基线，避免一次突变把基线拉偏
+                value = state.mean + direction * self.z_threshold * std
+            else:
+                state.streak = 0
+                if state.active and z * direction < self.z_threshold / 2:
+                    state.active = False
+                    event = AnomalyEvent(device_id, metric, value, state.mean, std, z, cleared=True)
+        
+        state.update(value, now, self.halflife)
+        return event
+    
+    def save(self, path: str):
+        """把基线写入快照文件（先写临时文件再替换，避免写到一半的文件）"""
+        data = {
+            'states': [
+                [device_id, metric, state.mean, state.var, state.count, state.last_ts, state.streak, state.active]
+                for (device_id, metric), state in self.states.items()
+            ],
+            'drain_anchors': [[device_id, level, ts] for device_id, (level, ts) in self.drain_anchors.items()],
+        }
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+    
+    def load(self, path: str) -> int:
+        """
+        从快照文件恢复基线
+        
+        连续异常计数和未恢复标记一并恢复：重启后未恢复的异常仍能产生恢复事件解决告警，
+        也不会对同一次异常重复告警。旧快照每个状态只有前 6 个字段，按未处于异常恢复
+        
+        Returns:
+            恢复的状态数，文件不存在或损坏时为 0
+        """
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            states = {}
+            for device_id, metric, mean, var, count, last_ts, *flags in data.get('states', []):
+                if metric not in ANOMALY_METRICS:
+                    continue
+                state = states[(device_id, metric)] = EwmaState(mean, var, count, last_ts)
+                if flags:
+                    state.streak, state.active = int(flags[0]), bool(flags[1])
+            self.states = states
+            self.drain_anchors = {
+                device_id: (level, ts) for device_id, level, ts in data.get('drain_anchors', [])
+            }
+        except FileNotFoundError:
+            return 0
+        except (ValueError, TypeError) as e:
+            print(f"⚠️ 异常检测快照损坏，重新学习基线: {e}")
+            self.states = {}
+            self.drain_anchors = {}
+            return 0
+        return len(self.states)
@@ -4,6 +4,7 @@
 """
 from sqlmodel import Session, select
 from app.models import Device
+from app.core.metrics import adb_command_duration
 from typing import List, Dict, Optional
 import subprocess
 import asyncio
@@ -82,12 +83,13 @@ class BatchDeviceService:
     def _install_app_single(self, device: Device, apk_path: str) -> Dict:
         """单个设备安装应用"""
         try:
-            result = subprocess.run(
-                ['adb', '-s', device.serial_number, 'install', '-r', apk_path],
-                capture_output=True,
-                text=True,
-                timeout=60
-            )
+            with adb_command_duration.time(command="install"):
+                result = subprocess.run(
+                    ['adb', '-s', device.serial_number, 'install', '-r', apk_path],
+                    capture_output=True,
+                    text=True,
+                    timeout=60
+                )
             
             success = result.returncode == 0 and 'Success' in result.stdout
             
@@ -172,12 +174,13 @@ class BatchDeviceService:
     def _uninstall_app_single(self, device: Device, package_name: str) -> Dict:
         """单个设备卸载应用"""
         try:
-            result = subprocess.run(
-                ['adb', '-s', device.serial_number, 'uninstall', package_name],
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
+            with adb_command_duration.time(command="uninstall"):
+                result = subprocess.run(
+                    ['adb', '-s', device.serial_number, 'uninstall', package_name],
+                    capture_output=True,
+                    text=True,
+                    timeout=30
+                )
             
             success = result.returncode == 0 and 'Success' in result.stdout
             
@@ -249,12 +252,13 @@ class BatchDeviceService:
     def _push_file_single(self, device: Device, local_path: str, remote_path: str) -> Dict:
         """单个设备推送文件"""
         try:
-            result = subprocess.run(
-                ['adb', '-s', device.serial_number, 'push', local_path, remote_path],
-                capture_output=True,
-                text=True,
-                timeout=60
-            )
+            with adb_command_duration.time(command="push"):
+                result = subprocess.run(
+                    ['adb', '-s', device.serial_number, 'push', local_path, remote_path],
+                    capture_output=True,
+                    text=True,
+                    timeout=60
+                )
             
             success = result.returncode == 0
             
@@ -324,12 +328,13 @@ class BatchDeviceService:
     def _execute_command_single(self, device: Device, command: str) -> Dict:
         """单个设备执行命令"""
         try:
-            result = subprocess.run(
-                ['adb', '-s', device.serial_number, 'shell', command],
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
+            with adb_command_duration.time(command="shell"):
+                result = subprocess.run(
+                    ['adb', '-s', device.serial_number, 'shell', command],
+                    capture_output=True,
+                    text=True,
+                    timeout=30
+                )
             
             success = result.returncode == 0
             
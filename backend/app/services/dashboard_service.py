@@ -68,14 +68,17 @@ class DashboardService:
             
             # 执行统计（本周）
             week_start = datetime.now() - timedelta(days=7)
-            week_logs = db.exec(
-                select(TaskLog).where(TaskLog.start_time >= week_start)
-            ).all()
+            # 在 SQL 中按状态计数，不把一周的任务日志加载到 Python
+            status_counts = dict(db.exec(
+                select(TaskLog.status, func.count(TaskLog.id))
+                .where(TaskLog.start_time >= week_start)
+                .group_by(TaskLog.status)
+            ).all())
             
-            success_count = sum(1 for log in week_logs if log.status == "success")
-            failed_count = sum(1 for log in week_logs if log.status == "failed")
-            running_count = sum(1 for log in week_logs if log.status == "running")
-            total_count = len(week_logs)
+            success_count = status_counts.get("success", 0)
+            failed_count = status_counts.get("failed", 0)
+            running_count = status_counts.get("running", 0)
+            total_count = sum(status_counts.values())
             
             execution_stats = ExecutionStats(
                 success_count=success_count,
@@ -0,0 +1,295 @@
+"""
+冷数据归档
+把早于截止时间的任务日志和原始健康记录按月移入 ARCHIVE_DIR 下的归档库（archive_YYYY_MM.db，
+与热库相同的表结构和索引），热库只保留近期数据，扫描和备份都更快。
+归档分段记录在热库的 archive_segments 表中，报告和健康度历史查询的时间范围早于热库数据时，
+按分段找到对应的归档库合并查询。
+任务日志的失败分析和步骤执行日志随父记录一起移入同一个归档库，热库中不留下指向已归档任务的子记录
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import delete, select as sa_select
+from sqlmodel import Session, create_engine, func, select
+from app.core.config import settings
+from app.core.database import engine
+from app.models.archive import ArchiveSegment
+from app.models.device_health import DeviceHealthRecord
+from app.models.failure_analysis import FailureAnalysis, StepExecutionLog
+from app.models.task_log import TaskLog
+import os
+import threading
+
+
+# 可归档的表: {表名: (模型, 时间列)}
+ARCHIVE_TABLES = {
+    "task_log": (TaskLog, "start_time"),
+    "device_health_records": (DeviceHealthRecord, "created_at"),
+}
+
+# 随父记录一起归档的子表（通过 task_log_id 关联）: {表名: [子模型]}
+ARCHIVE_CHILDREN = {
+    "task_log": [FailureAnalysis, StepExecutionLog],
+}
+
+
+def month_start(ts: datetime) -> datetime:
+    """所在月份的第一天零点"""
+    return ts.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+class DataArchiver:
+    """冷数据归档服务"""
+
+    def __init__(self, archive_dir: str = None, batch_size: int = None):
+        self.archive_dir = archive_dir or settings.ARCHIVE_DIR
+        self.batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+        self.archive_days: Dict[str, int] = {
+            "task_log": settings.ARCHIVE_TASK_LOG_DAYS,
+            "device_health_records": settings.ARCHIVE_HEALTH_RECORD_DAYS,
+        }
+        # 归档库引擎按文件路径缓存
+        self._engines: Dict[str, object] = {}
+        self._engines_lock = threading.Lock()
+
+    def archive_path(self, month: datetime) -> str:
+        return os.path.abspath(os.path.join(self.archive_dir, f"archive_{month:%Y_%m}.db"))
+
+    def engine_for(self, path: str):
+        """归档库引擎（首次打开时创建归档的表和索引）"""
+        with self._engines_lock:
+            archive_engine = self._engines.get(path)
+            if archive_engine is None:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                archive_engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+                for model, _ in ARCHIVE_TABLES.values():
+                    model.__table__.create(archive_engine, checkfirst=True)
+                for children in ARCHIVE_CHILDREN.values():
+                    for child in children:
+                        child.__table__.create(archive_engine, checkfirst=True)
+                self._engines[path] = archive_engine
+            return archive_engine
+
+    def run(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """执行一次归档（阻塞调用，由调度器放到线程中执行）"""
+        now = now or datetime.now()
+        with Session(engine) as session:
+            moved = {
+                table_name: self.archive_table(session, table_name, cutoff)
+                for table_name in ARCHIVE_TABLES
+                if (cutoff := self.cutoff(session, table_name, now)) is not None
+            }
+        if any(moved.values()):
+            print(f"🗄️ 冷数据归档完成: {moved}")
+        return moved
+
+    def cutoff(self, session: Session, table_name: str, now: datetime) -> Optional[datetime]:
+        """
+        归档截止时间，不归档时返回 None
+
+        原始健康记录只归档所有粒度都已聚合覆盖的部分，避免聚合前移走数据
+        """
+        days = self.archive_days.get(table_name, 0)
+        if days <= 0:
+            return None
+        cutoff = now - timedelta(days=days)
+        if table_name == "device_health_records":
+            from app.services.health_rollup import RESOLUTIONS, health_rollup_service
+            for resolution in RESOLUTIONS:
+                covered = health_rollup_service.next_bucket(session, resolution)
+                if covered is None:
+                    return None
+                cutoff = min(cutoff, covered)
+        return cutoff
+
+    def archive_table(self, session: Session, table_name: str, cutoff: datetime) -> int:
+        """
+        把早于 cutoff 的记录分批移入对应月份的归档库
+
+        每批先写归档库（INSERT OR IGNORE，连同子表记录）并提交，再从热库删除；
+        中途失败重跑时已写入的记录被忽略，不会重复
+
+        Returns:
+            移动的记录数
+        """
+        model, column = ARCHIVE_TABLES[table_name]
+        table = model.__table__
+        ts = table.c[column]
+        moved = 0
+        while True:
+            rows = session.execute(
+                sa_select(table).where(ts < cutoff).order_by(ts, table.c.id).limit(self.batch_size)
+            ).mappings().all()
+            if not rows:
+                break
+
+            by_month: Dict[datetime, List[dict]] = {}
+            for row in rows:
+                by_month.setdefault(month_start(row[column]), []).append(dict(row))
+            for month, month_rows in by_month.items():
+                path = self.archive_path(month)
+                ids = [row["id"] for row in month_rows]
+                children = [
+                    (child.__table__, [
+                        dict(child_row) for child_row in session.execute(
+                            sa_select(child.__table__).where(child.__table__.c.task_log_id.in_(ids))
+                        ).mappings()
+                    ])
+                    for child in ARCHIVE_CHILDREN.get(table_name, [])
+                ]
+                with self.engine_for(path).begin() as conn:
+                    # 重跑时已在归档库中的记录被忽略，分段只计入实际写入的行数
+                    inserted = conn.execute(table.insert().prefix_with("OR IGNORE"), month_rows).rowcount
+                    for child_table, child_rows in children:
+                        if child_rows:
+                            conn.execute(child_table.insert().prefix_with("OR IGNORE"), child_rows)
+                self._record_segment(session, table_name, month, path, month_rows, column, inserted)
+
+            ids = [row["id"] for row in rows]
+            for child in ARCHIVE_CHILDREN.get(table_name, []):
+                session.execute(delete(child.__table__).where(child.__table__.c.task_log_id.in_(ids)))
+            session.execute(delete(table).where(table.c.id.in_(ids)))
+            session.commit()
+            moved += len(rows)
+        return moved
+
+    def _record_segment(
+        self,
+        session: Session,
+        table_name: str,
+        month: datetime,
+        path: str,
+        rows: List[dict],
+        column: str,
+        inserted: int
+    ):
+        """
+        更新归档分段的记录数和时间范围（与热库删除同一事务提交）
+
+        Args:
+            rows: 本批移入该月份的记录
+            inserted: 其中实际写入归档库的行数（已存在的记录被 INSERT OR IGNORE 忽略）
+        """
+        times = [row[column] for row in rows]
+        key = f"{month:%Y-%m}"
+        segment = session.exec(
+            select(ArchiveSegment).where(ArchiveSegment.table_name == table_name, ArchiveSegment.month == key)
+        ).first()
+        if segment is None:
+            segment = ArchiveSegment(
+                table_name=table_name, month=key, path=path, row_count=0, min_time=min(times), max_time=max(times)
+            )
+        segment.row_count += inserted
+        segment.min_time = min(segment.min_time, min(times))
+        segment.max_time = max(segment.max_time, max(times))
+        segment.archived_at = datetime.now()
+        session.add(segment)
+
+    def segments(
+        self,
+        session: Session,
+        table_name: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        newest_first: bool = False
+    ) -> List[ArchiveSegment]:
+        """与 [start, end] 有交集的归档分段"""
+        statement = select(ArchiveSegment).where(ArchiveSegment.table_name == table_name)
+        if start is not None:
+            statement = statement.where(ArchiveSegment.max_time >= start)
+        if end is not None:
+            statement = statement.where(ArchiveSegment.min_time <= end)
+        order = ArchiveSegment.month.desc() if newest_first else ArchiveSegment.month.asc()
+        return list(session.exec(statement.order_by(order)).all())
+
+    def sessions(
+        self,
+        session: Session,
+        table_name: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ) -> Iterator[Session]:
+        """按时间从旧到新依次打开与 [start, end] 有交集的归档库会话"""
+        for segment in self.segments(session, table_name, start, end):
+            with Session(self.engine_for(segment.path)) as archive_session:
+                yield archive_session
+
+    def page(self, segments: List[ArchiveSegment], statement, offset: int, limit: int) -> Tuple[int, list]:
+        """
+        在多个归档库上连续分页
+
+        Args:
+            segments: 归档分段，顺序即结果顺序（按时间倒序的列表传 newest_first 的分段）
+            statement: 带排序和过滤条件的查询
+            offset: 在所有归档结果中的偏移
+            limit: 本页最多返回的记录数
+
+        Returns:
+            (所有归档库中的匹配总数, 本页记录)
+        """
+        total = 0
+        rows = []
+        for segment in segments:
+            with Session(self.engine_for(segment.path)) as archive_session:
+                count = archive_session.exec(select(func.count()).select_from(statement.subquery())).one()
+                if len(rows) < limit and offset < total + count:
+                    skip = max(0, offset - total)
+                    rows.extend(archive_session.exec(statement.offset(skip).limit(limit - len(rows))).all())
+            total += count
+        return total, rows
+
+    def lookup(self, segments: List[ArchiveSegment], model, ids: List[int]) -> list:
+        """按 id 在归档库中查找记录（热库中查不到的详情、导出请求），返回找到的记录"""
+        found = []
+        remaining = set(ids)
+        for segment in segments:
+            if not remaining:
+                break
+            with Session(self.engine_for(segment.path)) as archive_session:
+                rows = archive_session.exec(select(model).where(model.id.in_(remaining))).all()
+            found.extend(rows)
+            remaining -= {row.id for row in rows}
+        return found
+
+    def remove(self, segments: List[ArchiveSegment], table_name: str, row_id: int) -> Optional[ArchiveSegment]:
+        """
+        从归档库中删除一条记录及其子表记录
+
+        Returns:
+            记录所在的分段（调用方据此更新分段记录数），没有找到时返回 None
+        """
+        model, _ = ARCHIVE_TABLES[table_name]
+        for segment in segments:
+            with self.engine_for(segment.path).begin() as conn:
+                deleted = conn.execute(delete(model.__table__).where(model.__table__.c.id == row_id)).rowcount
+                if not deleted:
+                    continue
+                for child in ARCHIVE_CHILDREN.get(table_name, []):
+                    conn.execute(delete(child.__table__).where(child.__table__.c.task_log_id == row_id))
+            return segment
+        return None
+
+    def fetch(self, segments: List[ArchiveSegment], statement, limit: int) -> list:
+        """按分段顺序依次查询，取满 limit 条为止（游标分页，statement 已带游标条件和排序）"""
+        rows = []
+        for segment in segments:
+            if len(rows) >= limit:
+                break
+            with Session(self.engine_for(segment.path)) as archive_session:
+                rows.extend(archive_session.exec(statement.limit(limit - len(rows))).all())
+        return rows
+
+    def count(self, segments: List[ArchiveSegment], statement, cap: int) -> int:
+        """所有归档库中的匹配数，超过 cap 后不再继续计数（返回值最多为 cap + 1）"""
+        total = 0
+        for segment in segments:
+            if total > cap:
+                break
+            with Session(self.engine_for(segment.path)) as archive_session:
+                total += archive_session.exec(
+                    select(func.count()).select_from(statement.limit(cap + 1 - total).subquery())
+                ).one()
+        return total
+
+
+# 全局归档服务实例
+data_archiver = DataArchiver()
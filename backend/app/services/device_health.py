@@ -15,9 +15,42 @@ from datetime import datetime, timedelta
 from typing import Dict, Tuple, Optional, List
 import re
 import logging
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
+# 批量评分结果的结构化数组字段：总分、各维度得分、输入是否有效
+SCORE_DTYPE = np.dtype([
+    ('total_score', 'f8'),
+    ('battery', 'f8'),
+    ('temperature', 'f8'),
+    ('cpu', 'f8'),
+    ('memory', 'f8'),
+    ('storage', 'f8'),
+    ('network', 'f8'),
+    ('activity', 'f8'),
+    ('valid', '?'),
+])
+
+# 列式解析的数值指标: (字段名, 别名, 缺省值)
+NUMERIC_COLUMNS = (
+    ('battery_level', 'battery', 0),
+    ('temperature', 'temp', 30),
+    ('cpu_usage', 'cpu', 0),
+    ('memory_usage', 'memory', 0),
+    ('storage_usage', 'storage', 0),
+)
+
+
+def _to_float(value) -> float:
+    """数值直接转换，字符串（如 "85%"、"32.5℃"）才走正则；无法解析时返回 NaN"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(re.sub(r'[^\d.]', '', value))
+    except (TypeError, ValueError):
+        return float('nan')
+
 
 class DeviceHealthScorer:
     """设备健康度评分器"""
@@ -482,6 +515,108 @@ class DeviceHealthScorer:
                 })
         return results
 
+    def metrics_to_columns(self, devices_metrics: List[Dict], now: Optional[datetime] = None) -> Dict[str, np.ndarray]:
+        """
+        把设备指标列表转换为列式数组（与 parse_metrics 的字段、别名和缺省值一致）
+        
+        Args:
+            devices_metrics: 设备指标列表
+            now: 计算未活跃时长的基准时间，默认当前时间
+        
+        Returns:
+            {列名: 数组}，数值列无法解析时为 NaN；network 为网络状态编码（2=connected, 1=limited, 0=其他），
+            inactive_hours 未知时为 NaN
+        """
+        now = now or datetime.now()
+        count = len(devices_metrics)
+        columns = {}
+        for field, alias, default in NUMERIC_COLUMNS:
+            columns[field] = np.fromiter(
+                (_to_float(m.get(field, m.get(alias, default))) for m in devices_metrics),
+                dtype=np.float64,
+                count=count
+            )
+        
+        network_codes = {'connected': 2, 'limited': 1}
+        columns['network'] = np.fromiter(
+            (
+                network_codes.get(str(m.get('network_status', m.get('network', 'unknown'))).lower(), 0)
+                for m in devices_metrics
+            ),
+            dtype=np.int8,
+            count=count
+        )
+        
+        def inactive_hours(metrics: Dict) -> float:
+            last_active = metrics.get('last_active_time', metrics.get('last_active'))
+            if isinstance(last_active, str):
+                try:
+                    last_active = datetime.fromisoformat(last_active.replace('Z', '+00:00'))
+                except ValueError:
+                    return float('nan')
+            if not isinstance(last_active, datetime):
+                return float('nan')
+            if last_active.tzinfo is not None:
+                last_active = last_active.astimezone().replace(tzinfo=None)
+            return (now - last_active).total_seconds() / 3600
+        
+        columns['inactive_hours'] = np.fromiter(
+            (inactive_hours(m) for m in devices_metrics), dtype=np.float64, count=count
+        )
+        return columns
+    
+    def score_columns(self, columns: Dict[str, np.ndarray]) -> np.ndarray:
+        """
+        向量化计算健康度（规则与 calculate_score 相同）
+        
+        七个维度用分段线性插值/分档一次算出，再与权重向量做一次矩阵乘法得到总分；
+        数值指标无法解析的设备 valid 为 False、总分为 0
+        
+        Args:
+            columns: metrics_to_columns 返回的列式数组
+        
+        Returns:
+            SCORE_DTYPE 结构化数组，每个设备一行
+        """
+        count = len(columns['battery_level'])
+        result = np.zeros(count, dtype=SCORE_DTYPE)
+        
+        result['battery'] = np.interp(columns['battery_level'], [20, 80], [0, 100])
+        result['temperature'] = np.interp(columns['temperature'], [35, 45], [100, 0])
+        result['cpu'] = np.interp(columns['cpu_usage'], [30, 80], [100, 0])
+        result['memory'] = np.interp(columns['memory_usage'], [50, 85], [100, 0])
+        result['storage'] = np.interp(columns['storage_usage'], [70, 95], [100, 0])
+        result['network'] = np.select([columns['network'] == 2, columns['network'] == 1], [100.0, 50.0], 0.0)
+        
+        hours = columns['inactive_hours']
+        result['activity'] = np.select(
+            [np.isnan(hours), hours < 0.083, hours < 1, hours < 24, hours < 72],
+            [50.0, 100.0, 80.0, 50.0, 20.0],
+            0.0
+        )
+        
+        dimensions = list(self.DEFAULT_WEIGHTS)
+        scores = np.column_stack([result[dim] for dim in dimensions])
+        weights = np.array([self.weights[dim] for dim in dimensions])
+        valid = ~np.isnan(scores).any(axis=1)
+        
+        result['valid'] = valid
+        result['total_score'] = np.where(valid, np.round(np.nan_to_num(scores) @ weights, 2), 0.0)
+        return result
+    
+    def score_batch(self, devices_metrics: List[Dict], now: Optional[datetime] = None) -> np.ndarray:
+        """
+        列式批量计算健康度（适用于整批设备，不生成改进建议）
+        
+        Args:
+            devices_metrics: 设备指标列表
+            now: 计算活跃度的基准时间，默认当前时间
+        
+        Returns:
+            SCORE_DTYPE 结构化数组，顺序与输入一致
+        """
+        return self.score_columns(self.metrics_to_columns(devices_metrics, now))
+
 
 # ============================================================================
 # 测试用例
@@ -631,6 +766,18 @@ class DeviceHealthService:
         result = self.scorer.calculate_score(device_data)
         return int(result['total_score'])
     
+    def calculate_health_scores(self, devices_data: List[Dict]) -> List[int]:
+        """
+        批量计算设备健康度分数（列式向量化计算）
+        
+        Args:
+            devices_data: 设备数据列表
+        
+        Returns:
+            健康度分数列表 0-100 (整数)，顺序与输入一致
+        """
+        return self.scorer.score_batch(devices_data)['total_score'].astype(int).tolist()
+    
     def get_health_level(self, score: int) -> Tuple[str, str, str]:
         """
         根据分数获取健康等级 (兼容旧接口)
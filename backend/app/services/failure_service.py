@@ -725,3 +725,73 @@ class FailureService:
         
         self.session.add(step_log)
         self.session.commit()
+    
+    def get_step_latency_stats(self, script_id: int, days: int = 30, limit: int = 20000) -> List[Dict]:
+        """
+        统计脚本各步骤的耗时百分位数
+        
+        只统计执行完成（成功或失败）的步骤，被取消的步骤耗时不完整，跳过的步骤没有耗时
+        
+        Args:
+            script_id: 脚本ID
+            days: 统计最近N天
+            limit: 最多读取最近的步骤记录数，避免高频脚本一次加载全部历史
+            
+        Returns:
+            按步骤索引排序的统计列表
+        """
+        from datetime import timedelta
+        from app.utils.stats import percentile
+        
+        start_date = datetime.now() - timedelta(days=days)
+        statement = (
+            select(
+                StepExecutionLog.step_index,
+                StepExecutionLog.step_name,
+                StepExecutionLog.step_type,
+                StepExecutionLog.status,
+                StepExecutionLog.duration
+            )
+            .join(TaskLog, StepExecutionLog.task_log_id == TaskLog.id)
+            .where(
+                TaskLog.script_id == script_id,
+                TaskLog.start_time >= start_date,
+                StepExecutionLog.status.in_(('success', 'failed')),
+                StepExecutionLog.duration.is_not(None)
+            )
+            .order_by(StepExecutionLog.id.desc())
+            .limit(limit)
+        )
+        
+        # 按步骤索引分组
+        steps: Dict[int, Dict] = {}
+        for step_index, step_name, step_type, status, duration in self.session.exec(statement):
+            entry = steps.setdefault(step_index, {
+                'step_name': step_name,
+                'step_type': step_type,
+                'durations': [],
+                'failed': 0
+            })
+            entry['durations'].append(duration)
+            if status == 'failed':
+                entry['failed'] += 1
+        
+        stats = []
+        for step_index in sorted(steps):
+            entry = steps[step_index]
+            durations = sorted(entry['durations'])
+            stats.append({
+                'step_index': step_index,
+                'step_name': entry['step_name'],
+                'step_type': entry['step_type'],
+                'count': len(durations),
+                'failed': entry['failed'],
+                'avg': round(sum(durations) / len(durations), 3),
+                'max': round(durations[-1], 3),
+                'p50': round(percentile(durations, 50), 3),
+                'p90': round(percentile(durations, 90), 3),
+                'p95': round(percentile(durations, 95), 3),
+                'p99': round(percentile(durations, 99), 3),
+            })
+        
+        return stats
@@ -0,0 +1,402 @@
+"""
+设备健康度时序聚合与数据保留
+把原始健康记录按 1分钟/1小时/1天 聚合为 min/max/avg/p95，按保留策略清理过期数据；
+历史查询根据时间窗口和采样间隔自动选择满足要求的最粗粒度
+"""
+from datetime import datetime, timedelta
+from itertools import chain
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import Integer, case, cast, delete, insert
+from sqlmodel import Session, select, func
+from app.core.config import settings
+from app.core.database import engine
+from app.models.device_health import DeviceHealthRecord, DeviceHealthRollup
+from app.services.data_archiver import data_archiver
+from app.utils.stats import percentile
+
+# 聚合粒度（从细到粗）及时间桶长度
+RESOLUTIONS: Dict[str, timedelta] = {
+    "1m": timedelta(minutes=1),
+    "1h": timedelta(hours=1),
+    "1d": timedelta(days=1),
+}
+
+# 参与聚合的指标
+ROLLUP_METRICS = ("health_score", "battery_level", "temperature", "cpu_usage", "memory_usage", "storage_usage")
+
+# 历史查询返回的指标
+HISTORY_METRICS = ("health_score", "battery_level", "temperature", "cpu_usage", "memory_usage")
+
+# SQLite strftime('%s') 按 UTC 解释无时区时间，时间桶编号据此换算回本地时间
+EPOCH = datetime(1970, 1, 1)
+
+# 每批处理的原始数据时间跨度，首次回填大量历史数据时分批加载
+ROLLUP_CHUNK = timedelta(days=1)
+
+
+def bucket_floor(ts: datetime, resolution: str) -> datetime:
+    """时间戳向下取整到所在时间桶的起点"""
+    if resolution == "1m":
+        return ts.replace(second=0, microsecond=0)
+    if resolution == "1h":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def aggregate_bucket(device_id: int, resolution: str, bucket_start: datetime, rows: List) -> dict:
+    """
+    把一个时间桶内的原始记录聚合为一条聚合记录（字段字典，用于批量插入）
+    
+    Args:
+        device_id: 设备ID
+        resolution: 聚合粒度
+        bucket_start: 时间桶起点
+        rows: 桶内的原始记录（需包含各指标字段）
+    """
+    rollup = {
+        "device_id": device_id,
+        "resolution": resolution,
+        "bucket_start": bucket_start,
+        "sample_count": len(rows)
+    }
+    for metric in ROLLUP_METRICS:
+        values = sorted(float(v) for v in (getattr(row, metric) for row in rows) if v is not None)
+        if not values:
+            rollup.update({f"{metric}_{stat}": None for stat in ("min", "max", "avg", "p95")})
+            continue
+        rollup[f"{metric}_min"] = values[0]
+        rollup[f"{metric}_max"] = values[-1]
+        rollup[f"{metric}_avg"] = round(sum(values) / len(values), 2)
+        rollup[f"{metric}_p95"] = round(percentile(values, 95), 2)
+    return rollup
+
+
+class HealthRollupService:
+    """健康度聚合服务"""
+    
+    def __init__(self):
+        # 保留天数，0 表示永久保留
+        self.retention_days: Dict[str, int] = {
+            "raw": settings.HEALTH_RAW_RETENTION_DAYS,
+            "1m": settings.HEALTH_ROLLUP_1M_RETENTION_DAYS,
+            "1h": settings.HEALTH_ROLLUP_1H_RETENTION_DAYS,
+            "1d": settings.HEALTH_ROLLUP_1D_RETENTION_DAYS,
+        }
+        # 时间桶结束后仍可能有延迟提交的记录（写入队列、慢采集），宽限期内的桶每次都重新聚合
+        self.grace = timedelta(minutes=settings.HEALTH_ROLLUP_GRACE_MINUTES)
+    
+    def run(self, now: Optional[datetime] = None) -> dict:
+        """执行一次聚合和过期数据清理（阻塞调用，由调度器放到线程中执行）"""
+        now = now or datetime.now()
+        with Session(engine) as session:
+            written = self.rollup(session, now)
+            purged = self.apply_retention(session, now)
+        
+        if any(written.values()) or any(purged.values()):
+            print(f"📦 健康数据聚合完成: 写入 {written}, 清理 {purged}")
+        return {"written": written, "purged": purged}
+    
+    def rollup(self, session: Session, now: datetime) -> Dict[str, int]:
+        """
+        聚合所有已结束的时间桶
+        
+        每个粒度从上次聚合到的位置继续，只处理已结束的桶；结束时间在宽限期内的桶重新聚合，
+        收录延迟提交到已结束桶中的记录。同一区间重复执行会先删除再写入，结果不变
+        
+        Returns:
+            {粒度: 写入的聚合记录数}
+        """
+        return {resolution: self._rollup_resolution(session, resolution, now) for resolution in RESOLUTIONS}
+    
+    def _rollup_resolution(self, session: Session, resolution: str, now: datetime) -> int:
+        """
+        聚合单个粒度
+        
+        只聚合该粒度保留期内的桶：首次回填大量历史数据时，1m 只覆盖最近的保留期，
+        更早的数据由 1h/1d 直接从原始记录聚合，不生成随即被清理的 1m 聚合
+        """
+        start = self.next_bucket(session, resolution)
+        if start is None:
+            first = session.exec(select(func.min(DeviceHealthRecord.created_at))).one()
+            if first is None:
+                return 0
+            start = bucket_floor(first, resolution)
+        else:
+            start = min(start, bucket_floor(now - self.grace, resolution))
+        retained_from = self.retention_start(resolution, now)
+        if retained_from is not None:
+            start = max(start, bucket_floor(retained_from, resolution))
+        
+        end = bucket_floor(now, resolution)
+        step = max(RESOLUTIONS[resolution], ROLLUP_CHUNK)
+        written = 0
+        while start < end:
+            chunk_end = min(end, start + step)
+            written += self._rollup_range(session, resolution, start, chunk_end)
+            start = chunk_end
+        return written
+    
+    def _rollup_range(self, session: Session, resolution: str, start: datetime, end: datetime) -> int:
+        """聚合 [start, end) 区间内的原始记录"""
+        groups = self._group_raw(session, resolution, start, end)
+        
+        session.exec(
+            delete(DeviceHealthRollup).where(
+                DeviceHealthRollup.resolution == resolution,
+                DeviceHealthRollup.bucket_start >= start,
+                DeviceHealthRollup.bucket_start < end
+            )
+        )
+        if groups:
+            session.exec(
+                insert(DeviceHealthRollup),
+                params=[
+                    aggregate_bucket(device_id, resolution, bucket_start, rows)
+                    for (device_id, bucket_start), rows in groups.items()
+                ]
+            )
+        session.commit()
+        return len(groups)
+    
+    def _group_raw(
+        self,
+        session: Session,
+        resolution: str,
+        start: datetime,
+        end: datetime
+    ) -> Dict[Tuple[int, datetime], List]:
+        """按 (设备, 时间桶) 分组读取原始记录，只加载聚合需要的列"""
+        columns = [getattr(DeviceHealthRecord, metric) for metric in ROLLUP_METRICS]
+        statement = select(DeviceHealthRecord.device_id, DeviceHealthRecord.created_at, *columns).where(
+            DeviceHealthRecord.created_at >= start,
+            DeviceHealthRecord.created_at < end
+        )
+        
+        groups: Dict[Tuple[int, datetime], List] = {}
+        for row in session.exec(statement.order_by(DeviceHealthRecord.created_at)):
+            groups.setdefault((row.device_id, bucket_floor(row.created_at, resolution)), []).append(row)
+        return groups
+    
+    def next_bucket(self, session: Session, resolution: str) -> Optional[datetime]:
+        """该粒度下一个待聚合的时间桶起点，从未聚合过时返回 None"""
+        latest = session.exec(
+            select(func.max(DeviceHealthRollup.bucket_start)).where(DeviceHealthRollup.resolution == resolution)
+        ).one()
+        return latest + RESOLUTIONS[resolution] if latest else None
+    
+    def retention_start(self, kind: str, now: datetime) -> Optional[datetime]:
+        """某类数据（raw 或聚合粒度）最早保留到的时间，永久保留时返回 None"""
+        days = self.retention_days.get(kind, 0)
+        return now - timedelta(days=days) if days > 0 else None
+    
+    def apply_retention(self, session: Session, now: datetime) -> Dict[str, int]:
+        """
+        清理过期数据
+        
+        原始记录只有在所有粒度都已聚合覆盖后才会删除，避免聚合前丢数据
+        
+        Returns:
+            {数据类型: 删除的记录数}
+        """
+        purged: Dict[str, int] = {}
+        
+        raw_cutoff = self.retention_start("raw", now)
+        if raw_cutoff is not None:
+            for resolution in RESOLUTIONS:
+                covered = self.next_bucket(session, resolution)
+                raw_cutoff = min(raw_cutoff, covered) if covered else None
+                if raw_cutoff is None:
+                    break
+        if raw_cutoff is not None:
+            result = session.exec(delete(DeviceHealthRecord).where(DeviceHealthRecord.created_at < raw_cutoff))
+            purged["raw"] = result.rowcount
+        
+        for resolution in RESOLUTIONS:
+            cutoff = self.retention_start(resolution, now)
+            if cutoff is None:
+                continue
+            result = session.exec(
+                delete(DeviceHealthRollup).where(
+                    DeviceHealthRollup.resolution == resolution,
+                    DeviceHealthRollup.bucket_start < cutoff
+                )
+            )
+            purged[resolution] = result.rowcount
+        
+        session.commit()
+        return purged
+    
+    def choose_resolution(self, start_time: datetime, sample_interval_seconds: int, now: datetime) -> str:
+        """
+        为历史查询选择数据粒度
+        
+        优先选择桶长度不超过采样间隔、且保留期覆盖查询窗口的最粗粒度；
+        都不满足时使用原始数据，原始数据也已过期时退到仍覆盖窗口的最细粒度
+        """
+        def covers(kind: str) -> bool:
+            retained_from = self.retention_start(kind, now)
+            return retained_from is None or start_time >= retained_from
+        
+        for resolution in reversed(list(RESOLUTIONS)):
+            if RESOLUTIONS[resolution].total_seconds() <= sample_interval_seconds and covers(resolution):
+                return resolution
+        if covers("raw"):
+            return "raw"
+        for resolution in RESOLUTIONS:
+            if covers(resolution):
+                return resolution
+        return "1d"
+    
+    def query_history(
+        self,
+        session: Session,
+        device_id: int,
+        start_time: datetime,
+        sample_interval_seconds: int,
+        now: Optional[datetime] = None
+    ) -> Tuple[str, List[dict]]:
+        """
+        查询设备健康度历史
+        
+        按采样间隔在 SQL 中分桶（GROUP BY 时间桶），每个桶返回各指标均值及健康度最小/最大值；
+        使用聚合数据时，最近尚未聚合的部分从原始记录补齐。采样间隔为 0 时返回原始记录。
+        使用原始数据且窗口早于热库数据时，合并查询已归档的原始记录（归档只移走已聚合覆盖的部分，
+        聚合数据的补齐部分总在热库中）
+        
+        Returns:
+            (使用的粒度, 按时间升序的数据点列表)
+        """
+        now = now or datetime.now()
+        resolution = self.choose_resolution(start_time, sample_interval_seconds, now)
+        
+        if resolution == "raw":
+            points: List[dict] = []
+            # 归档库按时间从旧到新，最后是热库
+            archives = data_archiver.sessions(session, "device_health_records", start_time, now)
+            for source in chain(archives, [session]):
+                if sample_interval_seconds <= 0:
+                    records = source.exec(
+                        select(DeviceHealthRecord).where(
+                            DeviceHealthRecord.device_id == device_id,
+                            DeviceHealthRecord.created_at >= start_time
+                        ).order_by(DeviceHealthRecord.created_at.asc())
+                    ).all()
+                    points.extend(self._raw_point(record) for record in records)
+                else:
+                    append_points(points, self._bucket_raw(source, device_id, start_time, now, sample_interval_seconds))
+            return resolution, points
+        
+        # 原始记录已过期时，采样间隔至少为所选粒度的桶长度
+        interval = max(sample_interval_seconds, int(RESOLUTIONS[resolution].total_seconds()))
+        tail_start = max(self.next_bucket(session, resolution) or start_time, start_time)
+        points = self._bucket_rollups(session, device_id, resolution, start_time, tail_start, interval)
+        append_points(points, self._bucket_raw(session, device_id, tail_start, now, interval))
+        return resolution, points
+        
+    def _bucket_raw(
+        self,
+        session: Session,
+        device_id: int,
+        start: datetime,
+        end: datetime,
+        interval: int
+    ) -> List[dict]:
+        """原始记录按采样间隔分桶聚合"""
+        bucket = (cast(func.strftime('%s', DeviceHealthRecord.created_at), Integer) // interval).label("bucket")
+        statement = select(
+            bucket,
+            func.count().label("sample_count"),
+            *[func.avg(getattr(DeviceHealthRecord, metric)).label(metric) for metric in HISTORY_METRICS],
+            func.min(DeviceHealthRecord.health_score).label("health_score_min"),
+            func.max(DeviceHealthRecord.health_score).label("health_score_max")
+        ).where(
+            DeviceHealthRecord.device_id == device_id,
+            DeviceHealthRecord.created_at >= start,
+            DeviceHealthRecord.created_at <= end
+        ).group_by(bucket).order_by(bucket)
+        return [self._bucket_point(row, interval) for row in session.exec(statement)]
+    
+    def _bucket_rollups(
+        self,
+        session: Session,
+        device_id: int,
+        resolution: str,
+        start: datetime,
+        end: datetime,
+        interval: int
+    ) -> List[dict]:
+        """聚合数据按采样间隔再分桶，均值按样本数加权"""
+        if start >= end:
+            return []
+        
+        def weighted_avg(metric: str):
+            column = getattr(DeviceHealthRollup, f"{metric}_avg")
+            weight = func.sum(case((column.isnot(None), DeviceHealthRollup.sample_count), else_=0))
+            return (func.sum(column * DeviceHealthRollup.sample_count) / func.nullif(weight, 0)).label(metric)
+        
+        bucket = (cast(func.strftime('%s', DeviceHealthRollup.bucket_start), Integer) // interval).label("bucket")
+        statement = select(
+            bucket,
+            func.sum(DeviceHealthRollup.sample_count).label("sample_count"),
+            *[weighted_avg(metric) for metric in HISTORY_METRICS],
+            func.min(DeviceHealthRollup.health_score_min).label("health_score_min"),
+            func.max(DeviceHealthRollup.health_score_max).label("health_score_max")
+        ).where(
+            DeviceHealthRollup.device_id == device_id,
+            DeviceHealthRollup.resolution == resolution,
+            DeviceHealthRollup.bucket_start >= bucket_floor(start, resolution),
+            DeviceHealthRollup.bucket_start < end
+        ).group_by(bucket).order_by(bucket)
+        return [self._bucket_point(row, interval) for row in session.exec(statement)]
+    
+    def _bucket_point(self, row, interval: int) -> dict:
+        """分桶查询结果转换为数据点，created_at 为时间桶起点"""
+        point = {
+            metric: round(getattr(row, metric), 2) if getattr(row, metric) is not None else None
+            for metric in HISTORY_METRICS
+        }
+        point.update({
+            "health_score_min": row.health_score_min,
+            "health_score_max": row.health_score_max,
+            "sample_count": row.sample_count,
+            "created_at": EPOCH + timedelta(seconds=row.bucket * interval)
+        })
+        return point
+    
+    def _raw_point(self, record: DeviceHealthRecord) -> dict:
+        return {
+            "health_score": record.health_score,
+            "battery_level": record.battery_level,
+            "temperature": record.temperature,
+            "cpu_usage": record.cpu_usage,
+            "memory_usage": record.memory_usage,
+            "created_at": record.created_at
+        }
+    
+
+def append_points(points: List[dict], later: List[dict]):
+    """把时间更晚的一段数据点接到 points 末尾，交界处落在同一时间桶的两个点合并"""
+    for point in later:
+        if points and points[-1]["created_at"] == point["created_at"]:
+            points[-1] = merge_points(points[-1], point)
+        else:
+            points.append(point)
+
+
+def merge_points(a: dict, b: dict) -> dict:
+    """合并落在同一时间桶内的两个数据点（聚合数据与未聚合的原始记录、归档库与热库交界处）"""
+    total = a["sample_count"] + b["sample_count"]
+    merged = dict(a, sample_count=total)
+    for metric in HISTORY_METRICS:
+        if a[metric] is None or b[metric] is None:
+            merged[metric] = a[metric] if b[metric] is None else b[metric]
+        else:
+            merged[metric] = round((a[metric] * a["sample_count"] + b[metric] * b["sample_count"]) / total, 2)
+    for key, pick in (("health_score_min", min), ("health_score_max", max)):
+        values = [v for v in (a[key], b[key]) if v is not None]
+        merged[key] = pick(values) if values else None
+    return merged
+
+
+# 全局聚合服务实例
+health_rollup_service = HealthRollupService()
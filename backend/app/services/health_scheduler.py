@@ -2,13 +2,31 @@
 设备健康度定时采集调度器
 """
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from sqlalchemy import update
 from sqlmodel import Session, select
 from app.models.device import Device
-from app.models.device_health import DeviceHealthRecord, DeviceUsageStats
+from app.models.device_health import DeviceHealthRecord, DeviceUsageStats, DeviceHealthLatest
 from app.services.device_health import DeviceHealthService
 from app.services.alert_engine import AlertEngine
+from app.services.health_rollup import HealthRollupService
+from app.services.data_archiver import data_archiver
+from app.services.health_snapshot import upsert_latest, rebuild_latest
+from app.services.adaptive_sampling import AdaptiveSampler
+from app.services.anomaly_detector import AnomalyDetector
+from app.core.metrics import health_cycle_duration, health_cycle_coverage, observe_device_health
+from app.core.config import settings
 from app.core.database import engine
+from app.core.write_queue import write_queue
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import Dict, List, Optional
+import asyncio
+import logging
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
 
 
 class HealthScheduler:
@@ -17,43 +35,124 @@ class HealthScheduler:
     def __init__(self):
         self.scheduler = AsyncIOScheduler()
         self.health_service = DeviceHealthService()
+        self.rollup_service = HealthRollupService()
+        self.concurrency = settings.HEALTH_COLLECT_CONCURRENCY
+        self.cycle_deadline = settings.HEALTH_CYCLE_DEADLINE_SECONDS
+        self.max_devices_per_cycle = settings.HEALTH_MAX_DEVICES_PER_CYCLE
+        self.sample_interval = settings.HEALTH_SAMPLE_INTERVAL_SECONDS
+        # 自适应采样：调度器按最短间隔轮询，每轮只采集到期的设备
+        self.sampler = AdaptiveSampler(
+            settings.HEALTH_SAMPLE_INTERVAL_SECONDS,
+            settings.HEALTH_SAMPLE_MIN_INTERVAL_SECONDS,
+            settings.HEALTH_SAMPLE_MAX_INTERVAL_SECONDS
+        ) if settings.HEALTH_ADAPTIVE_SAMPLING else None
+        # adb 探测是阻塞调用，放在独立线程池中，线程数即最大并发
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="health-probe")
+        self.adb_timeout = settings.HEALTH_ADB_TIMEOUT_SECONDS
+        self.probe_timeout = settings.HEALTH_PROBE_TIMEOUT_SECONDS
+        # 线程池占用情况：正在执行和排队等待的探测数（线程中更新，加锁）
+        self._probe_lock = threading.Lock()
+        self.probes_running = 0
+        self.probes_queued = 0
+        # 每个设备最后一次成功采集的时间: {device_id: timestamp}
+        self.last_collected: Dict[int, float] = {}
+        self.last_cycle: Optional[dict] = None
+        # 每个设备每个指标的 EWMA 基线，定期写入快照文件
+        self.detector = AnomalyDetector() if settings.ANOMALY_DETECTION_ENABLED else None
+        self._collecting = False
     
     async def collect_device_health(self):
-        """定时采集设备健康数据"""
-        print(f"\n🔍 [{datetime.now().strftime('%H:%M:%S')}] 开始采集设备健康数据...")
+        """
+        定时采集设备健康数据
         
-        with Session(engine) as session:
-            # 获取所有在线设备，限制数量避免过载
-            statement = select(Device).where(Device.status == 'online').limit(50)
-            devices = session.exec(statement).all()
+        设备探测在线程池中并发执行（HEALTH_COLLECT_CONCURRENCY），整轮受 HEALTH_CYCLE_DEADLINE_SECONDS 限制；
+        设备按上次采集时间排序，最久未采集的优先，超过单轮上限或到期未完成的设备在下一轮优先采集。
+        启用自适应采样时只采集到达各自采集间隔的设备，按逾期比例排序。
+        """
+        if self._collecting:
+            logger.warning("上一轮健康数据采集尚未结束，跳过本次")
+            return
+        self._collecting = True
+        try:
+            await self._run_cycle()
+        finally:
+            self._collecting = False
+    
+    async def _run_cycle(self):
+        """执行一轮采集"""
+        started_at = datetime.now()
+        cycle_start = time.monotonic()
+        logger.info("开始采集设备健康数据")
+        
+        with Session(engine, expire_on_commit=False) as session:
+            # 正在执行任务的设备 (busy) 同样在线，且最需要采集
+            devices = session.exec(select(Device).where(Device.status.in_(("online", "busy")))).all()
+            # 结束读事务：探测期间不持有旧快照，告警引擎随后能读到写入队列提交的数据
+            session.commit()
             
             if not devices:
-                print(f"   没有在线设备需要采集")
+                logger.info("没有在线设备需要采集")
+                self.last_cycle = self._cycle_stats(started_at, cycle_start, 0, [], {}, 0)
+                return
+            
+            if self.sampler:
+                # 按上一轮的指标重新分配采集间隔，逾期最多的设备优先
+                device_ids = [device.id for device in devices]
+                self.sampler.rebalance(device_ids, running=[device.id for device in devices if device.status == "busy"])
+                order = {
+                    device_id: index
+                    for index, device_id in enumerate(self.sampler.due(device_ids, self.last_collected, time.time()))
+                }
+                due = sorted((device for device in devices if device.id in order), key=lambda d: order[d.id])
+            else:
+                # 最久未采集的设备优先（分片轮转）
+                due = sorted(devices, key=lambda d: self.last_collected.get(d.id, 0.0))
+            if self.max_devices_per_cycle > 0:
+                scheduled = due[:self.max_devices_per_cycle]
+            else:
+                scheduled = due
+            
+            if not scheduled:
+                self.last_cycle = self._cycle_stats(started_at, cycle_start, len(devices), [], {}, 0, due_count=0)
                 return
+            logger.info(
+                "发现 %d 个在线设备，%d 个到期，本轮采集 %d 个 (并发 %d)",
+                len(devices), len(due), len(scheduled), self.concurrency,
+            )
             
-            print(f"   发现 {len(devices)} 个在线设备")
+            results = await self._probe_devices(scheduled)
             
             alert_engine = AlertEngine(session)
             success_count = 0
+            health_records = []
+            device_updates = {}
+            # 本轮每个设备的样本在结束后批量送入告警引擎（持续时间/变化率规则需要连续样本）
+            alert_candidates = {}
+            device_map = {device.id: device for device in scheduled}
+            
+            # 如果无法获取真实数据，使用模拟数据
+            device_metrics = {
+                device_id: metrics or self.health_service.generate_mock_metrics(device_id)
+                for device_id, metrics in results.items()
+            }
+            # 整批设备一次性向量化计算健康度分数
+            health_scores = dict(zip(
+                device_metrics,
+                self.health_service.calculate_health_scores(list(device_metrics.values()))
+            ))
             
-            for device in devices:
+            for device_id, metrics in device_metrics.items():
+                device = device_map[device_id]
+                health_score = health_scores[device_id]
                 try:
-                    # 采集设备指标 (优先使用真实数据，失败则使用模拟数据)
-                    metrics = await self._collect_real_metrics(device)
-                    if not metrics:
-                        # 如果无法获取真实数据，使用模拟数据
-                        metrics = self.health_service.generate_mock_metrics(device.id)
-                    
-                    # 计算健康度分数
-                    health_score = self.health_service.calculate_health_score(metrics)
-                    level_code, level_name, level_color = self.health_service.get_health_level(health_score)
-                    
-                    # 更新设备信息
+                    # 更新设备信息（只写指标列，不覆盖任务执行期间修改的 status）
+                    values = {
+                        'cpu_usage': metrics.get('cpu_usage', device.cpu_usage),
+                        'memory_usage': metrics.get('memory_usage', device.memory_usage),
+                    }
                     if 'battery_level' in metrics:
-                        device.battery = metrics['battery_level']
-                    device.cpu_usage = metrics.get('cpu_usage', device.cpu_usage)
-                    device.memory_usage = metrics.get('memory_usage', device.memory_usage)
-                    session.add(device)
+                        values['battery'] = metrics['battery_level']
+                    device_updates[device.id] = values
                     
                     # 保存健康度记录
                     health_record = DeviceHealthRecord(
@@ -67,51 +166,226 @@ class HealthScheduler:
                         network_status=metrics.get('network_status'),
                         last_active_time=metrics.get('last_active_time')
                     )
-                    session.add(health_record)
+                    health_records.append(health_record)
                     
-                    # 检查告警（仅对异常情况）
-                    if health_score < 60:  # 只对健康度低的设备检查告警
-                        alerts = await alert_engine.check_alerts(device.id, metrics)
-                        if alerts:
-                            print(f"   ⚠️  设备 {device.id} 触发 {len(alerts)} 个告警")
+                    alert_candidates[device.id] = {**metrics, 'health_score': health_score}
                     
+                    self.last_collected[device.id] = time.time()
+                    if self.sampler:
+                        self.sampler.record(device.id, metrics, health_score)
                     success_count += 1
                     
                 except Exception as e:
-                    print(f"   ❌ 采集设备 {device.id} 健康数据失败: {e}")
-                    session.rollback()
+                    logger.error("采集设备 %s 健康数据失败: %s", device.id, e)
+                    device_updates.pop(device.id, None)
+                    alert_candidates.pop(device.id, None)
+                    health_records = [record for record in health_records if record.device_id != device.id]
                     continue
             
-            # 批量提交
+            def write(write_session: Session):
+                for device_id, values in device_updates.items():
+                    write_session.execute(update(Device).where(Device.id == device_id).values(**values))
+                write_session.add_all(health_records)
+                upsert_latest(write_session, health_records)
+            
+            # 经写入队列批量提交（与任务执行器的步骤遥测等写操作合并，不单独争抢写锁），
+            # 最新健康度快照随记录在同一事务中更新
             try:
-                session.commit()
-                print(f"✅ 设备健康数据采集完成 (成功: {success_count}/{len(devices)})\n")
+                await write_queue.run(write)
+                # 提交后记录已过期，直接用本轮的指标字典，避免逐条重新加载
+                for device_id, sample in alert_candidates.items():
+                    observe_device_health(device_id, device_map[device_id].serial_number, sample)
             except Exception as e:
-                print(f"❌ 批量提交失败: {e}\n")
-                session.rollback()
-    async def _collect_real_metrics(self, device: Device) -> dict:
+                logger.error("批量提交失败: %s", e)
+                success_count = 0
+                alert_candidates = {}
+            
+            # 已写入的样本增量更新异常检测基线
+            anomalies = []
+            if self.detector:
+                now = time.time()
+                for device_id, sample in alert_candidates.items():
+                    anomalies.extend(self.detector.observe(device_id, sample, now))
+            
+            # 新告警和解决状态由告警引擎写入（只在告警触发或恢复时才有写操作）
+            if alert_candidates or anomalies:
+                try:
+                    alerts = await alert_engine.check_alerts_batch(alert_candidates, anomalies=anomalies)
+                    if alerts:
+                        logger.warning("%d 个设备触发 %d 个告警", len({alert.device_id for alert in alerts}), len(alerts))
+                except Exception as e:
+                    logger.error("告警检查失败: %s", e)
+                    session.rollback()
+        
+        self.last_cycle = self._cycle_stats(
+            started_at, cycle_start, len(devices), scheduled, results, success_count, due_count=len(due)
+        )
+        stats = self.last_cycle
+        health_cycle_duration.observe(stats['duration_seconds'])
+        health_cycle_coverage.set(stats['coverage'])
+        logger.info(
+            "设备健康数据采集完成 (成功: %d/%d, 超时: %d, 覆盖率: %.0f%%, 耗时: %.1fs)",
+            success_count, len(scheduled), stats['timed_out'], stats['coverage'] * 100, stats['duration_seconds'],
+        )
+    
+    async def _probe_devices(self, devices: List[Device]) -> Dict[int, Optional[dict]]:
+        """
+        并发探测设备指标
+        
+        Returns:
+            {device_id: 指标或 None(探测失败)}，到期未完成的设备不在结果中
         """
-        从真实设备采集指标数据
+        futures = {}
+        for device in devices:
+            with self._probe_lock:
+                self.probes_queued += 1
+            future = self.executor.submit(self._run_probe, device.id, device.serial_number, device.status)
+            futures[asyncio.wrap_future(future)] = (device.id, future)
+        done, pending = await asyncio.wait(futures, timeout=self.cycle_deadline)
+        for waiter in pending:
+            # 尚未开始的探测直接取消；已开始的不再等待，其 adb 调用受 probe_timeout 限制，会自行结束
+            if futures[waiter][1].cancel():
+                with self._probe_lock:
+                    self.probes_queued -= 1
+            waiter.cancel()
+        
+        results = {}
+        for future in done:
+            device_id = futures[future][0]
+            try:
+                results[device_id] = future.result()
+            except Exception as e:
+                logger.warning("探测设备 %s 失败: %s", device_id, e)
+                results[device_id] = None
+        return results
+    
+    def _cycle_stats(
+        self,
+        started_at: datetime,
+        cycle_start: float,
+        online: int,
+        scheduled: List[Device],
+        results: Dict[int, Optional[dict]],
+        success_count: int,
+        due_count: Optional[int] = None
+    ) -> dict:
+        """单轮采集指标（覆盖率 = 成功采集数 / 到期设备数，未启用自适应采样时所有在线设备都到期）"""
+        due_count = online if due_count is None else due_count
+        return {
+            "started_at": started_at.isoformat(),
+            "duration_seconds": round(time.monotonic() - cycle_start, 3),
+            "online_devices": online,
+            "due_devices": due_count,
+            "scheduled": len(scheduled),
+            "collected": success_count,
+            "real_metrics": sum(1 for metrics in results.values() if metrics),
+            "mock_metrics": sum(1 for metrics in results.values() if not metrics),
+            "timed_out": len(scheduled) - len(results),
+            "coverage": round(success_count / due_count, 4) if due_count else 1.0,
+            "concurrency": self.concurrency,
+            "deadline_seconds": self.cycle_deadline,
+        }
+    
+    async def rollup_health_records(self):
+        """定时聚合健康记录并清理过期数据（数据库批量操作放到线程中，避免阻塞事件循环）"""
+        try:
+            await asyncio.to_thread(self.rollup_service.run)
+        except Exception as e:
+            logger.error("健康数据聚合失败: %s", e)
+    
+    async def archive_cold_data(self):
+        """定时把过期的任务日志和原始健康记录移入按月归档库"""
+        try:
+            await asyncio.to_thread(data_archiver.run)
+        except Exception as e:
+            logger.error("冷数据归档失败: %s", e)
+    
+    def snapshot_anomaly_state(self):
+        """把异常检测基线写入快照文件"""
+        try:
+            self.detector.save(settings.ANOMALY_STATE_FILE)
+        except Exception as e:
+            logger.error("异常检测基线快照失败: %s", e)
+    
+    def get_stats(self) -> dict:
+        """采集器状态：最近一轮的耗时与覆盖率、自适应采样速率，以及最久未采集的设备"""
+        now = time.time()
+        stale = sorted(self.last_collected.items(), key=lambda item: item[1])[:10]
+        return {
+            "running": self._collecting,
+            "last_cycle": self.last_cycle,
+            "tracked_devices": len(self.last_collected),
+            "executor": self.executor_stats(),
+            "sampling": self.sampler.get_stats(self.last_collected, now) if self.sampler else {
+                "enabled": False,
+                "base_interval_seconds": self.sample_interval,
+            },
+            "stalest_devices": [
+                {"device_id": device_id, "seconds_since_collected": round(now - ts, 1)}
+                for device_id, ts in stale
+            ],
+        }
+    
+    def executor_stats(self) -> dict:
+        """探测线程池占用：所有线程都在执行且仍有排队时为饱和，说明并发或探测超时需要调整"""
+        with self._probe_lock:
+            running, queued = self.probes_running, self.probes_queued
+        return {
+            "max_workers": self.concurrency,
+            "running": running,
+            "queued": queued,
+            "saturated": running >= self.concurrency and queued > 0,
+            "adb_timeout_seconds": self.adb_timeout,
+            "probe_timeout_seconds": self.probe_timeout,
+        }
 
+    def _run_probe(self, device_id: int, serial: str, status: str) -> Optional[dict]:
+        """在线程池中执行单个设备的探测，并维护线程池占用计数"""
+        with self._probe_lock:
+            self.probes_queued -= 1
+            self.probes_running += 1
+        try:
+            return self._probe_device_metrics(device_id, serial, status)
+        finally:
+            with self._probe_lock:
+                self.probes_running -= 1
+    
+    def _probe_device_metrics(self, device_id: int, serial: str, status: str) -> Optional[dict]:
+        """
+        通过 adb 探测设备指标（阻塞调用，在线程池中运行）
+        
         Args:
-            device: 设备对象
+            device_id: 设备ID
+            serial: 设备序列号
+            status: 设备状态
 
         Returns:
-            指标字典，如果采集失败返回None
+            指标字典，如果采集失败或超过 probe_timeout 返回None
         """
         try:
             from app.services.adb_device_scanner import ADBDeviceScanner
-            import subprocess
-            import re
 
             scanner = ADBDeviceScanner()
-            serial = device.serial_number
+            deadline = time.monotonic() + self.probe_timeout
+            
+            def shell(command: str) -> Optional[str]:
+                """每条 adb 命令最多 adb_timeout 秒，且不超过本次探测的剩余时间"""
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"探测超过 {self.probe_timeout}s")
+                return scanner._execute_shell_command(serial, command, timeout=min(self.adb_timeout, remaining))
 
             # 获取电池电量
-            battery_level = scanner._get_battery_level(serial)
+            battery_level = 0
+            battery_output = shell("dumpsys battery | grep level")
+            if battery_output:
+                # 格式: level: 85
+                match = re.search(r'level:\s*(\d+)', battery_output)
+                if match:
+                    battery_level = int(match.group(1))
 
             # 获取温度 (电池温度)
-            temp_output = scanner._execute_shell_command(serial, "dumpsys battery | grep temperature")
+            temp_output = shell("dumpsys battery | grep temperature")
             temperature = 0.0
             if temp_output:
                 # 格式: temperature: 350 (表示35.0°C)
@@ -121,7 +395,7 @@ class HealthScheduler:
 
             # 获取CPU使用率 - 使用top命令
             cpu_usage = 0.0
-            cpu_output = scanner._execute_shell_command(serial, "top -n 1 -b | head -5")
+            cpu_output = shell("top -n 1 -b | head -5")
             if cpu_output:
                 # 查找CPU行: 800%cpu   7%user   0%nice   7%sys 782%idle
                 for line in cpu_output.split('\n'):
@@ -145,7 +419,7 @@ class HealthScheduler:
 
             # 获取内存使用率 - 使用/proc/meminfo
             memory_usage = 0.0
-            mem_output = scanner._execute_shell_command(serial, "cat /proc/meminfo | head -5")
+            mem_output = shell("cat /proc/meminfo | head -5")
             if mem_output:
                 mem_total = 0
                 mem_available = 0
@@ -169,7 +443,7 @@ class HealthScheduler:
 
             # 获取存储使用率 - 使用df命令
             storage_usage = 0.0
-            storage_output = scanner._execute_shell_command(serial, "df /data")
+            storage_output = shell("df /data")
             if storage_output:
                 lines = storage_output.split('\n')
                 if len(lines) >= 2:
@@ -183,7 +457,7 @@ class HealthScheduler:
                             pass
 
             # 网络状态 (简单检查设备是否在线)
-            network_status = 'connected' if device.status == 'online' else 'disconnected'
+            network_status = 'connected' if status in ('online', 'busy') else 'disconnected'
 
             return {
                 'battery_level': battery_level,
@@ -196,21 +470,52 @@ class HealthScheduler:
             }
 
         except Exception as e:
-            print(f"   ⚠️  采集设备 {device.id} 真实数据失败: {e}")
+            logger.warning("采集设备 %s 真实数据失败: %s", device_id, e)
             return None
 
     
     def start(self):
         """启动调度器"""
-        # 每5分钟采集一次设备健康数据
+        # 固定间隔时每个基准间隔采集一次；自适应采样时按最短间隔轮询，只采集到期的设备
+        poll_interval = self.sampler.min_interval if self.sampler else self.sample_interval
         self.scheduler.add_job(
             self.collect_device_health,
             'interval',
-            minutes=5,
+            seconds=poll_interval,
             id='collect_device_health',
             replace_existing=True
         )
         
+        # 定期把原始记录聚合为 1m/1h/1d 数据并清理过期数据
+        self.scheduler.add_job(
+            self.rollup_health_records,
+            'interval',
+            minutes=settings.HEALTH_ROLLUP_INTERVAL_MINUTES,
+            id='rollup_health_records',
+            replace_existing=True
+        )
+        
+        # 定期归档冷数据（任务日志与已聚合覆盖的原始健康记录）
+        self.scheduler.add_job(
+            self.archive_cold_data,
+            'interval',
+            hours=settings.ARCHIVE_INTERVAL_HOURS,
+            id='archive_cold_data',
+            replace_existing=True
+        )
+        
+        if self.detector:
+            restored = self.detector.load(settings.ANOMALY_STATE_FILE)
+            if restored:
+                logger.info(f"已从快照恢复 {restored} 个异常检测基线")
+            self.scheduler.add_job(
+                self.snapshot_anomaly_state,
+                'interval',
+                minutes=settings.ANOMALY_SNAPSHOT_INTERVAL_MINUTES,
+                id='snapshot_anomaly_state',
+                replace_existing=True
+            )
+        
         # 延迟10秒后执行第一次采集，避免阻塞应用启动
         from datetime import timedelta
         first_run = datetime.now() + timedelta(seconds=10)
@@ -221,14 +526,35 @@ class HealthScheduler:
             id='collect_device_health_first'
         )
         
+        # 升级后首次启动时从历史记录生成最新健康度快照
+        with Session(engine) as session:
+            rebuilt = rebuild_latest(session)
+            # 用快照初始化 /metrics 中的设备指标，之后由采集器更新
+            for latest, serial in session.exec(
+                select(DeviceHealthLatest, Device.serial_number).join(Device, Device.id == DeviceHealthLatest.device_id)
+            ):
+                observe_device_health(latest.device_id, serial, latest.dict())
+        if rebuilt:
+            logger.info(f"已从历史记录生成 {rebuilt} 个设备的最新健康度快照")
+        
         self.scheduler.start()
-        print("✅ 健康度调度器已启动 (首次采集将在10秒后开始，之后每5分钟采集一次)")
+        if self.sampler:
+            logger.info(
+                f"健康度调度器已启动 (首次采集将在10秒后开始，之后每 {poll_interval:g} 秒检查一次，"
+                f"按设备状态在 {self.sampler.min_interval:g}~{self.sampler.max_interval:g} 秒间隔内采集到期的设备)"
+            )
+        else:
+            logger.info(f"健康度调度器已启动 (首次采集将在10秒后开始，之后每 {poll_interval:g} 秒采集一次)")
     
     def shutdown(self):
         """关闭调度器"""
         if self.scheduler.running:
             self.scheduler.shutdown()
-            print("✅ 健康度调度器已关闭")
+            logger.info("健康度调度器已关闭")
+            # 只有运行调度器的 worker 持有基线
+            if self.detector:
+                self.snapshot_anomaly_state()
+        self.executor.shutdown(wait=False, cancel_futures=True)
 
 
 # 全局调度器实例
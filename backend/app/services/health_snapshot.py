@@ -0,0 +1,71 @@
+"""
+设备最新健康度快照
+采集器每写入一批健康记录，同步更新 device_health_latest（每个设备一行），
+总览接口只读快照表，耗时与设备数成正比，不随历史记录增长
+"""
+from typing import List
+from sqlmodel import Session, select, func
+from app.models.device_health import DeviceHealthRecord, DeviceHealthLatest
+
+# 快照中同步的记录字段
+SNAPSHOT_FIELDS = (
+    "health_score", "battery_level", "temperature", "cpu_usage",
+    "memory_usage", "storage_usage", "network_status", "last_active_time"
+)
+
+
+def upsert_latest(session: Session, records: List[DeviceHealthRecord]):
+    """
+    用新写入的健康记录更新快照（不提交，随记录在同一事务中提交）
+    
+    Args:
+        session: 数据库会话
+        records: 新的健康记录，同一设备有多条时以采集时间最新的为准
+    """
+    latest = {}
+    for record in records:
+        current = latest.get(record.device_id)
+        if current is None or record.created_at >= current.created_at:
+            latest[record.device_id] = record
+    if not latest:
+        return
+    
+    existing = {
+        snapshot.device_id: snapshot
+        for snapshot in session.exec(
+            select(DeviceHealthLatest).where(DeviceHealthLatest.device_id.in_(list(latest)))
+        )
+    }
+    for device_id, record in latest.items():
+        snapshot = existing.get(device_id)
+        if snapshot is None:
+            snapshot = DeviceHealthLatest(device_id=device_id, health_score=record.health_score, recorded_at=record.created_at)
+        elif snapshot.recorded_at > record.created_at:
+            continue
+        for field in SNAPSHOT_FIELDS:
+            setattr(snapshot, field, getattr(record, field))
+        snapshot.recorded_at = record.created_at
+        session.add(snapshot)
+
+
+def rebuild_latest(session: Session) -> int:
+    """
+    从历史记录重建快照（快照表为空时执行一次，用于已有数据的升级）
+    
+    Returns:
+        写入的快照数
+    """
+    if session.exec(select(DeviceHealthLatest.device_id).limit(1)).first() is not None:
+        return 0
+    
+    subquery = (
+        select(DeviceHealthRecord.device_id, func.max(DeviceHealthRecord.id).label('max_id'))
+        .group_by(DeviceHealthRecord.device_id)
+        .subquery()
+    )
+    records = session.exec(
+        select(DeviceHealthRecord).join(subquery, DeviceHealthRecord.id == subquery.c.max_id)
+    ).all()
+    upsert_latest(session, records)
+    session.commit()
+    return len(records)
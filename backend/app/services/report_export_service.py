@@ -5,6 +5,7 @@
 from sqlmodel import Session, select
 from app.models.task_log import TaskLog
 from app.models import Device, Script
+from app.services.data_archiver import data_archiver
 from typing import List, Dict, Optional
 import logging
 from datetime import datetime
@@ -494,9 +495,14 @@ class ReportExportService:
         return html
     
     def _get_task_logs(self, task_log_ids: List[int]) -> List[TaskLog]:
-        """获取任务日志列表"""
+        """获取任务日志列表（热库中没有的到归档库中查找）"""
         statement = select(TaskLog).where(TaskLog.id.in_(task_log_ids))
-        return self.session.exec(statement).all()
+        task_logs = list(self.session.exec(statement).all())
+        missing = set(task_log_ids) - {task_log.id for task_log in task_logs}
+        if missing:
+            segments = data_archiver.segments(self.session, "task_log", newest_first=True)
+            task_logs.extend(data_archiver.lookup(segments, TaskLog, list(missing)))
+        return task_logs
     
     def _get_status_text(self, status: str) -> str:
         """获取状态文本"""
@@ -6,7 +6,9 @@ from apscheduler.triggers.cron import CronTrigger
 from sqlmodel import Session, select
 from app.models import ScheduledTask
 from app.core.database import engine
+from app.core.write_queue import write_queue
 from datetime import datetime, timedelta
+from typing import Optional
 import logging
 
 logger = logging.getLogger(__name__)
@@ -16,12 +18,48 @@ class SchedulerService:
     """定时任务调度器"""
     
     def __init__(self):
+        # 调度线程只在主进程中启动（start），其他 worker 不运行调度器
         self.scheduler = BackgroundScheduler(daemon=True)
+        # 多 worker 部署时只有主进程执行定时任务，其他进程把变更转发给主进程
+        self.leader = True
+    
+    def start(self):
+        """启动调度器（选主成功的进程调用）"""
+        self.leader = True
         self.scheduler.start()
         logger.info("定时任务调度器已启动")
     
+    def _forward(self, action: str, task_id: int) -> bool:
+        """非主进程：把调度变更经事件总线转发给主进程"""
+        if self.leader:
+            return False
+        from app.core.websocket_manager import manager
+        if not manager.bus.distributed:
+            # 进程内总线不会转发，变更会静默丢失
+            raise RuntimeError("多 worker 部署未配置 EVENT_BUS_URL，定时任务变更无法转发给调度器所在的进程")
+        manager.bus.publish_nowait("scheduled_task", {"action": action, "task_id": task_id})
+        return True
+    
+    async def handle_bus_event(self, payload: dict):
+        """主进程处理其他 worker 转发来的调度变更"""
+        task_id = payload["task_id"]
+        action = payload["action"]
+        if action == "add":
+            with Session(engine) as db:
+                task = db.get(ScheduledTask, task_id)
+            if task:
+                self.add_task(task)
+        elif action == "remove":
+            self.remove_task(task_id)
+        elif action == "pause":
+            self.pause_task(task_id)
+        elif action == "resume":
+            self.resume_task(task_id)
+    
     def add_task(self, task: ScheduledTask):
         """添加定时任务"""
+        if self._forward("add", task.id):
+            return
         try:
             job_id = f"scheduled_task_{task.id}"
             
@@ -53,12 +91,14 @@ class SchedulerService:
             )
             
             logger.info(f"定时任务已添加: {task.name} (ID: {task.id})")
-            
+        
         except Exception as e:
             logger.error(f"添加定时任务失败: {e}")
     
     def remove_task(self, task_id: int):
         """移除定时任务"""
+        if self._forward("remove", task_id):
+            return
         try:
             job_id = f"scheduled_task_{task_id}"
             self.scheduler.remove_job(job_id)
@@ -68,6 +108,8 @@ class SchedulerService:
     
     def pause_task(self, task_id: int):
         """暂停定时任务"""
+        if self._forward("pause", task_id):
+            return
         try:
             job_id = f"scheduled_task_{task_id}"
             self.scheduler.pause_job(job_id)
@@ -77,6 +119,8 @@ class SchedulerService:
     
     def resume_task(self, task_id: int):
         """恢复定时任务"""
+        if self._forward("resume", task_id):
+            return
         try:
             job_id = f"scheduled_task_{task_id}"
             self.scheduler.resume_job(job_id)
@@ -88,11 +132,10 @@ class SchedulerService:
         """执行定时任务"""
         logger.info(f"开始执行定时任务: ID {task_id}")
         
-        with Session(engine) as db:
+        def record_run(db: Session) -> Optional[str]:
             task = db.get(ScheduledTask, task_id)
             if not task or not task.is_enabled:
-                logger.warning(f"定时任务不存在或已禁用: ID {task_id}")
-                return
+                return None
             
             # 更新任务统计
             task.last_run_at = datetime.now()
@@ -102,10 +145,16 @@ class SchedulerService:
             task.next_run_at = self._calculate_next_run(task)
             
             db.add(task)
-            db.commit()
+            return task.name
             
-            # TODO: 调用脚本执行服务
-            logger.info(f"定时任务执行完成: {task.name}")
+        # 统计更新经写入队列提交，不与执行器的写入争抢写锁
+        task_name = write_queue.execute(record_run)
+        if task_name is None:
+            logger.warning(f"定时任务不存在或已禁用: ID {task_id}")
+            return
+        
+        # TODO: 调用脚本执行服务
+        logger.info(f"定时任务执行完成: {task_name}")
     
     def _calculate_next_run(self, task: ScheduledTask) -> datetime:
         """计算下次运行时间"""
@@ -146,6 +195,8 @@ class SchedulerService:
     
     def shutdown(self):
         """关闭调度器"""
+        if not self.scheduler.running:
+            return
         self.scheduler.shutdown()
         logger.info("定时任务调度器已关闭")
 
@@ -0,0 +1,149 @@
+"""
+步骤执行遥测
+在内存中记录每个步骤的开始/结束时间和状态，任务结束时（或长任务按批次）批量写入数据库
+"""
+from datetime import datetime
+from typing import Dict, List, Optional
+from sqlmodel import Session, select, func
+from app.core.write_queue import write_queue
+from app.models.failure_analysis import StepExecutionLog
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class StepTelemetryRecorder:
+    """步骤遥测记录器（每个任务一个实例）"""
+
+    def __init__(self, task_log_id: int, flush_size: int = 50):
+        """
+        初始化记录器
+
+        Args:
+            task_log_id: 任务日志ID
+            flush_size: 缓冲的已完成步骤数达到该值时批量写入一次
+        """
+        self.task_log_id = task_log_id
+        self.flush_size = flush_size
+        self.pending: List[StepExecutionLog] = []
+        self.current: Optional[StepExecutionLog] = None
+        self.flushed_count = 0
+
+    def start_step(self, step_index: int, step: Dict):
+        """记录步骤开始"""
+        self.current = StepExecutionLog(
+            task_log_id=self.task_log_id,
+            step_index=step_index,
+            step_name=step.get("name"),
+            step_type=step.get("type"),
+            status="running",
+            start_time=datetime.now()
+        )
+
+    def end_step(self, status: str, error_message: str = None):
+        """记录步骤结束，达到批次大小时自动写入"""
+        if not self.current:
+            return
+
+        record = self.current
+        record.status = status
+        record.end_time = datetime.now()
+        record.duration = (record.end_time - record.start_time).total_seconds()
+        record.error_message = error_message
+
+        self.pending.append(record)
+        self.current = None
+
+        if len(self.pending) >= self.flush_size:
+            # 执行中不等待写入完成，由写入队列和其他写操作合并提交
+            self.flush(wait=False)
+
+    def skip_step(self, step_index: int, step: Dict):
+        """记录被跳过的步骤（不计时）"""
+        self.pending.append(StepExecutionLog(
+            task_log_id=self.task_log_id,
+            step_index=step_index,
+            step_name=step.get("name"),
+            step_type=step.get("type"),
+            status="skipped"
+        ))
+
+    def flush(self, wait: bool = True) -> int:
+        """
+        将缓冲的步骤记录交给写入队列批量写入数据库
+
+        Args:
+            wait: 是否等待写入提交
+
+        Returns:
+            写入（wait=False 时为已提交到队列）的记录数
+        """
+        if not self.pending:
+            return 0
+
+        records, self.pending = self.pending, []
+        future = write_queue.submit(lambda session: session.add_all(records))
+        self.flushed_count += len(records)
+        if not wait:
+            future.add_done_callback(lambda done: self._log_failure(done.exception()))
+            return len(records)
+        try:
+            future.result()
+            return len(records)
+        except Exception as e:
+            self._log_failure(e)
+            return 0
+
+    async def flush_async(self) -> int:
+        """flush() 的异步版本，等待写入时不阻塞事件循环"""
+        if not self.pending:
+            return 0
+
+        records, self.pending = self.pending, []
+        self.flushed_count += len(records)
+        try:
+            await write_queue.run(lambda session: session.add_all(records))
+            return len(records)
+        except Exception as e:
+            self._log_failure(e)
+            return 0
+
+    def _log_failure(self, error: Optional[BaseException]):
+        if error is not None:
+            logger.error(f"步骤遥测写入失败 (任务 {self.task_log_id}): {error}")
+
+
+def get_resume_step(session: Session, task_log_id: int) -> Optional[int]:
+    """
+    根据步骤检查点计算续跑起点
+
+    优先返回第一个失败的步骤；没有失败记录时返回最后一个已完成步骤的下一步。
+    续跑时跳过的步骤（skipped）在之前的执行中已经完成，同样视为检查点，
+    否则续跑任务在失败前被取消时会退回到最后一个 setup 步骤之后。
+
+    Args:
+        session: 数据库会话
+        task_log_id: 任务日志ID
+
+    Returns:
+        续跑起始步骤（从1开始），没有检查点时返回None
+    """
+    failed_step = session.exec(
+        select(func.min(StepExecutionLog.step_index)).where(
+            StepExecutionLog.task_log_id == task_log_id,
+            StepExecutionLog.status == "failed"
+        )
+    ).one()
+    if failed_step is not None:
+        return failed_step
+
+    last_completed = session.exec(
+        select(func.max(StepExecutionLog.step_index)).where(
+            StepExecutionLog.task_log_id == task_log_id,
+            StepExecutionLog.status.in_(("success", "skipped"))
+        )
+    ).one()
+    if last_completed is not None:
+        return last_completed + 1
+
+    return None
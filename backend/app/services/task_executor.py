@@ -5,6 +5,7 @@ import asyncio
 import sys
 from datetime import datetime
 from app.core.websocket_manager import manager
+from app.services.step_telemetry import StepTelemetryRecorder
 from typing import List, Dict
 
 
@@ -16,10 +17,18 @@ class TaskExecutor:
         task_id: int, 
         script_id: int, 
         device_id: int, 
-        steps: List[Dict]
+        steps: List[Dict],
+        start_step: int = 1
     ):
-        """执行脚本并实时推送进度"""
+        """
+        执行脚本并实时推送进度
+        
+        每个成功的步骤都会作为检查点记录到步骤执行日志中。
+        start_step > 1 时为续跑模式：先执行声明为 setup 的步骤恢复应用状态，
+        跳过其余已完成的步骤，从 start_step 开始继续执行。
+        """
         total_steps = len(steps)
+        telemetry = StepTelemetryRecorder(task_id)
         
         # 初始化任务
         await manager.send_task_update(task_id, {
@@ -27,7 +36,7 @@ class TaskExecutor:
             "progress": 0,
             "current_step": 0,
             "total_steps": total_steps,
-            "message": "任务开始执行",
+            "message": "任务开始执行" if start_step <= 1 else f"从第 {start_step} 步恢复执行",
             "start_time": datetime.now().isoformat()
         })
         
@@ -36,6 +45,11 @@ class TaskExecutor:
                 current_step = index + 1
                 progress = int((current_step / total_steps) * 100)
                 
+                # 续跑模式：跳过检查点之前的非 setup 步骤
+                if current_step < start_step and not step.get("setup"):
+                    telemetry.skip_step(current_step, step)
+                    continue
+                
                 # 推送步骤开始
                 await manager.send_task_update(task_id, {
                     "status": "running",
@@ -53,8 +67,18 @@ class TaskExecutor:
                     "level": "info"
                 })
                 
-                # 执行步骤
-                await self._execute_step(task_id, step, device_id)
+                # 执行步骤（记录步骤耗时）
+                telemetry.start_step(current_step, step)
+                # 在 finally 中记录，任务被取消（CancelledError）时也有步骤结束记录
+                outcome = ("cancelled", "任务已取消")
+                try:
+                    await self._execute_step(task_id, step, device_id)
+                    outcome = ("success", None)
+                except Exception as e:
+                    outcome = ("failed", str(e))
+                    raise
+                finally:
+                    telemetry.end_step(*outcome)
                 
                 # 推送步骤完成
                 await manager.send_task_update(task_id, {
@@ -90,7 +114,15 @@ class TaskExecutor:
                 "end_time": datetime.now().isoformat()
             })
             
-            return {"status": "failed", "message": str(e)}
+            return {
+                "status": "failed",
+                "message": str(e),
+                "failed_step": current_step if 'current_step' in locals() else None
+            }
+        
+        finally:
+            # 批量写入剩余的步骤遥测数据
+            await telemetry.flush_async()
     
     async def _execute_step(self, task_id: int, step: Dict, device_id: int):
         """执行单个步骤"""
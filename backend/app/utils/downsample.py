@@ -0,0 +1,60 @@
+"""
+时序数据可视化降采样
+LTTB (Largest-Triangle-Three-Buckets) 在保留曲线形状（峰值、拐点）的前提下把数据点减少到图表可用的数量
+"""
+from typing import Callable, List, TypeVar
+
+T = TypeVar("T")
+
+
+def lttb(points: List[T], threshold: int, x: Callable[[T], float], y: Callable[[T], float]) -> List[T]:
+    """
+    LTTB 降采样
+    
+    首尾两点始终保留；中间的点分成 threshold - 2 个桶，每个桶选出与
+    上一个已选点、下一个桶平均点构成三角形面积最大的点
+    
+    Args:
+        points: 按 x 升序排列的数据点
+        threshold: 目标点数，小于 3 或不小于数据点数时原样返回
+        x: 取横坐标（通常是时间戳）的函数
+        y: 取纵坐标的函数
+    
+    Returns:
+        选中的原始数据点（保持原顺序）
+    """
+    if threshold < 3 or len(points) <= threshold:
+        return list(points)
+    
+    xs = [x(point) for point in points]
+    ys = [y(point) for point in points]
+    bucket_size = (len(points) - 2) / (threshold - 2)
+    
+    selected = [points[0]]
+    a = 0
+    for i in range(threshold - 2):
+        bucket_start = int(i * bucket_size) + 1
+        bucket_end = int((i + 1) * bucket_size) + 1
+        
+        # 下一个桶的平均点（最后一个桶用末尾点）
+        next_start = bucket_end
+        next_end = min(int((i + 2) * bucket_size) + 1, len(points))
+        if next_start >= next_end:
+            next_start, next_end = len(points) - 1, len(points)
+        count = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / count
+        avg_y = sum(ys[next_start:next_end]) / count
+        
+        best_index = bucket_start
+        best_area = -1.0
+        for j in range(bucket_start, bucket_end):
+            area = abs((xs[a] - avg_x) * (ys[j] - ys[a]) - (xs[a] - xs[j]) * (avg_y - ys[a]))
+            if area > best_area:
+                best_area = area
+                best_index = j
+        
+        selected.append(points[best_index])
+        a = best_index
+    
+    selected.append(points[-1])
+    return selected
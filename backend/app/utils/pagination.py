@@ -0,0 +1,88 @@
+"""
+游标（keyset）分页
+按 (时间, id) 倒序分页，下一页从上一页最后一条记录的排序键之后继续（WHERE (时间, id) < (?, ?)），
+配合以过滤列 + 时间开头的索引，任意深度的页都只扫描一页的记录；OFFSET 分页需要先跳过前面所有记录。
+游标是排序键的 base64 编码，对客户端不透明，只能原样传回
+"""
+from datetime import datetime
+from typing import List, Optional, Sequence
+from sqlalchemy import tuple_
+from sqlmodel import select, func
+import base64
+import json
+
+
+def encode_cursor(values: Sequence) -> str:
+    """把排序键编码为游标"""
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns: Sequence) -> list:
+    """
+    解析游标，按排序列的类型还原排序键
+
+    Raises:
+        ValueError: 游标格式无效
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError
+        return [
+            datetime.fromisoformat(value) if column.type.python_type is datetime else column.type.python_type(value)
+            for column, value in zip(columns, values)
+        ]
+    except (ValueError, TypeError):
+        raise ValueError("无效的分页游标")
+
+
+def keyset(statement, columns: Sequence, cursor: Optional[str], limit: int):
+    """
+    给查询加上游标条件、倒序排序和 LIMIT
+
+    多取一条用于判断是否还有下一页，结果交给 keyset_page 处理
+
+    Args:
+        statement: 带过滤条件、不带排序的查询
+        columns: 排序列，最后一列需唯一（通常是 id）
+        cursor: 上一页返回的 next_cursor，首页为空
+        limit: 每页记录数
+
+    Raises:
+        ValueError: 游标格式无效
+    """
+    if cursor:
+        statement = statement.where(tuple_(*columns) < tuple_(*decode_cursor(cursor, columns)))
+    return statement.order_by(*[column.desc() for column in columns]).limit(limit + 1)
+
+
+def keyset_page(rows: List, columns: Sequence, limit: int) -> dict:
+    """
+    keyset 查询结果转换为分页数据
+
+    Returns:
+        {"items": 本页记录, "page_size": 每页记录数, "next_cursor": 下一页游标，没有下一页时为 None}
+    """
+    items = list(rows[:limit])
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor([getattr(last, column.key) for column in columns])
+    return {"items": items, "page_size": limit, "next_cursor": next_cursor}
+
+
+def capped_count(statement, cap: int):
+    """
+    近似总数查询：最多数到 cap + 1 条，结果大于 cap 时表示总数超过 cap
+
+    Args:
+        statement: 带过滤条件、不带排序和分页的查询
+    """
+    return select(func.count()).select_from(statement.limit(cap + 1).subquery())
+
+
+def approximate_total(count: int, cap: int) -> dict:
+    """capped_count 的结果转换为 {"total": 总数（超过上限时为上限）, "total_exact": 是否精确}"""
+    return {"total": min(count, cap), "total_exact": count <= cap}
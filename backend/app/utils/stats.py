@@ -0,0 +1,27 @@
+"""
+统计工具
+"""
+from typing import List, Optional
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    """
+    计算百分位数（线性插值）
+
+    Args:
+        sorted_values: 已升序排列的数值列表
+        q: 百分位 (0-100)
+
+    Returns:
+        百分位数值，列表为空时返回None
+    """
+    if not sorted_values:
+        return None
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+
+    rank = (len(sorted_values) - 1) * q / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    fraction = rank - lower
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * fraction
@@ -0,0 +1,136 @@
+"""
+事件循环延迟基准测试
+
+在临时 SQLite 数据库中写入 TASK_LOGS 条任务日志，CLIENTS 个并发客户端持续请求
+任务列表（按状态计数 + 分页）和仪表盘概览，同时用一个每 TICK_MS 毫秒醒来一次的协程
+测量事件循环延迟（实际醒来时间 - 预期醒来时间）。对比:
+  同步会话: 迁移前的写法，async 路由内直接执行同步查询
+  异步会话: get_async_session + aiosqlite，同步服务代码经 run_sync 执行
+
+延迟高说明同一事件循环上的 WebSocket 推送、其他请求都在排队。
+
+运行: python benchmarks/bench_event_loop_lag.py
+"""
+import os
+import sys
+import asyncio
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_DB_DIR = tempfile.mkdtemp(prefix="adbweb_bench_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_DB_DIR, 'bench.db')}"
+
+from sqlmodel import Session, select, func
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.core.database import engine, async_engine, create_db_and_tables
+import app.models  # noqa: F401
+from app.api.dashboard import get_dashboard_overview
+from app.api.tasks import get_task_logs_list
+from app.models.device import Device
+from app.models.script import Script
+from app.models.task_log import TaskLog
+from app.services.dashboard_service import DashboardService
+from app.utils.stats import percentile
+
+TASK_LOGS = 200_000
+CLIENTS = 8
+DURATION = 10
+TICK_MS = 5
+STATUSES = ("success", "failed", "running")
+
+
+def seed():
+    create_db_and_tables()
+    with Session(engine) as session:
+        for i in range(20):
+            session.add(Device(serial_number=f"SN{i:04d}", model="Pixel", android_version="14", status="online"))
+            session.add(Script(name=f"script{i}", type="visual"))
+        session.commit()
+
+    now = datetime.now()
+    rows = [
+        {
+            "task_name": f"task{i}",
+            "script_id": i % 20 + 1,
+            "device_id": i % 20 + 1,
+            "status": random.choice(STATUSES),
+            "start_time": now - timedelta(seconds=i * 10),
+            "created_at": now - timedelta(seconds=i * 10),
+        }
+        for i in range(TASK_LOGS)
+    ]
+    with engine.begin() as conn:
+        conn.execute(TaskLog.__table__.insert(), rows)
+
+
+async def legacy_request(n: int):
+    """迁移前：async 路由内的同步查询"""
+    with Session(engine) as db:
+        if n % 2:
+            return DashboardService.get_dashboard_overview(db)
+        status = STATUSES[n % 3]
+        total = db.exec(select(func.count(TaskLog.id)).where(TaskLog.status == status)).one()
+        db.exec(
+            select(TaskLog).where(TaskLog.status == status)
+            .order_by(TaskLog.start_time.desc()).offset((n % 50) * 20).limit(20)
+        ).all()
+        return total
+
+
+async def async_request(n: int):
+    """迁移后：调用异步会话版本的路由函数"""
+    async with AsyncSession(async_engine, expire_on_commit=False) as db:
+        if n % 2:
+            return await get_dashboard_overview(db=db)
+        return await get_task_logs_list(status=STATUSES[n % 3], page=n % 50 + 1, page_size=20, db=db)
+
+
+async def run(request):
+    """返回 (请求/秒, 延迟 p50, p99, 最大值 ms)"""
+    stop = asyncio.Event()
+    deadline = time.perf_counter() + DURATION
+    lags = []
+    completed = 0
+
+    async def monitor():
+        interval = TICK_MS / 1000
+        while not stop.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            lags.append((time.perf_counter() - started - interval) * 1000)
+
+    async def client(index: int):
+        nonlocal completed
+        n = index
+        while time.perf_counter() < deadline:
+            await request(n)
+            completed += 1
+            n += CLIENTS
+            # 每个请求之间让出一次，相当于服务器处理下一个请求前回到事件循环
+            await asyncio.sleep(0)
+
+    monitor_task = asyncio.create_task(monitor())
+    await asyncio.gather(*(client(i) for i in range(CLIENTS)))
+    stop.set()
+    await monitor_task
+    lags.sort()
+    return completed / DURATION, percentile(lags, 50), percentile(lags, 99), lags[-1]
+
+
+def main():
+    start = time.perf_counter()
+    seed()
+    print(f"写入 {TASK_LOGS} 条任务日志: {time.perf_counter() - start:.1f}s")
+    print(f"{CLIENTS} 个并发客户端，每种实现运行 {DURATION}s\n")
+    print(f"{'实现':<12}{'请求/秒':>10}{'延迟p50(ms)':>14}{'延迟p99(ms)':>14}{'最大(ms)':>12}")
+    for name, request in (("同步会话", legacy_request), ("异步会话", async_request)):
+        rps, p50, p99, worst = asyncio.run(run(request))
+        print(f"{name:<12}{rps:>10.0f}{p50:>14.1f}{p99:>14.1f}{worst:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
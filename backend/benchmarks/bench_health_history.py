@@ -0,0 +1,118 @@
+"""
+设备健康度历史查询基准测试
+
+在临时 SQLite 数据库中写入 DEVICES 台设备 30 天、每 5 分钟一条的健康记录，
+对比旧实现（加载窗口内全部记录后在 Python 中抽样）与
+SQL 分桶 + 聚合数据 + LTTB 的 30 天查询耗时。
+
+运行: python benchmarks/bench_health_history.py
+"""
+import os
+import sys
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_DB_DIR = tempfile.mkdtemp(prefix="adbweb_bench_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_DB_DIR, 'bench.db')}"
+
+from sqlmodel import Session, select
+from app.core.database import engine, create_db_and_tables
+import app.models  # noqa: F401
+from app.models.device import Device
+from app.models.device_health import DeviceHealthRecord
+from app.services.health_rollup import HealthRollupService
+from app.utils.downsample import lttb
+
+DEVICES = 50
+DAYS = 30
+INTERVAL = timedelta(minutes=5)
+SAMPLE_INTERVAL_MINUTES = 30
+ROUNDS = 5
+
+
+def seed(now: datetime):
+    create_db_and_tables()
+    with Session(engine) as session:
+        for i in range(DEVICES):
+            session.add(Device(serial_number=f"SN{i:04d}", model="Pixel", android_version="14", status="online"))
+        session.commit()
+    
+    start = now - timedelta(days=DAYS)
+    steps = int(timedelta(days=DAYS) / INTERVAL)
+    rows = []
+    for device_id in range(1, DEVICES + 1):
+        for step in range(steps):
+            rows.append({
+                "device_id": device_id,
+                "health_score": random.randint(40, 100),
+                "battery_level": random.randint(10, 100),
+                "temperature": round(random.uniform(25, 45), 1),
+                "cpu_usage": round(random.uniform(0, 100), 1),
+                "memory_usage": round(random.uniform(20, 90), 1),
+                "storage_usage": 60.0,
+                "created_at": start + INTERVAL * step,
+            })
+    with engine.begin() as conn:
+        conn.execute(DeviceHealthRecord.__table__.insert(), rows)
+    return len(rows)
+
+
+def legacy_query(device_id: int, start_time: datetime) -> int:
+    """旧实现：加载全部记录后按间隔抽样"""
+    with Session(engine) as session:
+        records = session.exec(
+            select(DeviceHealthRecord).where(
+                DeviceHealthRecord.device_id == device_id,
+                DeviceHealthRecord.created_at >= start_time
+            ).order_by(DeviceHealthRecord.created_at.asc())
+        ).all()
+    sampled = []
+    last_sample_time = None
+    for record in records:
+        if last_sample_time is None or (record.created_at - last_sample_time).total_seconds() >= SAMPLE_INTERVAL_MINUTES * 60:
+            sampled.append(record)
+            last_sample_time = record.created_at
+    return len(sampled)
+
+
+def bucketed_query(service: HealthRollupService, device_id: int, start_time: datetime, now: datetime) -> int:
+    """新实现：自动选择粒度，SQL 分桶后 LTTB 降到 300 个点"""
+    with Session(engine) as session:
+        _, points = service.query_history(session, device_id, start_time, SAMPLE_INTERVAL_MINUTES * 60, now=now)
+    points = lttb(points, 300, x=lambda p: p["created_at"].timestamp(), y=lambda p: p["health_score"] or 0)
+    return len(points)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        result = func(*args)
+    return (time.perf_counter() - start) / ROUNDS * 1000, result
+
+
+def main():
+    now = datetime.now().replace(microsecond=0)
+    start = time.perf_counter()
+    total = seed(now)
+    print(f"写入 {total} 条原始记录: {time.perf_counter() - start:.1f}s")
+    
+    service = HealthRollupService()
+    start = time.perf_counter()
+    with Session(engine) as session:
+        written = service.rollup(session, now)
+    print(f"首次聚合 {written}: {time.perf_counter() - start:.1f}s\n")
+    
+    start_time = now - timedelta(days=DAYS)
+    legacy_ms, legacy_points = timed(legacy_query, 1, start_time)
+    new_ms, new_points = timed(bucketed_query, service, 1, start_time, now)
+    print(f"{'实现':<24}{'耗时(ms)':>12}{'返回点数':>10}")
+    print(f"{'加载全部 + Python 抽样':<24}{legacy_ms:>12.1f}{legacy_points:>10}")
+    print(f"{'聚合数据 + SQL 分桶 + LTTB':<24}{new_ms:>12.1f}{new_points:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+深分页基准测试
+
+在临时 SQLite 数据库中写入 TASK_LOGS 条任务日志，对比按状态过滤、开始时间倒序的任务列表
+在不同深度取一页的耗时:
+  OFFSET: 旧的 page/page_size 分页，需要先跳过前面所有记录
+  游标:   keyset 分页，WHERE (start_time, id) < (?, ?) 直接从索引位置开始读
+
+运行: python benchmarks/bench_pagination.py
+"""
+import os
+import sys
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_DB_DIR = tempfile.mkdtemp(prefix="adbweb_bench_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_DB_DIR, 'bench.db')}"
+
+from sqlmodel import Session, select
+from app.core.database import engine, create_db_and_tables
+import app.models  # noqa: F401
+from app.models.task_log import TaskLog
+from app.utils.pagination import encode_cursor, keyset
+
+TASK_LOGS = 500_000
+PAGE_SIZE = 20
+DEPTHS = (0, 1_000, 10_000, 100_000)
+REPEAT = 20
+KEYS = (TaskLog.start_time, TaskLog.id)
+
+
+def seed():
+    create_db_and_tables()
+    now = datetime.now()
+    rows = [
+        {
+            "task_name": f"task{i}",
+            "script_id": i % 20 + 1,
+            "device_id": i % 20 + 1,
+            "status": random.choice(("success", "failed")),
+            "start_time": now - timedelta(seconds=i * 10),
+            "created_at": now - timedelta(seconds=i * 10),
+        }
+        for i in range(TASK_LOGS)
+    ]
+    with engine.begin() as conn:
+        conn.execute(TaskLog.__table__.insert(), rows)
+
+
+def timed(session: Session, statement) -> float:
+    """执行 REPEAT 次，返回平均毫秒数"""
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        session.exec(statement).all()
+    return (time.perf_counter() - start) / REPEAT * 1000
+
+
+def main():
+    start = time.perf_counter()
+    seed()
+    print(f"写入 {TASK_LOGS} 条任务日志: {time.perf_counter() - start:.1f}s\n")
+    query = select(TaskLog).where(TaskLog.status == "success")
+    print(f"{'深度(条)':<12}{'OFFSET(ms)':>12}{'游标(ms)':>12}")
+    with Session(engine) as session:
+        for depth in DEPTHS:
+            ordered = query.order_by(TaskLog.start_time.desc(), TaskLog.id.desc())
+            offset_ms = timed(session, ordered.offset(depth).limit(PAGE_SIZE))
+            # 游标取自上一页最后一条记录
+            cursor = None
+            if depth:
+                last = session.exec(ordered.offset(depth - 1).limit(1)).one()
+                cursor = encode_cursor([last.start_time, last.id])
+            keyset_ms = timed(session, keyset(query, KEYS, cursor, PAGE_SIZE))
+            print(f"{depth:<12}{offset_ms:>12.2f}{keyset_ms:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+报告列表基准测试
+
+在临时 SQLite 数据库中写入 TASK_LOGS 条任务日志（每条带 LOG_BYTES 字节日志内容），
+对比报告列表第一页的耗时:
+  旧实现: len(query.all()) 计数（加载所有匹配记录，含日志内容），每行两次 db.get 查询脚本和设备名称
+  新实现: COUNT(*) + 一次连表投影查询（不取日志内容和截图路径）
+
+运行: python benchmarks/bench_reports.py
+"""
+import os
+import sys
+import asyncio
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_DB_DIR = tempfile.mkdtemp(prefix="adbweb_bench_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_DB_DIR, 'bench.db')}"
+
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.core.database import engine, async_engine, create_db_and_tables
+import app.models  # noqa: F401
+from app.api.reports import get_reports
+from app.models.device import Device
+from app.models.script import Script
+from app.models.task_log import TaskLog
+
+TASK_LOGS = 1_000_000
+LOG_BYTES = 200
+PAGE_SIZE = 10
+REPEAT = 5
+BATCH = 100_000
+SCENARIOS = (
+    ("全部", {}),
+    ("按状态", {"status": "failed"}),
+    ("按脚本", {"script_id": 3}),
+)
+
+
+def seed():
+    create_db_and_tables()
+    with Session(engine) as session:
+        for i in range(20):
+            session.add(Device(serial_number=f"SN{i:04d}", model="Pixel", android_version="14", status="online"))
+            session.add(Script(name=f"script{i}", type="visual"))
+        session.commit()
+
+    now = datetime.now()
+    log = "x" * LOG_BYTES
+    for start in range(0, TASK_LOGS, BATCH):
+        rows = [
+            {
+                "task_name": f"task{i}",
+                "script_id": i % 20 + 1,
+                "device_id": i % 20 + 1,
+                "status": random.choice(("success", "failed", "success")),
+                "start_time": now - timedelta(seconds=i * 10),
+                "log_content": log,
+                "created_at": now - timedelta(seconds=i * 10),
+            }
+            for i in range(start, min(start + BATCH, TASK_LOGS))
+        ]
+        with engine.begin() as conn:
+            conn.execute(TaskLog.__table__.insert(), rows)
+
+
+async def legacy_reports(db: AsyncSession, status=None, script_id=None) -> int:
+    """旧实现"""
+    query = select(TaskLog).order_by(TaskLog.start_time.desc())
+    if status:
+        query = query.where(TaskLog.status == status)
+    if script_id:
+        query = query.where(TaskLog.script_id == script_id)
+    total = len((await db.exec(query)).all())
+    items = []
+    for report in (await db.exec(query.limit(PAGE_SIZE))).all():
+        item = report.model_dump()
+        item["script_name"] = (await db.get(Script, report.script_id)).name
+        item["device_name"] = (await db.get(Device, report.device_id)).model
+        items.append(item)
+    return total
+
+
+async def new_reports(db: AsyncSession, status=None, script_id=None) -> int:
+    response = await get_reports(status=status, script_id=script_id, page=1, page_size=PAGE_SIZE, db=db)
+    return response.data["total"]
+
+
+async def timed(implementation, params: dict, repeat: int):
+    """返回 (平均毫秒数, 总数)"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        # 每次新会话，避免旧实现的 identity map 缓存影响结果
+        async with AsyncSession(async_engine, expire_on_commit=False) as db:
+            total = await implementation(db, **params)
+    return (time.perf_counter() - start) / repeat * 1000, total
+
+
+async def run():
+    print(f"{'场景':<10}{'总数':>10}{'旧实现(ms)':>14}{'新实现(ms)':>14}{'加速':>10}")
+    for name, params in SCENARIOS:
+        new_ms, total = await timed(new_reports, params, REPEAT)
+        legacy_ms, legacy_total = await timed(legacy_reports, params, 1)
+        assert total == legacy_total
+        print(f"{name:<10}{total:>10}{legacy_ms:>14.1f}{new_ms:>14.1f}{legacy_ms / new_ms:>9.0f}x")
+
+
+def main():
+    start = time.perf_counter()
+    seed()
+    print(f"写入 {TASK_LOGS} 条任务日志: {time.perf_counter() - start:.1f}s\n")
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+SQLite 并发读写基准测试
+
+WRITERS 个线程各自写入小事务（模拟执行器/采集器写健康记录），同时 READERS 个线程
+持续执行历史查询，运行 DURATION 秒。对比:
+  默认: 回滚日志模式，只设置 check_same_thread=False，每个写操作单独提交
+  调优: WAL + synchronous=NORMAL + busy_timeout + mmap/cache，写操作经写入队列合并提交
+
+运行: python benchmarks/bench_sqlite_concurrency.py
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_DB_DIR = tempfile.mkdtemp(prefix="adbweb_bench_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_DB_DIR, 'bench.db')}"
+
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, SQLModel, create_engine, func, select
+from app.core.database import engine as tuned_engine
+from app.core.write_queue import WriteQueue
+import app.models  # noqa: F401
+from app.models.device import Device
+from app.models.device_health import DeviceHealthRecord
+from app.utils.stats import percentile
+
+DEVICES = 50
+WRITERS = 8
+READERS = 4
+DURATION = 10
+
+
+def seed(engine):
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        for i in range(DEVICES):
+            session.add(Device(serial_number=f"SN{i:04d}", model="Pixel", android_version="14", status="online"))
+        session.commit()
+
+
+def make_record(n: int) -> DeviceHealthRecord:
+    return DeviceHealthRecord(
+        device_id=n % DEVICES + 1, health_score=80, battery_level=50,
+        temperature=30.0, cpu_usage=20.0, memory_usage=40.0, created_at=datetime.now()
+    )
+
+
+def run(engine, write):
+    """write(n) 写入一条记录；返回 (写/秒, 读/秒, 锁错误数, 写 p95 ms)"""
+    stop = threading.Event()
+    lock = threading.Lock()
+    stats = {"writes": 0, "reads": 0, "errors": 0}
+    latencies = []
+
+    def writer(index: int):
+        n = index
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                write(n)
+                elapsed = time.perf_counter() - started
+                with lock:
+                    stats["writes"] += 1
+                    latencies.append(elapsed * 1000)
+            except OperationalError:
+                with lock:
+                    stats["errors"] += 1
+            n += WRITERS
+
+    def reader(index: int):
+        n = index
+        while not stop.is_set():
+            try:
+                with Session(engine) as session:
+                    session.exec(
+                        select(func.count(), func.avg(DeviceHealthRecord.health_score))
+                        .where(DeviceHealthRecord.device_id == n % DEVICES + 1)
+                    ).one()
+                with lock:
+                    stats["reads"] += 1
+            except OperationalError:
+                with lock:
+                    stats["errors"] += 1
+            n += 1
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(WRITERS)]
+    threads += [threading.Thread(target=reader, args=(i,)) for i in range(READERS)]
+    for thread in threads:
+        thread.start()
+    time.sleep(DURATION)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return (
+        stats["writes"] / DURATION, stats["reads"] / DURATION,
+        stats["errors"], percentile(latencies, 95) or 0.0
+    )
+
+
+def main():
+    # 默认配置：独立数据库文件，不加载调优参数
+    default_engine = create_engine(
+        f"sqlite:///{os.path.join(_DB_DIR, 'default.db')}",
+        connect_args={"check_same_thread": False}
+    )
+    seed(default_engine)
+
+    def default_write(n: int):
+        with Session(default_engine) as session:
+            session.add(make_record(n))
+            session.commit()
+
+    seed(tuned_engine)
+    queue = WriteQueue()
+
+    def tuned_write(n: int):
+        queue.execute(lambda session: session.add(make_record(n)))
+
+    print(f"{WRITERS} 个写线程 + {READERS} 个读线程，每种配置运行 {DURATION}s\n")
+    print(f"{'配置':<22}{'写/秒':>10}{'读/秒':>10}{'锁错误':>8}{'写p95(ms)':>12}")
+    for name, engine, write in (
+        ("默认", default_engine, default_write),
+        ("WAL + 写入队列", tuned_engine, tuned_write),
+    ):
+        writes, reads, errors, p95 = run(engine, write)
+        print(f"{name:<22}{writes:>10.0f}{reads:>10.0f}{errors:>8}{p95:>12.1f}")
+    queue.stop()
+    print(f"\n写入队列: {queue.get_stats()}")
+
+
+if __name__ == "__main__":
+    main()
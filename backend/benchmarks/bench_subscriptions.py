@@ -0,0 +1,86 @@
+"""
+订阅索引微基准测试
+
+对比旧的 {task_id: [client_id]} 列表实现与 SubscriptionRegistry 在
+10k 订阅下的订阅、查找和断开开销。
+
+运行: python benchmarks/bench_subscriptions.py
+"""
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.subscriptions import SubscriptionRegistry, task_topic
+
+TASKS = 2000
+CLIENTS = 200
+SUBSCRIPTIONS_PER_CLIENT = 50  # 共 10k 订阅
+
+
+class LegacySubscribers:
+    """旧实现：任务→客户端列表，断开时扫描所有任务"""
+    
+    def __init__(self):
+        self.task_subscribers = {}
+    
+    def subscribe(self, task_id, client_id):
+        if task_id not in self.task_subscribers:
+            self.task_subscribers[task_id] = []
+        if client_id not in self.task_subscribers[task_id]:
+            self.task_subscribers[task_id].append(client_id)
+    
+    def subscribers(self, task_id):
+        return self.task_subscribers.get(task_id, [])
+    
+    def disconnect(self, client_id):
+        for task_id in list(self.task_subscribers.keys()):
+            if client_id in self.task_subscribers[task_id]:
+                self.task_subscribers[task_id].remove(client_id)
+                if not self.task_subscribers[task_id]:
+                    del self.task_subscribers[task_id]
+
+
+def build_plan():
+    random.seed(42)
+    return {
+        f"client-{c}": random.sample(range(TASKS), SUBSCRIPTIONS_PER_CLIENT)
+        for c in range(CLIENTS)
+    }
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    func()
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"  {label:28s} {elapsed:9.2f} ms")
+    return elapsed
+
+
+def bench_legacy(plan):
+    legacy = LegacySubscribers()
+    print("旧实现 (list):")
+    timed("订阅 10k", lambda: [legacy.subscribe(t, c) for c, tasks in plan.items() for t in tasks])
+    timed("查找 2k 任务订阅者", lambda: [legacy.subscribers(t) for t in range(TASKS)])
+    return timed("断开 200 客户端", lambda: [legacy.disconnect(c) for c in plan])
+
+
+def bench_registry(plan):
+    registry = SubscriptionRegistry()
+    registry.subscribe("dashboard", "task:*")
+    print("SubscriptionRegistry (set + 反向索引):")
+    timed("订阅 10k", lambda: [registry.subscribe(c, task_topic(t)) for c, tasks in plan.items() for t in tasks])
+    print(f"  当前订阅数: {len(registry)}")
+    timed("查找 2k 任务订阅者(含通配)", lambda: [registry.subscribers(task_topic(t)) for t in range(TASKS)])
+    return timed("断开 200 客户端", lambda: [registry.remove_client(c) for c in plan])
+
+
+if __name__ == "__main__":
+    plan = build_plan()
+    print(f"任务数: {TASKS}, 客户端数: {CLIENTS}, 订阅数: {CLIENTS * SUBSCRIPTIONS_PER_CLIENT}\n")
+    legacy_ms = bench_legacy(plan)
+    print()
+    registry_ms = bench_registry(plan)
+    print(f"\n断开连接加速比: {legacy_ms / max(registry_ms, 1e-6):.1f}x")
@@ -0,0 +1,135 @@
+"""
+WebSocket 编码微基准测试
+
+以一段典型的 pip install 日志为负载，对比 JSON / MessagePack 两种编码、
+逐条推送 / 批量帧两种推送方式，以及是否启用 permessage-deflate 时
+每行日志的传输字节数和编码 CPU 时间。
+
+permessage-deflate 用 zlib 原始 deflate 流 + 上下文复用（context takeover）+ 每帧 SYNC_FLUSH 模拟，
+与浏览器和 websockets 库的默认协商结果一致。
+
+运行: python benchmarks/bench_ws_codec.py
+"""
+import os
+import sys
+import time
+import zlib
+import random
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.ws_codec import CODECS
+
+LINES = 2000
+BATCH_SIZE = 50
+ROUNDS = 5
+
+PACKAGES = [
+    ("fastapi", "0.109.0"), ("starlette", "0.35.1"), ("pydantic", "2.5.3"), ("pydantic-core", "2.14.6"),
+    ("uvicorn", "0.27.0"), ("sqlmodel", "0.0.14"), ("SQLAlchemy", "2.0.25"), ("greenlet", "3.0.3"),
+    ("httpx", "0.27.0"), ("anyio", "4.2.0"), ("numpy", "1.26.4"), ("opencv-python", "4.6.0.66"),
+    ("pillow", "12.1.0"), ("requests", "2.31.0"), ("urllib3", "2.1.0"), ("certifi", "2023.11.17"),
+]
+
+
+def pip_install_log(count: int):
+    """生成 pip install 风格的日志行"""
+    random.seed(7)
+    templates = [
+        lambda p, v: f"Collecting {p}=={v}",
+        lambda p, v: f"  Downloading {p}-{v}-py3-none-any.whl ({random.randint(20, 9000) / 100:.1f} MB)",
+        lambda p, v: f"     ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━ {random.randint(1, 90) / 10:.1f}/9.0 MB "
+                     f"{random.randint(10, 400) / 10:.1f} MB/s eta 0:00:0{random.randint(0, 9)}",
+        lambda p, v: f"Requirement already satisfied: {p}>={v} in /usr/local/lib/python3.11/site-packages",
+        lambda p, v: f"  Using cached {p}-{v}-cp311-cp311-manylinux_2_17_x86_64.whl",
+    ]
+    lines = []
+    for i in range(count):
+        package, version = PACKAGES[i % len(PACKAGES)]
+        lines.append(random.choice(templates)(package, version))
+    lines.append("Successfully installed " + " ".join(f"{p}-{v}" for p, v in PACKAGES))
+    return lines
+
+
+def build_updates(lines):
+    """包装成 task_update 消息（与 ConnectionManager 推送的结构一致）"""
+    start = datetime(2026, 3, 1, 10, 0, 0)
+    return [
+        {
+            "type": "task_update",
+            "task_id": 1024,
+            "data": {"type": "log", "message": line, "level": "info"},
+            "timestamp": (start + timedelta(milliseconds=37 * i)).isoformat(),
+            "seq": i + 1,
+        }
+        for i, line in enumerate(lines)
+    ]
+
+
+def frames_of(updates, batch: bool):
+    if not batch:
+        return updates
+    return [
+        {
+            "type": "task_update_batch",
+            "task_id": 1024,
+            "updates": updates[i:i + BATCH_SIZE],
+            "dropped": 0,
+            "timestamp": updates[i]["timestamp"],
+        }
+        for i in range(0, len(updates), BATCH_SIZE)
+    ]
+
+
+def deflated_size(payloads):
+    """模拟 permessage-deflate：同一连接共享压缩上下文，每帧 SYNC_FLUSH 后去掉 4 字节尾部"""
+    compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    total = 0
+    for payload in payloads:
+        data = payload.encode("utf-8") if isinstance(payload, str) else payload
+        total += len(compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)) - 4
+    return total
+
+
+def bench(codec, updates, batch: bool):
+    frames = frames_of(updates, batch)
+    best = float("inf")
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        payloads = [codec.encode(frame) for frame in frames]
+        best = min(best, time.perf_counter() - start)
+    
+    raw = sum(len(p.encode("utf-8") if isinstance(p, str) else p) for p in payloads)
+    start = time.perf_counter()
+    deflated = deflated_size(payloads)
+    deflate_cpu = time.perf_counter() - start
+    
+    n = len(updates)
+    return {
+        "bytes": raw / n,
+        "deflate_bytes": deflated / n,
+        "encode_us": best / n * 1e6,
+        "deflate_us": deflate_cpu / n * 1e6,
+    }
+
+
+if __name__ == "__main__":
+    updates = build_updates(pip_install_log(LINES))
+    print(f"日志行数: {len(updates)}, 批量帧大小: {BATCH_SIZE}")
+    print()
+    header = f"{'编码':10s}{'推送方式':10s}{'字节/行':>10s}{'deflate 后':>12s}{'编码 µs/行':>12s}{'压缩 µs/行':>12s}"
+    print(header)
+    print("-" * 66)
+    baseline = None
+    for name, codec in CODECS.items():
+        for batch in (False, True):
+            result = bench(codec, updates, batch)
+            if baseline is None:
+                baseline = result["bytes"]
+            mode = "批量帧" if batch else "逐条"
+            print(
+                f"{name:10s}{mode:10s}{result['bytes']:10.1f}{result['deflate_bytes']:12.1f}"
+                f"{result['encode_us']:12.2f}{result['deflate_us']:12.2f}"
+            )
+    print(f"\n基准: JSON 逐条推送 {baseline:.1f} 字节/行")
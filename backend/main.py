@@ -37,7 +37,17 @@ from app.api.script_templates import router as script_templates_router
 from app.api.batch_operations import router as batch_operations_router
 from app.api.report_export import router as report_export_router
 from app.api.ai_element_locator import router as ai_element_locator_router
+from app.api.metrics import router as metrics_router
 from app.services.health_scheduler import health_scheduler
+from app.services.alert_engine import alert_rule_cache
+from app.core.config import settings
+from app.core.event_bus import create_event_bus
+from app.core.leader import LeaderLock
+from app.core.websocket_manager import manager
+from app.core.write_queue import write_queue
+
+# 调度器选主锁（多 worker 部署时只有一个进程运行调度器）
+leader_lock = LeaderLock(settings.SCHEDULER_LOCK_FILE)
 
 
 @asynccontextmanager
@@ -69,12 +79,28 @@ async def lifespan(app: FastAPI):
     os.makedirs("uploads/scripts", exist_ok=True)
     os.makedirs("uploads/screenshots", exist_ok=True)
     
-    print("[INFO] 正在启动定时任务调度器...")
-    # 延迟加载定时任务，避免阻塞启动
-    # scheduler_service.load_tasks_from_db()
+    print("[INFO] 正在启动事件总线...")
+    event_bus = create_event_bus(settings.EVENT_BUS_URL)
+    await manager.start_event_bus(event_bus)
     
-    print("[INFO] 正在启动健康度监控调度器...")
-    health_scheduler.start()
+    if leader_lock.acquire():
+        manager.on_bus_event("scheduled_task", scheduler_service.handle_bus_event)
+        manager.on_bus_event("alert_rules", alert_rule_cache.handle_bus_event)
+        
+        print("[INFO] 正在启动定时任务调度器...")
+        scheduler_service.start()
+        # 延迟加载定时任务，避免阻塞启动
+        # scheduler_service.load_tasks_from_db()
+        
+        print("[INFO] 正在启动健康度监控调度器...")
+        health_scheduler.start()
+    else:
+        # 其他 worker 已在运行调度器，本进程只处理 HTTP/WebSocket 请求
+        if not event_bus.distributed:
+            # 没有共享总线时跨 worker 的实时推送和定时任务变更都会丢失，直接拒绝启动
+            raise RuntimeError("多 worker 部署必须配置 EVENT_BUS_URL (如 redis://localhost:6379/0)")
+        scheduler_service.leader = False
+        print(f"[INFO] 调度器由其他 worker 运行 (pid {os.getpid()} 跳过)")
     
     print("[INFO] 应用启动完成！")
     
@@ -85,6 +111,11 @@ async def lifespan(app: FastAPI):
     scheduler_service.shutdown()
     print("[INFO] 正在关闭健康度监控调度器...")
     health_scheduler.shutdown()
+    leader_lock.release()
+    await manager.stop_event_bus()
+    manager.task_events.flush()
+    print("[INFO] 正在提交写入队列中剩余的写操作...")
+    write_queue.stop()
     print("[INFO] 应用已关闭")
 
 
@@ -126,6 +157,7 @@ app.include_router(script_templates_router, prefix="/api/v1")  # 脚本模板路
 app.include_router(batch_operations_router, prefix="/api/v1")  # 批量操作路由
 app.include_router(report_export_router, prefix="/api/v1")  # 报告导出路由
 app.include_router(ai_element_locator_router, prefix="/api/v1")  # AI元素定位路由
+app.include_router(metrics_router)  # OpenMetrics 抓取端点（/metrics，不带 API 前缀）
 
 # 挂载静态文件目录（用于访问上传的图片）
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
@@ -155,5 +187,7 @@ if __name__ == "__main__":
         host="0.0.0.0",
         port=8000,
         reload=True,  # 开发模式下自动重载
-        log_level="info"
+        log_level="info",
+        ws="websockets",
+        ws_per_message_deflate=settings.WS_PER_MESSAGE_DEFLATE  # 与客户端协商压缩
     )
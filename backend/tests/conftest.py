@@ -0,0 +1,31 @@
+"""
+后端单元测试配置
+使用临时SQLite数据库，避免影响开发数据库
+"""
+import os
+import sys
+import tempfile
+
+_TEST_DB_DIR = tempfile.mkdtemp(prefix="adbweb_test_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_TEST_DB_DIR, 'test.db')}"
+os.environ["TASK_EVENT_LOG_DIR"] = os.path.join(_TEST_DB_DIR, "task_events")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from sqlmodel import SQLModel, Session
+
+import app.models  # noqa: F401  注册所有表
+import app.models.device_health  # noqa: F401
+import app.models.failure_analysis  # noqa: F401
+import app.models.archive  # noqa: F401
+from app.core.database import engine
+
+
+@pytest.fixture
+def db():
+    """每个测试使用一套干净的表"""
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
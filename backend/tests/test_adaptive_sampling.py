@@ -0,0 +1,92 @@
+"""
+设备健康度自适应采样测试
+"""
+from app.services.adaptive_sampling import AdaptiveSampler
+
+
+IDLE = {"temperature": 30.0, "cpu_usage": 10.0}
+HOT = {"temperature": 46.0, "cpu_usage": 10.0}
+
+
+def _sampler() -> AdaptiveSampler:
+    return AdaptiveSampler(base_interval=300, min_interval=60, max_interval=900)
+
+
+class TestUrgency:
+    """关注程度测试"""
+    
+    def test_signals(self):
+        sampler = _sampler()
+        
+        assert sampler.urgency(IDLE, 95, 95) == (0.0, "stable")
+        assert sampler.urgency(HOT, 95, 95) == (1.0, "hot")
+        assert sampler.urgency({"cpu_usage": 70.0}, 95, None) == (0.5, "busy")
+        assert sampler.urgency(IDLE, 85, 95) == (10 / 15, "degrading")
+        assert sampler.urgency(IDLE, 50, 50) == (1.0, "unhealthy")
+    
+    def test_interval_bounds(self):
+        sampler = _sampler()
+        
+        assert sampler.target_interval(0.0) == 900
+        assert round(sampler.target_interval(1.0)) == 60
+        assert 60 < sampler.target_interval(0.5) < 300
+
+
+class TestBudget:
+    """探测预算测试"""
+    
+    def test_hot_devices_sampled_faster_within_budget(self):
+        sampler = _sampler()
+        device_ids = list(range(1, 11))
+        for device_id in device_ids:
+            sampler.record(device_id, HOT if device_id == 1 else IDLE, 95)
+        
+        sampler.rebalance(device_ids)
+        
+        # 高温设备每分钟采集，其余 15 分钟一次，总速率低于固定 5 分钟间隔
+        assert round(sampler.interval(1)) == 60
+        assert sampler.interval(3) == 900
+        assert sampler.rate_per_minute <= sampler.budget_per_minute == 2.0
+    
+    def test_scaled_when_over_budget(self):
+        sampler = _sampler()
+        device_ids = list(range(1, 11))
+        for device_id in device_ids:
+            sampler.record(device_id, HOT, 95)
+        
+        sampler.rebalance(device_ids)
+        
+        # 全部高温时每分钟 10 次超出预算，间隔整体拉长到基准间隔
+        assert sampler.scale > 1
+        assert round(sampler.interval(1)) == 300
+        assert sampler.rate_per_minute <= sampler.budget_per_minute * 1.0001
+    
+    def test_due_order(self):
+        sampler = _sampler()
+        sampler.record(1, HOT, 95)
+        sampler.record(2, IDLE, 95)
+        sampler.rebalance([1, 2, 3])
+        
+        # 设备3 从未采集最先；设备2 间隔更长，尚未到期
+        assert sampler.interval(1) < sampler.interval(2)
+        assert sampler.due([1, 2, 3], {1: 0.0, 2: 0.0}, now=sampler.interval(1) + 1) == [3, 1]
+        # 离线设备的状态被丢弃
+        sampler.rebalance([1])
+        assert set(sampler.states) == {1}
+    
+    def test_running_task_sampled_faster(self):
+        sampler = _sampler()
+        device_ids = list(range(1, 11))
+        for device_id in device_ids:
+            sampler.record(device_id, IDLE, 95)
+        sampler.rebalance(device_ids, running=[1])
+        
+        # 指标相同，执行任务的设备间隔更短并先到期
+        assert sampler.interval(1) == sampler.target_interval(AdaptiveSampler.TASK_URGENCY)
+        assert sampler.interval(1) < sampler.interval(2) == 900
+        last_collected = {device_id: 0.0 for device_id in device_ids}
+        assert sampler.due(device_ids, last_collected, now=sampler.interval(1) + 1) == [1]
+        
+        # 任务结束后恢复稀疏采集
+        sampler.rebalance(device_ids)
+        assert sampler.interval(1) == 900
@@ -0,0 +1,242 @@
+"""
+告警规则引擎测试
+"""
+import asyncio
+from datetime import datetime, timedelta
+from sqlalchemy import event, text
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.api.device_health import (
+    AlertRuleUpdate, ToggleAlertRuleRequest, resolve_alert, toggle_alert_rule, update_alert_rule
+)
+from app.core.database import async_engine, engine
+from app.core.migrations import MIGRATIONS
+from app.models.device import Device
+from app.models.device_health import AlertRule, DeviceAlert
+from app.services.alert_engine import AlertEngine, alert_rule_cache, compile_rule
+
+
+def _setup(db, device_count: int = 3):
+    alert_rule_cache.invalidate(broadcast=False)
+    for i in range(device_count):
+        db.add(Device(serial_number=f"SN{i:04d}", model="Pixel", android_version="14", status="online"))
+    db.add(AlertRule(
+        rule_name="低电量", rule_type="low_battery", condition_field="battery_level",
+        operator="<", threshold_value=20, severity="warning"
+    ))
+    db.add(AlertRule(
+        rule_name="高温", rule_type="high_temp", condition_field="temperature",
+        operator=">=", threshold_value=45, severity="critical"
+    ))
+    db.commit()
+
+
+def _count_commits():
+    commits = []
+    listener = lambda conn: commits.append(1)
+    event.listen(engine, "commit", listener)
+    return commits, lambda: event.remove(engine, "commit", listener)
+
+
+def _api(endpoint, *args):
+    """用异步会话调用接口函数"""
+    async def call():
+        async with AsyncSession(async_engine) as session:
+            return await endpoint(*args, db=session)
+    return asyncio.run(call())
+
+
+class TestCompiledRules:
+    """规则编译测试"""
+    
+    def test_predicates(self):
+        rule = compile_rule(AlertRule(
+            rule_name="r", rule_type="t", condition_field="cpu_usage",
+            operator=">", threshold_value=80, severity="warning"
+        ))
+        assert rule.predicate({"cpu_usage": 90})
+        assert rule.predicate({"cpu_usage": "85"})
+        assert not rule.predicate({"cpu_usage": 80})
+        assert not rule.predicate({"cpu_usage": "n/a"})
+        assert not rule.predicate({})
+        
+        equals = compile_rule(AlertRule(
+            rule_name="r", rule_type="t", condition_field="x", operator="==", threshold_value=1.0, severity="info"
+        ))
+        assert equals.predicate({"x": 1.0})
+        assert not equals.predicate({"x": 1})
+
+
+class TestBatchAlerts:
+    """批量告警检查测试"""
+    
+    def test_batch_in_one_transaction(self, db):
+        _setup(db)
+        db.add(DeviceAlert(device_id=2, alert_type="low_battery", severity="warning", message="已存在"))
+        db.commit()
+        
+        commits, stop = _count_commits()
+        try:
+            alerts = asyncio.run(AlertEngine(db).check_alerts_batch({
+                1: {"battery_level": 10, "temperature": 50},
+                2: {"battery_level": 5, "temperature": 30},
+                3: {"battery_level": 90, "temperature": 30},
+            }))
+        finally:
+            stop()
+        
+        assert sorted((a.device_id, a.alert_type) for a in alerts) == [(1, "high_temp"), (1, "low_battery")]
+        assert len(commits) == 1
+        
+        # 未解决的同类告警不重复创建
+        again = asyncio.run(AlertEngine(db).check_alerts(1, {"battery_level": 10, "temperature": 50}))
+        assert again == []
+        assert len(db.exec(select(DeviceAlert)).all()) == 3
+    
+    def test_rule_edits_invalidate_cache(self, db):
+        _setup(db, device_count=1)
+        engine_ = AlertEngine(db)
+        asyncio.run(engine_.check_alerts_batch({1: {"battery_level": 90}}))
+        assert len(alert_rule_cache.rules) == 2
+        
+        # 直接改库不会影响已编译的规则
+        rule = db.exec(select(AlertRule).where(AlertRule.rule_type == "low_battery")).one()
+        rule.threshold_value = 95
+        db.add(rule)
+        db.commit()
+        assert asyncio.run(engine_.check_alerts_batch({1: {"battery_level": 90}})) == []
+        
+        # 通过接口修改后重新编译
+        _api(update_alert_rule, rule.id, AlertRuleUpdate(threshold_value=95))
+        assert alert_rule_cache.rules is None
+        alerts = asyncio.run(engine_.check_alerts_batch({1: {"battery_level": 90}}))
+        assert [a.alert_type for a in alerts] == ["low_battery"]
+        
+        _api(toggle_alert_rule, rule.id, ToggleAlertRuleRequest(is_enabled=False))
+        assert [r.rule_type for r in alert_rule_cache.get(db)] == ["high_temp"]
+    
+    def test_open_alert_index_maintained_in_memory(self, db):
+        _setup(db, device_count=2)
+        engine_ = AlertEngine(db)
+        asyncio.run(engine_.check_alerts_batch({1: {"battery_level": 10}}))
+        alert_id = alert_rule_cache.open_alerts[(1, "low_battery")]
+        
+        # 后续批次不再查询未解决告警
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            asyncio.run(engine_.check_alerts_batch({1: {"battery_level": 10}, 2: {"battery_level": 10}}))
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+        assert not any("device_alerts.is_resolved = 0" in s for s in statements)
+        assert set(alert_rule_cache.open_alerts) == {(1, "low_battery"), (2, "low_battery")}
+        
+        # 手动解决后索引失效，下次检查重新加载
+        _api(resolve_alert, alert_id)
+        assert alert_rule_cache.open_alerts is None
+        asyncio.run(engine_.check_alerts_batch({2: {"battery_level": 90}}))
+        assert set(alert_rule_cache.open_alerts) == {(2, "low_battery")}
+    
+    def test_rule_edit_keeps_other_rules_state(self, db):
+        _setup(db, device_count=1)
+        high_temp = db.exec(select(AlertRule).where(AlertRule.rule_type == "high_temp")).one()
+        high_temp.duration_seconds = 600
+        db.add(high_temp)
+        db.commit()
+        low_battery_id = db.exec(select(AlertRule.id).where(AlertRule.rule_type == "low_battery")).one()
+        alert_rule_cache.invalidate(broadcast=False)
+        engine_ = AlertEngine(db)
+        start = datetime(2026, 3, 10, 12, 0)
+        asyncio.run(engine_.check_alerts_batch({1: {"temperature": 50}}, now=start))
+        
+        # 修改其他规则不会重置高温规则的持续时间计时
+        _api(update_alert_rule, low_battery_id, AlertRuleUpdate(threshold_value=15))
+        alerts = asyncio.run(engine_.check_alerts_batch({1: {"temperature": 50}}, now=start + timedelta(minutes=10)))
+        assert [a.alert_type for a in alerts] == ["high_temp"]
+
+
+def _run(db, rule: AlertRule, samples):
+    """按 (分钟偏移, 指标) 依次送入样本，返回每个样本后设备1的未解决告警数"""
+    alert_rule_cache.invalidate(broadcast=False)
+    db.add(Device(serial_number="SN0000", model="Pixel", android_version="14", status="online"))
+    db.add(rule)
+    db.commit()
+    start = datetime(2026, 3, 10, 12, 0)
+    engine_ = AlertEngine(db)
+    open_counts = []
+    for minute, metrics in samples:
+        asyncio.run(engine_.check_alerts_batch({1: metrics}, now=start + timedelta(minutes=minute)))
+        open_counts.append(len(db.exec(select(DeviceAlert).where(DeviceAlert.is_resolved == False)).all()))
+    return open_counts
+
+
+class TestWindowedConditions:
+    """持续时间、变化率与滞回测试"""
+    
+    def test_duration_fires_after_sustained_breach(self, db):
+        rule = AlertRule(
+            rule_name="高温", rule_type="high_temp", condition_field="temperature",
+            operator=">", threshold_value=45, severity="critical", duration_seconds=600
+        )
+        # 中途回落一次会重新计时
+        counts = _run(db, rule, [
+            (0, {"temperature": 50}), (5, {"temperature": 50}), (6, {"temperature": 40}),
+            (7, {"temperature": 50}), (15, {"temperature": 50}), (17, {"temperature": 50}),
+        ])
+        
+        assert counts == [0, 0, 0, 0, 0, 1]
+        alert = db.exec(select(DeviceAlert)).one()
+        assert alert.message.endswith("已持续 10 分钟")
+    
+    def test_rate_of_change(self, db):
+        rule = AlertRule(
+            rule_name="电量骤降", rule_type="battery_drop", condition_field="battery_level",
+            operator="<=", threshold_value=-2, severity="warning", condition_type="rate", window_seconds=600
+        )
+        counts = _run(db, rule, [
+            (0, {"battery_level": 90}), (5, {"battery_level": 89}), (10, {"battery_level": 88}),
+            (12, {"battery_level": 80}), (14, {"battery_level": 70}),
+        ])
+        
+        # 按 10 分钟窗口内最早的样本计算：第 12 分钟 (80 - 89) / 7 ≈ -1.3，第 14 分钟 (70 - 89) / 9 ≈ -2.1
+        assert counts == [0, 0, 0, 0, 1]
+    
+    def test_hysteresis_auto_resolves_without_flapping(self, db):
+        rule = AlertRule(
+            rule_name="低电量", rule_type="low_battery", condition_field="battery_level",
+            operator="<", threshold_value=20, severity="warning", clear_threshold=30
+        )
+        counts = _run(db, rule, [
+            (0, {"battery_level": 15}), (1, {"battery_level": 21}), (2, {"battery_level": 19}),
+            (3, {"battery_level": 25}), (4, {"battery_level": 31}), (5, {"battery_level": 18}),
+        ])
+        
+        # 在 20 ~ 30 之间抖动不会恢复或重复告警，越过 30 后自动解决，再次跌破才重新告警
+        assert counts == [1, 1, 1, 1, 0, 1]
+        alerts = db.exec(select(DeviceAlert).order_by(DeviceAlert.id)).all()
+        assert [a.is_resolved for a in alerts] == [True, False]
+        assert alerts[0].resolved_at == datetime(2026, 3, 10, 12, 4)
+    
+    def test_migration_upgrades_old_table(self, db):
+        db.close()
+        with engine.begin() as conn:
+            conn.execute(text("DROP TABLE alert_rules"))
+            conn.execute(text(
+                "CREATE TABLE alert_rules (id INTEGER PRIMARY KEY, rule_name VARCHAR(100) NOT NULL, "
+                "rule_type VARCHAR(50) NOT NULL, condition_field VARCHAR(50) NOT NULL, operator VARCHAR(10) NOT NULL, "
+                "threshold_value FLOAT NOT NULL, severity VARCHAR(20) NOT NULL, is_enabled BOOLEAN NOT NULL, "
+                "notification_channels VARCHAR, created_at DATETIME NOT NULL)"
+            ))
+            conn.execute(text(
+                "INSERT INTO alert_rules VALUES (1, '低电量', 'low_battery', 'battery_level', '<', 20, "
+                "'warning', 1, NULL, '2026-03-01 00:00:00')"
+            ))
+        
+        upgrade = next(m.upgrade for m in MIGRATIONS if m.version == 2)
+        with engine.begin() as conn:
+            upgrade(conn)
+        
+        rule = db.get(AlertRule, 1)
+        assert rule.condition_type == "threshold"
+        assert rule.duration_seconds is None and rule.clear_threshold is None
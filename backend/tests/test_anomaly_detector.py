@@ -0,0 +1,137 @@
+"""
+设备指标流式异常检测测试
+"""
+import asyncio
+import json
+import random
+from sqlmodel import select
+from app.models.device import Device
+from app.models.device_health import DeviceAlert
+from app.services.alert_engine import AlertEngine, alert_rule_cache
+from app.services.anomaly_detector import AnomalyDetector, AnomalyEvent
+
+
+STEP = 600  # 样本间隔 10 分钟
+
+
+def _detector() -> AnomalyDetector:
+    return AnomalyDetector(halflife_hours=72, z_threshold=4.0, min_samples=30, consecutive=3)
+
+
+def _feed(detector, samples, start: float = 0.0):
+    """按 STEP 间隔依次输入样本，返回 [(样本序号, 事件)]"""
+    events = []
+    for index, sample in enumerate(samples):
+        for event in detector.observe(1, sample, start + index * STEP):
+            events.append((index, event))
+    return events
+
+
+class TestDetector:
+    """检测器测试"""
+    
+    def test_battery_drain_doubles(self):
+        random.seed(1)
+        detector = _detector()
+        # 3 天内每小时耗电约 5%，每次充满后重新放电
+        samples = []
+        level = 100.0
+        for _ in range(3 * 24 * 6):
+            level -= random.uniform(0.7, 0.97)
+            if level < 20:
+                level = 100.0
+            samples.append({"battery_level": round(level)})
+        assert _feed(detector, samples) == []
+        
+        # 之后耗电速度翻倍
+        faster = []
+        for _ in range(6 * 6):
+            level -= 1.7
+            faster.append({"battery_level": round(level)})
+        events = _feed(detector, faster, start=len(samples) * STEP)
+        
+        assert len(events) == 1
+        event = events[0][1]
+        assert event.metric == "battery_drain"
+        assert event.value > 2 * event.mean - 1
+        assert event.message.startswith("耗电速度(%/小时)异常")
+    
+    def test_single_spike_ignored_and_recovery(self):
+        random.seed(2)
+        detector = _detector()
+        normal = lambda: {"temperature": random.uniform(30, 32)}
+        _feed(detector, [normal() for _ in range(100)])
+        mean = detector.states[(1, "temperature")].mean
+        
+        # 单个尖峰不告警，截断后也不会明显拉高基线
+        assert _feed(detector, [{"temperature": 60}, normal()], start=100 * STEP) == []
+        assert detector.states[(1, "temperature")].mean - mean < 0.2
+        
+        events = _feed(detector, [{"temperature": 45}] * 3 + [normal()], start=102 * STEP)
+        assert [(index, event.cleared) for index, event in events] == [(2, False), (3, True)]
+    
+    def test_needs_min_samples_and_direction(self):
+        detector = _detector()
+        
+        # 基线样本不足时不告警
+        assert _feed(detector, [{"cpu_usage": 10}] * 5 + [{"cpu_usage": 90}] * 5) == []
+        
+        # 健康度只检测下降
+        detector = _detector()
+        _feed(detector, [{"health_score": 90}] * 40)
+        assert _feed(detector, [{"health_score": 100}] * 3, start=40 * STEP) == []
+        assert len(_feed(detector, [{"health_score": 70}] * 3, start=43 * STEP)) == 1
+    
+    def test_snapshot_roundtrip(self, tmp_path):
+        detector = _detector()
+        _feed(detector, [{"temperature": 30 + i % 3, "battery_level": 90} for i in range(40)])
+        path = str(tmp_path / "state" / "anomaly.json")
+        
+        detector.save(path)
+        restored = _detector()
+        
+        assert restored.load(path) == len(detector.states)
+        state, original = restored.states[(1, "temperature")], detector.states[(1, "temperature")]
+        assert (state.mean, state.var, state.count) == (original.mean, original.var, original.count)
+        assert restored.drain_anchors == detector.drain_anchors
+        
+        # 连续异常计数和未恢复标记随快照恢复
+        original.streak, original.active = 2, True
+        detector.save(path)
+        assert restored.load(path) == len(detector.states)
+        state = restored.states[(1, "temperature")]
+        assert (state.streak, state.active) == (2, True)
+        
+        # 旧快照每个状态只有 6 个字段
+        with open(path, "w") as f:
+            json.dump({"states": [[1, "temperature", 31.0, 1.0, 40, 1000.0]], "drain_anchors": []}, f)
+        assert restored.load(path) == 1
+        state = restored.states[(1, "temperature")]
+        assert (state.mean, state.count, state.streak, state.active) == (31.0, 40, 0, False)
+        
+        with open(path, "w") as f:
+            f.write("{broken")
+        assert restored.load(path) == 0
+        assert restored.load(str(tmp_path / "missing.json")) == 0
+
+
+class TestAnomalyAlerts:
+    """异常事件写入告警测试"""
+    
+    def test_anomaly_alert_lifecycle(self, db):
+        alert_rule_cache.invalidate(broadcast=False)
+        db.add(Device(serial_number="SN0001", model="Pixel", android_version="14", status="online"))
+        db.commit()
+        engine_ = AlertEngine(db)
+        event = AnomalyEvent(device_id=1, metric="temperature", value=45.0, mean=31.0, std=1.0, z=14.0)
+        
+        alerts = asyncio.run(engine_.check_alerts_batch({}, anomalies=[event]))
+        assert [(a.alert_type, a.severity) for a in alerts] == [("anomaly_temperature", "warning")]
+        
+        # 未解决时不重复创建，恢复后自动解决
+        assert asyncio.run(engine_.check_alerts_batch({}, anomalies=[event])) == []
+        cleared = AnomalyEvent(device_id=1, metric="temperature", value=31.0, mean=31.0, std=1.0, z=0.0, cleared=True)
+        asyncio.run(engine_.check_alerts_batch({}, anomalies=[cleared]))
+        
+        alert = db.exec(select(DeviceAlert)).one()
+        assert alert.is_resolved
@@ -0,0 +1,105 @@
+"""
+异步数据库会话测试
+"""
+from datetime import datetime, timedelta
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from app.api.dashboard import router as dashboard_router
+from app.api.reports import REPORT_ERROR_PREVIEW, router as reports_router
+from app.api.tasks import router as tasks_router
+from app.core.database import async_database_url, async_engine, is_sqlite
+from app.models.device import Device
+from app.models.script import Script
+from app.models.task_log import TaskLog
+
+
+def _client() -> TestClient:
+    app = FastAPI()
+    for router in (tasks_router, reports_router, dashboard_router):
+        app.include_router(router, prefix="/api/v1")
+    return TestClient(app)
+
+
+def _seed(db, count: int):
+    db.add(Device(serial_number="SN1", model="Pixel", android_version="14", status="online"))
+    db.add(Script(name="login", type="visual"))
+    now = datetime.now()
+    for i in range(count):
+        db.add(TaskLog(
+            task_name=f"t{i}", script_id=1, device_id=1,
+            status="failed" if i % 3 == 0 else "success",
+            start_time=now - timedelta(minutes=i)
+        ))
+    db.commit()
+
+
+class TestAsyncDatabaseUrl:
+    """异步连接串推导测试"""
+
+    def test_driver_mapping(self):
+        assert async_database_url("sqlite:///./a.db") == "sqlite+aiosqlite:///./a.db"
+        assert async_database_url("postgresql://u:p@h/db") == "postgresql://u:p@h/db"
+        assert async_database_url("mysql://h/db") == "mysql://h/db"
+
+    def test_sqlite_only_connect_args(self):
+        assert is_sqlite("sqlite+aiosqlite:///./a.db")
+        assert not is_sqlite("postgresql+asyncpg://u:p@h/db")
+
+
+class TestAsyncEndpoints:
+    """迁移到异步会话的接口测试"""
+
+    def test_task_list_and_detail(self, db):
+        _seed(db, 12)
+        client = _client()
+
+        data = client.get("/api/v1/tasks", params={"status": "failed", "page_size": 3}).json()["data"]
+        assert data["total"] == 4
+        assert [item["task_name"] for item in data["items"]] == ["t0", "t3", "t6"]
+
+        detail = client.get("/api/v1/tasks/2/logs").json()["data"]
+        assert detail["task_name"] == "t1"
+        assert client.get("/api/v1/tasks/999/logs").status_code == 404
+
+    def test_reports_include_related_names(self, db):
+        _seed(db, 5)
+        client = _client()
+
+        data = client.get("/api/v1/reports", params={"page_size": 2}).json()["data"]
+        assert data["total"] == 5
+        assert data["items"][0]["script_name"] == "login"
+        assert data["items"][0]["device_name"] == "Pixel"
+
+        assert client.delete("/api/v1/reports/1").status_code == 200
+        assert client.get("/api/v1/reports").json()["data"]["total"] == 4
+
+    def test_report_list_is_one_projected_query(self, db):
+        _seed(db, 12)
+        log = db.get(TaskLog, 1)
+        log.log_content = "x" * 10000
+        log.error_message = "e" * 2000
+        db.commit()
+        statements = []
+        listen = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(async_engine.sync_engine, "before_cursor_execute", listen)
+        try:
+            data = _client().get("/api/v1/reports", params={"page_size": 10}).json()["data"]
+        finally:
+            event.remove(async_engine.sync_engine, "before_cursor_execute", listen)
+
+        assert data["total"] == 12
+        assert len(data["items"]) == 10
+        # 一次 COUNT(*) + 一次连表分页查询，不逐行查询脚本和设备
+        assert len(statements) == 2
+        assert "log_content" not in statements[1]
+        item = data["items"][0]
+        assert "log_content" not in item and "screenshot_paths" not in item
+        assert len(item["error_message"]) == REPORT_ERROR_PREVIEW
+        assert (item["script_name"], item["device_name"]) == ("login", "Pixel")
+
+    def test_dashboard_runs_sync_service(self, db):
+        _seed(db, 3)
+        response = _client().get("/api/v1/dashboard/overview")
+        assert response.status_code == 200
+        assert response.json()["data"]["statistics"]["total_devices"] == 1
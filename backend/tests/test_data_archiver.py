@@ -0,0 +1,208 @@
+"""
+冷数据归档测试
+"""
+from datetime import datetime, timedelta
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select, func
+from app.api.reports import router as reports_router
+from app.models.device import Device
+from app.models.archive import ArchiveSegment
+from app.models.device_health import DeviceHealthRecord
+from app.models.failure_analysis import FailureAnalysis, StepExecutionLog
+from app.models.script import Script
+from app.models.task_log import TaskLog
+from app.services.data_archiver import DataArchiver, data_archiver
+from app.services.health_rollup import HealthRollupService
+from app.services.report_export_service import ReportExportService
+
+
+NOW = datetime(2026, 3, 10, 12, 0)
+
+
+@pytest.fixture
+def archiver(tmp_path, monkeypatch):
+    """全局归档服务使用临时目录（接口和健康度历史查询通过它读取归档库）"""
+    monkeypatch.setattr(data_archiver, "archive_dir", str(tmp_path))
+    monkeypatch.setattr(data_archiver, "batch_size", 3)
+    monkeypatch.setattr(data_archiver, "archive_days", {"task_log": 30, "device_health_records": 30})
+    return data_archiver
+
+
+def _seed_task_logs(db):
+    """今天 2 条、1 月 3 条、12 月 2 条任务日志"""
+    db.add(Device(serial_number="SN1", model="Pixel", android_version="14", status="online"))
+    db.add(Script(name="login", type="visual"))
+    starts = [NOW, NOW - timedelta(hours=1)]
+    starts += [datetime(2026, 1, 20 - i) for i in range(3)]
+    starts += [datetime(2025, 12, 31 - i) for i in range(2)]
+    for i, start in enumerate(starts):
+        db.add(TaskLog(task_name=f"t{i}", script_id=1, device_id=1, status="success", start_time=start))
+    db.commit()
+
+
+def _count(session: Session, model) -> int:
+    return session.exec(select(func.count()).select_from(model)).one()
+
+
+class TestArchiveTaskLogs:
+    """任务日志归档测试"""
+
+    def test_moves_rows_into_monthly_archives(self, db, archiver):
+        _seed_task_logs(db)
+
+        moved = archiver.run(NOW)
+
+        assert moved["task_log"] == 5
+        db.expire_all()
+        assert [log.task_name for log in db.exec(select(TaskLog).order_by(TaskLog.id))] == ["t0", "t1"]
+        segments = archiver.segments(db, "task_log")
+        assert [(s.month, s.row_count) for s in segments] == [("2025-12", 2), ("2026-01", 3)]
+        assert segments[1].min_time == datetime(2026, 1, 18)
+        assert segments[1].max_time == datetime(2026, 1, 20)
+        with Session(archiver.engine_for(segments[1].path)) as archive:
+            assert [log.id for log in archive.exec(select(TaskLog).order_by(TaskLog.id))] == [3, 4, 5]
+
+    def test_children_move_with_parent(self, db, archiver):
+        _seed_task_logs(db)
+        # t2 (1 月) 已归档，t0 留在热库
+        for task_log_id in (1, 3):
+            db.add(FailureAnalysis(task_log_id=task_log_id, failure_type="timeout"))
+            db.add(StepExecutionLog(task_log_id=task_log_id, step_index=1, status="failed"))
+        db.commit()
+
+        archiver.run(NOW)
+
+        for model in (FailureAnalysis, StepExecutionLog):
+            assert [row.task_log_id for row in db.exec(select(model))] == [1]
+        segment = archiver.segments(db, "task_log")[1]
+        with Session(archiver.engine_for(segment.path)) as archive:
+            for model in (FailureAnalysis, StepExecutionLog):
+                assert [row.task_log_id for row in archive.exec(select(model))] == [3]
+
+    def test_rerun_is_idempotent(self, db, archiver):
+        _seed_task_logs(db)
+        archiver.run(NOW)
+
+        assert archiver.run(NOW) == {"task_log": 0}
+        assert sum(s.row_count for s in archiver.segments(db, "task_log")) == 5
+
+        # 归档库已提交、热库删除前中断：重跑时这些记录再次移动，但不重复计数
+        segment = archiver.segments(db, "task_log")[1]
+        with Session(archiver.engine_for(segment.path)) as archive:
+            for log in archive.exec(select(TaskLog)).all():
+                db.add(TaskLog(**log.model_dump()))
+        db.commit()
+
+        assert archiver.run(NOW) == {"task_log": 3}
+        db.expire_all()
+        assert [(s.month, s.row_count) for s in archiver.segments(db, "task_log")] == [("2025-12", 2), ("2026-01", 3)]
+
+    def test_disabled_when_days_zero(self, db, tmp_path):
+        _seed_task_logs(db)
+        archiver = DataArchiver(archive_dir=str(tmp_path))
+        archiver.archive_days = {"task_log": 0, "device_health_records": 0}
+
+        assert archiver.run(NOW) == {}
+        assert _count(db, TaskLog) == 7
+
+
+class TestArchivedReports:
+    """报告列表合并归档库测试"""
+
+    def _client(self) -> TestClient:
+        app = FastAPI()
+        app.include_router(reports_router, prefix="/api/v1")
+        return TestClient(app)
+
+    def test_hot_only_by_default(self, db, archiver):
+        _seed_task_logs(db)
+        archiver.run(NOW)
+
+        data = self._client().get("/api/v1/reports").json()["data"]
+        assert data["total"] == 2
+
+    def test_union_pages_across_hot_and_archives(self, db, archiver):
+        _seed_task_logs(db)
+        archiver.run(NOW)
+        client = self._client()
+
+        pages = [
+            client.get("/api/v1/reports", params={"include_archived": True, "page": page, "page_size": 3}).json()["data"]
+            for page in (1, 2, 3)
+        ]
+        assert [p["total"] for p in pages] == [7, 7, 7]
+        assert [[item["task_name"] for item in p["items"]] for p in pages] == [
+            ["t0", "t1", "t2"], ["t3", "t4", "t5"], ["t6"]
+        ]
+        assert pages[0]["items"][2]["script_name"] == "login"
+
+    def test_archived_detail_and_delete(self, db, archiver):
+        _seed_task_logs(db)
+        db.add(StepExecutionLog(task_log_id=3, step_index=1, status="success"))
+        db.commit()
+        archiver.run(NOW)
+        client = self._client()
+
+        assert client.get("/api/v1/reports/3").json()["data"]["task_name"] == "t2"
+        exported = ReportExportService(db)._get_task_logs([1, 3])
+        assert sorted(log.task_name for log in exported) == ["t0", "t2"]
+        assert client.delete("/api/v1/reports/3").status_code == 200
+        assert client.get("/api/v1/reports/3").status_code == 404
+        assert client.delete("/api/v1/reports/99").status_code == 404
+
+        db.expire_all()
+        segment = db.exec(select(ArchiveSegment).where(ArchiveSegment.month == "2026-01")).one()
+        assert segment.row_count == 2
+        with Session(archiver.engine_for(segment.path)) as archive:
+            assert _count(archive, StepExecutionLog) == 0
+
+    def test_start_date_reaching_back_includes_archives(self, db, archiver):
+        _seed_task_logs(db)
+        archiver.run(NOW)
+
+        data = self._client().get("/api/v1/reports", params={"start_date": "2026-01-19"}).json()["data"]
+        assert data["total"] == 4
+        assert [item["task_name"] for item in data["items"]] == ["t0", "t1", "t2", "t3"]
+
+
+class TestArchivedHealthHistory:
+    """健康记录归档测试"""
+
+    def _seed_records(self, db) -> int:
+        device = Device(serial_number="SN1", model="Pixel", android_version="14", status="online")
+        db.add(device)
+        db.commit()
+        # 2 月 1 日 10:00 起每 10 分钟一条，共 12 条
+        start = datetime(2026, 2, 1, 10, 0)
+        for i in range(12):
+            db.add(DeviceHealthRecord(
+                device_id=device.id, health_score=i, battery_level=50, created_at=start + timedelta(minutes=10 * i)
+            ))
+        db.commit()
+        return device.id
+
+    def test_not_archived_before_rollup(self, db, archiver):
+        self._seed_records(db)
+
+        assert "device_health_records" not in archiver.run(NOW)
+        assert _count(db, DeviceHealthRecord) == 12
+
+    def test_raw_history_unions_archives(self, db, archiver):
+        device_id = self._seed_records(db)
+        rollup = HealthRollupService()
+        rollup.retention_days = {"raw": 0, "1m": 0, "1h": 0, "1d": 0}
+        rollup.rollup(db, NOW)
+        # 截止时间 2 月 1 日 11:00：前 6 条归档，后 6 条留在热库
+        assert archiver.run(datetime(2026, 3, 3, 11, 0))["device_health_records"] == 6
+        assert _count(db, DeviceHealthRecord) == 6
+
+        resolution, points = rollup.query_history(db, device_id, datetime(2026, 2, 1), 0, NOW)
+        assert resolution == "raw"
+        assert [p["health_score"] for p in points] == list(range(12))
+
+        # 采样间隔短于最细聚合粒度时在归档库和热库中分别分桶
+        resolution, points = rollup.query_history(db, device_id, datetime(2026, 2, 1), 30, NOW)
+        assert resolution == "raw"
+        assert [p["health_score"] for p in points] == list(range(12))
@@ -0,0 +1,42 @@
+"""
+LTTB 降采样测试
+"""
+from app.utils.downsample import lttb
+
+
+def _series(values):
+    return [{"x": i, "y": v} for i, v in enumerate(values)]
+
+
+def _lttb(points, threshold):
+    return lttb(points, threshold, x=lambda p: p["x"], y=lambda p: p["y"])
+
+
+class TestLTTB:
+    """LTTB 测试"""
+    
+    def test_short_series_unchanged(self):
+        points = _series([1, 2, 3])
+        assert _lttb(points, 10) == points
+        assert _lttb(points, 2) == points
+    
+    def test_keeps_endpoints_and_threshold(self):
+        points = _series([i % 7 for i in range(1000)])
+        
+        sampled = _lttb(points, 50)
+        
+        assert len(sampled) == 50
+        assert sampled[0] is points[0]
+        assert sampled[-1] is points[-1]
+        assert [p["x"] for p in sampled] == sorted(p["x"] for p in sampled)
+    
+    def test_preserves_spikes(self):
+        values = [50] * 500
+        values[123] = 5
+        values[377] = 99
+        
+        sampled = _lttb(_series(values), 20)
+        
+        ys = [p["y"] for p in sampled]
+        assert 5 in ys
+        assert 99 in ys
@@ -0,0 +1,149 @@
+"""
+跨进程事件总线测试
+用进程内的 Redis Pub/Sub 替身模拟两个 worker
+"""
+import asyncio
+import pytest
+from app.core.event_bus import RedisEventBus
+from app.core.leader import LeaderLock
+from app.core.task_events import TaskEventStore
+from app.core.websocket_manager import ConnectionManager
+from app.services.scheduler_service import SchedulerService
+from tests.test_websocket_manager import FakeWebSocket, _log, _settle
+
+
+class LocalBroker:
+    """Redis Pub/Sub 替身：所有客户端共享的频道"""
+
+    def __init__(self):
+        self.queues = {}
+
+    def client(self):
+        return LocalRedisClient(self)
+
+
+class LocalRedisClient:
+    def __init__(self, broker: LocalBroker):
+        self.broker = broker
+
+    async def publish(self, channel: str, message: str):
+        for queue in self.broker.queues.get(channel, []):
+            queue.put_nowait({"type": "message", "channel": channel, "data": message.encode()})
+
+    def pubsub(self):
+        return LocalPubSub(self.broker)
+
+    async def close(self):
+        pass
+
+
+class LocalPubSub:
+    def __init__(self, broker: LocalBroker):
+        self.broker = broker
+        self.queue = asyncio.Queue()
+
+    async def subscribe(self, channel: str):
+        self.broker.queues.setdefault(channel, []).append(self.queue)
+
+    async def listen(self):
+        while True:
+            yield await self.queue.get()
+
+
+async def _start_workers(tmp_path, count: int = 2):
+    broker = LocalBroker()
+    workers = []
+    for i in range(count):
+        worker = ConnectionManager()
+        worker.task_events = TaskEventStore(str(tmp_path / f"worker{i}"), buffer_size=3, spill_batch=2)
+        await worker.start_event_bus(RedisEventBus(client=broker.client()))
+        workers.append(worker)
+    return workers
+
+
+class TestEventBus:
+    """事件总线测试"""
+
+    def test_task_update_reaches_client_on_other_worker(self, tmp_path):
+        async def scenario():
+            worker_a, worker_b = await _start_workers(tmp_path)
+            ws = FakeWebSocket()
+            await worker_b.connect(ws, "browser")
+            worker_b.subscribe_task(1, "browser", batch=True)
+
+            # 任务在 worker A 上执行
+            await worker_a.send_task_update(1, _log("a"))
+            await worker_a.send_task_update(1, {"status": "success", "progress": 100})
+            await _settle()
+
+            await worker_a.stop_event_bus()
+            await worker_b.stop_event_bus()
+            return ws.sent
+
+        sent = asyncio.run(scenario())
+        updates = [u for frame in sent for u in frame["updates"]]
+        # 序号由执行任务的 worker 分配
+        assert [u["seq"] for u in updates] == [1, 2]
+        assert updates[-1]["data"]["status"] == "success"
+
+    def test_replay_on_other_worker(self, tmp_path):
+        async def scenario():
+            worker_a, worker_b = await _start_workers(tmp_path)
+            worker_b.task_events.log_dir = worker_a.task_events.log_dir
+            for i in range(6):
+                await worker_a.send_task_update(1, _log(f"line {i}"))
+            await _settle()
+
+            ws = FakeWebSocket()
+            await worker_b.connect(ws, "late")
+            replayed = await worker_b.subscribe_task_since(1, "late", since_seq=0)
+            await _settle()
+
+            await worker_a.stop_event_bus()
+            await worker_b.stop_event_bus()
+            return replayed, ws.sent
+
+        replayed, sent = asyncio.run(scenario())
+        assert replayed == 6
+        assert [u["seq"] for u in sent[0]["updates"]] == [1, 2, 3, 4, 5, 6]
+
+    def test_broadcast_reaches_all_workers_once(self, tmp_path):
+        async def scenario():
+            worker_a, worker_b = await _start_workers(tmp_path)
+            ws_a, ws_b = FakeWebSocket(), FakeWebSocket()
+            await worker_a.connect(ws_a, "a")
+            await worker_b.connect(ws_b, "b")
+
+            await worker_a.broadcast('{"type": "device_alert"}')
+            await _settle()
+
+            await worker_a.stop_event_bus()
+            await worker_b.stop_event_bus()
+            return ws_a.sent, ws_b.sent
+
+        sent_a, sent_b = asyncio.run(scenario())
+        assert sent_a == [{"type": "device_alert"}]
+        assert sent_b == [{"type": "device_alert"}]
+
+
+class TestLeaderLock:
+    """调度器选主测试"""
+
+    def test_only_one_leader(self, tmp_path):
+        path = str(tmp_path / "scheduler.lock")
+        first, second = LeaderLock(path), LeaderLock(path)
+
+        assert first.acquire()
+        assert not second.acquire()
+
+        first.release()
+        assert second.acquire()
+        second.release()
+
+    def test_follower_scheduler_not_started(self):
+        service = SchedulerService()
+        service.leader = False
+        assert not service.scheduler.running
+        # 进程内总线无法把变更转发给主进程，直接报错而不是静默丢失
+        with pytest.raises(RuntimeError):
+            service.remove_task(1)
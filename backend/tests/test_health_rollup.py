@@ -0,0 +1,213 @@
+"""
+设备健康度聚合与数据保留测试
+"""
+from datetime import datetime, timedelta
+from sqlmodel import select
+from app.models.device import Device
+from app.models.device_health import DeviceHealthRecord, DeviceHealthRollup
+from app.services.health_rollup import HealthRollupService
+
+
+NOW = datetime(2026, 3, 10, 12, 0, 30)
+
+
+def _add_device(db) -> int:
+    device = Device(serial_number="SN0001", model="Pixel", android_version="14", status="online")
+    db.add(device)
+    db.commit()
+    db.refresh(device)
+    return device.id
+
+
+def _add_records(db, device_id: int, start: datetime, count: int, step: timedelta):
+    """从 start 开始每隔 step 写入一条记录，健康度分数依次为 0, 1, 2 ..."""
+    for i in range(count):
+        db.add(DeviceHealthRecord(
+            device_id=device_id,
+            health_score=i,
+            battery_level=50,
+            temperature=30.0 + i,
+            created_at=start + step * i
+        ))
+    db.commit()
+
+
+def _service(days=None) -> HealthRollupService:
+    service = HealthRollupService()
+    service.retention_days = days or {"raw": 7, "1m": 14, "1h": 180, "1d": 0}
+    return service
+
+
+class TestRollup:
+    """聚合测试"""
+    
+    def test_hourly_aggregates(self, db):
+        device_id = _add_device(db)
+        # 10:00 ~ 10:59 每5分钟一条，共12条
+        _add_records(db, device_id, datetime(2026, 3, 10, 10, 0), 12, timedelta(minutes=5))
+        
+        written = _service().rollup(db, NOW)
+        
+        assert written == {"1m": 12, "1h": 1, "1d": 0}
+        hourly = db.exec(select(DeviceHealthRollup).where(DeviceHealthRollup.resolution == "1h")).one()
+        assert hourly.bucket_start == datetime(2026, 3, 10, 10, 0)
+        assert hourly.sample_count == 12
+        assert hourly.health_score_min == 0
+        assert hourly.health_score_max == 11
+        assert hourly.health_score_avg == 5.5
+        assert hourly.health_score_p95 == 10.45
+        assert hourly.battery_level_avg == 50
+        # 未采集的指标不聚合
+        assert hourly.cpu_usage_avg is None
+    
+    def test_rerun_is_incremental(self, db):
+        device_id = _add_device(db)
+        _add_records(db, device_id, datetime(2026, 3, 10, 10, 0), 12, timedelta(minutes=5))
+        service = _service()
+        service.rollup(db, NOW)
+        
+        assert service.rollup(db, NOW) == {"1m": 0, "1h": 0, "1d": 0}
+        
+        # 下一天只聚合新结束的桶
+        _add_records(db, device_id, datetime(2026, 3, 10, 12, 0), 3, timedelta(minutes=20))
+        written = service.rollup(db, NOW + timedelta(days=1))
+        assert written == {"1m": 3, "1h": 1, "1d": 1}
+        assert len(db.exec(select(DeviceHealthRollup).where(DeviceHealthRollup.resolution == "1h")).all()) == 2
+    
+    def test_backfill_limited_to_retention(self, db):
+        device_id = _add_device(db)
+        # 20 天的历史数据，每小时一条
+        _add_records(db, device_id, datetime(2026, 2, 18, 12, 0), 20 * 24, timedelta(hours=1))
+        
+        written = _service().rollup(db, NOW)
+        
+        # 1m 只回填最近 14 天，1h/1d 覆盖全部历史
+        assert written == {"1m": 14 * 24, "1h": 20 * 24, "1d": 20}
+        first_minute = db.exec(
+            select(DeviceHealthRollup.bucket_start).where(DeviceHealthRollup.resolution == "1m")
+            .order_by(DeviceHealthRollup.bucket_start)
+        ).first()
+        assert first_minute == datetime(2026, 2, 24, 12, 0)
+    
+    def test_late_record_rolled_up_within_grace(self, db):
+        device_id = _add_device(db)
+        _add_records(db, device_id, datetime(2026, 3, 10, 11, 50), 2, timedelta(minutes=5))
+        service = _service()
+        service.rollup(db, NOW)
+        
+        # 11:59 的记录在 11:00 的小时桶结束后才提交
+        _add_records(db, device_id, datetime(2026, 3, 10, 11, 59), 1, timedelta(minutes=1))
+        service.rollup(db, NOW + timedelta(minutes=10))
+        hourly = db.exec(select(DeviceHealthRollup).where(DeviceHealthRollup.resolution == "1h")).one()
+        assert hourly.sample_count == 3
+        
+        # 宽限期（15分钟）过后不再重新计算
+        assert service.rollup(db, NOW + timedelta(minutes=30)) == {"1m": 0, "1h": 0, "1d": 0}
+
+
+class TestRetention:
+    """数据保留测试"""
+    
+    def test_raw_deleted_only_after_rollup(self, db):
+        device_id = _add_device(db)
+        _add_records(db, device_id, NOW - timedelta(days=10), 10, timedelta(days=1))
+        service = _service()
+        
+        # 尚未聚合时不删除原始记录
+        assert service.apply_retention(db, NOW).get("raw") is None
+        assert len(db.exec(select(DeviceHealthRecord)).all()) == 10
+        
+        service.rollup(db, NOW)
+        purged = service.apply_retention(db, NOW)
+        
+        # 10 天前 ~ 8 天前的 3 条超过 7 天保留期
+        assert purged["raw"] == 3
+        assert len(db.exec(select(DeviceHealthRecord)).all()) == 7
+        assert len(db.exec(select(DeviceHealthRollup).where(DeviceHealthRollup.resolution == "1d")).all()) == 10
+    
+    def test_rollup_retention(self, db):
+        device_id = _add_device(db)
+        _add_records(db, device_id, NOW - timedelta(days=20), 20, timedelta(days=1))
+        service = _service()
+        # 一周前聚合的 1m 桶在保留期内，之后过期
+        service.rollup(db, NOW - timedelta(days=7))
+        service.rollup(db, NOW)
+        
+        purged = service.apply_retention(db, NOW)
+        
+        # 14 天前那条记录所在的桶起点早于保留起点，一并清理
+        assert purged["1m"] == 7
+        assert "1d" not in purged
+        assert len(db.exec(select(DeviceHealthRollup).where(DeviceHealthRollup.resolution == "1m")).all()) == 13
+
+
+class TestHistoryQuery:
+    """历史查询测试"""
+    
+    def test_choose_coarsest_resolution(self):
+        service = _service()
+        
+        assert service.choose_resolution(NOW - timedelta(hours=24), 30 * 60, NOW) == "1m"
+        assert service.choose_resolution(NOW - timedelta(days=30), 6 * 3600, NOW) == "1h"
+        assert service.choose_resolution(NOW - timedelta(days=365), 86400, NOW) == "1d"
+        assert service.choose_resolution(NOW - timedelta(hours=1), 0, NOW) == "raw"
+        # 原始记录和 1m 数据都已过期时退到 1h
+        assert service.choose_resolution(NOW - timedelta(days=30), 0, NOW) == "1h"
+    
+    def test_tail_filled_from_raw(self, db):
+        device_id = _add_device(db)
+        _add_records(db, device_id, datetime(2026, 3, 10, 9, 0), 12, timedelta(minutes=15))
+        service = _service()
+        # 只聚合到 11:00，11:00 之后的记录尚未聚合
+        service.rollup(db, datetime(2026, 3, 10, 11, 0))
+        
+        resolution, points = service.query_history(
+            db, device_id, datetime(2026, 3, 10, 8, 0), 3600, now=NOW
+        )
+        
+        assert resolution == "1h"
+        assert [p["created_at"].hour for p in points] == [9, 10, 11]
+        assert [p["sample_count"] for p in points] == [4, 4, 4]
+        assert points[2]["health_score"] == 9.5
+    
+    def test_raw_bucketed_in_sql(self, db):
+        device_id = _add_device(db)
+        # 10:00 ~ 10:55 每5分钟一条
+        _add_records(db, device_id, datetime(2026, 3, 10, 10, 0), 12, timedelta(minutes=5))
+        
+        resolution, points = _service().query_history(
+            db, device_id, datetime(2026, 3, 10, 9, 0), 30 * 60, now=datetime(2026, 3, 10, 11, 0)
+        )
+        
+        # 尚未生成聚合数据，全部由原始记录在 SQL 中按 30 分钟分桶
+        assert resolution == "1m"
+        assert [p["created_at"] for p in points] == [datetime(2026, 3, 10, 10, 0), datetime(2026, 3, 10, 10, 30)]
+        assert [p["sample_count"] for p in points] == [6, 6]
+        assert points[0]["health_score"] == 2.5
+        assert (points[1]["health_score_min"], points[1]["health_score_max"]) == (6, 11)
+    
+    def test_rollup_and_tail_merged_in_same_bucket(self, db):
+        device_id = _add_device(db)
+        _add_records(db, device_id, datetime(2026, 3, 1, 10, 0), 8, timedelta(minutes=15))
+        service = _service()
+        # 10:00 之后的 1h 聚合还未生成，10:00 ~ 11:45 的 2 小时采样桶由聚合数据和原始记录拼接
+        service.rollup(db, datetime(2026, 3, 1, 11, 0))
+        
+        resolution, points = service.query_history(db, device_id, datetime(2026, 3, 1, 10, 0), 2 * 3600, now=NOW)
+        
+        assert resolution == "1h"
+        assert len(points) == 1
+        assert points[0]["created_at"] == datetime(2026, 3, 1, 10, 0)
+        assert points[0]["sample_count"] == 8
+        assert points[0]["health_score"] == 3.5
+        assert (points[0]["health_score_min"], points[0]["health_score_max"]) == (0, 7)
+    
+    def test_history_uses_composite_index(self, db):
+        from sqlalchemy import text
+        
+        plan = db.exec(text(
+            "EXPLAIN QUERY PLAN SELECT * FROM device_health_records "
+            "WHERE device_id = 1 AND created_at >= '2026-03-01'"
+        )).all()
+        
+        assert any("ix_device_health_records_device_created" in row[-1] for row in plan)
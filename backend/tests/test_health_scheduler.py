@@ -0,0 +1,174 @@
+"""
+设备健康度并发采集测试
+"""
+import asyncio
+import time
+from datetime import datetime
+from sqlmodel import select
+from app.core.config import settings
+from app.core import metrics
+from app.models.device import Device
+from app.models.device_health import DeviceHealthRecord, DeviceHealthLatest
+from app.services.adb_device_scanner import ADBDeviceScanner
+from app.services.health_scheduler import HealthScheduler
+
+
+def _add_devices(db, count: int):
+    for i in range(count):
+        db.add(Device(
+            serial_number=f"SN{i:04d}",
+            model="Pixel",
+            android_version="14",
+            status="online"
+        ))
+    db.commit()
+
+
+def _scheduler(
+    monkeypatch, concurrency: int, deadline: float, probe_seconds: float, max_per_cycle: int = 0, adaptive: bool = False
+):
+    monkeypatch.setattr(settings, "HEALTH_COLLECT_CONCURRENCY", concurrency)
+    monkeypatch.setattr(settings, "HEALTH_ADAPTIVE_SAMPLING", adaptive)
+    monkeypatch.setattr(settings, "HEALTH_CYCLE_DEADLINE_SECONDS", deadline)
+    monkeypatch.setattr(settings, "HEALTH_MAX_DEVICES_PER_CYCLE", max_per_cycle)
+    scheduler = HealthScheduler()
+    
+    def probe(device_id, serial, status):
+        time.sleep(probe_seconds)
+        # 设备1 高温高负载，其余设备空闲
+        return {
+            "battery_level": 80,
+            "temperature": 44.0 if device_id == 1 else 30.0,
+            "cpu_usage": 95.0 if device_id == 1 else 20.0,
+            "memory_usage": 40.0,
+            "storage_usage": 50.0,
+            "network_status": "connected",
+            "last_active_time": datetime.now()
+        }
+    
+    scheduler._probe_device_metrics = probe
+    return scheduler
+
+
+class TestConcurrentCollection:
+    """并发采集测试"""
+    
+    def test_collects_beyond_50_devices_concurrently(self, db, monkeypatch):
+        _add_devices(db, 60)
+        scheduler = _scheduler(monkeypatch, concurrency=20, deadline=10, probe_seconds=0.05)
+        
+        asyncio.run(scheduler.collect_device_health())
+        
+        stats = scheduler.last_cycle
+        assert stats["collected"] == 60
+        assert stats["coverage"] == 1.0
+        # 串行需要 3 秒，20 并发约 0.15 秒
+        assert stats["duration_seconds"] < 1.5
+        assert len(db.exec(select(DeviceHealthRecord)).all()) == 60
+        assert len(db.exec(select(DeviceHealthLatest)).all()) == 60
+        assert metrics.device_temperature.value(device_id=1, serial="SN0000") == 44.0
+        assert metrics.health_cycle_duration.count() >= 1
+    
+    def test_deadline_and_rotation(self, db, monkeypatch):
+        _add_devices(db, 6)
+        scheduler = _scheduler(monkeypatch, concurrency=2, deadline=0.25, probe_seconds=0.2)
+        
+        asyncio.run(scheduler.collect_device_health())
+        first = scheduler.last_cycle
+        collected_first = set(scheduler.last_collected)
+        
+        assert first["collected"] == 2
+        assert first["timed_out"] == 4
+        assert first["duration_seconds"] < 0.5
+        # 截止时 2 个探测仍在运行，排队的 2 个已取消
+        executor = scheduler.get_stats()["executor"]
+        assert executor["running"] == 2 and executor["queued"] == 0
+        
+        # 等上一轮已开始的探测结束，下一轮优先采集上一轮没采到的设备
+        time.sleep(0.2)
+        asyncio.run(scheduler.collect_device_health())
+        collected_second = set(scheduler.last_collected) - collected_first
+        assert len(collected_second) == 2
+    
+    def test_max_devices_per_cycle(self, db, monkeypatch):
+        _add_devices(db, 5)
+        scheduler = _scheduler(monkeypatch, concurrency=4, deadline=5, probe_seconds=0, max_per_cycle=2)
+        
+        for _ in range(3):
+            asyncio.run(scheduler.collect_device_health())
+        
+        assert scheduler.last_cycle["scheduled"] == 2
+        # 3 轮 × 2 个，轮转覆盖全部 5 个设备
+        assert len(scheduler.last_collected) == 5
+        assert scheduler.get_stats()["tracked_devices"] == 5
+    
+    def test_adaptive_sampling_only_collects_due_devices(self, db, monkeypatch):
+        _add_devices(db, 4)
+        scheduler = _scheduler(monkeypatch, concurrency=4, deadline=5, probe_seconds=0, adaptive=True)
+        
+        asyncio.run(scheduler.collect_device_health())
+        assert scheduler.last_cycle["collected"] == 4
+        
+        # 刚采集过，都未到期
+        asyncio.run(scheduler.collect_device_health())
+        assert scheduler.last_cycle["due_devices"] == 0
+        
+        # 2 分钟后只有高温高负载的设备1 到期
+        first = dict(scheduler.last_collected)
+        for device_id in scheduler.last_collected:
+            scheduler.last_collected[device_id] -= 120
+        asyncio.run(scheduler.collect_device_health())
+        assert scheduler.last_cycle["collected"] == 1
+        assert scheduler.last_collected[1] > first[1]
+        
+        sampling = scheduler.get_stats()["sampling"]
+        assert sampling["fastest_devices"][0]["device_id"] == 1
+        assert sampling["probes_per_minute"] <= sampling["budget_per_minute"]
+    
+    def test_busy_devices_collected_and_due_sooner(self, db, monkeypatch):
+        _add_devices(db, 4)
+        device = db.exec(select(Device).where(Device.serial_number == "SN0002")).one()
+        device.status = "busy"
+        db.add(device)
+        db.commit()
+        busy_id = device.id
+        scheduler = _scheduler(monkeypatch, concurrency=4, deadline=5, probe_seconds=0, adaptive=True)
+        
+        # 执行任务的设备同样被采集
+        asyncio.run(scheduler.collect_device_health())
+        assert scheduler.last_cycle["collected"] == 4
+        assert busy_id in scheduler.last_collected
+        # 指标经写入队列更新，不覆盖任务占用的状态
+        db.refresh(device)
+        assert (device.status, device.cpu_usage) == ("busy", 20.0)
+        
+        # 再一轮按任务状态重新分配间隔：指标同样空闲，执行任务的设备间隔更短
+        asyncio.run(scheduler.collect_device_health())
+        sampler = scheduler.sampler
+        assert sampler.interval(busy_id) < sampler.interval(4)
+        
+        elapsed = sampler.interval(busy_id) + 1
+        for device_id in scheduler.last_collected:
+            scheduler.last_collected[device_id] -= elapsed
+        asyncio.run(scheduler.collect_device_health())
+        assert scheduler.last_cycle["collected"] == 2
+        assert sampler.states[busy_id].running_task
+        assert scheduler.get_stats()["sampling"]["reasons"]["task"] == 1
+    
+    def test_probe_bounded_by_timeout(self, monkeypatch):
+        monkeypatch.setattr(settings, "HEALTH_ADB_TIMEOUT_SECONDS", 5)
+        monkeypatch.setattr(settings, "HEALTH_PROBE_TIMEOUT_SECONDS", 0.1)
+        scheduler = HealthScheduler()
+        timeouts = []
+        
+        def slow_shell(self, serial, command, timeout=5):
+            timeouts.append(timeout)
+            time.sleep(0.06)
+            return None
+        
+        monkeypatch.setattr(ADBDeviceScanner, "_execute_shell_command", slow_shell)
+        
+        # 第3条命令前已超过探测上限，放弃该设备
+        assert scheduler._probe_device_metrics(1, "SN0000", "online") is None
+        assert len(timeouts) == 2
+        assert all(t <= 0.1 for t in timeouts)
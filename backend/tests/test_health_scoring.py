@@ -0,0 +1,57 @@
+"""
+向量化健康度评分测试
+"""
+import random
+from datetime import datetime, timedelta
+from app.services.device_health import DeviceHealthScorer, DeviceHealthService
+
+
+def _random_metrics(rng: random.Random, now: datetime) -> dict:
+    return {
+        'battery_level': rng.randint(0, 100),
+        'temperature': rng.uniform(25, 55),
+        'cpu_usage': rng.uniform(0, 100),
+        'memory_usage': rng.uniform(0, 100),
+        'storage_usage': rng.uniform(0, 100),
+        'network_status': rng.choice(['connected', 'limited', 'disconnected', 'unknown']),
+        'last_active_time': rng.choice([None, now - timedelta(hours=rng.uniform(0, 100))])
+    }
+
+
+class TestVectorizedScoring:
+    """列式批量评分测试"""
+    
+    def test_matches_scalar_scores(self):
+        scorer = DeviceHealthScorer()
+        rng = random.Random(42)
+        now = datetime.now()
+        metrics = [_random_metrics(rng, now) for _ in range(2000)]
+        
+        result = scorer.score_batch(metrics, now=now)
+        
+        for row, item in zip(result, metrics):
+            expected = scorer.calculate_score(item)
+            assert row['total_score'] == expected['total_score']
+            for dim, score in expected['dimension_scores'].items():
+                assert round(float(row[dim]), 2) == score
+    
+    def test_parses_adb_strings_and_aliases(self):
+        scorer = DeviceHealthScorer()
+        
+        result = scorer.score_batch([
+            {'battery': '85%', 'temp': '32.5℃', 'cpu': '45', 'network': 'Connected'},
+            {'battery_level': 85, 'temperature': 32.5, 'cpu_usage': 45, 'network_status': 'connected'},
+        ])
+        
+        assert result['valid'].all()
+        assert result['total_score'][0] == result['total_score'][1]
+        assert result['network'][0] == 100
+    
+    def test_invalid_rows_score_zero(self):
+        service = DeviceHealthService()
+        
+        scores = service.scorer.score_batch([{'battery_level': None}, {'temperature': 'n/a'}, {}])
+        
+        assert scores['valid'].tolist() == [False, False, True]
+        assert scores['total_score'][:2].tolist() == [0, 0]
+        assert service.calculate_health_scores([{}]) == [service.calculate_health_score({})]
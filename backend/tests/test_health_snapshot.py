@@ -0,0 +1,73 @@
+"""
+最新健康度快照测试
+"""
+import asyncio
+from datetime import datetime, timedelta
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.api.device_health import get_health_overview
+from app.core.database import async_engine
+from app.models.device import Device
+from app.models.device_health import DeviceHealthRecord, DeviceHealthLatest
+from app.services.health_snapshot import upsert_latest, rebuild_latest
+
+
+def _add_devices(db, count: int):
+    for i in range(count):
+        db.add(Device(serial_number=f"SN{i:04d}", model=f"Pixel {i}", android_version="14", status="online"))
+    db.commit()
+
+
+def _record(device_id: int, score: int, minutes_ago: int) -> DeviceHealthRecord:
+    return DeviceHealthRecord(
+        device_id=device_id,
+        health_score=score,
+        battery_level=score,
+        created_at=datetime.now() - timedelta(minutes=minutes_ago)
+    )
+
+
+class TestHealthSnapshot:
+    """快照测试"""
+    
+    def test_upsert_keeps_newest(self, db):
+        _add_devices(db, 2)
+        upsert_latest(db, [_record(1, 70, 10), _record(1, 80, 5), _record(2, 90, 5)])
+        db.commit()
+        
+        # 较旧的记录不会覆盖快照
+        upsert_latest(db, [_record(1, 10, 30), _record(2, 95, 0)])
+        db.commit()
+        
+        snapshots = {s.device_id: s.health_score for s in db.exec(select(DeviceHealthLatest)).all()}
+        assert snapshots == {1: 80, 2: 95}
+    
+    def test_rebuild_from_history(self, db):
+        _add_devices(db, 3)
+        for device_id in (1, 2):
+            for i, score in enumerate((50, 60, 70)):
+                db.add(_record(device_id, score + device_id, 30 - i * 10))
+        db.commit()
+        
+        assert rebuild_latest(db) == 2
+        # 快照已存在时不重复重建
+        assert rebuild_latest(db) == 0
+        snapshots = {s.device_id: s.health_score for s in db.exec(select(DeviceHealthLatest)).all()}
+        assert snapshots == {1: 71, 2: 72}
+    
+    def test_overview_reads_snapshot(self, db):
+        _add_devices(db, 2)
+        db.add(_record(1, 30, 0))
+        upsert_latest(db, [_record(1, 88, 0), _record(2, 55, 0)])
+        db.commit()
+        
+        async def overview():
+            async with AsyncSession(async_engine) as session:
+                return await get_health_overview(db=session)
+        
+        response = asyncio.run(overview())
+        
+        devices = sorted(response.data["devices"], key=lambda d: d["device_id"])
+        assert [d["health_score"] for d in devices] == [88, 55]
+        assert devices[0]["device_name"] == "Pixel 0"
+        assert response.data["unresolved_alerts"] == 0
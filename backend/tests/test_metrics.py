@@ -0,0 +1,84 @@
+"""
+OpenMetrics 指标测试
+"""
+import threading
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlmodel import select
+from app.api.metrics import router
+from app.core import metrics
+from app.core.metrics import MetricsRegistry
+from app.models.device import Device
+
+
+class TestExposition:
+    """文本格式测试"""
+    
+    def test_render(self):
+        registry = MetricsRegistry()
+        counter = registry.counter("demo_requests", "请求数", ("path",))
+        gauge = registry.gauge("demo_running", "运行中")
+        histogram = registry.histogram("demo_latency_seconds", "耗时", buckets=(0.1, 1.0))
+        counter.inc(path='/a"b')
+        counter.inc(2, path='/a"b')
+        gauge.set(3)
+        for value in (0.05, 0.5, 5):
+            histogram.observe(value)
+        
+        text = registry.render()
+        
+        assert '# TYPE demo_requests counter' in text
+        assert 'demo_requests_total{path="/a\\"b"} 3' in text
+        assert 'demo_running 3' in text
+        assert 'demo_latency_seconds_bucket{le="0.1"} 1' in text
+        assert 'demo_latency_seconds_bucket{le="1"} 2' in text
+        assert 'demo_latency_seconds_bucket{le="+Inf"} 3' in text
+        assert 'demo_latency_seconds_count 3' in text
+        assert 'demo_latency_seconds_sum 5.55' in text
+        assert text.endswith("# EOF\n")
+    
+    def test_thread_sharded_counters(self):
+        registry = MetricsRegistry()
+        counter = registry.counter("demo_hits", "命中数")
+        histogram = registry.histogram("demo_op_seconds", "耗时", ("op",))
+        
+        def work():
+            for _ in range(10000):
+                counter.inc()
+                histogram.observe(0.01, op="x")
+        
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        # 每个线程写自己的分片，汇总后没有丢失的更新
+        assert counter.value() == 80000
+        assert histogram.count(op="x") == 80000
+
+
+class TestPlatformMetrics:
+    """平台指标测试"""
+    
+    def test_db_queries_timed(self, db):
+        before = metrics.db_query_duration.count(operation="select")
+        
+        db.exec(select(Device)).all()
+        
+        assert metrics.db_query_duration.count(operation="select") == before + 1
+    
+    def test_endpoint(self, db):
+        metrics.adb_command_duration.observe(0.2, command="shell")
+        metrics.device_battery_level.set(55, device_id=7, serial="SN0007")
+        app = FastAPI()
+        app.include_router(router)
+        
+        response = TestClient(app).get("/metrics")
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/openmetrics-text")
+        assert 'adbweb_device_battery_level_percent{device_id="7",serial="SN0007"} 55' in response.text
+        assert 'adbweb_adb_command_duration_seconds_count{command="shell"}' in response.text
+        assert "adbweb_websocket_connections 0" in response.text
+        assert "adbweb_tasks_running" in response.text
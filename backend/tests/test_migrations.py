@@ -0,0 +1,123 @@
+"""
+数据库迁移与热点查询索引测试
+"""
+import os
+import tempfile
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlmodel import select, func
+from app.core.database import engine
+from app.core.migrations import MIGRATIONS, applied_versions, run_migrations
+from app.models.activity_log import ActivityLog
+from app.models.device_health import DeviceAlert, DeviceHealthRecord
+from app.models.failure_analysis import FailureAnalysis
+from app.models.task_log import TaskLog
+from app.utils.pagination import encode_cursor, keyset
+
+
+def query_plan(statement) -> str:
+    """EXPLAIN QUERY PLAN 的 detail 列，每步一行"""
+    compiled = statement.compile(engine, compile_kwargs={"render_postcompile": True})
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).all()
+    return "\n".join(row[-1] for row in rows)
+
+
+class TestMigrations:
+    """迁移执行测试"""
+
+    @pytest.fixture
+    def legacy_engine(self):
+        """迁移系统引入前的数据库：task_log 只有单列索引"""
+        path = os.path.join(tempfile.mkdtemp(prefix="adbweb_migrate_"), "legacy.db")
+        legacy = create_engine(f"sqlite:///{path}")
+        with legacy.begin() as conn:
+            conn.execute(text(
+                "CREATE TABLE task_log (id INTEGER PRIMARY KEY, task_name VARCHAR, script_id INTEGER, "
+                "status VARCHAR, start_time DATETIME)"
+            ))
+            conn.execute(text("CREATE INDEX ix_task_log_status ON task_log (status)"))
+            conn.execute(text("CREATE INDEX ix_task_log_script_id ON task_log (script_id)"))
+            conn.execute(text("CREATE TABLE activity_log (id INTEGER PRIMARY KEY, created_at DATETIME)"))
+            conn.execute(text(
+                "CREATE TABLE device_alerts (id INTEGER PRIMARY KEY, device_id INTEGER, alert_type VARCHAR, "
+                "is_resolved BOOLEAN, created_at DATETIME)"
+            ))
+        yield legacy
+        legacy.dispose()
+
+    def test_upgrades_existing_database(self, legacy_engine):
+        assert run_migrations(legacy_engine) == [m.version for m in MIGRATIONS]
+
+        inspector = inspect(legacy_engine)
+        task_log_indexes = {index["name"] for index in inspector.get_indexes("task_log")}
+        assert task_log_indexes == {"ix_task_log_status_start_time", "ix_task_log_script_id_start_time"}
+        assert {index["name"] for index in inspector.get_indexes("activity_log")} == {"ix_activity_log_created_at"}
+        assert {index["name"] for index in inspector.get_indexes("device_alerts")} == {
+            "ix_device_alerts_device_type_resolved", "ix_device_alerts_created_at"
+        }
+
+    def test_runs_once(self, legacy_engine):
+        run_migrations(legacy_engine)
+        assert run_migrations(legacy_engine) == []
+        assert applied_versions(legacy_engine) == [m.version for m in MIGRATIONS]
+
+
+class TestHotQueryPlans:
+    """热点查询使用复合索引"""
+
+    def test_task_list_by_status(self, db):
+        plan = query_plan(
+            select(TaskLog).where(TaskLog.status == "failed").order_by(TaskLog.start_time.desc()).limit(20)
+        )
+        assert "ix_task_log_status_start_time (status=?)" in plan
+        assert "TEMP B-TREE" not in plan
+
+    def test_status_count(self, db):
+        plan = query_plan(select(func.count(TaskLog.id)).where(TaskLog.status == "failed"))
+        assert "ix_task_log_status_start_time (status=?)" in plan
+
+    def test_reports_by_script(self, db):
+        plan = query_plan(
+            select(TaskLog).where(TaskLog.script_id == 1).order_by(TaskLog.start_time.desc()).limit(10)
+        )
+        assert "ix_task_log_script_id_start_time (script_id=?)" in plan
+        assert "TEMP B-TREE" not in plan
+
+    def test_health_history(self, db):
+        plan = query_plan(
+            select(DeviceHealthRecord).where(
+                DeviceHealthRecord.device_id == 1,
+                DeviceHealthRecord.created_at >= datetime.now() - timedelta(hours=24)
+            ).order_by(DeviceHealthRecord.created_at)
+        )
+        assert "ix_device_health_records_device_created (device_id=? AND created_at>?)" in plan
+
+    def test_open_alerts(self, db):
+        plan = query_plan(
+            select(DeviceAlert).where(DeviceAlert.is_resolved == False, DeviceAlert.device_id.in_([1, 2]))
+        )
+        assert "ix_device_alerts_device_type_resolved (device_id=?)" in plan
+
+    def test_failure_analysis_lookups(self, db):
+        assert "ix_failure_analysis_task_log_id (task_log_id=?)" in query_plan(
+            select(FailureAnalysis).where(FailureAnalysis.task_log_id == 1)
+        )
+        assert "ix_failure_analysis_created_at (created_at>?)" in query_plan(
+            select(FailureAnalysis).where(FailureAnalysis.created_at >= datetime.now() - timedelta(days=7))
+        )
+
+    def test_task_list_keyset_page(self, db):
+        plan = query_plan(keyset(
+            select(TaskLog).where(TaskLog.status == "failed"),
+            (TaskLog.start_time, TaskLog.id), encode_cursor([datetime.now(), 100]), 20
+        ))
+        assert "ix_task_log_status_start_time (status=? AND start_time<?)" in plan
+        assert "TEMP B-TREE" not in plan
+
+    def test_recent_activities(self, db):
+        plan = query_plan(select(ActivityLog).order_by(ActivityLog.created_at.desc()).limit(10))
+        assert "ix_activity_log_created_at" in plan
+        assert "TEMP B-TREE" not in plan
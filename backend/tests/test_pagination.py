@@ -0,0 +1,144 @@
+"""
+游标分页测试
+"""
+from datetime import datetime, timedelta
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.api.activity_logs import router as activity_logs_router
+from app.api.device_health import router as device_health_router
+from app.api.reports import router as reports_router
+from app.api.tasks import router as tasks_router
+from app.core.config import settings
+from app.models.activity_log import ActivityLog
+from app.models.device import Device
+from app.models.device_health import DeviceAlert
+from app.models.script import Script
+from app.models.task_log import TaskLog
+from app.services.data_archiver import data_archiver
+from app.utils.pagination import decode_cursor, encode_cursor
+
+
+NOW = datetime(2026, 3, 10, 12, 0)
+
+
+def _client() -> TestClient:
+    app = FastAPI()
+    for router in (tasks_router, reports_router, device_health_router, activity_logs_router):
+        app.include_router(router, prefix="/api/v1")
+    return TestClient(app)
+
+
+def _seed_task_logs(db, count: int):
+    """每两条任务日志共用一个开始时间，验证时间相同时按 id 继续"""
+    db.add(Device(serial_number="SN1", model="Pixel", android_version="14", status="online"))
+    db.add(Script(name="login", type="visual"))
+    for i in range(count):
+        db.add(TaskLog(
+            task_name=f"t{i}", script_id=1, device_id=1,
+            status="failed" if i % 3 == 0 else "success",
+            start_time=NOW - timedelta(minutes=i // 2)
+        ))
+    db.commit()
+
+
+def _walk(client: TestClient, url: str, **params) -> list:
+    """按 next_cursor 翻完所有页，返回每页的记录"""
+    pages = []
+    cursor = ""
+    while cursor is not None:
+        data = client.get(url, params=dict(params, cursor=cursor)).json()["data"]
+        pages.append(data["items"])
+        cursor = data["next_cursor"]
+    return pages
+
+
+class TestCursor:
+    """游标编码测试"""
+
+    def test_round_trip(self):
+        cursor = encode_cursor([NOW, 42])
+        assert decode_cursor(cursor, (TaskLog.start_time, TaskLog.id)) == [NOW, 42]
+
+    @pytest.mark.parametrize("cursor", ["not-base64!", encode_cursor([1]), encode_cursor(["x", 1])])
+    def test_invalid(self, cursor):
+        with pytest.raises(ValueError):
+            decode_cursor(cursor, (TaskLog.start_time, TaskLog.id))
+
+
+class TestKeysetEndpoints:
+    """列表接口游标分页测试"""
+
+    def test_task_pages_match_legacy_order(self, db):
+        _seed_task_logs(db, 11)
+        client = _client()
+
+        pages = _walk(client, "/api/v1/tasks", page_size=4)
+        assert [len(page) for page in pages] == [4, 4, 3]
+        names = [item["task_name"] for page in pages for item in page]
+        assert names == ["t1", "t0", "t3", "t2", "t5", "t4", "t7", "t6", "t9", "t8", "t10"]
+
+        failed = _walk(client, "/api/v1/tasks", status="failed", page_size=2)
+        assert [item["task_name"] for page in failed for item in page] == ["t0", "t3", "t6", "t9"]
+
+    def test_approximate_total(self, db, monkeypatch):
+        _seed_task_logs(db, 11)
+        client = _client()
+
+        data = client.get("/api/v1/tasks", params={"cursor": "", "include_total": True}).json()["data"]
+        assert (data["total"], data["total_exact"]) == (11, True)
+
+        monkeypatch.setattr(settings, "PAGINATION_COUNT_CAP", 5)
+        data = client.get("/api/v1/tasks", params={"cursor": "", "include_total": True}).json()["data"]
+        assert (data["total"], data["total_exact"]) == (5, False)
+
+    def test_invalid_cursor_rejected(self, db):
+        response = _client().get("/api/v1/tasks", params={"cursor": "bogus"})
+        assert response.status_code == 400
+
+    def test_alerts(self, db):
+        db.add(Device(serial_number="SN1", model="Pixel", android_version="14", status="online"))
+        for i in range(5):
+            db.add(DeviceAlert(
+                device_id=1, alert_type="battery_low", severity="warning", message=f"a{i}",
+                created_at=NOW - timedelta(minutes=i)
+            ))
+        db.commit()
+        client = _client()
+
+        # 不传游标时与原接口一致返回全部告警，传 limit 时返回最近 limit 条
+        legacy = client.get("/api/v1/device-health/alerts").json()["data"]
+        assert [alert["message"] for alert in legacy] == ["a0", "a1", "a2", "a3", "a4"]
+        legacy = client.get("/api/v1/device-health/alerts", params={"limit": 2}).json()["data"]
+        assert [alert["message"] for alert in legacy] == ["a0", "a1"]
+
+        pages = _walk(client, "/api/v1/device-health/alerts", limit=2)
+        assert [[alert["message"] for alert in page] for page in pages] == [["a0", "a1"], ["a2", "a3"], ["a4"]]
+
+    def test_activity_logs(self, db):
+        for i in range(3):
+            db.add(ActivityLog(activity_type="script", description=f"d{i}", created_at=NOW - timedelta(minutes=i)))
+        db.commit()
+
+        pages = _walk(_client(), "/api/v1/activity-logs", limit=2)
+        assert [[log["description"] for log in page] for page in pages] == [["d0", "d1"], ["d2"]]
+
+    def test_reports_continue_into_archives(self, db, tmp_path, monkeypatch):
+        monkeypatch.setattr(data_archiver, "archive_dir", str(tmp_path))
+        monkeypatch.setattr(data_archiver, "archive_days", {"task_log": 30, "device_health_records": 0})
+        _seed_task_logs(db, 4)
+        for i in range(3):
+            db.add(TaskLog(task_name=f"old{i}", script_id=1, device_id=1, status="success",
+                           start_time=datetime(2026, 1, 20 - i)))
+        db.commit()
+        data_archiver.run(NOW)
+        client = _client()
+
+        pages = _walk(client, "/api/v1/reports", include_archived=True, page_size=3)
+        assert [[item["task_name"] for item in page] for page in pages] == [
+            ["t1", "t0", "t3"], ["t2", "old0", "old1"], ["old2"]
+        ]
+        data = client.get(
+            "/api/v1/reports", params={"cursor": "", "include_archived": True, "include_total": True}
+        ).json()["data"]
+        assert (data["total"], data["total_exact"]) == (7, True)
@@ -0,0 +1,89 @@
+"""
+步骤遥测测试
+"""
+from datetime import datetime
+from sqlmodel import select
+from app.models.failure_analysis import StepExecutionLog
+from app.models.task_log import TaskLog
+from app.services.failure_service import FailureService
+from app.services.step_telemetry import StepTelemetryRecorder
+from app.utils.stats import percentile
+
+
+class TestPercentile:
+    """百分位数计算测试"""
+
+    def test_empty(self):
+        assert percentile([], 50) is None
+
+    def test_interpolation(self):
+        values = [1.0, 2.0, 3.0, 4.0]
+        assert percentile(values, 0) == 1.0
+        assert percentile(values, 100) == 4.0
+        assert percentile(values, 50) == 2.5
+
+
+class TestStepTelemetryRecorder:
+    """步骤遥测记录器测试"""
+
+    def test_buffered_until_flush(self, db):
+        task_log = TaskLog(task_name="t", status="running")
+        db.add(task_log)
+        db.commit()
+        db.refresh(task_log)
+
+        recorder = StepTelemetryRecorder(task_log.id, flush_size=100)
+        for index in range(1, 4):
+            recorder.start_step(index, {"name": f"step{index}", "type": "click"})
+            recorder.end_step("success")
+
+        # 未达到批次大小前不写库
+        assert db.exec(select(StepExecutionLog)).all() == []
+
+        assert recorder.flush() == 3
+        logs = db.exec(select(StepExecutionLog)).all()
+        assert [log.step_index for log in logs] == [1, 2, 3]
+        assert all(log.duration is not None for log in logs)
+
+    def test_auto_flush_by_batch_size(self, db):
+        recorder = StepTelemetryRecorder(1, flush_size=2)
+        for index in range(1, 4):
+            recorder.start_step(index, {"name": "s", "type": "wait"})
+            recorder.end_step("success")
+
+        assert recorder.flushed_count == 2
+        assert len(recorder.pending) == 1
+
+
+class TestStepLatencyStats:
+    """步骤耗时百分位统计测试"""
+
+    def test_latency_percentiles(self, db):
+        task_log = TaskLog(task_name="t", script_id=7, status="success", start_time=datetime.now())
+        db.add(task_log)
+        db.commit()
+        db.refresh(task_log)
+
+        db.add_all([
+            StepExecutionLog(task_log_id=task_log.id, step_index=1, step_name="a",
+                             status="success", duration=float(d))
+            for d in range(1, 11)
+        ] + [
+            StepExecutionLog(task_log_id=task_log.id, step_index=2, step_name="b",
+                             status="failed", duration=5.0),
+            # 被取消的步骤耗时不完整，不计入统计
+            StepExecutionLog(task_log_id=task_log.id, step_index=1, step_name="a",
+                             status="cancelled", duration=100.0)
+        ])
+        db.commit()
+
+        stats = FailureService(db).get_step_latency_stats(7)
+        assert [s["step_index"] for s in stats] == [1, 2]
+        assert stats[0]["count"] == 10
+        assert stats[0]["p50"] == 5.5
+        assert stats[0]["max"] == 10.0
+        assert stats[1]["failed"] == 1
+
+        # 只读取最近的 limit 条记录
+        stats = FailureService(db).get_step_latency_stats(7, limit=4)
+        assert [(s["step_index"], s["count"]) for s in stats] == [(1, 3), (2, 1)]
@@ -0,0 +1,114 @@
+"""
+任务检查点与续跑测试
+"""
+import asyncio
+from sqlmodel import select
+from app.models.failure_analysis import StepExecutionLog
+from app.services import task_executor
+from app.services.step_telemetry import get_resume_step
+from app.services.task_executor import TaskExecutor
+
+
+async def _no_sleep(*args, **kwargs):
+    return None
+
+
+STEPS = [
+    {"name": "启动应用", "type": "wait", "setup": True, "config": {"duration": 0}},
+    {"name": "进入页面", "type": "wait", "config": {"duration": 0}},
+    {"name": "点击按钮", "type": "click", "config": {"selector": "不存在的按钮"}},
+    {"name": "返回", "type": "wait", "config": {"duration": 0}},
+]
+
+
+class TestCheckpointResume:
+    """检查点续跑测试"""
+
+    def test_failed_step_is_checkpointed(self, db, monkeypatch):
+        monkeypatch.setattr(task_executor.asyncio, "sleep", _no_sleep)
+
+        result = asyncio.run(TaskExecutor().execute_script(1, 1, 1, STEPS))
+
+        assert result["status"] == "failed"
+        assert result["failed_step"] == 3
+        assert get_resume_step(db, 1) == 3
+
+    def test_resume_runs_setup_and_skips_completed(self, db, monkeypatch):
+        monkeypatch.setattr(task_executor.asyncio, "sleep", _no_sleep)
+        steps = [dict(step) for step in STEPS]
+        steps[2]["config"] = {"selector": "按钮"}
+
+        result = asyncio.run(TaskExecutor().execute_script(2, 1, 1, steps, start_step=3))
+
+        assert result["status"] == "success"
+        logs = db.exec(
+            select(StepExecutionLog).where(StepExecutionLog.task_log_id == 2)
+            .order_by(StepExecutionLog.step_index)
+        ).all()
+        assert [log.status for log in logs] == ["success", "skipped", "success", "success"]
+
+    def test_cancelled_step_recorded(self, db, monkeypatch):
+        monkeypatch.setattr(task_executor.asyncio, "sleep", _no_sleep)
+        executor = TaskExecutor()
+        execute_step = executor._execute_step
+
+        async def scenario():
+            blocked = asyncio.Event()
+
+            async def step_or_block(task_id, step, device_id):
+                if step["name"] == "进入页面":
+                    blocked.set()
+                    await asyncio.Event().wait()
+                await execute_step(task_id, step, device_id)
+
+            executor._execute_step = step_or_block
+            task = asyncio.create_task(executor.execute_script(3, 1, 1, STEPS))
+            await blocked.wait()
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+        asyncio.run(scenario())
+        logs = db.exec(
+            select(StepExecutionLog).where(StepExecutionLog.task_log_id == 3)
+            .order_by(StepExecutionLog.step_index)
+        ).all()
+        assert [log.status for log in logs] == ["success", "cancelled"]
+        assert logs[1].duration is not None
+
+    def test_resume_of_cancelled_resume(self, db, monkeypatch):
+        monkeypatch.setattr(task_executor.asyncio, "sleep", _no_sleep)
+        executor = TaskExecutor()
+        execute_step = executor._execute_step
+
+        async def scenario():
+            blocked = asyncio.Event()
+
+            async def step_or_block(task_id, step, device_id):
+                if step["name"] == "点击按钮":
+                    blocked.set()
+                    await asyncio.Event().wait()
+                await execute_step(task_id, step, device_id)
+
+            executor._execute_step = step_or_block
+            task = asyncio.create_task(executor.execute_script(4, 1, 1, STEPS, start_step=3))
+            await blocked.wait()
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+        asyncio.run(scenario())
+        logs = db.exec(
+            select(StepExecutionLog).where(StepExecutionLog.task_log_id == 4)
+            .order_by(StepExecutionLog.step_index)
+        ).all()
+        assert [log.status for log in logs] == ["success", "skipped", "cancelled"]
+        # 跳过的步骤视为已完成，再次续跑仍从第3步开始，而不是 setup 之后的第2步
+        assert get_resume_step(db, 4) == 3
+
+    def test_no_checkpoint(self, db):
+        assert get_resume_step(db, 999) is None
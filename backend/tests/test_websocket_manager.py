@@ -0,0 +1,464 @@
+"""
+WebSocket 连接管理器测试
+"""
+import asyncio
+import json
+import msgpack
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.api.websocket import router as websocket_router
+from app.core.subscriptions import SubscriptionRegistry, device_event_topics
+from app.core.task_events import TaskEventStore
+from app.core.websocket_manager import ConnectionManager, TaskUpdateBuffer
+from app.core.ws_codec import get_codec
+
+
+class FakeWebSocket:
+    """记录发送内容的假 WebSocket"""
+    
+    def __init__(self):
+        self.sent = []
+    
+    async def accept(self):
+        pass
+    
+    async def send_text(self, text: str):
+        self.sent.append(json.loads(text))
+
+
+class SlowWebSocket(FakeWebSocket):
+    """发送被阻塞的慢客户端"""
+    
+    def __init__(self):
+        super().__init__()
+        self.release = asyncio.Event()
+        self.closed = False
+    
+    async def send_text(self, text: str):
+        await self.release.wait()
+        await super().send_text(text)
+    
+    async def close(self, code: int = 1000):
+        self.closed = True
+
+
+def _log(message: str, level: str = "info") -> dict:
+    return {"type": "log", "message": message, "level": level}
+
+
+async def _settle():
+    """让写协程把队列发送完"""
+    await asyncio.sleep(0.01)
+
+
+class TestTaskUpdateCoalescing:
+    """任务更新合并发送测试"""
+    
+    def test_batch_client_receives_one_frame(self):
+        async def scenario():
+            manager = ConnectionManager()
+            ws = FakeWebSocket()
+            await manager.connect(ws, "c1")
+            manager.subscribe_task(1, "c1", batch=True)
+            
+            await manager.send_task_update(1, {"status": "running", "progress": 10})
+            await manager.send_task_update(1, _log("a"))
+            await manager.send_task_update(1, {"status": "running", "progress": 20})
+            await manager.send_task_update(1, _log("b"))
+            await _settle()
+            assert ws.sent == []
+            
+            await manager.flush_task(1)
+            await _settle()
+            return ws.sent
+        
+        sent = asyncio.run(scenario())
+        assert len(sent) == 1
+        frame = sent[0]
+        assert frame["type"] == "task_update_batch"
+        # 保持产生顺序，旧进度合并进最新进度
+        assert [u["data"].get("message", u["data"].get("progress")) for u in frame["updates"]] == ["a", 20, "b"]
+        assert all(u["type"] == "task_update" for u in frame["updates"])
+    
+    def test_progress_fields_merged(self):
+        buffer = TaskUpdateBuffer(10)
+        first = {"seq": 1, "data": {"status": "running", "current_step": 3}}
+        buffer.add(first)
+        buffer.add({"seq": 2, "data": {"progress": 40}})
+        
+        updates = buffer.drain()
+        assert updates == [{"seq": 2, "data": {"status": "running", "current_step": 3, "progress": 40}}]
+        assert first["data"] == {"status": "running", "current_step": 3}
+    
+    def test_legacy_client_receives_task_update_messages(self):
+        async def scenario():
+            manager = ConnectionManager()
+            ws = FakeWebSocket()
+            await manager.connect(ws, "c1")
+            manager.subscribe_task(1, "c1")
+            
+            await manager.send_task_update(1, _log("a"))
+            await manager.send_task_update(1, {"status": "success", "progress": 100})
+            await _settle()
+            return ws.sent
+        
+        sent = asyncio.run(scenario())
+        # 结束状态立即发送，无需等待时间窗口
+        assert [m["type"] for m in sent] == ["task_update", "task_update"]
+        assert sent[-1]["data"]["status"] == "success"
+    
+    def test_flush_by_message_count(self):
+        async def scenario():
+            manager = ConnectionManager()
+            manager.flush_max_messages = 3
+            ws = FakeWebSocket()
+            await manager.connect(ws, "c1")
+            manager.subscribe_task(1, "c1", batch=True)
+            
+            for i in range(3):
+                await manager.send_task_update(1, _log(str(i)))
+            await _settle()
+            return ws.sent
+        
+        sent = asyncio.run(scenario())
+        assert len(sent) == 1
+        assert len(sent[0]["updates"]) == 3
+    
+    def test_ring_buffer_drops_oldest_logs(self):
+        async def scenario():
+            manager = ConnectionManager()
+            manager.task_buffer_size = 2
+            ws = FakeWebSocket()
+            await manager.connect(ws, "c1")
+            manager.subscribe_task(1, "c1", batch=True)
+            
+            for i in range(4):
+                await manager.send_task_update(1, _log(str(i)))
+            await manager.flush_task(1)
+            await _settle()
+            return ws.sent
+        
+        frame = asyncio.run(scenario())[0]
+        assert [u["data"]["message"] for u in frame["updates"]] == ["2", "3"]
+        assert frame["dropped"] == 2
+
+
+class TestBackpressure:
+    """慢客户端背压测试"""
+    
+    def test_slow_client_does_not_block_others(self):
+        async def scenario():
+            manager = ConnectionManager()
+            slow, fast = SlowWebSocket(), FakeWebSocket()
+            await manager.connect(slow, "slow")
+            await manager.connect(fast, "fast")
+            
+            await manager.broadcast(json.dumps({"type": "device_alert"}))
+            await _settle()
+            return slow, fast, manager.get_stats()
+        
+        slow, fast, stats = asyncio.run(scenario())
+        assert fast.sent == [{"type": "device_alert"}]
+        assert slow.sent == []
+        slow_stats = next(c for c in stats["clients"] if c["client_id"] == "slow")
+        assert slow_stats["queue_depth"] == 0  # 消息已被写协程取出，正在发送中
+        assert stats["connections"] == 2
+    
+    def test_debug_logs_dropped_before_disconnect(self):
+        async def scenario():
+            manager = ConnectionManager()
+            manager.send_queue_size = 4
+            slow = SlowWebSocket()
+            await manager.connect(slow, "slow")
+            manager.subscribe_task(1, "slow")
+            await manager.broadcast("{}")  # 占住写协程
+            await _settle()
+            
+            for i in range(4):
+                await manager.send_task_update(1, _log(f"d{i}", "debug"))
+            await manager.send_task_update(1, _log("important"))
+            await manager.flush_task(1)
+            
+            connection = manager.active_connections["slow"]
+            queued = [json.loads(text)["data"]["message"] for text, _, _ in connection.queue]
+            return queued, connection.dropped, "slow" in manager.active_connections
+        
+        queued, dropped, still_connected = asyncio.run(scenario())
+        assert still_connected
+        assert "important" in queued
+        assert dropped == 1
+    
+    def test_slow_consumer_disconnected_when_queue_full(self):
+        async def scenario():
+            manager = ConnectionManager()
+            manager.send_queue_size = 2
+            slow = SlowWebSocket()
+            await manager.connect(slow, "slow")
+            await manager.broadcast("{}")
+            await _settle()
+            
+            for _ in range(3):
+                await manager.broadcast("{}")
+            await _settle()
+            return manager, slow
+        
+        manager, slow = asyncio.run(scenario())
+        assert "slow" not in manager.active_connections
+        assert manager.slow_consumer_disconnects == 1
+        assert slow.closed
+
+
+class TestReconnect:
+    """同名客户端重连测试"""
+    
+    def test_stale_disconnect_keeps_new_connection(self):
+        async def scenario():
+            manager = ConnectionManager()
+            old_ws, new_ws = FakeWebSocket(), FakeWebSocket()
+            old = await manager.connect(old_ws, "c1")
+            new = await manager.connect(new_ws, "c1")
+            manager.subscribe_task(1, "c1")
+            
+            # 旧连接的端点随后收到断开事件
+            manager.disconnect("c1", old)
+            await manager.send_task_update(1, {"status": "success", "progress": 100})
+            await _settle()
+            return manager, new, new_ws.sent
+        
+        manager, new, sent = asyncio.run(scenario())
+        assert manager.active_connections["c1"] is new
+        assert [m["data"]["status"] for m in sent] == ["success"]
+
+
+class TestSubscriptionRegistry:
+    """订阅索引测试"""
+    
+    def test_forward_and_reverse_index(self):
+        registry = SubscriptionRegistry()
+        registry.subscribe("c1", "task:1")
+        registry.subscribe("c1", "task:2")
+        registry.subscribe("c2", "task:1")
+        
+        assert registry.subscribers("task:1") == {"c1", "c2"}
+        assert registry.topics_of("c1") == {"task:1", "task:2"}
+        
+        registry.remove_client("c1")
+        assert registry.subscribers("task:1") == {"c2"}
+        assert "task:2" not in registry.topic_clients
+        assert len(registry) == 1
+    
+    def test_wildcard_topics(self):
+        registry = SubscriptionRegistry()
+        registry.subscribe("dashboard", "task:*")
+        registry.subscribe("c1", "task:1")
+        
+        assert registry.subscribers("task:1") == {"dashboard", "c1"}
+        assert registry.subscribers("task:99") == {"dashboard"}
+        assert not registry.has_subscribers("device:1")
+        
+        assert registry.unsubscribe("dashboard", "task:*")
+        assert not registry.has_subscribers("task:99")
+    
+    def test_manager_wildcard_subscription_receives_task_updates(self):
+        async def scenario():
+            manager = ConnectionManager()
+            ws = FakeWebSocket()
+            await manager.connect(ws, "dashboard")
+            manager.subscribe("task:*", "dashboard")
+            
+            await manager.send_task_update(42, {"status": "success", "progress": 100})
+            await _settle()
+            return ws.sent
+        
+        sent = asyncio.run(scenario())
+        assert sent[0]["task_id"] == 42
+
+
+class TestTaskEventReplay:
+    """任务事件序号与重放测试"""
+    
+    def test_seq_assigned_without_subscribers(self, tmp_path):
+        async def scenario():
+            manager = ConnectionManager()
+            manager.task_events = TaskEventStore(str(tmp_path))
+            for i in range(3):
+                await manager.send_task_update(1, _log(f"line {i}"))
+            return manager.task_events.replay(1, 1)
+        
+        events = asyncio.run(scenario())
+        assert [e["seq"] for e in events] == [2, 3]
+        assert events[0]["data"]["message"] == "line 1"
+    
+    def test_late_subscriber_catches_up_from_buffer_and_file(self, tmp_path):
+        async def scenario():
+            manager = ConnectionManager()
+            manager.task_events = TaskEventStore(str(tmp_path), buffer_size=5, spill_batch=2)
+            for i in range(12):
+                await manager.send_task_update(1, _log(f"line {i}"))
+            
+            ws = FakeWebSocket()
+            await manager.connect(ws, "late")
+            replayed = await manager.subscribe_task_since(1, "late", since_seq=3)
+            
+            # 订阅之后的实时更新排在重放之后
+            await manager.send_task_update(1, {"status": "success", "progress": 100})
+            await _settle()
+            return replayed, ws.sent
+        
+        replayed, sent = asyncio.run(scenario())
+        assert replayed == 9
+        assert sent[0]["type"] == "task_update_batch" and sent[0]["replay"] is True
+        seqs = [u["seq"] for u in sent[0]["updates"]]
+        assert seqs == list(range(4, 13))
+        assert sent[-1]["seq"] == 13
+    
+    def test_pending_updates_not_replayed_twice(self, tmp_path):
+        async def scenario():
+            manager = ConnectionManager()
+            manager.task_events = TaskEventStore(str(tmp_path))
+            ws1, ws2 = FakeWebSocket(), FakeWebSocket()
+            await manager.connect(ws1, "c1")
+            await manager.connect(ws2, "c2")
+            manager.subscribe_task(1, "c1", batch=True)
+            
+            await manager.send_task_update(1, _log("a"))
+            await manager.flush_task(1)
+            # b 仍在发送缓冲区中，重放只包含已推送的 a
+            await manager.send_task_update(1, _log("b"))
+            replayed = await manager.subscribe_task_since(1, "c2", since_seq=0, batch=True)
+            await manager.flush_task(1)
+            await _settle()
+            return replayed, ws2.sent
+        
+        replayed, sent = asyncio.run(scenario())
+        assert replayed == 1
+        all_seqs = [u["seq"] for frame in sent for u in frame["updates"]]
+        assert all_seqs == [1, 2]
+    
+    def test_finished_task_replayed_from_file_after_eviction(self, tmp_path):
+        store = TaskEventStore(str(tmp_path), max_finished_tasks=1)
+        for task_id in (1, 2):
+            store.record(task_id, {"data": _log("start")})
+            seq = store.record(task_id, {"data": {"status": "success"}}, finished=True)
+            store.mark_flushed(task_id, seq)
+        
+        assert 1 not in store.tasks
+        assert [e["seq"] for e in store.replay(1, 0)] == [1, 2]
+        assert [e["seq"] for e in store.replay(2, 1)] == [2]
+
+    def test_events_written_once(self, tmp_path):
+        store = TaskEventStore(str(tmp_path), buffer_size=2, spill_batch=1)
+        for i in range(4):
+            store.record(1, {"data": _log(str(i))})
+        store.record(1, {"data": {"status": "failed"}}, finished=True)
+        # 结束后仍有迟到的事件
+        store.record(1, {"data": _log("late")})
+        store.record(1, {"data": {"status": "failed"}}, finished=True)
+        store.flush()
+        
+        seqs = [json.loads(line)["seq"] for line in open(tmp_path / "task_1.jsonl")]
+        assert seqs == [1, 2, 3, 4, 5, 6, 7]
+    
+    def test_idle_unfinished_task_evicted(self, tmp_path):
+        store = TaskEventStore(str(tmp_path), idle_ttl=60)
+        seq = store.record(1, {"data": _log("start")})
+        store.mark_flushed(1, seq)
+        store.tasks[1].last_active -= 120
+        store._next_idle_check = 0
+        store.record(2, {"data": _log("start")})
+        
+        assert 1 not in store.tasks and 2 in store.tasks
+        assert [e["seq"] for e in store.replay(1, 0)] == [1]
+
+
+class TestBinaryEncoding:
+    """MessagePack 编码协商测试"""
+    
+    def test_msgpack_client_receives_binary_frames(self):
+        class BinaryWebSocket(FakeWebSocket):
+            async def send_bytes(self, data: bytes):
+                self.sent.append(msgpack.unpackb(data, raw=False))
+        
+        async def scenario():
+            manager = ConnectionManager()
+            ws_json, ws_binary = FakeWebSocket(), BinaryWebSocket()
+            await manager.connect(ws_json, "json")
+            await manager.connect(ws_binary, "binary", get_codec("msgpack"))
+            manager.subscribe_task(1, "json", batch=True)
+            manager.subscribe_task(1, "binary", batch=True)
+            
+            await manager.send_task_update(1, _log("中文日志"))
+            await manager.send_task_update(1, {"status": "success", "progress": 100})
+            await manager.broadcast(json.dumps({"type": "device_alert"}))
+            await _settle()
+            return ws_json.sent, ws_binary.sent, manager.get_stats()
+        
+        sent_json, sent_binary, stats = asyncio.run(scenario())
+        # 两种编码收到的消息结构完全相同
+        assert sent_binary == sent_json
+        assert sent_binary[0]["updates"][0]["data"]["message"] == "中文日志"
+        assert {c["client_id"]: c["encoding"] for c in stats["clients"]} == {"json": "json", "binary": "msgpack"}
+    
+    def test_encoding_negotiated_on_endpoint(self, monkeypatch):
+        monkeypatch.setattr("app.api.websocket.manager", ConnectionManager())
+        app = FastAPI()
+        app.include_router(websocket_router)
+        
+        with TestClient(app).websocket_connect("/ws/c1?encoding=msgpack") as ws:
+            connected = msgpack.unpackb(ws.receive_bytes(), raw=False)
+            ws.send_bytes(msgpack.packb({"type": "subscribe", "task_id": 7}))
+            ack = msgpack.unpackb(ws.receive_bytes(), raw=False)
+            # 二进制连接仍然接受 JSON 文本消息
+            ws.send_text(json.dumps({"type": "ping", "timestamp": 1}))
+            pong = msgpack.unpackb(ws.receive_bytes(), raw=False)
+        
+        assert (connected["type"], connected["encoding"]) == ("connected", "msgpack")
+        assert ack["type"] == "subscribed" and ack["task_id"] == 7
+        assert pong == {"type": "pong", "timestamp": 1}
+    
+    def test_unknown_encoding_falls_back_to_json(self, monkeypatch):
+        monkeypatch.setattr("app.api.websocket.manager", ConnectionManager())
+        app = FastAPI()
+        app.include_router(websocket_router)
+        
+        # 不支持的编码使用 JSON 文本帧，连接确认告知客户端实际编码
+        with TestClient(app).websocket_connect("/ws/c1?encoding=protobuf") as ws:
+            connected = json.loads(ws.receive_text())
+        
+        assert (connected["type"], connected["encoding"]) == ("connected", "json")
+        assert get_codec(None).name == "json"
+
+
+class TestTopicEvents:
+    """按主题推送设备事件测试"""
+    
+    def test_alert_only_delivered_to_matching_topics(self):
+        async def scenario():
+            manager = ConnectionManager()
+            sockets = {name: FakeWebSocket() for name in ("device", "group", "severity", "all", "other", "none")}
+            for name, ws in sockets.items():
+                await manager.connect(ws, name)
+            manager.subscribe("device:1", "device")
+            manager.subscribe("group:产线A", "group")
+            manager.subscribe("severity:critical", "severity")
+            manager.subscribe("device:*", "all")
+            manager.subscribe("group:产线A", "all")
+            manager.subscribe("device:2", "other")
+            
+            alert = {"type": "device_alert", "data": {"device_id": 1, "severity": "critical"}}
+            recipients = await manager.publish(device_event_topics(1, "产线A", "critical"), alert)
+            await _settle()
+            return recipients, {name: ws.sent for name, ws in sockets.items()}
+        
+        recipients, sent = asyncio.run(scenario())
+        assert recipients == 4
+        for name in ("device", "group", "severity", "all"):
+            # 同时匹配多个主题的客户端只收到一次
+            assert sent[name] == [{"type": "device_alert", "data": {"device_id": 1, "severity": "critical"}}]
+        assert sent["other"] == []
+        assert sent["none"] == []
+    
+    def test_device_event_topics(self):
+        assert device_event_topics(3) == ["device:3"]
+        assert device_event_topics(3, "机房", "warning") == ["device:3", "group:机房", "severity:warning"]
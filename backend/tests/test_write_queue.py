@@ -0,0 +1,87 @@
+"""
+SQLite 调优参数与写入队列测试
+"""
+import threading
+import pytest
+from sqlalchemy import text
+from sqlmodel import select
+from app.core.database import engine
+from app.core.write_queue import WriteQueue
+from app.models.device import Device
+
+
+def _add_device(serial: str):
+    def write(session):
+        device = Device(serial_number=serial, model="m", android_version="13", status="online")
+        session.add(device)
+        session.flush()
+        return device.id
+    return write
+
+
+class TestSqlitePragmas:
+    """连接调优参数测试"""
+
+    def test_wal_and_busy_timeout(self):
+        with engine.connect() as conn:
+            assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+            assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 1  # NORMAL
+            assert conn.exec_driver_sql("PRAGMA busy_timeout").scalar() == 5000
+
+
+class TestWriteQueue:
+    """写入队列测试"""
+
+    def test_batches_writes_into_one_transaction(self, db):
+        queue = WriteQueue(max_delay_ms=200)
+        try:
+            futures = [queue.submit(_add_device(f"s{i}")) for i in range(20)]
+            ids = [future.result(timeout=5) for future in futures]
+        finally:
+            queue.stop()
+
+        assert len(set(ids)) == 20
+        assert len(db.exec(select(Device)).all()) == 20
+        # 200ms 窗口内提交的写操作合并成远少于 20 个事务
+        assert queue.batches < 20
+        assert queue.get_stats()["committed"] == 20
+
+    def test_failing_write_does_not_affect_batch(self, db):
+        def broken(session):
+            session.exec(text("INSERT INTO no_such_table VALUES (1)"))
+
+        queue = WriteQueue(max_delay_ms=200)
+        try:
+            ok = queue.submit(_add_device("ok1"))
+            bad = queue.submit(broken)
+            ok2 = queue.submit(_add_device("ok2"))
+            assert ok.result(timeout=5) and ok2.result(timeout=5)
+            with pytest.raises(Exception):
+                bad.result(timeout=5)
+        finally:
+            queue.stop()
+
+        serials = sorted(device.serial_number for device in db.exec(select(Device)).all())
+        assert serials == ["ok1", "ok2"]
+        assert queue.failed == 1
+
+    def test_concurrent_submitters(self, db):
+        queue = WriteQueue()
+        errors = []
+
+        def worker(index: int):
+            try:
+                for n in range(25):
+                    queue.execute(_add_device(f"w{index}-{n}"))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        queue.stop()
+
+        assert errors == []
+        assert len(db.exec(select(Device)).all()) == 200